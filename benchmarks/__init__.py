@@ -0,0 +1,2 @@
+# benchmarks/__init__.py
+"""Scripts de mesure de performance (hors package livré). Lancer avec `python -m benchmarks.<script>`."""
@@ -0,0 +1,90 @@
+# benchmarks/bench_field_scanner.py
+"""
+Microbenchmark : cascade de regex historique vs scanner une passe.
+
+    python -m benchmarks.bench_field_scanner [--repeat 2000] [--pdf-dir traitement]
+
+Compare, sur les mêmes textes bruts :
+  - "cascade" : _clean_text historique (replace/re.sub) + find_invoice_number + find_date + _find_total_ttc
+  - "scanner" : field_scanner.FieldScanner.scan (nettoyage + détection en une passe)
+Vérifie d'abord que les deux donnent exactement les mêmes résultats.
+"""
+from __future__ import annotations
+
+import argparse
+import re
+import sys
+import timeit
+from pathlib import Path
+
+from invoices import pdf_parser
+from invoices.pdf_parser import _SCANNER, _find_total_ttc, find_date, find_invoice_number
+
+# Textes synthétiques : cas sans TTC* (repli générique), numéro date-like, texte long sans champ
+_SYNTHETIC = [
+    "Facture N° 2024-001\nDate : 12/03/2024\nMontant TTC : 1\xa0234,56€\n",
+    "INVOICE\nInvoice number: INV-77\n2024-05-06\nGrand total $ 99.00\n",
+    "Facture 2024-01-01\nN° ABC-42\nNet à payer 12,00 €\n",
+    ("Conditions générales " * 400) + "\nTotal TTC* pour Mars 2024 45,00 €\nle 01/03/2024\n",
+]
+
+
+def _legacy_clean(txt: str) -> str:
+    # Copie de l'implémentation d'origine de pdf_parser._clean_text (référence)
+    if not txt:
+        return ""
+    txt = txt.replace("\xa0", " ")
+    txt = txt.replace("\u202f", " ")
+    txt = txt.replace("€", " €")
+    txt = re.sub(r"[ \t]+", " ", txt)
+    txt = txt.replace("\r", "\n")
+    return txt
+
+
+def cascade(raw: str):
+    txt = _legacy_clean(raw)
+    return find_invoice_number(txt), find_date(txt), _find_total_ttc(txt)
+
+
+def scanner(raw: str):
+    r = _SCANNER.scan(raw)
+    return r.invoice_number, r.date, (r.total_ttc, r.source_montant, r.periode)
+
+
+def _load_texts(pdf_dir: Path) -> list[str]:
+    texts = list(_SYNTHETIC)
+    for pdf in sorted(pdf_dir.glob("*.pdf")):
+        # Texte brut (non nettoyé) pour mesurer aussi le nettoyage
+        from PyPDF2 import PdfReader
+        reader = PdfReader(str(pdf))
+        texts.append("\n".join(page.extract_text() or "" for page in reader.pages))
+    return texts
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=2000, help="Nombre de passes sur le corpus de textes")
+    parser.add_argument("--pdf-dir", default=str(Path(pdf_parser.__file__).resolve().parent.parent / "traitement"))
+    args = parser.parse_args(argv)
+
+    texts = _load_texts(Path(args.pdf_dir))
+
+    for raw in texts:
+        a, b = cascade(raw), scanner(raw)
+        if a != b:
+            print(f"❌ Résultats différents:\n  cascade={a}\n  scanner={b}\n  texte={raw[:200]!r}")
+            return 1
+
+    print(f"{len(texts)} textes, {args.repeat} répétitions, résultats identiques")
+    results = {}
+    for name, fn in (("cascade", cascade), ("scanner", scanner)):
+        secs = min(timeit.repeat(lambda: [fn(t) for t in texts], number=args.repeat, repeat=3))
+        per_doc_us = secs / (args.repeat * len(texts)) * 1e6
+        results[name] = per_doc_us
+        print(f"  {name:<8} {per_doc_us:8.1f} µs/doc")
+    print(f"  gain     x{results['cascade'] / results['scanner']:.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+# benchmarks/bench_import.py
+"""
+Microbenchmark : coût de démarrage (imports) de chaque commande de python -m invoices.
+
+    python -m benchmarks.bench_import [--repeat 10]
+
+Chaque scénario est lancé dans un interpréteur neuf (python -c) :
+  - "python"       : interpréteur seul (référence, soustraite des autres)
+  - "cli"          : import de invoices.__main__ (--help, analyse des arguments)
+  - "extract"      : cli + modules de la commande extract (pdf_parser)
+  - "report"       : cli + excel_reporter
+  - "send"         : cli + mail_sender
+  - "run"          : cli + invoices.main (modules chargés avant la première étape)
+  - "run (complet)": invoices.main + tous les modules qu'un run peut charger
+                     (équivalent de l'ancien import de invoices.main, tout au démarrage)
+Pour chacun : meilleur temps sur --repeat lancements, et modules lourds effectivement chargés.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+_ROOT = Path(__file__).resolve().parent.parent
+
+_HEAVY = ("PyPDF2", "openpyxl", "smtplib", "imaplib", "asyncio", "multiprocessing", "concurrent.futures.process")
+
+_SCENARIOS = {
+    "python": "",
+    "cli": "import invoices.__main__",
+    "extract": "import invoices.__main__, invoices.pdf_parser",
+    "report": "import invoices.__main__, invoices.excel_reporter",
+    "send": "import invoices.__main__, invoices.mail_sender",
+    "run": "import invoices.__main__, invoices.main",
+    "run (complet)": (
+        "import invoices.main, invoices.excel_reporter, invoices.mail_sender, invoices.mail_handler, "
+        "invoices.async_pipeline, invoices.archiver, invoices.column_store, invoices.isolation, "
+        "concurrent.futures.process, openpyxl"
+    ),
+}
+
+
+def _launch(code: str) -> tuple[float, list[str]]:
+    probe = f"{code}\nimport sys, json; print(json.dumps([m for m in {_HEAVY!r} if m in sys.modules]))"
+    env = dict(os.environ, PYTHONPATH=str(_ROOT))
+    t0 = time.perf_counter()
+    out = subprocess.run([sys.executable, "-c", probe], env=env, cwd=_ROOT, capture_output=True, text=True, check=True)
+    return time.perf_counter() - t0, json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    results = {}
+    for name, code in _SCENARIOS.items():
+        _launch(code)  # préchauffage (fichiers .pyc, cache disque)
+        best, loaded = min(_launch(code) for _ in range(args.repeat))
+        results[name] = (best, loaded)
+
+    base = results["python"][0]
+    print(f"interpréteur seul: {base * 1e3:.1f} ms ({args.repeat} lancements, meilleur temps)")
+    for name, (secs, loaded) in list(results.items())[1:]:
+        print(f"  {name:<14} {(secs - base) * 1e3:7.1f} ms   {', '.join(loaded) or '-'}")
+    full = results["run (complet)"][0] - base
+    for name in ("cli", "extract", "report", "send", "run"):
+        print(f"  gain {name}: x{full / max(results[name][0] - base, 1e-4):.1f} vs run (complet)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+# benchmarks/bench_manifest.py
+"""
+Microbenchmark : liste des PDF d'un dossier, rglob vs manifeste incrémental.
+
+    python -m benchmarks.bench_manifest [--dirs 200] [--files 50]
+
+Sur une arborescence synthétique (dirs sous-dossiers de files PDF vides, plus quelques
+fichiers non PDF) :
+  - "rglob"              : sorted(dossier.rglob("*.pdf")), comme main avant le manifeste
+  - "manifeste (froid)"  : premier refresh, sans état (tout est relu avec os.scandir)
+  - "manifeste (chaud)"  : refresh avec état, rien n'a changé (un stat par dossier)
+  - "manifeste (1 ajout)": refresh après l'ajout d'un PDF dans un sous-dossier
+Vérifie d'abord que le manifeste liste exactement les mêmes fichiers que rglob.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from invoices.file_manifest import FileManifest
+
+
+def _tree(root: Path, dirs: int, files: int) -> None:
+    for d in range(dirs):
+        sub = root / f"lot_{d // 20:03d}" / f"dossier_{d:04d}"
+        sub.mkdir(parents=True)
+        for i in range(files):
+            (sub / f"facture_{i:04d}.pdf").touch()
+        (sub / "notes.txt").touch()
+    # mtime des dossiers dans le passé : pas de relecture "dossier trop récent"
+    past = time.time() - 60
+    for dirpath, _, _ in os.walk(root):
+        os.utime(dirpath, (past, past))
+
+
+def _best(fn, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dirs", type=int, default=200)
+    parser.add_argument("--files", type=int, default=50)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp) / "input"
+        state = Path(tmp) / "manifest.json"
+        _tree(root, args.dirs, args.files)
+
+        reference = sorted(root.rglob("*.pdf"))
+        manifest = FileManifest(root, state)
+        manifest.refresh()
+        if manifest.paths() != reference:
+            print("❌ Listes différentes entre rglob et le manifeste")
+            return 1
+        print(f"{len(reference)} PDF dans {args.dirs} dossiers, listes identiques")
+
+        def cold():
+            FileManifest(root).refresh()
+
+        def warm():
+            FileManifest(root, state).refresh()
+
+        counter = iter(range(1_000_000))
+
+        def one_added():
+            (root / "lot_000" / "dossier_0000" / f"ajout_{next(counter)}.pdf").touch()
+            FileManifest(root, state).refresh()
+
+        results = {
+            "rglob": _best(lambda: sorted(root.rglob("*.pdf"))),
+            "manifeste (froid)": _best(cold),
+            "manifeste (chaud)": _best(warm),
+            "manifeste (1 ajout)": _best(one_added),
+        }
+        for name, secs in results.items():
+            print(f"  {name:<20} {secs * 1e3:8.1f} ms")
+        for name in list(results)[1:]:
+            print(f"  gain {name}: x{results['rglob'] / results[name]:.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+# benchmarks/bench_normalize.py
+"""
+Microbenchmark : conversion montant/date ligne par ligne vs par colonne.
+
+    python -m benchmarks.bench_normalize [--rows 200000] [--seed 0]
+
+Compare, sur les mêmes lignes (forme CSV, montants "1 234,56€", dates "dd/mm/yyyy") :
+  - "lignes"       : InvoiceRecord.from_mapping, une ligne à la fois
+  - "lot (python)" : normalize.records_from_rows sans NumPy
+  - "lot (numpy)"  : normalize.records_from_rows avec NumPy (si installé)
+Vérifie d'abord que les trois donnent exactement les mêmes enregistrements.
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+import timeit
+
+from invoices import normalize
+from invoices.records import InvoiceRecord
+
+
+def _rows(count: int, seed: int) -> list[dict]:
+    rng = random.Random(seed)
+    rows = []
+    for i in range(count):
+        euros = rng.randint(0, 5000)
+        total = f"{euros:,}".replace(",", " ") + f",{rng.randint(0, 99):02d}€"
+        rows.append({
+            "fichier": f"facture_{i:06d}.pdf",
+            "date_facture": f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/{rng.randint(2019, 2025)}",
+            "numero_facture": f"{rng.randint(2019, 2025)}-{i:06d}-IH-1",
+            "total_ttc": total if rng.random() > 0.01 else "INCONNU",
+            "periode": "",
+        })
+    return rows
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    rows = _rows(args.rows, args.seed)
+    variants = {
+        "lignes": lambda: [InvoiceRecord.from_mapping(r) for r in rows],
+        "lot (python)": lambda: normalize.records_from_rows(rows, use_numpy=False),
+    }
+    if normalize.HAVE_NUMPY:
+        variants["lot (numpy)"] = lambda: normalize.records_from_rows(rows, use_numpy=True)
+    else:
+        print("numpy non installé : variante numpy ignorée")
+
+    reference = variants["lignes"]()
+    for name, fn in variants.items():
+        if fn() != reference:
+            print(f"❌ Résultats différents: {name}")
+            return 1
+
+    print(f"{args.rows} lignes, résultats identiques")
+    results = {}
+    for name, fn in variants.items():
+        secs = min(timeit.repeat(fn, number=1, repeat=3))
+        results[name] = secs
+        print(f"  {name:<13} {secs * 1e3:8.1f} ms   {args.rows / secs:12,.0f} lignes/s")
+    for name in list(results)[1:]:
+        print(f"  gain {name}: x{results['lignes'] / results[name]:.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
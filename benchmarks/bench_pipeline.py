@@ -0,0 +1,303 @@
+# benchmarks/bench_pipeline.py
+"""
+Benchmark de débit du pipeline sur un corpus synthétique (voir benchmarks.corpus).
+
+    python -m benchmarks.bench_pipeline --docs 1000 [--stages extract,csv,excel,main]
+                                        [--workers 1] [--output FICHIER.json] [--compare ANCIEN.json]
+
+Étapes mesurées :
+  - extract : pdf_parser.extract_invoice_data, PDF par PDF (cache d'extraction désactivé)
+  - csv     : main._write_csv_report sur les lignes attendues du corpus
+  - excel   : excel_reporter.write_report sur les mêmes lignes (sans latence par ligne)
+  - main    : main.main() complet sur le corpus (envoi d'email neutralisé)
+
+Chaque étape tourne dans un processus neuf (spawn) : le pic RSS mesuré est le sien,
+pas celui des étapes précédentes. Pour chaque étape : docs/s, latence p50/p95 par
+document (intervalle entre deux lignes pour le CSV) et pic RSS (processus +
+sous-processus, ex. pool d'extraction de main).
+
+Les résultats sont écrits en JSON (défaut: benchmarks/results/bench_<date>.json) ;
+--compare signale les étapes dont le débit a baissé de plus de --tolerance.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+try:
+    import resource  # absent sous Windows
+except ImportError:
+    resource = None
+
+from benchmarks.corpus import Invoice, generate_corpus
+
+STAGES = ("extract", "csv", "excel", "main")
+_ROOT = Path(__file__).resolve().parent.parent
+
+
+# ============================
+#   MESURES
+# ============================
+
+def _peak_rss_mb() -> Dict[str, Optional[float]]:
+    if resource is None:
+        return {"peak_rss_mb": None, "children_peak_rss_mb": None}
+    # ru_maxrss : Ko sous Linux, octets sous macOS
+    scale = 1 / 1024 if sys.platform != "darwin" else 1 / (1024 * 1024)
+    return {
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale, 1),
+        "children_peak_rss_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale, 1),
+    }
+
+def _percentile(values: List[float], pct: float) -> Optional[float]:
+    """Percentile au rang le plus proche (None si aucune valeur)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered) + 0.5) - 1))
+    return ordered[rank]
+
+def _summary(docs: int, seconds: float, latencies: List[float]) -> Dict[str, Any]:
+    out: Dict[str, Any] = {
+        "docs": docs,
+        "seconds": round(seconds, 4),
+        "docs_per_sec": round(docs / seconds, 2) if seconds > 0 else None,
+        "p50_ms": None,
+        "p95_ms": None,
+    }
+    if latencies:
+        out["p50_ms"] = round(_percentile(latencies, 50) * 1000, 3)
+        out["p95_ms"] = round(_percentile(latencies, 95) * 1000, 3)
+    out.update(_peak_rss_mb())
+    return out
+
+def _timed_rows(rows: Iterable[Any], latencies: List[float]) -> Iterator[Any]:
+    # Temps passé par le consommateur sur chaque ligne = intervalle entre deux lectures
+    last = time.perf_counter()
+    for row in rows:
+        yield row
+        now = time.perf_counter()
+        latencies.append(now - last)
+        last = now
+
+def _rows(invoices: List[Invoice]) -> List[Any]:
+    from invoices.records import InvoiceRecord
+
+    return [
+        InvoiceRecord.from_fields(
+            inv.fichier,
+            inv.numero_facture,
+            inv.date_facture,
+            inv.total_ttc,
+            inv.periode,
+            "TTC* mois" if inv.total_ttc else "non trouvé",
+        )
+        for inv in invoices
+    ]
+
+
+# ============================
+#   ÉTAPES (exécutées dans un processus neuf)
+# ============================
+
+def _quiet_logging() -> None:
+    # invoices.main configure le logging en INFO à l'import
+    import logging
+    logging.getLogger().setLevel(logging.WARNING)
+
+def _stage_extract(corpus_dir: str, invoices: List[Invoice], workers: int) -> Dict[str, Any]:
+    from invoices import extract_cache
+    from invoices.pdf_parser import extract_invoice_data
+
+    extract_cache.configure_cache(None)
+    latencies: List[float] = []
+    start = time.perf_counter()
+    for inv in invoices:
+        t0 = time.perf_counter()
+        extract_invoice_data(Path(corpus_dir) / inv.fichier)
+        latencies.append(time.perf_counter() - t0)
+    return _summary(len(invoices), time.perf_counter() - start, latencies)
+
+def _stage_csv(corpus_dir: str, invoices: List[Invoice], workers: int) -> Dict[str, Any]:
+    from invoices.main import _write_csv_report
+
+    _quiet_logging()
+    rows = _rows(invoices)
+    latencies: List[float] = []
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        _write_csv_report(_timed_rows(rows, latencies), Path(tmp) / "invoices_extract.csv")
+        return _summary(len(rows), time.perf_counter() - start, latencies)
+
+def _stage_excel(corpus_dir: str, invoices: List[Invoice], workers: int) -> Dict[str, Any]:
+    from invoices import excel_reporter
+
+    # Pas de latence par ligne : les WIDTH_SAMPLE_ROWS premières lignes sont lues avant toute écriture
+    rows = _rows(invoices)
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        excel_reporter.write_report(rows, Path(tmp) / "invoices_extract.xlsx")
+        return _summary(len(rows), time.perf_counter() - start, [])
+
+def _stage_main(corpus_dir: str, invoices: List[Invoice], workers: int) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {
+            "EMAIL_ACCOUNT": "bench@example.invalid",
+            "GMAIL_APP_PASSWORD": "-",
+            "INPUT_DIR": corpus_dir,
+            "TRAITEMENT_DIR": "./traitement",
+            "OUTPUT_DIR": "./output",
+            "EXCEL_FILE": "invoices_extract.xlsx",
+            "SMTP_SERVER": "localhost",
+            "SMTP_PORT": 0,
+            "EMAIL_RECIPIENTS": "bench@example.invalid",
+            "EMAIL_SUBJECT": "-",
+            "EMAIL_BODY": "-",
+            "EXTRACT_WORKERS": workers,
+            "EXTRACT_CACHE": False,
+            "ALLOW_EMPTY_REPORT_IF_MISSING": True,
+        }
+        env_path = Path(tmp) / "env.json"
+        env_path.write_text(json.dumps(env), encoding="utf-8")
+        os.environ["WORKSPACE"] = tmp
+        os.environ["INVOICES_ENV_PATH"] = str(env_path)
+
+        from invoices import main as pipeline, mail_sender
+
+        mail_sender.send_report = lambda *args, **kwargs: None  # jamais d'envoi réel
+        _quiet_logging()
+        start = time.perf_counter()
+        pipeline.main([])
+        return _summary(len(invoices), time.perf_counter() - start, [])
+
+_STAGE_FUNCS: Dict[str, Callable[[str, List[Invoice], int], Dict[str, Any]]] = {
+    "extract": _stage_extract,
+    "csv": _stage_csv,
+    "excel": _stage_excel,
+    "main": _stage_main,
+}
+
+def _run_stage(name: str, corpus_dir: str, invoices: List[Invoice], workers: int) -> Dict[str, Any]:
+    # Processus jetable : stdout (messages du parser sur les PDF malformés, y compris
+    # depuis les workers) part vers /dev/null au niveau du descripteur
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    os.close(devnull)
+    return _STAGE_FUNCS[name](corpus_dir, invoices, workers)
+
+def run_stage_isolated(name: str, corpus_dir: Path, invoices: List[Invoice], workers: int = 1) -> Dict[str, Any]:
+    """Exécute une étape dans un processus neuf (spawn) et renvoie ses mesures."""
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+        return pool.submit(_run_stage, name, str(corpus_dir), invoices, workers).result()
+
+
+# ============================
+#   RÉSULTATS
+# ============================
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=_ROOT, capture_output=True, text=True, timeout=10
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+def _compare(current: Dict[str, Any], previous: Dict[str, Any], tolerance: float) -> bool:
+    """Affiche l'évolution du débit par étape. True si une étape régresse au-delà de tolerance."""
+    regressed = False
+    print(f"Comparaison avec {previous.get('git_commit') or '?'} ({previous.get('timestamp', '?')}) :")
+    for key in ("corpus", "workers"):
+        if previous.get(key) != current.get(key):
+            print(f"  ⚠️ {key} différent : {previous.get(key)} -> {current.get(key)}")
+    for name, stage in current["stages"].items():
+        old = previous.get("stages", {}).get(name)
+        if not old or not old.get("docs_per_sec") or not stage.get("docs_per_sec"):
+            continue
+        ratio = stage["docs_per_sec"] / old["docs_per_sec"]
+        flag = ""
+        if ratio < 1 - tolerance:
+            flag = "  ⚠️ régression"
+            regressed = True
+        print(f"  {name:<8} {old['docs_per_sec']:>10.1f} -> {stage['docs_per_sec']:>10.1f} docs/s (x{ratio:.2f}){flag}")
+    return regressed
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=100, help="Taille du corpus (10 à 100000)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--multipage-ratio", type=float, default=0.1)
+    parser.add_argument("--malformed-ratio", type=float, default=0.02)
+    parser.add_argument("--corpus-dir", help="Dossier du corpus (défaut: .cache/bench_corpus/<docs>_<seed>)")
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"Étapes, parmi {','.join(STAGES)}")
+    parser.add_argument("--workers", type=int, default=1, help="EXTRACT_WORKERS pour l'étape main")
+    parser.add_argument("--output", help="Fichier JSON de résultats (défaut: benchmarks/results/bench_<date>.json)")
+    parser.add_argument("--compare", help="Résultats d'un run précédent à comparer")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Baisse de débit tolérée avec --compare")
+    args = parser.parse_args(argv)
+
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    unknown = [s for s in stages if s not in STAGES]
+    if unknown:
+        parser.error(f"étape(s) inconnue(s): {', '.join(unknown)}")
+
+    corpus_dir = Path(args.corpus_dir or _ROOT / ".cache" / "bench_corpus" / f"{args.docs}_{args.seed}").resolve()
+    t0 = time.perf_counter()
+    invoices = generate_corpus(corpus_dir, args.docs, args.seed, args.multipage_ratio, args.malformed_ratio)
+    print(f"Corpus: {len(invoices)} PDF dans {corpus_dir} ({time.perf_counter() - t0:.1f}s)")
+
+    from invoices.pdf_parser import PARSER_VERSION
+
+    results: Dict[str, Any] = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_commit": _git_commit(),
+        "parser_version": PARSER_VERSION,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "workers": args.workers,
+        "corpus": {
+            "docs": args.docs,
+            "seed": args.seed,
+            "multipage_ratio": args.multipage_ratio,
+            "malformed_ratio": args.malformed_ratio,
+        },
+        "stages": {},
+    }
+    for name in stages:
+        stage = run_stage_isolated(name, corpus_dir, invoices, args.workers)
+        results["stages"][name] = stage
+        p50 = f"{stage['p50_ms']:.3f}" if stage["p50_ms"] is not None else "-"
+        p95 = f"{stage['p95_ms']:.3f}" if stage["p95_ms"] is not None else "-"
+        rss = f"{stage['peak_rss_mb']:.0f}" if stage["peak_rss_mb"] is not None else "?"
+        print(
+            f"  {name:<8} {stage['docs_per_sec']:>10.1f} docs/s   p50 {p50:>8} ms   p95 {p95:>8} ms"
+            f"   pic RSS {rss} Mo"
+        )
+
+    output = Path(args.output or _ROOT / "benchmarks" / "results" / f"bench_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2, ensure_ascii=False), encoding="utf-8")
+    print(f"Résultats: {output}")
+
+    if args.compare:
+        previous = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        if _compare(results, previous, args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
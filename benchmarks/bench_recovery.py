@@ -0,0 +1,102 @@
+# benchmarks/bench_recovery.py
+"""
+Microbenchmark : reprise après un échec transitoire de l'envoi, avec et sans points de reprise.
+
+    python -m benchmarks.bench_recovery [--docs 500] [--no-cache]
+
+Pour chaque scénario, espace de travail neuf sur un corpus synthétique (benchmarks.corpus) :
+  1. main() complet, envoi en échec (ConnectionResetError, SEND_MAX_ATTEMPTS=1) : le run lève
+  2. main() relancé, envoi rétabli : durée mesurée
+Scénarios :
+  - "sans reprise"  : CHECKPOINTS=false, le run relancé refait extraction, CSV et Excel
+  - "avec reprise"  : CHECKPOINTS=true, seule l'étape send est refaite
+Cache d'extraction actif (configuration par défaut) sauf --no-cache. Vérifie d'abord que
+les deux scénarios produisent le même CSV et que l'envoi a bien lieu au run relancé.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.corpus import generate_corpus
+
+
+def _scenario(corpus_dir: Path, workspace: Path, checkpoints: bool, cache: bool) -> tuple[float, bytes, int]:
+    workspace.mkdir()
+    env = {
+        "EMAIL_ACCOUNT": "bench@example.invalid",
+        "GMAIL_APP_PASSWORD": "-",
+        "INPUT_DIR": str(corpus_dir),
+        "TRAITEMENT_DIR": "./traitement",
+        "OUTPUT_DIR": "./output",
+        "EXCEL_FILE": "invoices_extract.xlsx",
+        "SMTP_SERVER": "localhost",
+        "SMTP_PORT": 0,
+        "EMAIL_RECIPIENTS": "bench@example.invalid",
+        "EMAIL_SUBJECT": "-",
+        "EMAIL_BODY": "-",
+        "EXTRACT_CACHE": cache,
+        "CHECKPOINTS": checkpoints,
+        "SEND_MAX_ATTEMPTS": 1,
+        "METRICS_JSON": "",
+    }
+    env_path = workspace / "env.json"
+    env_path.write_text(json.dumps(env), encoding="utf-8")
+    os.environ["WORKSPACE"] = str(workspace)
+    os.environ["INVOICES_ENV_PATH"] = str(env_path)
+
+    from invoices import main as pipeline, mail_sender
+
+    sent = []
+
+    def down(*args, **kwargs):
+        raise ConnectionResetError("connexion SMTP interrompue")
+
+    mail_sender.send_report = down
+    try:
+        pipeline.main([])
+    except ConnectionResetError:
+        pass
+    else:
+        raise RuntimeError("le premier run aurait dû échouer à l'envoi")
+
+    mail_sender.send_report = lambda *args, **kwargs: sent.append(1)
+    t0 = time.perf_counter()
+    pipeline.main([])
+    seconds = time.perf_counter() - t0
+    return seconds, (workspace / "output" / "invoices_extract.csv").read_bytes(), len(sent)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=500)
+    parser.add_argument("--no-cache", action="store_true")
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.CRITICAL)
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        corpus_dir = tmp / "corpus"
+        generate_corpus(corpus_dir, args.docs)
+        (corpus_dir / "manifest.json").unlink()
+        without, csv_without, sent_without = _scenario(corpus_dir, tmp / "sans", False, not args.no_cache)
+        with_cp, csv_with, sent_with = _scenario(corpus_dir, tmp / "avec", True, not args.no_cache)
+
+    if csv_without != csv_with or sent_without != 1 or sent_with != 1:
+        print(f"❌ CSV identiques: {csv_without == csv_with}, envois: {sent_without} / {sent_with}")
+        return 1
+    print(f"{args.docs} PDF, cache d'extraction {'inactif' if args.no_cache else 'actif'} : CSV identiques, envoi au run relancé")
+    print(f"  sans reprise   {without * 1e3:9.1f} ms")
+    print(f"  avec reprise   {with_cp * 1e3:9.1f} ms")
+    print(f"  gain           x{without / with_cp:.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
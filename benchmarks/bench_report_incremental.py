@@ -0,0 +1,125 @@
+# benchmarks/bench_report_incremental.py
+"""
+Microbenchmark : reporting d'un run quotidien, complet vs incrémental (REPORT_MODE).
+
+    python -m benchmarks.bench_report_incremental [--history 20000] [--new 20] [--repeat 3]
+
+Historique de --history lignes déjà reportées (2015-2025), puis un run qui voit ces lignes
+plus --new nouvelles des deux derniers mois (main relit tout INPUT_DIR : les lignes connues
+repassent par le reporting) :
+  - "complet"     : CSV et invoices_extract.xlsx réécrits avec toutes les lignes
+  - "incrémental" : filtrage par le registre (report_ledger), ajout des nouvelles lignes
+                    au CSV, invoices_extract.xlsx des nouvelles lignes, classeurs des mois
+                    touchés, validation du run
+Vérifie d'abord que le CSV incrémental est identique au CSV complet.
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from invoices import excel_reporter
+from invoices.main import _commit_increment, _tee_to_csv, _write_csv_report
+from invoices.records import InvoiceRecord
+from invoices.report_ledger import ReportLedger
+
+
+def _records(count: int, seed: int, start: int = 0, recent: bool = False) -> list[InvoiceRecord]:
+    # Historique sur 2015-2025 ; un run quotidien (recent) reçoit les factures des deux derniers mois
+    rnd = random.Random(seed)
+    rows = []
+    for i in range(start, start + count):
+        year, month = (2025, rnd.randint(11, 12)) if recent else (rnd.randint(2015, 2025), rnd.randint(1, 12))
+        cents = rnd.randint(2_000, 60_000)
+        rows.append(InvoiceRecord.from_fields(
+            f"Alan {year}{month:02d}01 - Facture Sante {i:07d}.pdf",
+            f"{year}-{month:02d}-{i:09d}-IH-1",
+            f"01/{month:02d}/{year}",
+            f"{cents // 100},{cents % 100:02d}€",
+            "",
+            "TTC* mois",
+        ))
+    return rows
+
+
+def _full(rows: list[InvoiceRecord], out: Path) -> None:
+    _write_csv_report(rows, out / "invoices_extract.csv")
+    excel_reporter.write_report(rows, out / "invoices_extract.xlsx")
+
+
+def _incremental(rows: list[InvoiceRecord], out: Path, ledger: ReportLedger) -> None:
+    csv_path = out / "invoices_extract.csv"
+    ledger.prepare_csv(csv_path)
+    stats: dict = {}
+    new = ledger.new_records(rows, stats)
+    excel_reporter.write_report(_tee_to_csv(new, csv_path, stats, append=True), out / "invoices_extract.xlsx")
+    _commit_increment(ledger, out / "parts", csv_path)
+
+
+def _snapshot(src: Path, dst: Path) -> None:
+    if dst.exists():
+        shutil.rmtree(dst)
+    shutil.copytree(src, dst)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--history", type=int, default=20000)
+    parser.add_argument("--new", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.CRITICAL)
+    history = _records(args.history, args.seed)
+    rows = history + _records(args.new, args.seed + 1, start=args.history, recent=True)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        # État de départ : historique déjà reporté en mode incrémental
+        base = tmp / "base"
+        base.mkdir()
+        _incremental(history, base, ReportLedger(base / "report_ledger.sqlite"))
+
+        run = tmp / "run"
+        _snapshot(base, run)
+        _incremental(rows, run, ReportLedger(run / "report_ledger.sqlite"))
+        full = tmp / "full"
+        full.mkdir()
+        _full(rows, full)
+        if (run / "invoices_extract.csv").read_bytes() != (full / "invoices_extract.csv").read_bytes():
+            print("❌ CSV incrémental différent du CSV complet")
+            return 1
+        print(f"{args.history} ligne(s) d'historique + {args.new} nouvelle(s), CSV identiques")
+
+        results = {}
+        best = float("inf")
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            _full(rows, full)
+            best = min(best, time.perf_counter() - t0)
+        results["complet"] = best
+        best = float("inf")
+        for _ in range(args.repeat):
+            _snapshot(base, run)
+            ledger = ReportLedger(run / "report_ledger.sqlite")
+            t0 = time.perf_counter()
+            _incremental(rows, run, ledger)
+            best = min(best, time.perf_counter() - t0)
+            ledger.close()
+        results["incrémental"] = best
+
+    for name, secs in results.items():
+        print(f"  {name:<12} {secs * 1e3:9.1f} ms")
+    print(f"  gain         x{results['complet'] / results['incrémental']:.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
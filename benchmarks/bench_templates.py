@@ -0,0 +1,81 @@
+# benchmarks/bench_templates.py
+"""
+Microbenchmark : extraction des champs par modèle fournisseur vs cascade générique.
+
+    python -m benchmarks.bench_templates [--docs 300] [--seed 0] [--pdf-dir traitement] [--repeat 200]
+
+Corpus : textes des factures synthétiques (benchmarks.corpus) + les PDF de --pdf-dir
+s'il existe (factures Alan réelles). Sur les mêmes textes :
+  - "générique" : pdf_parser._extract_fields sans modèles (FieldScanner)
+  - "modèles"   : pdf_parser._extract_fields avec supplier_templates (repli générique)
+Vérifie d'abord que les deux donnent les mêmes champs, et affiche le taux de reconnaissance.
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import sys
+import timeit
+from pathlib import Path
+
+from benchmarks.corpus import generate_corpus
+from invoices import pdf_parser, supplier_templates
+from invoices.pdf_parser import configure_extraction
+
+_ROOT = Path(__file__).resolve().parent.parent
+
+
+def _load(pdfs: list[Path]) -> list[tuple[str, str]]:
+    return [(pdf_parser._extract_text_from_pdf(pdf), pdf.name) for pdf in pdfs]
+
+
+def _fields(docs: list[tuple[str, str]], templates: bool) -> list:
+    configure_extraction("full", templates=templates)
+    return [pdf_parser._extract_fields(text, name) for text, name in docs]
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--pdf-dir", default="traitement")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    # PDF malformés : les erreurs de lecture attendues ne doivent pas noyer les résultats
+    logging.disable(logging.CRITICAL)
+    corpus_dir = _ROOT / ".cache" / "bench_corpus" / f"{args.docs}_{args.seed}"
+    generate_corpus(corpus_dir, args.docs, args.seed)
+    pdfs = sorted(corpus_dir.glob("*.pdf"))
+    real_dir = _ROOT / args.pdf_dir
+    if real_dir.is_dir():
+        pdfs += sorted(real_dir.glob("*.pdf"))
+    docs = _load(pdfs)
+
+    generic, templated = _fields(docs, False), _fields(docs, True)
+    for (text, name), a, b in zip(docs, generic, templated):
+        if a != b:
+            print(f"❌ Champs différents pour {name}:\n  générique={a}\n  modèles={b}")
+            return 1
+    hits = sum(
+        1 for text, name in docs
+        if (t := supplier_templates.match(text, name)) is not None and t.extract(text) is not None
+    )
+    print(f"{len(docs)} textes, champs identiques, reconnus par un modèle: {hits}/{len(docs)}")
+
+    results = {}
+    for label, templates in (("générique", False), ("modèles", True)):
+        configure_extraction("full", templates=templates)
+        secs = min(timeit.repeat(
+            lambda: [pdf_parser._extract_fields(text, name) for text, name in docs],
+            number=args.repeat, repeat=3,
+        ))
+        results[label] = secs / (args.repeat * len(docs)) * 1e6
+        print(f"  {label:<10} {results[label]:8.1f} µs/doc")
+    configure_extraction("full")
+    print(f"  gain       x{results['générique'] / results['modèles']:.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+# benchmarks/bench_text_backends.py
+"""
+Microbenchmark : backends d'extraction de texte (pdf_parser.TEXT_BACKENDS) sur un même corpus.
+
+    python -m benchmarks.bench_text_backends [--docs 300] [--seed 0] [--pdf-dir traitement] [--repeat 3]
+
+Corpus : factures synthétiques (benchmarks.corpus, malformées comprises) + les PDF de
+--pdf-dir s'il existe (factures Alan réelles). Pour chaque backend enregistré :
+  - texte de chaque PDF en mode "full" (_extract_text_from_pdf, sans cache)
+  - temps total (meilleur de --repeat), ms par PDF, PDF/s
+  - replis vers PyPDF2 (invoices_text_backend_fallback_total)
+Vérifie d'abord que chaque backend donne le même texte que "pypdf2", sinon les mêmes champs.
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import sys
+import time
+from pathlib import Path
+
+from benchmarks.corpus import generate_corpus
+from invoices import metrics, pdf_parser
+from invoices.pdf_parser import TEXT_BACKENDS, configure_extraction
+
+_ROOT = Path(__file__).resolve().parent.parent
+
+
+def _texts(pdfs: list[Path]) -> list[str]:
+    return [pdf_parser._extract_text_from_pdf(pdf) for pdf in pdfs]
+
+
+def _fallbacks() -> int:
+    counters = metrics.REGISTRY.snapshot()["counters"]
+    return int(sum(value for name, _, value in counters if name == "invoices_text_backend_fallback_total"))
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--pdf-dir", default="traitement")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    # PDF malformés : les erreurs de lecture attendues ne doivent pas noyer les résultats
+    logging.disable(logging.CRITICAL)
+    corpus_dir = _ROOT / ".cache" / "bench_corpus" / f"{args.docs}_{args.seed}"
+    generate_corpus(corpus_dir, args.docs, args.seed)
+    pdfs = sorted(corpus_dir.glob("*.pdf"))
+    real_dir = _ROOT / args.pdf_dir
+    if real_dir.is_dir():
+        pdfs += sorted(real_dir.glob("*.pdf"))
+
+    results = {}
+    reference = None
+    for name in TEXT_BACKENDS:
+        configure_extraction("full", backend=name)
+        metrics.REGISTRY.reset()
+        texts = _texts(pdfs)
+        fallbacks = _fallbacks()
+        if reference is None:
+            reference = texts
+        else:
+            same_text = sum(a == b for a, b in zip(texts, reference))
+            same_fields = sum(
+                pdf_parser._extract_fields(a) == pdf_parser._extract_fields(b) for a, b in zip(texts, reference)
+            )
+            print(f"{name}: texte identique à {next(iter(TEXT_BACKENDS))} pour {same_text}/{len(pdfs)} PDF, "
+                  f"champs identiques pour {same_fields}/{len(pdfs)}")
+            if same_fields != len(pdfs):
+                print(f"❌ Champs différents: {name}")
+                return 1
+
+        best = float("inf")
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            _texts(pdfs)
+            best = min(best, time.perf_counter() - t0)
+        results[name] = (best, fallbacks)
+
+    configure_extraction("full")
+    print(f"{len(pdfs)} PDF")
+    first = next(iter(results))
+    for name, (secs, fallbacks) in results.items():
+        print(f"  {name:<8} {secs * 1e3:8.1f} ms   {secs / len(pdfs) * 1e3:6.2f} ms/PDF   "
+              f"{len(pdfs) / secs:8.1f} PDF/s   replis PyPDF2: {fallbacks}")
+    for name in list(results)[1:]:
+        print(f"  gain {name}: x{results[first][0] / results[name][0]:.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+# benchmarks/bench_work_queue.py
+"""
+Microbenchmark : débit de la file de travail partagée (WORK_QUEUE) selon le nombre de nœuds.
+
+    python -m benchmarks.bench_work_queue [--docs 400] [--nodes 1,2,4,8] [--work-ms 20] [--batch 8]
+
+Chaque nœud est un processus avec sa propre WorkQueue sur un même INPUT_DIR (dossier
+temporaire, comme le partage réseau) : réclamation par lots (renommage), "extraction"
+simulée par --work-ms d'attente par PDF (un nœud = une machine : le coût d'extraction
+ne se partage pas les cœurs locaux), publication des partiels ; le dernier nœud fusionne.
+Vérifie d'abord que chaque PDF est traité une fois et une seule et que la fusion
+contient toutes les lignes, puis mesure pour chaque nombre de nœuds :
+  - durée totale (premier lancement -> fusion validée) et PDF/s
+  - conflits de réclamation (renommages perdus face à un autre nœud)
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import multiprocessing as mp
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from invoices import metrics
+from invoices.records import InvoiceRecord
+from invoices.work_queue import WorkQueue
+
+
+def _node(input_dir: str, queue_dir: str, node: str, batch: int, work_ms: float, start, out) -> None:
+    logging.disable(logging.CRITICAL)
+    metrics.REGISTRY.reset()
+    queue = WorkQueue(input_dir, queue_dir, node)
+    start.wait()
+    processed = 0
+    with queue:
+        while True:
+            claimed = queue.claim(batch)
+            if not claimed:
+                break
+            time.sleep(work_ms / 1000 * len(claimed))
+            queue.publish([InvoiceRecord.from_fields(p.name, p.stem, "01/01/2025", "10,00€") for p in claimed], claimed)
+            processed += len(claimed)
+    merged = None
+    merge = queue.merge()
+    if merge is not None:
+        try:
+            merged = sum(1 for _ in merge.records())
+            merge.commit()
+        finally:
+            merge.release()
+    out.put((node, processed, merged, metrics.REGISTRY.counter("invoices_queue_claim_conflicts_total"), time.perf_counter()))
+
+
+def _run(docs: int, nodes: int, batch: int, work_ms: float) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        input_dir = Path(tmp) / "input"
+        queue_dir = Path(tmp) / "input.queue"
+        input_dir.mkdir()
+        for i in range(docs):
+            (input_dir / f"Alan 20250101 - Facture {i:06d}.pdf").write_bytes(b"%PDF-1.4\n")
+        ctx = mp.get_context("spawn")
+        start, out = ctx.Event(), ctx.Queue()
+        procs = [
+            ctx.Process(target=_node, args=(str(input_dir), str(queue_dir), f"node-{n}", batch, work_ms, start, out))
+            for n in range(nodes)
+        ]
+        for p in procs:
+            p.start()
+        time.sleep(0.5)  # processus démarrés (imports) avant le top départ
+        t0 = time.perf_counter()
+        start.set()
+        results = [out.get() for _ in procs]
+        for p in procs:
+            p.join()
+        done = sum(1 for _ in (queue_dir / "done").rglob("*.pdf"))
+    return {
+        "seconds": max(r[4] for r in results) - t0,
+        "processed": sum(r[1] for r in results),
+        "per_node": sorted(r[1] for r in results),
+        "merged": [r[2] for r in results if r[2] is not None],
+        "conflicts": sum(r[3] for r in results),
+        "done": done,
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=400)
+    parser.add_argument("--nodes", default="1,2,4,8")
+    parser.add_argument("--work-ms", type=float, default=20.0)
+    parser.add_argument("--batch", type=int, default=8)
+    args = parser.parse_args(argv)
+
+    counts = [int(n) for n in args.nodes.split(",")]
+    results = {}
+    for n in counts:
+        r = _run(args.docs, n, args.batch, args.work_ms)
+        if r["processed"] != args.docs or r["done"] != args.docs or r["merged"] != [args.docs]:
+            print(f"❌ {n} nœud(s): {r['processed']} traité(s), {r['done']} dans done/, fusions {r['merged']}")
+            return 1
+        results[n] = r
+    print(f"{args.docs} PDF, {args.work_ms:g} ms par PDF, lots de {args.batch} : chaque PDF traité une fois, une fusion")
+
+    base = results[counts[0]]["seconds"]
+    for n, r in results.items():
+        print(
+            f"  {n:>2} nœud(s) {r['seconds']:7.2f} s  {args.docs / r['seconds']:7.0f} PDF/s  "
+            f"x{base / r['seconds']:.1f}  conflits {r['conflicts']:.0f}  répartition {r['per_node']}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
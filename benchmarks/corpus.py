@@ -0,0 +1,292 @@
+# benchmarks/corpus.py
+"""
+Générateur de corpus de factures PDF synthétiques (sans dépendance : PDF écrit à la main).
+
+    python -m benchmarks.corpus --docs 1000 [--out .cache/bench_corpus/1000_0] [--seed 0]
+
+Reprend la mise en page des factures Alan de traitement/ (en-tête, numéro
+"Facture N°AAAA-MM-...", bénéficiaires, "Total TTC* pour <Mois> <Année>", mentions
+légales), avec trois variantes :
+  - "alan"      : une page, comme les originaux
+  - "multipage" : détail des bénéficiaires sur plusieurs pages, total en dernière page
+  - "malformed" : PDF tronqué, flux corrompu ou page sans texte (chemins d'erreur du parser)
+
+Le corpus est déterministe pour un (docs, seed, ratios) donné et un manifest.json
+permet de le réutiliser d'un run à l'autre.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import sys
+import zlib
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Sequence, Tuple
+
+MONTHS = (
+    "Janvier", "Février", "Mars", "Avril", "Mai", "Juin",
+    "Juillet", "Août", "Septembre", "Octobre", "Novembre", "Décembre",
+)
+_FIRST_NAMES = ("Camille", "Louis", "Inès", "Hugo", "Léa", "Nadia", "Karim", "Emma", "Yanis", "Chloé", "Sofia", "Adam")
+_LAST_NAMES = ("Martin", "Bernard", "Dubois", "Moreau", "Benali", "Lefèvre", "Garcia", "Roux", "Haddad", "Fontaine")
+_STREETS = ("Rue de la Paix", "Avenue Jean Jaurès", "Boulevard Voltaire", "Rue des Lilas", "Chemin du Moulin")
+_CITIES = ("75011 PARIS", "69003 LYON", "95490 VAUREAL", "33000 BORDEAUX", "59000 LILLE")
+
+_LEGAL = (
+    "* Les taxes sont payées par nous, il n'y a rien à déduire. Pas de TVA en assurance\xa0!",
+    "Alan, votre partenaire santé",
+    "Alan Insurance, société anonyme au capital de 150.800.000\xa0€ entièrement libéré (RCS Paris 908 311 103)",
+    "régie par le code des assurances. Siège social : 117 Quai de Valmy - 75010 Paris.",
+    "Entités soumises au contrôle de l’Autorité de contrôle prudentiel et de résolution (ACPR).",
+)
+
+KINDS = ("alan", "multipage", "malformed")
+_MALFORMED = ("truncated", "corrupt_stream", "no_text")
+
+# A4 en points
+_PAGE_W, _PAGE_H = 595.28, 841.89
+
+
+class Invoice(NamedTuple):
+    """Valeurs attendues d'une facture générée (None pour les PDF malformés)."""
+    fichier: str
+    kind: str
+    numero_facture: str | None
+    date_facture: str | None
+    total_ttc: str | None
+    periode: str | None
+
+
+# ============================
+#   ÉCRITURE PDF MINIMALE
+# ============================
+
+def _pdf_string(text: str) -> bytes:
+    # Helvetica + WinAnsiEncoding : cp1252 couvre les accents, € et ’
+    raw = text.encode("cp1252", errors="replace")
+    return b"(" + raw.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+def _content_stream(lines: Sequence[Tuple[float, float, float, str]]) -> bytes:
+    ops = []
+    for x, y, size, text in lines:
+        ops.append(b"BT /F1 %.1f Tf %.2f %.2f Td %s Tj ET" % (size, x, y, _pdf_string(text)))
+    return b"\n".join(ops)
+
+def pdf_bytes(pages: Sequence[Sequence[Tuple[float, float, float, str]]], compress: bool = True) -> bytes:
+    """
+    PDF 1.4 : une police Type1 standard, un flux de contenu (FlateDecode) par page.
+    pages : liste de pages, chaque page une liste de (x, y, taille, texte).
+    """
+    objects: List[bytes] = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"",  # /Pages, complété quand les numéros des pages sont connus
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+    ]
+    kids = []
+    for lines in pages:
+        content = _content_stream(lines)
+        if compress:
+            content = zlib.compress(content)
+            head = b"<< /Length %d /Filter /FlateDecode >>" % len(content)
+        else:
+            head = b"<< /Length %d >>" % len(content)
+        objects.append(head + b"\nstream\n" + content + b"\nendstream")
+        content_ref = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %.2f %.2f] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % (_PAGE_W, _PAGE_H, content_ref)
+        )
+        kids.append(b"%d 0 R" % len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [" + b" ".join(kids) + b"] /Count %d >>" % len(kids)
+
+    out = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for num, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % num + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for off in offsets:
+        out += b"%010d 00000 n \n" % off
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+# ============================
+#   MISE EN PAGE "ALAN"
+# ============================
+
+def _amount(cents: int) -> str:
+    euros, rest = divmod(cents, 100)
+    return f"{euros:,}".replace(",", ".") + f",{rest:02d}€"
+
+def _invoice_fields(rnd: random.Random, index: int) -> Dict[str, object]:
+    year = rnd.randint(2021, 2025)
+    month = rnd.randint(1, 12)
+    member = rnd.randint(100_000_000, 999_999_999)
+    first, last = rnd.choice(_FIRST_NAMES), rnd.choice(_LAST_NAMES)
+    beneficiaries = [(f"Vous : {first} {last}", rnd.randint(4_000, 15_000))]
+    if rnd.random() < 0.6:
+        beneficiaries.append((f"Votre conjoint(e) : {rnd.choice(_FIRST_NAMES)} {last}", rnd.randint(4_000, 12_000)))
+    for _ in range(rnd.choice((0, 0, 1, 2, 3, 6, 12))):
+        beneficiaries.append((f"Enfant : {rnd.choice(_FIRST_NAMES)} {last}", rnd.randint(2_000, 5_000)))
+    return {
+        "year": year,
+        "month": month,
+        "name": f"{first} {last}",
+        "address": f"{rnd.randint(1, 120)} {rnd.choice(_STREETS)}, {rnd.choice(_CITIES)}",
+        "member": member,
+        "numero": f"{year}-{month:02d}-{member}-{index:09d}-IH-1",
+        "date": f"01/{month:02d}/{year}",
+        "beneficiaries": beneficiaries,
+        "total": sum(c for _, c in beneficiaries),
+    }
+
+def _header_lines(f: Dict[str, object]) -> List[Tuple[float, float, float, str]]:
+    periode = f"{MONTHS[f['month'] - 1]} {f['year']}"
+    return [
+        (50, 790, 16, periode),
+        (50, 760, 10, str(f["name"])),
+        (50, 746, 10, str(f["address"])),
+        (50, 732, 10, f"ID: {f['member']}"),
+        (50, 700, 12, "Assurance complémentaire santé"),
+        (50, 684, 12, f"Facture N°{f['numero']}"),
+        (50, 668, 10, f"{MONTHS[f['month'] - 1]}, le mois qui vous veut du bien"),
+        (50, 652, 10, f"Team Alan, le {f['date']}"),
+        (50, 620, 12, "Facture"),
+        (50, 604, 10, "Bénéficiaires"),
+        (450, 604, 10, "Sous-total"),
+    ]
+
+def _beneficiary_lines(items: Sequence[Tuple[str, int]], top: float) -> List[Tuple[float, float, float, str]]:
+    lines = []
+    y = top
+    for label, cents in items:
+        lines.append((50, y, 10, label))
+        lines.append((450, y, 10, _amount(cents)))
+        y -= 16
+    return lines
+
+def _footer_lines(f: Dict[str, object], top: float) -> List[Tuple[float, float, float, str]]:
+    periode = f"{MONTHS[f['month'] - 1]} {f['year']}"
+    lines = [
+        (50, top, 11, f"Total TTC* pour {periode} {_amount(int(f['total']))}"),
+        (50, top - 16, 9, f"Règlement par prélèvement automatique le 02/{f['month']:02d}/{f['year']}."),
+    ]
+    y = top - 48
+    for text in _LEGAL:
+        lines.append((50, y, 7, text))
+        y -= 11
+    return lines
+
+def _alan_pages(f: Dict[str, object]) -> List[List[Tuple[float, float, float, str]]]:
+    items = f["beneficiaries"]
+    page = _header_lines(f) + _beneficiary_lines(items, 588)
+    page += _footer_lines(f, 588 - 16 * len(items) - 24)
+    return [page]
+
+def _multipage_pages(f: Dict[str, object], rnd: random.Random) -> List[List[Tuple[float, float, float, str]]]:
+    # Détail réparti sur plusieurs pages, total et mentions légales en dernière page
+    items = list(f["beneficiaries"])
+    per_page = 30
+    pages = [_header_lines(f) + _beneficiary_lines(items[:per_page], 588)]
+    rest = items[per_page:]
+    while rest:
+        pages.append(_beneficiary_lines(rest[:40], 790))
+        rest = rest[40:]
+    for _ in range(rnd.randint(1, 3)):
+        # Pages d'annexe (garanties) : beaucoup de texte, aucun champ utile
+        pages.append([(50, 790 - 12 * i, 8, f"Garantie {i + 1} : remboursement selon barème, plafond annuel, conditions générales art. {i + 3}.") for i in range(60)])
+    pages.append(_footer_lines(f, 700))
+    return pages
+
+def _malformed_bytes(f: Dict[str, object], rnd: random.Random) -> Tuple[str, bytes]:
+    variant = rnd.choice(_MALFORMED)
+    if variant == "no_text":
+        return variant, pdf_bytes([[]])
+    data = pdf_bytes(_alan_pages(f))
+    if variant == "truncated":
+        return variant, data[: rnd.randint(len(data) // 4, len(data) // 2)]
+    # Flux de contenu corrompu : octets inversés au milieu du flux compressé
+    start = data.index(b"stream\n") + 7
+    mid = start + 8
+    return variant, data[:mid] + bytes(reversed(data[mid:mid + 40])) + data[mid + 40:]
+
+
+# ============================
+#   CORPUS
+# ============================
+
+def iter_corpus(docs: int, seed: int = 0, multipage_ratio: float = 0.1, malformed_ratio: float = 0.02) -> Iterator[Tuple[Invoice, bytes]]:
+    """Produit (valeurs attendues, octets du PDF) pour chaque document."""
+    rnd = random.Random(seed)
+    for index in range(docs):
+        f = _invoice_fields(rnd, index)
+        draw = rnd.random()
+        stamp = f"{f['year']}{f['month']:02d}01"
+        fichier = f"Alan {stamp} - Facture Sante pour {f['name']} {index:06d}.pdf"
+        if draw < malformed_ratio:
+            variant, data = _malformed_bytes(f, rnd)
+            yield Invoice(fichier, f"malformed:{variant}", None, None, None, None), data
+            continue
+        if draw < malformed_ratio + multipage_ratio:
+            kind, pages = "multipage", _multipage_pages(f, rnd)
+        else:
+            kind, pages = "alan", _alan_pages(f)
+        periode = f"{MONTHS[f['month'] - 1]} {f['year']}"
+        yield Invoice(fichier, kind, str(f["numero"]), str(f["date"]), _amount(int(f["total"])), periode), pdf_bytes(pages)
+
+def generate_corpus(
+    out_dir: str | Path,
+    docs: int,
+    seed: int = 0,
+    multipage_ratio: float = 0.1,
+    malformed_ratio: float = 0.02,
+) -> List[Invoice]:
+    """
+    Écrit le corpus dans out_dir (réutilisé tel quel si manifest.json correspond aux paramètres).
+    Renvoie la liste des valeurs attendues.
+    """
+    out_dir = Path(out_dir)
+    params = {"docs": docs, "seed": seed, "multipage_ratio": multipage_ratio, "malformed_ratio": malformed_ratio}
+    manifest = out_dir / "manifest.json"
+    if manifest.exists():
+        try:
+            saved = json.loads(manifest.read_text(encoding="utf-8"))
+        except json.JSONDecodeError:
+            saved = {}
+        if saved.get("params") == params:
+            return [Invoice(*inv) for inv in saved["invoices"]]
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    for old in out_dir.glob("*.pdf"):
+        old.unlink()
+    invoices = []
+    for inv, data in iter_corpus(docs, seed, multipage_ratio, malformed_ratio):
+        (out_dir / inv.fichier).write_bytes(data)
+        invoices.append(inv)
+    manifest.write_text(json.dumps({"params": params, "invoices": invoices}, ensure_ascii=False), encoding="utf-8")
+    return invoices
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=100, help="Nombre de PDF (10 à 100000)")
+    parser.add_argument("--out", help="Dossier de sortie (défaut: .cache/bench_corpus/<docs>_<seed>)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--multipage-ratio", type=float, default=0.1)
+    parser.add_argument("--malformed-ratio", type=float, default=0.02)
+    args = parser.parse_args(argv)
+
+    out = Path(args.out or Path(".cache") / "bench_corpus" / f"{args.docs}_{args.seed}")
+    invoices = generate_corpus(out, args.docs, args.seed, args.multipage_ratio, args.malformed_ratio)
+    kinds: Dict[str, int] = {}
+    for inv in invoices:
+        kinds[inv.kind] = kinds.get(inv.kind, 0) + 1
+    print(f"{len(invoices)} PDF dans {out} : " + ", ".join(f"{k}={v}" for k, v in sorted(kinds.items())))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+# invoices/__main__.py
+"""
+Point d'entrée léger : python -m invoices <commande>
+
+    python -m invoices extract facture.pdf [dossier ...] [-o extrait.csv]   PyPDF2 seulement
+    python -m invoices report [output/invoices_extract.csv]                openpyxl seulement
+    python -m invoices send [output/invoices_extract.xlsx]                 smtplib seulement
+    python -m invoices run [-w N] [--pipeline async]                        pipeline complet (main)
+
+Ce module n'importe que argparse/logging : chaque commande importe ses modules lourds
+(PyPDF2, openpyxl, smtplib, imaplib, asyncio...) au moment de s'exécuter. L'ordonnanceur
+lance l'outil des centaines de fois par jour : une commande ne paie que ce qu'elle utilise
+(voir python -m benchmarks.bench_import).
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import sys
+from pathlib import Path
+from typing import Iterator, List
+
+
+def _pdfs(paths: List[str]) -> Iterator[Path]:
+    # Un dossier vaut tous ses PDF (récursif, triés), comme INPUT_DIR
+    for p in map(Path, paths):
+        if p.is_dir():
+            yield from sorted(p.rglob("*.pdf"))
+        else:
+            yield p
+
+# ---------------------------
+# Commandes
+# ---------------------------
+
+def _extract(args: argparse.Namespace) -> int:
+    import csv
+
+    from invoices.pdf_parser import extract_invoice_record
+    from invoices.records import CSV_FIELDS
+
+    out = open(args.output, "w", newline="", encoding="utf-8-sig") if args.output else sys.stdout
+    failed = 0
+    try:
+        writer = csv.DictWriter(out, fieldnames=list(CSV_FIELDS))
+        writer.writeheader()
+        for pdf in _pdfs(args.pdfs):
+            try:
+                writer.writerow(extract_invoice_record(pdf).csv_row())
+            except Exception as e:
+                failed += 1
+                logging.error(f"Échec extraction {pdf}: {type(e).__name__}: {e}")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 1 if failed else 0
+
+def _report(args: argparse.Namespace) -> int:
+    import csv
+
+    from invoices import excel_reporter
+    from invoices.records import as_record
+    from invoices.utils import load_env_config
+
+    if args.csv:
+        csv_path = Path(args.csv)
+    else:
+        env = load_env_config()
+        csv_path = env.resolve("OUTPUT_DIR", "./output") / env.get("CSV_FILE", "invoices_extract.csv")
+    with csv_path.open(newline="", encoding="utf-8-sig") as f:
+        xlsx_path = excel_reporter.write_report_to_output(as_record(row) for row in csv.DictReader(f))
+    logging.info(f"Reporting Excel généré depuis {csv_path}: {xlsx_path}")
+    return 0
+
+def _send(args: argparse.Namespace) -> int:
+    from invoices import mail_sender
+
+    mail_sender.send_report(args.xlsx)
+    logging.info("Reporting envoyé par email.")
+    return 0
+
+def _run(args: argparse.Namespace) -> int:
+    from invoices import main as pipeline
+
+    argv = []
+    if args.workers is not None:
+        argv += ["--workers", args.workers]
+    if args.pipeline:
+        argv += ["--pipeline", args.pipeline]
+    pipeline.main(argv)
+    return 0
+
+
+def _parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="invoices", description="Pipeline factures: commandes unitaires ou run complet.")
+    sub = parser.add_subparsers(dest="command", required=True, metavar="commande")
+
+    p = sub.add_parser("extract", help="Extrait des PDF (fichiers ou dossiers) vers un CSV (stdout par défaut).")
+    p.add_argument("pdfs", nargs="+", metavar="pdf")
+    p.add_argument("-o", "--output", help="Fichier CSV à écrire (défaut: stdout)")
+    p.set_defaults(func=_extract)
+
+    p = sub.add_parser("report", help="Génère invoices_extract.xlsx (OUTPUT_DIR) depuis un CSV existant.")
+    p.add_argument("csv", nargs="?", help="CSV source (défaut: OUTPUT_DIR/CSV_FILE de env.json)")
+    p.set_defaults(func=_report)
+
+    p = sub.add_parser("send", help="Envoie le reporting Excel existant par email.")
+    p.add_argument("xlsx", nargs="?", help="Chemin de invoices_extract.xlsx (défaut: OUTPUT_DIR de env.json)")
+    p.set_defaults(func=_send)
+
+    # Mêmes options que run-invoices (invoices.main)
+    p = sub.add_parser("run", help="Pipeline complet : extraction, CSV, Excel, email.")
+    p.add_argument("-w", "--workers", help="Processus d'extraction en parallèle (entier, 0 ou 'auto').")
+    p.add_argument("--pipeline", choices=("sequential", "async"), help="Enchaînement des étapes.")
+    p.set_defaults(func=_run)
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = _parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s - %(message)s")
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
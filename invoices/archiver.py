@@ -0,0 +1,153 @@
+# invoices/archiver.py
+"""
+Archivage en tâche de fond des PDF traités en mémoire (pièces jointes IMAP) dans TRAITEMENT_DIR.
+
+Le PDF est extrait directement depuis la mémoire ; son écriture sur disque part dans un
+thread dédié, hors du chemin critique :
+  - submit() réserve tout de suite le nom définitif (création exclusive : deux pièces
+    jointes homonymes ne s'écrasent pas, "facture.pdf" puis "facture_1.pdf") et renvoie
+    le chemin, utilisable aussitôt comme identifiant du document (index des doublons) ;
+  - le thread écrit le contenu (fichier .part puis os.replace, jamais de PDF tronqué) ;
+  - la file est bornée : si le disque ne suit pas, submit() attend au lieu d'accumuler
+    les PDF en mémoire ;
+  - flush() attend que tout ce qui a été soumis soit écrit.
+
+Les PDF archivés par un run ne sont définitifs qu'après commit() (rapport écrit) : ils
+sont listés dans un journal (JOURNAL, dans le dossier d'archive). Run en échec : discard()
+les supprime ; run tué : recover() les supprime au run suivant. Le point de reprise IMAP
+n'ayant pas avancé, ces messages sont relus, et une archive non rapportée n'est jamais
+prise pour l'original d'un doublon (dedup_index).
+
+    with Archiver(trait_dir) as archiver:
+        dest = archiver.submit("facture.pdf", data)
+    archiver.commit()
+"""
+from __future__ import annotations
+
+import itertools
+import logging
+import os
+import queue
+import threading
+from pathlib import Path
+from typing import List, Optional
+
+from invoices import metrics
+
+DEFAULT_QUEUE_SIZE = 16
+
+# Marqueur de fin pour le thread d'écriture
+_STOP = None
+
+# Archives du run en cours, une par ligne, jusqu'à commit()
+JOURNAL = ".archive_pending"
+
+
+class Archiver:
+    def __init__(self, directory: str | Path, queue_size: int = DEFAULT_QUEUE_SIZE):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._queue: queue.Queue = queue.Queue(max(1, queue_size))
+        self._thread: Optional[threading.Thread] = None
+        self.journal = self.directory / JOURNAL
+        self.pending: List[Path] = []
+        self.written = 0
+        self.errors = 0
+
+    def _reserve(self, filename: str) -> Path:
+        name = Path(filename.replace("\\", "/")).name or "document.pdf"
+        stem, suffix = os.path.splitext(name)
+        for i in itertools.count():
+            dest = self.directory / (name if i == 0 else f"{stem}_{i}{suffix}")
+            try:
+                # Fichier vide en attendant l'écriture : le nom est pris, y compris pour un autre processus
+                with open(dest, "xb"):
+                    return dest
+            except FileExistsError:
+                continue
+
+    def submit(self, filename: str, data) -> Path:
+        """Programme l'écriture de data (bytes, memoryview) et renvoie le chemin d'archive."""
+        dest = self._reserve(filename)
+        self.pending.append(dest)
+        with open(self.journal, "a", encoding="utf-8") as f:
+            f.write(f"{dest}\n")
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="invoices-archiver", daemon=True)
+            self._thread.start()
+        self._queue.put((dest, data))
+        return dest
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            try:
+                if item is _STOP:
+                    return
+                dest, data = item
+                try:
+                    with metrics.timed("invoices_archive_seconds"):
+                        tmp = dest.with_name(dest.name + ".part")
+                        with open(tmp, "wb") as f:
+                            f.write(data)
+                        os.replace(tmp, dest)
+                    self.written += 1
+                except OSError as e:
+                    self.errors += 1
+                    metrics.inc("invoices_archive_errors_total")
+                    logging.error(f"Archivage impossible de {dest}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def flush(self) -> None:
+        """Attend que tous les PDF soumis soient écrits."""
+        self._queue.join()
+
+    def commit(self) -> None:
+        """Rapport écrit : les PDF archivés par ce run sont définitifs."""
+        self.flush()
+        self.pending.clear()
+        self.journal.unlink(missing_ok=True)
+
+    def discard(self) -> int:
+        """Run en échec : supprime les PDF archivés depuis le dernier commit(). Renvoie leur nombre."""
+        self.flush()
+        removed = _remove(self.pending)
+        self.pending.clear()
+        self.journal.unlink(missing_ok=True)
+        return removed
+
+    def recover(self) -> int:
+        """Supprime les archives laissées par un run tué avant commit(). Renvoie leur nombre."""
+        try:
+            lines = self.journal.read_text(encoding="utf-8").splitlines()
+        except FileNotFoundError:
+            return 0
+        removed = _remove(Path(line) for line in lines if line)
+        self.journal.unlink(missing_ok=True)
+        return removed
+
+    def close(self) -> None:
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self) -> "Archiver":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def _remove(paths) -> int:
+    # Archive, et .part d'une écriture interrompue
+    removed = 0
+    for path in paths:
+        path.with_name(path.name + ".part").unlink(missing_ok=True)
+        try:
+            path.unlink()
+            removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
@@ -0,0 +1,328 @@
+# invoices/async_pipeline.py
+"""
+Orchestrateur asyncio : téléchargement mail, extraction PDF et reporting se chevauchent.
+
+    [PDF déjà dans INPUT] ─┐
+                           ├─> paths (file bornée) ─> N extractions ─> rows (file bornée) ─> CSV + Excel
+    [IMAP, thread dédié] ──┘                          (executor)                            (thread dédié)
+
+- Les files sont bornées (queue_size) : un étage lent freine les précédents au lieu
+  d'accumuler les PDF ou les lignes en mémoire.
+- L'extraction (CPU) part dans un executor (pool de processus en général) ; au plus
+  `parse_concurrency` PDF y sont en vol. Un worker mort (crash natif, OOM) casse le pool :
+  avec rebuild, le pool est remplacé et les PDF en vol relancés un par un (seul celui qui
+  tue le worker est compté en échec) ; sans rebuild, le pipeline s'arrête.
+- Le téléchargement IMAP et l'écriture des rapports sont bloquants : chacun tourne dans
+  un thread et échange avec la boucle via les files.
+- Un PDF présent à la fois dans INPUT et dans le flux IMAP n'est extrait qu'une fois.
+- Le flux IMAP peut produire des chemins ou des PDF en mémoire (mail_handler.Attachment),
+  transmis tels quels à l'extraction.
+- Les lignes sont remises au rapport dans l'ordre d'arrivée des PDF (celui de pdf_paths,
+  puis du flux IMAP), comme en mode séquentiel, quel que soit l'ordre de fin d'extraction ;
+  une extraction ne démarre qu'avec au plus `parse_concurrency + queue_size` PDF d'avance
+  sur la prochaine ligne à remettre (mémoire bornée).
+
+Si l'extraction ou une source échoue, report() voit son itérable lever PipelineAborted
+au lieu de se terminer : il ne finalise rien. L'envoi du rapport reste à l'appelant
+(main), une fois le rapport complet.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+from concurrent.futures import Executor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator, Optional
+
+from invoices import metrics
+
+DEFAULT_QUEUE_SIZE = 16
+
+# Marqueur de fin de flux dans les files
+_DONE = object()
+# Attente max (s) d'un thread bloqué sur une file pleine avant de revérifier l'arrêt
+_POLL_SECONDS = 0.5
+
+
+def _await_from_thread(coro, loop: asyncio.AbstractEventLoop, stop: threading.Event) -> bool:
+    """Exécute coro dans la boucle depuis un thread et attend sa fin. False si le pipeline s'arrête."""
+    fut = asyncio.run_coroutine_threadsafe(coro, loop)
+    while True:
+        try:
+            fut.result(_POLL_SECONDS)
+            return True
+        except FutureTimeout:
+            if stop.is_set():
+                fut.cancel()
+                return False
+
+
+class PipelineAborted(RuntimeError):
+    """Levée dans le thread du rapport quand un étage amont a échoué : le rapport n'est pas finalisé."""
+
+
+class _Failed:
+    """Marqueur d'échec d'un étage amont, poussé dans la file des lignes à la place de _DONE."""
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def _iter_queue(queue: asyncio.Queue, loop: asyncio.AbstractEventLoop, stop: threading.Event) -> Iterator[Any]:
+    """
+    Itérateur bloquant (côté thread) sur une file asyncio, jusqu'au marqueur _DONE.
+    Lève PipelineAborted sur le marqueur _Failed ou si le pipeline s'arrête avant _DONE :
+    un flux incomplet ne doit jamais passer pour la fin normale des lignes.
+    """
+    while True:
+        fut = asyncio.run_coroutine_threadsafe(queue.get(), loop)
+        while True:
+            try:
+                item = fut.result(_POLL_SECONDS)
+                break
+            except FutureTimeout:
+                if stop.is_set():
+                    fut.cancel()
+                    raise PipelineAborted("pipeline interrompu avant la fin des lignes")
+        if item is _DONE:
+            return
+        if isinstance(item, _Failed):
+            raise PipelineAborted(f"étage amont en échec: {type(item.error).__name__}: {item.error}") from item.error
+        yield item
+
+
+class _Pipeline:
+    def __init__(
+        self,
+        extract: Callable[[Any], tuple],
+        report: Callable[[Iterable[dict]], Any],
+        executor: Optional[Executor],
+        parse_concurrency: int,
+        queue_size: int,
+        rebuild: Optional[Callable[[], Executor]] = None,
+    ):
+        self.extract = extract
+        self.report = report
+        self.executor = executor
+        self.rebuild = rebuild
+        self.parse_concurrency = max(1, parse_concurrency)
+        self.queue_size = max(1, queue_size)
+        self.window = self.parse_concurrency + self.queue_size
+        self.stop = threading.Event()
+        self.seen: set[str] = set()
+        self.stats = {"queued": 0, "extracted": 0, "failed": 0, "duplicates": 0, "downloaded": 0}
+        # Ordre des lignes : index d'arrivée du prochain PDF pris, de la prochaine ligne à remettre
+        self._taken = 0
+        self._next = 0
+        self._ready: dict[int, Any] = {}
+        # Extractions en vol dans l'executor ; une relance après casse du pool s'y exécute seule
+        self._running = 0
+        self._solo = False
+        self._solo_waiting = 0
+        self._generation = 0
+        self._order = asyncio.Condition()
+        self._slots = asyncio.Condition()
+
+    # ---------------------------
+    # Étage 1 : sources de PDF
+    # ---------------------------
+
+    async def _enqueue(self, paths: asyncio.Queue, pdf: Any) -> None:
+        # PDF en mémoire : nom d'archive unique, rien à dédoublonner par chemin
+        if isinstance(pdf, (str, Path)):
+            key = str(Path(pdf).resolve())
+            if key in self.seen:
+                return
+            self.seen.add(key)
+        self.stats["queued"] += 1
+        await paths.put(pdf)
+
+    async def _from_disk(self, paths: asyncio.Queue, pdf_paths: Iterable[Path]) -> None:
+        for pdf in pdf_paths:
+            await self._enqueue(paths, str(pdf))
+
+    def _download(self, paths: asyncio.Queue, loop: asyncio.AbstractEventLoop, fetch: Callable[[], Iterable[Any]]) -> None:
+        # Thread dédié : chaque PDF écrit est poussé dans la file sans attendre la fin de la boîte mail
+        for pdf in fetch():
+            self.stats["downloaded"] += 1
+            # File pleine -> le thread attend : la boîte mail n'est pas lue plus vite que l'extraction
+            if not _await_from_thread(self._enqueue(paths, pdf), loop, self.stop):
+                return
+
+    async def _sources(self, paths: asyncio.Queue, pdf_paths: Iterable[Path], fetch: Optional[Callable[[], Iterable[Any]]]) -> None:
+        jobs = [self._from_disk(paths, pdf_paths)]
+        if fetch is not None:
+            loop = asyncio.get_running_loop()
+            jobs.append(asyncio.to_thread(self._download, paths, loop, fetch))
+        for res in await asyncio.gather(*jobs, return_exceptions=True):
+            if isinstance(res, Exception):
+                # Échec IMAP : les PDF déjà reçus sont quand même traités
+                logging.error(f"Téléchargement des factures interrompu: {type(res).__name__}: {res}")
+        for _ in range(self.parse_concurrency):
+            await paths.put(_DONE)
+
+    # ---------------------------
+    # Étage 2 : extraction (executor)
+    # ---------------------------
+
+    async def _submit(self, pdf: Any, alone: bool = False) -> tuple:
+        """
+        extract(pdf) dans l'executor. alone=True : attend que rien d'autre n'y soit en vol et
+        bloque les autres pendant l'extraction. Sur BrokenProcessPool, le premier à voir la
+        casse d'un pool le remplace (rebuild) ; l'erreur est relevée.
+        """
+        async with self._slots:
+            if alone:
+                self._solo_waiting += 1
+                try:
+                    await self._slots.wait_for(lambda: not self._solo and self._running == 0)
+                finally:
+                    self._solo_waiting -= 1
+                self._solo = True
+            else:
+                await self._slots.wait_for(lambda: not self._solo and not self._solo_waiting)
+            self._running += 1
+            generation = self._generation
+        try:
+            if self.executor is None:
+                return await asyncio.get_running_loop().run_in_executor(None, self.extract, pdf)
+            fut = self.executor.submit(self.extract, pdf)
+            try:
+                return await asyncio.wrap_future(fut)
+            except asyncio.CancelledError:
+                # Tâche en vol annulée par le remplacement du pool cassé (pas par l'arrêt du pipeline)
+                if fut.cancelled() and generation != self._generation and not self.stop.is_set():
+                    raise BrokenProcessPool("pool remplacé pendant l'extraction") from None
+                raise
+        except BrokenProcessPool:
+            if self.rebuild is not None and generation == self._generation:
+                self.executor = self.rebuild()
+                self._generation += 1
+            raise
+        finally:
+            async with self._slots:
+                self._running -= 1
+                if alone:
+                    self._solo = False
+                self._slots.notify_all()
+
+    async def _extract_pdf(self, pdf: Any) -> tuple:
+        """(data, erreur) ; un worker mort ne fait échouer que le PDF qui le tue (pool remplacé)."""
+        try:
+            data, err, worker_metrics = await self._submit(pdf)
+        except BrokenProcessPool as e:
+            if self.rebuild is None:
+                raise
+            # Ce PDF, ou un autre en vol ? relancé seul dans le pool neuf
+            logging.warning(f"Pool d'extraction cassé ({e}) : {pdf} relancé seul")
+            try:
+                data, err, worker_metrics = await self._submit(pdf, alone=True)
+            except BrokenProcessPool as e:
+                metrics.inc("invoices_pdf_total", result="error")
+                return None, f"worker interrompu ({e})"
+        metrics.merge(worker_metrics)
+        return data, err
+
+    async def _emit(self, rows: asyncio.Queue, index: int, data: Any) -> None:
+        # Résultat du PDF n° index (None : pas de ligne) ; les lignes prêtes sont remises dans l'ordre
+        async with self._order:
+            self._ready[index] = data
+            while self._next in self._ready:
+                data = self._ready.pop(self._next)
+                self._next += 1
+                if data is not None:
+                    await rows.put(data)
+            self._order.notify_all()
+
+    async def _parse(self, paths: asyncio.Queue, rows: asyncio.Queue) -> None:
+        while True:
+            pdf = await paths.get()
+            if pdf is _DONE:
+                return
+            index = self._taken
+            self._taken += 1
+            async with self._order:
+                await self._order.wait_for(lambda: index < self._next + self.window)
+            logging.info(f"Extraction: {pdf}")
+            data, err = await self._extract_pdf(pdf)
+            if err:
+                self.stats["failed"] += 1
+                logging.error(f"Échec extraction {pdf}: {err}")
+                data = None
+            elif data is None:
+                self.stats["duplicates"] += 1  # doublon exact, non parsé
+            else:
+                self.stats["extracted"] += 1
+            await self._emit(rows, index, data)
+
+    async def _parsers(self, paths: asyncio.Queue, rows: asyncio.Queue) -> None:
+        await asyncio.gather(*(self._parse(paths, rows) for _ in range(self.parse_concurrency)))
+        await rows.put(_DONE)
+
+    # ---------------------------
+    # Orchestration
+    # ---------------------------
+
+    @staticmethod
+    def _abort(rows: asyncio.Queue, error: BaseException) -> None:
+        # Les lignes en attente ne seront pas rapportées : la place libérée reçoit le marqueur
+        # d'échec, et le rapport s'interrompt sans rien finaliser (Excel, registre, stockage)
+        while not rows.empty():
+            rows.get_nowait()
+        rows.put_nowait(_Failed(error))
+
+    async def run(self, pdf_paths: Iterable[Path], fetch: Optional[Callable[[], Iterable[Any]]]) -> Any:
+        loop = asyncio.get_running_loop()
+        paths: asyncio.Queue = asyncio.Queue(self.queue_size)
+        rows: asyncio.Queue = asyncio.Queue(self.queue_size)
+        upstream = [
+            asyncio.create_task(self._sources(paths, pdf_paths, fetch)),
+            asyncio.create_task(self._parsers(paths, rows)),
+        ]
+        # Étage 3 : le rapport consomme les lignes au fil de l'eau dans un thread
+        reporting = asyncio.create_task(asyncio.to_thread(self.report, _iter_queue(rows, loop, self.stop)))
+        tasks = upstream + [reporting]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            for task in tasks:
+                if task.done() and not task.cancelled() and task.exception() is not None:
+                    if task is not reporting:
+                        self._abort(rows, task.exception())
+                    raise task.exception()
+            return reporting.result()
+        finally:
+            # Sur erreur : débloque les threads en attente sur une file, puis annule les étages
+            self.stop.set()
+            for task in upstream:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def run_pipeline(
+    pdf_paths: Iterable[Path],
+    extract: Callable[[Any], tuple],
+    report: Callable[[Iterable[dict]], Any],
+    fetch: Optional[Callable[[], Iterable[Any]]] = None,
+    executor: Optional[Executor] = None,
+    parse_concurrency: int = 1,
+    queue_size: int = DEFAULT_QUEUE_SIZE,
+    rebuild: Optional[Callable[[], Executor]] = None,
+) -> tuple[Any, dict]:
+    """
+    Exécute le pipeline et renvoie (résultat de report, statistiques).
+      - pdf_paths : PDF déjà présents dans INPUT
+      - extract(pdf) -> (data, erreur, métriques du worker | None) : ne doit pas lever
+        (cf. main._extract_one), data None sans erreur = PDF ignoré (doublon) ;
+        picklable si executor est un pool de processus
+      - report(rows) : consomme l'itérable de lignes (CSV + Excel), appelé dans un thread
+      - fetch() : itérable des PDF téléchargés au fil de l'eau : chemins (ex. mail_handler.iter_invoices)
+        ou PDF en mémoire (mail_handler.iter_attachments)
+      - executor : None -> executor par défaut de la boucle (threads)
+      - rebuild() : remplace un executor cassé (BrokenProcessPool) et renvoie le nouveau
+        (ex. main._ExtractPool.rebuild) ; sans rebuild, un pool cassé arrête le pipeline
+    """
+    pipeline = _Pipeline(extract, report, executor, parse_concurrency, queue_size, rebuild)
+    result = asyncio.run(pipeline.run(pdf_paths, fetch))
+    return result, pipeline.stats
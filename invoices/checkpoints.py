@@ -0,0 +1,159 @@
+# invoices/checkpoints.py
+"""
+Points de reprise des étapes du pipeline (JSON), pour qu'un run relancé après un échec
+transitoire ne refasse que ce qui a échoué (voir main._configure_checkpoints).
+
+Pour chaque étape : empreinte de ses entrées (fingerprint), sorties produites
+(chemin -> taille, mtime_ns), état ("done" ou "failed") et informations libres :
+
+    {"report": {"inputs": "3f2a...", "status": "done", "outputs": {"csv": [...], "xlsx": [...]},
+                "info": {"rows": 120}, "at": "2025-01-31T08:00:00"},
+     "send":   {"inputs": "9c41...", "status": "failed", "error": "SMTPServerDisconnected: ...", "attempts": 4}}
+
+Les étapes ne sont reprises que si le run précédent ne s'est pas terminé (entrée "run" :
+"running" s'il a été interrompu, "failed" s'il a levé) : un run normal refait tout, même
+sur des entrées inchangées. Une étape est alors sautée si elle est "done" avec les mêmes
+entrées ET si ses sorties sont toujours là, inchangées ; sinon elle est refaite. Les sorties d'une étape entrent dans
+l'empreinte de la suivante (ex. contenu de l'Excel pour l'envoi) : refaire une étape
+invalide celles qui en dépendent.
+
+retry() : nouvelle tentative avec attente exponentielle (et gigue) pour les erreurs
+transitoires seulement.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, Mapping, Optional, TypeVar
+
+from invoices import metrics
+
+T = TypeVar("T")
+
+# Entrée du run lui-même (pas une étape) : "running" jusqu'à end_run(), puis "done" ou "failed"
+RUN = "run"
+
+
+def fingerprint(*parts: Any) -> str:
+    """Empreinte SHA-256 d'entrées sérialisables en JSON (clés triées : stable d'un run à l'autre)."""
+    data = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+def _stat(path: str | Path) -> Optional[list]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+
+class StageCheckpoints:
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            if isinstance(data, dict):
+                self.stages = data
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logging.warning(f"Points de reprise illisibles, ignorés ({self.path}): {e}")
+        # Run précédent en échec ou interrompu : seul cas où les étapes déjà faites sont reprises
+        self.resuming = self.stages.get(RUN, {}).get("status") in ("running", "failed")
+
+    def begin_run(self) -> None:
+        """Début du run, marqué "running" : un run tué avant end_run() sera repris au suivant."""
+        self._set(RUN, {"status": "running", "at": time.strftime("%Y-%m-%dT%H:%M:%S")})
+
+    def end_run(self, success: bool) -> None:
+        self._set(RUN, {"status": "done" if success else "failed", "at": time.strftime("%Y-%m-%dT%H:%M:%S")})
+
+    def completed(self, stage: str, inputs: str) -> Optional[Dict[str, Any]]:
+        """
+        Entrée de l'étape si le run reprend un run non terminé, qu'elle y a été faite pour ces
+        entrées et que ses sorties sont intactes (sinon None : l'étape est à refaire).
+        Journalise un échec précédent.
+        """
+        entry = self.stages.get(stage)
+        if entry is None or not self.resuming:
+            return None
+        if entry.get("status") == "failed":
+            logging.info(f"Reprise: étape {stage} en échec au run précédent ({entry.get('error')})")
+            return None
+        if entry.get("inputs") != inputs:
+            return None
+        for name, (path, stat) in entry.get("outputs", {}).items():
+            if _stat(path) != stat:
+                logging.info(f"Reprise: sortie {name} de l'étape {stage} absente ou modifiée ({path})")
+                return None
+        metrics.inc("invoices_stage_skipped_total", stage=stage)
+        return entry
+
+    def complete(self, stage: str, inputs: str, outputs: Optional[Mapping[str, str | Path]] = None, **info: Any) -> None:
+        """Étape réussie : entrées, sorties (relues sur disque) et informations, écrites aussitôt."""
+        self._set(stage, {
+            "inputs": inputs,
+            "status": "done",
+            "outputs": {name: [str(p), _stat(p)] for name, p in (outputs or {}).items()},
+            "info": info,
+            "at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        })
+
+    def fail(self, stage: str, inputs: str, error: BaseException, **info: Any) -> None:
+        self._set(stage, {
+            "inputs": inputs,
+            "status": "failed",
+            "error": f"{type(error).__name__}: {error}",
+            "info": info,
+            "at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        })
+
+    def _set(self, stage: str, entry: Dict[str, Any]) -> None:
+        with self._lock:
+            self.stages[stage] = entry
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            tmp.write_text(json.dumps(self.stages, indent=2, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp, self.path)
+
+
+# ---------------------------
+# Nouvelles tentatives
+# ---------------------------
+
+def retry(
+    fn: Callable[[], T],
+    stage: str,
+    attempts: int = 4,
+    delay: float = 2.0,
+    max_delay: float = 60.0,
+    transient: Callable[[BaseException], bool] = lambda e: True,
+    sleep: Callable[[float], None] = time.sleep,
+) -> T:
+    """
+    Appelle fn() jusqu'à `attempts` fois : attente delay, 2*delay, 4*delay... (plafonnée à
+    max_delay, gigue de +/-20 %) entre deux tentatives. Une erreur non transitoire, ou
+    la dernière, est relevée telle quelle ; l'attribut `attempts` y indique le nombre d'essais.
+    """
+    for attempt in range(1, max(attempts, 1) + 1):
+        try:
+            return fn()
+        except Exception as e:
+            if attempt >= attempts or not transient(e):
+                e.attempts = attempt
+                raise
+            wait = min(delay * 2 ** (attempt - 1), max_delay) * random.uniform(0.8, 1.2)
+            metrics.inc("invoices_stage_retries_total", stage=stage)
+            logging.warning(
+                f"Étape {stage}: échec transitoire ({type(e).__name__}: {e}), "
+                f"tentative {attempt + 1}/{attempts} dans {wait:.1f}s"
+            )
+            sleep(wait)
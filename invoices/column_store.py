@@ -0,0 +1,545 @@
+# invoices/column_store.py
+"""
+Stockage colonnaire local des factures extraites (ajout seul), pour les agrégats
+pluriannuels sans re-parser les PDF ni relire le reporting Excel.
+
+    store/
+      manifest.json          nb de lignes validées, colonnes, dictionnaires, historique des runs
+      total_cents.col        int64  (montant TTC en centimes, _NO_AMOUNT si absent)
+      jour.col               int32  (date.toordinal(), 0 si absente)
+      mois.col               int32  (aaaamm, 0 si date absente)
+      periode.col            uint32 (code dans manifest["dictionaries"]["periode"])
+      fournisseur.col        uint32 (code dans manifest["dictionaries"]["fournisseur"])
+      fichier.off / .dat     chaînes : fins cumulées (uint64) + texte UTF-8 concaténé
+      numero_facture.off / .dat
+      digest.off / .dat      empreinte du PDF (InvoiceRecord.digest, vide avant le format 2)
+
+      fichiers.sqlite        index des documents présents, (fichier, digest) (déduplication)
+
+Chaque run ajoute ses lignes en fin de fichiers au fil de l'eau (StoreAppender, tampon
+de _FLUSH_ROWS lignes) puis réécrit le manifeste (atomique) : le manifeste fait foi.
+Des octets au-delà de son nombre de lignes (run interrompu) sont tronqués à l'ouverture
+suivante. Un seul écrivain à la fois.
+
+Une facture déjà présente (même nom de fichier, même contenu) n'est pas ré-ajoutée :
+main relit tout INPUT_DIR à chaque run ; un PDF remplacé sous le même nom l'est. Les
+documents présents sont cherchés dans fichiers.sqlite (clé primaire) plutôt qu'en
+relisant les colonnes ; l'index est validé après le manifeste et reconstruit depuis les
+colonnes s'il ne compte pas le même nombre de lignes. Une ligne sans empreinte (format 1)
+prend celle du premier contenu ajouté sous son nom, comme dans report_ledger.
+Les agrégats du reporting (rollups.Rollups) sont mis à jour avec les seules lignes
+ajoutées et validés dans le même manifeste.
+
+Lecture par mmap (vues typées sans copie, démappées en sortie de bloc) ; avec NumPy,
+les group-by sont vectorisés (bincount), sinon une boucle Python sur les vues.
+
+    python -m invoices.column_store --by mois [--since 2023-01-01] [--until 2023-12-31]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import mmap
+import os
+import sqlite3
+import sys
+import time
+from array import array
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import date
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # dépendance optionnelle
+    np = None
+
+from invoices.records import UNKNOWN, InvoiceRecord, as_record
+from invoices.rollups import DIMENSIONS, GroupTotal, Rollups
+
+FORMAT_VERSION = 2
+# Format 1 : sans colonne digest (lue vide), mis à niveau au premier ajout
+_READABLE_VERSIONS = (1, FORMAT_VERSION)
+MANIFEST = "manifest.json"
+KEYS = "fichiers.sqlite"
+
+_NO_AMOUNT = -(2 ** 63)
+_FLUSH_ROWS = 4096
+
+# nom -> code array (tailles fixes : q=8, i=4, I=4 octets)
+_INT_COLUMNS = {
+    "total_cents": "q",
+    "jour": "i",
+    "mois": "i",
+    "periode": "I",
+    "fournisseur": "I",
+}
+_STR_COLUMNS = ("fichier", "numero_facture", "digest")
+_DICT_COLUMNS = ("periode", "fournisseur")
+_NUMPY_DTYPES = {"q": "=i8", "i": "=i4", "I": "=u4", "Q": "=u8"}  # ordre natif, cf. manifest["byteorder"]
+
+GROUP_KEYS = ("mois", "annee", "periode", "fournisseur")
+
+
+_KEYS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    fichier TEXT NOT NULL,
+    digest  TEXT NOT NULL,
+    PRIMARY KEY (fichier, digest)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+class StoreError(Exception):
+    """Stockage illisible (manifeste absent ou incompatible, colonne tronquée)."""
+
+
+def _write_atomic(path: Path, text: str) -> None:
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(text, encoding="utf-8")
+    os.replace(tmp, path)
+
+
+# ---------------------------
+# Lecture mmap
+# ---------------------------
+
+def _open_map(path: Path, typecode: str, count: int) -> Optional[mmap.mmap]:
+    size = count * array(typecode).itemsize
+    if count == 0 or not path.exists():
+        return None
+    with path.open("rb") as f:
+        actual = os.fstat(f.fileno()).st_size
+        if actual < size:
+            raise StoreError(f"Colonne tronquée: {path} ({actual} octets, {size} attendus)")
+        return mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+
+def _view(mm: Optional[mmap.mmap], typecode: str, count: int):
+    if np is not None:
+        return np.frombuffer(mm, _NUMPY_DTYPES[typecode], count) if mm is not None else np.zeros(0, _NUMPY_DTYPES[typecode])
+    return memoryview(mm).cast(typecode) if mm is not None else memoryview(array(typecode))
+
+@contextmanager
+def _mapped(columns: Sequence[Tuple[Path, str]], count: int) -> Iterator[list]:
+    """
+    Vues typées (memoryview, ou ndarray avec NumPy) sur les `count` premiers éléments de
+    chaque (fichier, typecode), valables dans le bloc seulement : la liste est vidée puis
+    les fichiers démappés en sortie (ne pas garder de référence aux vues au-delà).
+    StoreError si un fichier est plus court que `count` éléments.
+    """
+    maps: List[Optional[mmap.mmap]] = []
+    views: list = []
+    try:
+        for path, typecode in columns:
+            maps.append(_open_map(path, typecode, count))
+            views.append(_view(maps[-1], typecode, count))
+        yield views
+    finally:
+        for view in views:
+            if isinstance(view, memoryview):
+                view.release()
+        views.clear()
+        for mm in maps:
+            if mm is not None:
+                mm.close()
+
+
+class ColumnStore:
+    def __init__(self, directory: str | Path):
+        self.directory = Path(directory)
+        self.manifest = self._load_manifest()
+
+    # ---------------------------
+    # Manifeste
+    # ---------------------------
+
+    def _load_manifest(self) -> Dict[str, Any]:
+        path = self.directory / MANIFEST
+        if not path.exists():
+            return {
+                "version": FORMAT_VERSION,
+                "byteorder": sys.byteorder,
+                "rows": 0,
+                "string_bytes": {name: 0 for name in _STR_COLUMNS},
+                "dictionaries": {name: [""] for name in _DICT_COLUMNS},  # code 0 = absent
+                "runs": [],
+            }
+        manifest = json.loads(path.read_text(encoding="utf-8"))
+        if manifest.get("version") not in _READABLE_VERSIONS:
+            raise StoreError(f"Version de stockage non supportée: {manifest.get('version')} ({path})")
+        manifest["string_bytes"].setdefault("digest", 0)
+        if manifest.get("byteorder") != sys.byteorder:
+            raise StoreError(f"Stockage écrit en {manifest.get('byteorder')}-endian, illisible ici ({path})")
+        return manifest
+
+    def __len__(self) -> int:
+        return self.manifest["rows"]
+
+    def _file(self, name: str, suffix: str = ".col") -> Path:
+        return self.directory / f"{name}{suffix}"
+
+    # ---------------------------
+    # Écriture
+    # ---------------------------
+
+    def _truncate_uncommitted(self) -> None:
+        # Run précédent interrompu entre l'écriture des colonnes et celle du manifeste
+        rows = self.manifest["rows"]
+        sizes = {self._file(n): rows * array(t).itemsize for n, t in _INT_COLUMNS.items()}
+        for name in _STR_COLUMNS:
+            sizes[self._file(name, ".off")] = rows * array("Q").itemsize
+            sizes[self._file(name, ".dat")] = self.manifest["string_bytes"][name]
+        for path, size in sizes.items():
+            if path.exists() and path.stat().st_size > size:
+                with path.open("r+b") as f:
+                    f.truncate(size)
+        # Format 1 : empreintes vides pour les lignes déjà stockées
+        offsets = self._file("digest", ".off")
+        if rows and not offsets.exists():
+            offsets.write_bytes(bytes(sizes[offsets]))
+
+    def rollups(self) -> Rollups:
+        """Agrégats tenus à jour à chaque ajout (reconstruits une fois pour un stockage antérieur)."""
+        if "rollups" in self.manifest or not len(self):
+            return Rollups.from_json(self.manifest.get("rollups"))
+        return Rollups({dim: {k: list(t) for k, t in self.group_sum(dim).items()} for dim in DIMENSIONS})
+
+    def fichiers(self) -> set:
+        return set(self.strings("fichier"))
+
+    def appender(self, run_id: Optional[str] = None) -> "StoreAppender":
+        """Ajout en flux (voir StoreAppender), à utiliser en bloc with."""
+        return StoreAppender(self, run_id)
+
+    def append(self, records: Iterable[InvoiceRecord], run_id: Optional[str] = None) -> int:
+        """Ajoute les enregistrements (hors documents déjà présents). Retourne le nb de lignes ajoutées."""
+        with self.appender(run_id) as appender:
+            for rec in records:
+                appender.add(rec)
+            return appender.commit()
+
+    def _open_keys(self) -> sqlite3.Connection:
+        """
+        Index des documents (fichiers.sqlite), aligné sur le manifeste : reconstruit depuis
+        les colonnes fichier et digest s'il n'a pas le même nombre de lignes (stockage
+        antérieur à l'index, run interrompu entre le manifeste et l'index) ou s'il est
+        encore indexé par nom seul (table fichiers).
+        """
+        db = sqlite3.connect(str(self.directory / KEYS), isolation_level=None)
+        try:
+            db.executescript(_KEYS_SCHEMA)
+            row = db.execute("SELECT value FROM meta WHERE key = 'rows'").fetchone()
+            by_name = db.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'fichiers'").fetchone()
+            if by_name or (row[0] if row is not None else 0) != len(self):
+                with db:
+                    db.execute("BEGIN IMMEDIATE")
+                    db.execute("DROP TABLE IF EXISTS fichiers")
+                    db.execute("DELETE FROM documents")
+                    db.executemany(
+                        "INSERT OR IGNORE INTO documents(fichier, digest) VALUES (?, ?)",
+                        zip(self.strings("fichier"), self.strings("digest")),
+                    )
+                    self._set_key_rows(db, len(self))
+        except BaseException:
+            db.close()
+            raise
+        return db
+
+    @staticmethod
+    def _set_key_rows(db: sqlite3.Connection, rows: int) -> None:
+        db.execute("INSERT OR REPLACE INTO meta(key, value) VALUES ('rows', ?)", (rows,))
+
+    @staticmethod
+    def _new_buffers() -> Dict[str, Any]:
+        buffers: Dict[str, Any] = {name: array(t) for name, t in _INT_COLUMNS.items()}
+        for name in _STR_COLUMNS:
+            buffers[f"{name}.off"] = array("Q")
+            buffers[f"{name}.dat"] = []
+        return buffers
+
+    @staticmethod
+    def _flush(buffers: Dict[str, Any], handles: Dict[str, Any]) -> None:
+        for key, buf in buffers.items():
+            if key.endswith(".dat"):
+                handles[key].write(b"".join(buf))
+            else:
+                buf.tofile(handles[key])
+            handles[key].flush()
+
+    # ---------------------------
+    # Lecture
+    # ---------------------------
+
+    @contextmanager
+    def columns(self, *names: str) -> Iterator[list]:
+        """
+        Colonnes entières typées (ndarray avec NumPy, memoryview sinon), sans copie :
+            with store.columns("mois", "total_cents") as (mois, cents): ...
+        Valables dans le bloc seulement (démappées en sortie).
+        """
+        for name in names:
+            if name not in _INT_COLUMNS:
+                raise KeyError(f"Colonne inconnue: {name} ({', '.join(_INT_COLUMNS)})")
+        with _mapped([(self._file(name), _INT_COLUMNS[name]) for name in names], len(self)) as views:
+            yield views
+
+    def strings(self, name: str) -> List[str]:
+        if name not in _STR_COLUMNS:
+            raise KeyError(f"Colonne texte inconnue: {name} ({', '.join(_STR_COLUMNS)})")
+        rows = len(self)
+        if not rows:
+            return []
+        size = self.manifest["string_bytes"][name]
+        if name == "digest" and not self._file(name, ".off").exists():
+            return [""] * rows  # format 1 pas encore mis à niveau
+        data = self._file(name, ".dat").read_bytes()[:size] if size else b""
+        if len(data) < size:
+            raise StoreError(f"Colonne tronquée: {self._file(name, '.dat')} ({len(data)} octets, {size} attendus)")
+        with _mapped([(self._file(name, ".off"), "Q")], rows) as views:
+            ends = views[0].tolist()
+        out, start = [], 0
+        for end in ends:
+            out.append(data[start:end].decode("utf-8"))
+            start = end
+        return out
+
+    def group_sum(self, by: str = "mois", since: Optional[date] = None, until: Optional[date] = None) -> Dict[Any, GroupTotal]:
+        """
+        Totaux par groupe : by = mois ("2023-04"), annee (2023), periode ou fournisseur.
+        since/until : bornes incluses sur la date de facture (lignes sans date exclues).
+        """
+        if by not in GROUP_KEYS:
+            raise ValueError(f"Regroupement inconnu: {by} ({', '.join(GROUP_KEYS)})")
+        if not len(self):
+            return {}
+        names = ["mois" if by == "annee" else by, "total_cents"]
+        if since or until:
+            names.append("jour")
+        lo = since.toordinal() if since else 1
+        hi = until.toordinal() if until else date.max.toordinal()
+        group = self._group_numpy if np is not None else self._group_python
+        with self.columns(*names) as cols:
+            totals = group(cols[0], cols[1], cols[2] if len(cols) > 2 else None, lo, hi, by == "annee")
+        return {self._label(by, k): v for k, v in sorted(totals.items())}
+
+    @staticmethod
+    def _group_numpy(keys, cents, days, lo: int, hi: int, yearly: bool) -> Dict[int, GroupTotal]:
+        if days is not None:
+            keep = (days >= lo) & (days <= hi)
+            keys, cents = keys[keep], cents[keep]
+        if yearly:
+            keys = keys // 100
+        uniq, inverse = np.unique(keys, return_inverse=True)
+        known = cents != _NO_AMOUNT
+        counts = np.bincount(inverse, minlength=len(uniq))
+        missing = np.bincount(inverse[~known], minlength=len(uniq))
+        # Sommes entières exactes (pas de poids flottants) : add.at sur int64
+        sums = np.zeros(len(uniq), np.int64)
+        np.add.at(sums, inverse[known], cents[known])
+        return {
+            int(k): GroupTotal(int(c), int(s), int(m))
+            for k, c, s, m in zip(uniq.tolist(), counts.tolist(), sums.tolist(), missing.tolist())
+        }
+
+    @staticmethod
+    def _group_python(keys, cents, days, lo: int, hi: int, yearly: bool) -> Dict[int, GroupTotal]:
+        counts: Dict[int, int] = defaultdict(int)
+        sums: Dict[int, int] = defaultdict(int)
+        missing: Dict[int, int] = defaultdict(int)
+        rows = zip(keys, cents) if days is None else (
+            (k, c) for k, c, d in zip(keys, cents, days) if lo <= d <= hi
+        )
+        for key, amount in rows:
+            if yearly:
+                key //= 100
+            counts[key] += 1
+            if amount == _NO_AMOUNT:
+                missing[key] += 1
+            else:
+                sums[key] += amount
+        return {k: GroupTotal(counts[k], sums[k], missing[k]) for k in counts}
+
+    def _label(self, by: str, key: int) -> Any:
+        if by in _DICT_COLUMNS:
+            return self.manifest["dictionaries"][by][key] or UNKNOWN
+        if by == "mois":
+            return f"{key // 100:04d}-{key % 100:02d}" if key else UNKNOWN
+        return key or UNKNOWN
+
+
+class StoreAppender:
+    """
+    Ajout en flux au stockage : add() écrit chaque ligne en fin de colonnes (tampon de
+    _FLUSH_ROWS lignes), commit() valide manifeste et agrégats puis l'index des fichiers.
+    Sans commit, la sortie du bloc with abandonne l'ajout : rien n'est validé, les octets
+    écrits sont tronqués à l'ouverture suivante. La mémoire ne dépend pas du nombre de
+    lignes ajoutées (hors dictionnaires periode / fournisseur).
+    """
+
+    def __init__(self, store: ColumnStore, run_id: Optional[str] = None):
+        self.store = store
+        self.run_id = run_id
+        self.added = 0
+        store.directory.mkdir(parents=True, exist_ok=True)
+        store._truncate_uncommitted()
+        self.rollups = store.rollups()
+        self._dictionaries = {
+            name: {v: i for i, v in enumerate(store.manifest["dictionaries"][name])} for name in _DICT_COLUMNS
+        }
+        self._string_bytes = dict(store.manifest["string_bytes"])
+        self._handles: Dict[str, Any] = {}
+        try:
+            self._keys = store._open_keys()
+        except sqlite3.Error as e:
+            raise StoreError(f"Index des fichiers illisible ({store.directory / KEYS}): {e}")
+        try:
+            self._keys.execute("BEGIN IMMEDIATE")
+            for name in _INT_COLUMNS:
+                self._handles[name] = store._file(name).open("ab")
+            for name in _STR_COLUMNS:
+                self._handles[f"{name}.off"] = store._file(name, ".off").open("ab")
+                self._handles[f"{name}.dat"] = store._file(name, ".dat").open("ab")
+        except sqlite3.Error as e:
+            self.close()
+            raise StoreError(f"Index des fichiers: {e}")
+        except BaseException:
+            self.close()
+            raise
+        self._buffers = store._new_buffers()
+
+    @property
+    def closed(self) -> bool:
+        return self._keys is None
+
+    def __enter__(self) -> "StoreAppender":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def add(self, rec: InvoiceRecord | Dict[str, Any]) -> bool:
+        """Ajoute la ligne, sauf si ce document (même fichier, même contenu) est déjà stocké (False)."""
+        rec = as_record(rec)
+        if self.closed:
+            raise StoreError("Ajout au stockage déjà validé ou abandonné")
+        try:
+            # Ligne sans empreinte (format 1) : ce contenu est le sien
+            if rec.digest and self._keys.execute(
+                "UPDATE OR IGNORE documents SET digest = ? WHERE fichier = ? AND digest = ''", (rec.digest, rec.fichier)
+            ).rowcount:
+                return False
+            if self._keys.execute(
+                "INSERT OR IGNORE INTO documents(fichier, digest) VALUES (?, ?)", (rec.fichier, rec.digest)
+            ).rowcount == 0:
+                return False
+        except sqlite3.Error as e:
+            raise StoreError(f"Index des fichiers: {e}")
+        self.rollups.add(rec)
+        buffers = self._buffers
+        d = rec.date_facture
+        buffers["total_cents"].append(rec.total_cents if rec.total_cents is not None else _NO_AMOUNT)
+        buffers["jour"].append(d.toordinal() if d else 0)
+        buffers["mois"].append(d.year * 100 + d.month if d else 0)
+        for name, value in (("periode", rec.periode), ("fournisseur", rec.fournisseur)):
+            codes = self._dictionaries[name]
+            if value not in codes:
+                codes[value] = len(codes)
+            buffers[name].append(codes[value])
+        for name, value in (("fichier", rec.fichier), ("numero_facture", rec.numero_facture or ""), ("digest", rec.digest)):
+            raw = value.encode("utf-8")
+            self._string_bytes[name] += len(raw)
+            buffers[f"{name}.dat"].append(raw)
+            buffers[f"{name}.off"].append(self._string_bytes[name])
+        self.added += 1
+        if self.added % _FLUSH_ROWS == 0:
+            self.store._flush(buffers, self._handles)
+            self._buffers = self.store._new_buffers()
+        return True
+
+    def commit(self) -> int:
+        """Valide les lignes ajoutées (manifeste, puis index). Retourne leur nombre."""
+        store = self.store
+        if self.closed:
+            raise StoreError("Ajout au stockage déjà validé ou abandonné")
+        store._flush(self._buffers, self._handles)
+        self._close_handles()
+        if self.added:
+            # Validation : le manifeste ne référence les nouvelles lignes qu'une fois tout écrit
+            manifest = dict(store.manifest)
+            manifest["version"] = FORMAT_VERSION
+            manifest["rows"] += self.added
+            manifest["string_bytes"] = self._string_bytes
+            manifest["dictionaries"] = {
+                name: sorted(codes, key=codes.get) for name, codes in self._dictionaries.items()
+            }
+            manifest["rollups"] = self.rollups.to_json()
+            manifest["runs"] = manifest["runs"] + [{
+                "run": self.run_id or time.strftime("%Y%m%dT%H%M%S"),
+                "rows": self.added,
+                "appended_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            }]
+            _write_atomic(store.directory / MANIFEST, json.dumps(manifest, indent=2, ensure_ascii=False))
+            store.manifest = manifest
+        try:
+            if self.added:
+                store._set_key_rows(self._keys, len(store))
+            self._keys.execute("COMMIT")
+        except sqlite3.Error as e:
+            # Manifeste déjà validé : l'index sera reconstruit à l'ouverture suivante
+            raise StoreError(f"Index des fichiers non validé: {e}")
+        finally:
+            self.close()
+        return self.added
+
+    def _close_handles(self) -> None:
+        for f in self._handles.values():
+            f.close()
+        self._handles = {}
+
+    def close(self) -> None:
+        """Abandonne un ajout non validé (sans effet après commit)."""
+        self._close_handles()
+        if self._keys is not None:
+            try:
+                if self._keys.in_transaction:
+                    self._keys.execute("ROLLBACK")
+            finally:
+                self._keys.close()
+                self._keys = None
+
+
+# ---------------------------
+# CLI : agrégats
+# ---------------------------
+
+def main(argv: list[str] | None = None) -> int:
+    from invoices.utils import load_env_config
+
+    parser = argparse.ArgumentParser(description="Totaux des factures depuis le stockage colonnaire.")
+    parser.add_argument("--by", choices=GROUP_KEYS, default="mois")
+    parser.add_argument("--since", type=date.fromisoformat, help="Date de facture min. (AAAA-MM-JJ)")
+    parser.add_argument("--until", type=date.fromisoformat, help="Date de facture max. (AAAA-MM-JJ)")
+    parser.add_argument("--dir", help="Dossier du stockage (défaut: COLUMN_STORE_DIR de env.json)")
+    args = parser.parse_args(argv)
+
+    directory = Path(args.dir) if args.dir else load_env_config().resolve("COLUMN_STORE_DIR", "./output/store")
+    store = ColumnStore(directory)
+    t0 = time.perf_counter()
+    totals = store.group_sum(args.by, args.since, args.until)
+    elapsed = time.perf_counter() - t0
+
+    print(f"{args.by:<20} {'factures':>9} {'total TTC':>14} {'sans montant':>13}")
+    for key, t in totals.items():
+        print(f"{str(key):<20} {t.count:>9} {t.total_cents / 100:>14,.2f} {t.missing:>13}")
+    print(f"{len(store)} ligne(s) dans {directory}, agrégées en {elapsed * 1000:.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
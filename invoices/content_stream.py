@@ -0,0 +1,408 @@
+# invoices/content_stream.py
+"""
+Extraction rapide du texte d'une page PDF, directement depuis ses flux de contenu.
+
+PyPDF2 (PageObject.extract_text) analyse tout le flux avec son lecteur d'objets générique,
+qui représente l'essentiel du temps d'extraction. Ici :
+  - le flux décompressé est découpé par une seule regex (nombres, chaînes, noms, tableaux,
+    opérateurs) ; seuls les opérateurs de texte et d'état graphique sont interprétés
+    (BT/ET, q/Q, cm, Tf, Td/TD/Tm/T*, Tj/TJ/'/", Tz/Tw/TL, Do pour les formulaires XObject)
+  - le décodage des chaînes reprend les tables de PyPDF2 (Encoding, Differences, ToUnicode,
+    largeur de l'espace : PyPDF2._cmap.build_char_map), mises en cache par police et par document
+  - les sauts de ligne et espaces suivent les mêmes règles que PyPDF2 3.x : le texte obtenu
+    est identique, donc les champs extraits aussi
+
+Hors périmètre (écriture de droite à gauche, syntaxe non reconnue, police introuvable...),
+page_text lève Unsupported et l'appelant repasse par PyPDF2 pour la page.
+"""
+from __future__ import annotations
+
+import math
+import re
+import weakref
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+try:  # tables de décodage des polices de PyPDF2 (module interne)
+    from PyPDF2._cmap import build_char_map, unknown_char_map
+    HAVE_CHAR_MAP = True
+except ImportError:  # pragma: no cover - autre version de PyPDF2
+    HAVE_CHAR_MAP = False
+
+# Largeur d'espace par défaut passée à build_char_map (valeur de PageObject.extract_text)
+_SPACE_WIDTH = 200.0
+
+
+class Unsupported(Exception):
+    """Page hors du périmètre du décodeur : l'appelant repasse par PyPDF2."""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+# ---------------------------
+# Découpage du flux
+# ---------------------------
+
+_WS = rb"\x00\t\n\f\r "
+_DELIMS = _WS + rb"/\[\]()<>{}%"
+_TOKEN = re.compile(
+    rb"[" + _WS + rb"]*(?:"
+    rb"\((?P<str>(?:[^()\\]|\\.)*)\)"                       # chaîne littérale sans parenthèses imbriquées
+    rb"|(?P<nested>\()"                                     # chaîne avec parenthèses imbriquées
+    rb"|(?P<dict><<|>>)"
+    rb"|<(?P<hex>[0-9A-Fa-f" + _WS + rb"]*)>"
+    rb"|(?P<num>[+-]?(?:\d+\.?\d*|\.\d+))"
+    rb"|/(?P<name>[^" + _DELIMS + rb"]*)"
+    rb"|(?P<open>\[)"
+    rb"|(?P<close>\])"
+    rb"|(?P<comment>%[^\r\n]*)"
+    rb"|(?P<op>[A-Za-z'\"][^" + _DELIMS + rb"]*)"
+    rb"|(?P<bad>[^" + _WS + rb"]))",
+    re.S,
+)
+# Numéro de groupe de chaque type de lexème (m.lastindex)
+_STR, _NESTED, _DICT, _HEX, _NUM, _NAME, _OPEN, _CLOSE, _COMMENT, _OP, _BAD = (
+    _TOKEN.groupindex[k] for k in ("str", "nested", "dict", "hex", "num", "name", "open", "close", "comment", "op", "bad")
+)
+# Fin d'une image en ligne (BI ... ID <données> EI)
+_END_INLINE_IMAGE = re.compile(rb"[" + _WS + rb"]EI(?=[" + _WS + rb"]|\Z)")
+_HEX_WS = re.compile(rb"[" + _WS + rb"]")
+_ESCAPE = re.compile(rb"\\(?:([0-7]{1,3})|(\r\n?|\n\r?)|(.))", re.S)
+_ESCAPES = {b"n": b"\n", b"r": b"\r", b"t": b"\t", b"b": b"\b", b"f": b"\f", b"c": b"\\c"}
+_NAME_HEX = re.compile(rb"#([0-9A-Fa-f]{2})")
+_KEYWORDS = (b"true", b"false", b"null")
+
+# Caractères écrits de droite à gauche : PyPDF2 les réordonne, on lui laisse la page
+_RTL = re.compile("[\u0590-\u08ff\ufb1d-\ufdff\ufe70-\ufeff]")
+
+
+def _unescape_one(m: re.Match) -> bytes:
+    if m.group(1):
+        return bytes((int(m.group(1), 8) & 0xFF,))
+    if m.group(2):
+        return b""  # fin de ligne échappée : ignorée
+    return _ESCAPES.get(m.group(3), m.group(3))
+
+def _unescape(raw: bytes) -> bytes:
+    return _ESCAPE.sub(_unescape_one, raw) if b"\\" in raw else raw
+
+def _nested_string(data: bytes, start: int) -> Tuple[bytes, int]:
+    """Chaîne littérale avec parenthèses imbriquées commençant à data[start] == "(" ; renvoie (octets, fin)."""
+    depth, i, end = 0, start, len(data)
+    while i < end:
+        c = data[i]
+        if c == 0x5C:  # "\" : le caractère suivant est échappé
+            i += 2
+            continue
+        if c == 0x28:
+            depth += 1
+        elif c == 0x29:
+            depth -= 1
+            if depth == 0:
+                return _unescape(data[start + 1:i]), i + 1
+        i += 1
+    raise Unsupported("syntax")
+
+def _name(raw: bytes) -> str:
+    if b"#" in raw:
+        raw = _NAME_HEX.sub(lambda m: bytes((int(m.group(1), 16),)), raw)
+    try:
+        return "/" + raw.decode("utf-8")
+    except UnicodeDecodeError:
+        return "/" + raw.decode("latin-1")
+
+def iter_operations(data: bytes) -> Iterator[Tuple[List[Any], bytes]]:
+    """
+    (opérandes, opérateur) du flux, comme ContentStream.operations de PyPDF2 : nombres en
+    float, chaînes en bytes, noms en str ("/F1"), tableaux en list. Les dictionnaires
+    (marques BDC) et images en ligne sont sautés.
+    """
+    operands: List[Any] = []
+    arrays: List[List[Any]] = []
+    target = operands
+    pos = 0
+    while pos is not None:
+        resume = None
+        for m in _TOKEN.finditer(data, pos):
+            kind = m.lastindex
+            if kind == _NUM:
+                target.append(float(m.group(kind)))
+            elif kind == _STR:
+                target.append(_unescape(m.group(kind)))
+            elif kind == _OP:
+                op = m.group(kind)
+                if op in _KEYWORDS:
+                    target.append(None)
+                    continue
+                if arrays:
+                    raise Unsupported("syntax")
+                if op == b"ID":
+                    # Données binaires de l'image : on reprend après EI
+                    end = _END_INLINE_IMAGE.search(data, m.end() + 1)
+                    if end is None:
+                        raise Unsupported("inline_image")
+                    operands = target = []
+                    resume = end.end()
+                    break
+                yield operands, op
+                operands = target = []
+            elif kind == _NAME:
+                target.append(_name(m.group(kind)))
+            elif kind == _OPEN:
+                arrays.append([])
+                target = arrays[-1]
+            elif kind == _CLOSE:
+                if not arrays:
+                    raise Unsupported("syntax")
+                done = arrays.pop()
+                target = arrays[-1] if arrays else operands
+                target.append(done)
+            elif kind == _HEX:
+                digits = _HEX_WS.sub(b"", m.group(kind))
+                if len(digits) % 2:
+                    digits += b"0"
+                target.append(bytes.fromhex(digits.decode("ascii")))
+            elif kind == _NESTED:
+                value, resume = _nested_string(data, m.start(kind))
+                target.append(value)
+                break
+            elif kind == _BAD:
+                raise Unsupported("syntax")
+            # dict / comment : rien à retenir
+        pos = resume
+
+
+# ---------------------------
+# Interprétation (règles de PageObject._extract_text, PyPDF2 3.x)
+# ---------------------------
+
+# Tables de décodage par document : {id de la police: build_char_map(...)}
+_CHAR_MAPS: "weakref.WeakKeyDictionary[Any, Dict[Any, tuple]]" = weakref.WeakKeyDictionary()
+
+def _mult(m: List[float], n: List[float]) -> List[float]:
+    return [
+        m[0] * n[0] + m[1] * n[2],
+        m[0] * n[1] + m[1] * n[3],
+        m[2] * n[0] + m[3] * n[2],
+        m[2] * n[1] + m[3] * n[3],
+        m[4] * n[0] + m[5] * n[2] + n[4],
+        m[4] * n[1] + m[5] * n[3] + n[5],
+    ]
+
+def _orient(m: List[float]) -> int:
+    if m[3] > 1e-6:
+        return 0
+    if m[3] < -1e-6:
+        return 180
+    return 90 if m[1] > 0 else 270
+
+def _resources(obj: Any) -> Optional[Any]:
+    """/Resources de l'objet ou hérité d'un parent (None : aucun texte possible)."""
+    try:
+        while "/Resources" not in obj:
+            obj = obj["/Parent"].get_object()
+        return obj["/Resources"]
+    except Exception:
+        return None
+
+def _char_map(obj: Any, resources: Any, font: str, doc_maps: Optional[Dict[Any, tuple]]) -> tuple:
+    """(encodage, table ToUnicode, largeur d'espace / 2) de la police, comme PyPDF2."""
+    try:
+        fonts = resources["/Font"] if "/Font" in resources else {}
+        if font not in fonts:
+            # Police absente des ressources : mêmes valeurs que PyPDF2 (caractères "�")
+            return unknown_char_map[2], unknown_char_map[3], unknown_char_map[1]
+        ref = fonts.raw_get(font)
+    except Exception:
+        raise Unsupported("font")
+    key = (ref.idnum, ref.generation) if hasattr(ref, "idnum") else None
+    if key is not None and doc_maps is not None and key in doc_maps:
+        return doc_maps[key]
+    try:
+        _, half_space, encoding, mapping, _ = build_char_map(font, _SPACE_WIDTH, obj)
+    except Exception:
+        raise Unsupported("font")
+    entry = (encoding, mapping, half_space)
+    if key is not None and doc_maps is not None:
+        doc_maps[key] = entry
+    return entry
+
+def _decode(raw: bytes, encoding: Any, mapping: Dict[Any, str]) -> str:
+    if isinstance(encoding, str):
+        try:
+            t = raw.decode(encoding, "surrogatepass")
+        except Exception:
+            t = raw.decode("utf-16-be" if encoding == "charmap" else "charmap", "surrogatepass")
+    else:
+        t = "".join([encoding[x] if x in encoding else bytes((x,)).decode() for x in raw])
+    if mapping:
+        t = "".join([mapping[c] if c in mapping else c for c in t])
+    if _RTL.search(t):
+        raise Unsupported("rtl")
+    return t
+
+def _stream_data(obj: Any, content_key: Optional[str]) -> Optional[bytes]:
+    if content_key is None:
+        return obj.get_data()
+    if content_key not in obj:
+        return None
+    contents = obj[content_key].get_object()
+    if isinstance(contents, list):
+        # Flux multiples concaténés, séparés par une fin de ligne (comme ContentStream)
+        data = b""
+        for part in contents:
+            data += part.get_object().get_data()
+            if not data or data[-1:] != b"\n":
+                data += b"\n"
+        return data
+    return contents.get_data()
+
+def _extract(obj: Any, content_key: Optional[str], doc_maps: Optional[Dict[Any, tuple]]) -> str:
+    resources = _resources(obj)
+    if resources is None:
+        return ""
+    data = _stream_data(obj, content_key)
+    if data is None:
+        return ""
+
+    output = ""
+    text = ""
+    cm_matrix = [1.0, 0.0, 0.0, 1.0, 0.0, 0.0]
+    cm_stack: List[tuple] = []
+    tm_matrix = [1.0, 0.0, 0.0, 1.0, 0.0, 0.0]
+    tm_prev = [1.0, 0.0, 0.0, 1.0, 0.0, 0.0]
+    encoding: Any = "charmap"
+    mapping: Dict[Any, str] = {}
+    space_width = 500.0  # fixé au premier Tf
+    char_scale = space_scale = 1.0
+    TL = 0.0
+    font_size = 12.0
+    fonts: Dict[str, tuple] = {}
+
+    def show(raw: Any) -> None:
+        nonlocal text
+        text += raw if isinstance(raw, str) else _decode(raw, encoding, mapping)
+
+    def crlf_space() -> None:
+        # Saut de ligne / espace selon le déplacement depuis la dernière position (PyPDF2)
+        nonlocal output, text, tm_prev
+        m = _mult(tm_matrix, cm_matrix)
+        orientation = _orient(m)
+        delta_x = m[4] - tm_prev[4]
+        delta_y = m[5] - tm_prev[5]
+        f = font_size * math.sqrt(abs(m[0] * m[3]) + abs(m[1] * m[2]))
+        tm_prev = m
+        if orientation == 0:
+            new_line, along, across = delta_y < -0.8 * f, delta_y, delta_x
+        elif orientation == 180:
+            new_line, along, across = delta_y > 0.8 * f, delta_y, delta_x
+        elif orientation == 90:
+            new_line, along, across = delta_x > 0.8 * f, delta_x, delta_y
+        else:
+            new_line, along, across = delta_x < -0.8 * f, delta_x, delta_y
+        last = text[-1:] or output[-1:]
+        if not last:
+            return
+        if new_line:
+            if last != "\n":
+                output += text + "\n"
+                text = ""
+        elif abs(along) < f * 0.3 and abs(across) > space_width / 1000.0 * f * 15:
+            if last != " ":
+                text += " "
+
+    for operands, op in iter_operations(data):
+        if op == b"TJ":
+            for item in operands[0] if operands and isinstance(operands[0], list) else ():
+                if isinstance(item, (bytes, str)):
+                    show(item)
+                    crlf_space()
+                elif isinstance(item, float) and abs(item) >= space_width and text and text[-1] != " ":
+                    show(" ")
+                    crlf_space()
+        elif op == b"Tj":
+            if operands:
+                show(operands[0])
+            crlf_space()
+        elif op == b"Td" or op == b"TD":
+            if op == b"TD":
+                TL = -operands[1]
+            tx, ty = operands[0], operands[1]
+            tm_matrix[4] += tx * tm_matrix[0] + ty * tm_matrix[2]
+            tm_matrix[5] += tx * tm_matrix[1] + ty * tm_matrix[3]
+            crlf_space()
+        elif op == b"Tm":
+            tm_matrix = [float(v) for v in operands[:6]]
+            crlf_space()
+        elif op == b"Tf":
+            output += text
+            text = ""
+            name = operands[0]
+            if name not in fonts:
+                fonts[name] = _char_map(obj, resources, name, doc_maps)
+            encoding, mapping, space_width = fonts[name]
+            try:
+                font_size = float(operands[1])
+            except Exception:
+                pass
+        elif op == b"BT":
+            tm_matrix = [1.0, 0.0, 0.0, 1.0, 0.0, 0.0]
+            output += text
+            text = ""
+        elif op == b"ET":
+            output += text
+            text = ""
+        elif op == b"T*" or op == b"'" or op == b'"':
+            tm_matrix[5] -= TL
+            crlf_space()
+            if op != b"T*":
+                if op == b'"':
+                    space_scale = 1.0 + operands[0]
+                if operands:
+                    show(operands[-1])
+                crlf_space()
+        elif op == b"q":
+            cm_stack.append((cm_matrix, encoding, mapping, font_size, char_scale, space_scale, space_width, TL))
+        elif op == b"Q":
+            try:
+                cm_matrix, encoding, mapping, font_size, char_scale, space_scale, space_width, TL = cm_stack.pop()
+            except IndexError:
+                cm_matrix = [1.0, 0.0, 0.0, 1.0, 0.0, 0.0]
+        elif op == b"cm":
+            output += text
+            text = ""
+            cm_matrix = _mult([float(v) for v in operands[:6]], cm_matrix)
+        elif op == b"TL":
+            TL = operands[0]
+        elif op == b"Tz":
+            char_scale = operands[0] / 100.0
+        elif op == b"Tw":
+            space_scale = 1.0 + operands[0]
+        elif op == b"Do":
+            output += text
+            text = ""
+            if output and output[-1] != "\n":
+                output += "\n"
+            try:
+                xobj = resources["/XObject"][operands[0]]
+                if xobj["/Subtype"] != "/Image":
+                    output += _extract(xobj, None, doc_maps)
+            except Unsupported:
+                raise
+            except Exception:
+                pass  # PyPDF2 : formulaire illisible ignoré
+    return output + text
+
+def page_text(page: Any) -> str:
+    """
+    Texte brut d'une page PyPDF2 (même résultat que page.extract_text()).
+    Lève Unsupported si la page sort du périmètre du décodeur.
+    """
+    if not HAVE_CHAR_MAP:
+        raise Unsupported("char_map")
+    try:
+        doc_maps = _CHAR_MAPS.setdefault(page.pdf, {})
+    except TypeError:  # document sans référence faible possible : pas de cache
+        doc_maps = None
+    return _extract(page, "/Contents", doc_maps)
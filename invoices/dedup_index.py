@@ -0,0 +1,214 @@
+# invoices/dedup_index.py
+"""
+Index persistant des doublons de factures (SQLite), partagé entre INPUT_DIR et TRAITEMENT_DIR.
+
+Deux clés, chacune en recherche O(1) (clé primaire) :
+  - avant extraction : empreinte SHA-256 du contenu -> chemin "canonique" du document.
+    Une autre copie du même PDF (reçue par mail ET déposée à la main, ou déjà
+    archivée dans TRAITEMENT_DIR) est un doublon exact : elle n'est pas parsée.
+  - après extraction : (numero_facture, date_facture, total) normalisés -> document.
+    Même facture avec un contenu différent (ré-émission, autre export) : doublon
+    probable, signalé dans le reporting (colonne "doublon") mais conservé.
+
+Les empreintes sont mémorisées par (chemin, taille, mtime) : un fichier inchangé
+n'est pas relu d'un run à l'autre.
+
+Même schéma d'accès que extract_cache : connexion ouverte paresseusement, une par thread,
+rouverte après un fork, index par défaut configuré dans chaque worker du pool.
+"""
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Iterable, Optional
+
+from invoices.extract_cache import file_digest
+from invoices.records import InvoiceRecord
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path     TEXT PRIMARY KEY,
+    size     INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    digest   TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS documents (
+    digest     TEXT PRIMARY KEY,
+    path       TEXT NOT NULL,
+    first_seen REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS invoices (
+    invoice_key TEXT PRIMARY KEY,
+    digest      TEXT NOT NULL,
+    fichier     TEXT NOT NULL
+);
+"""
+
+
+def invoice_key(rec: InvoiceRecord) -> Optional[str]:
+    """
+    Clé normalisée (numéro sans espaces ni casse, date ISO, centimes).
+    None sans numéro de facture : trop peu discriminant pour conclure à un doublon.
+    """
+    if not rec.numero_facture:
+        return None
+    numero = "".join(rec.numero_facture.split()).upper()
+    day = rec.date_facture.isoformat() if rec.date_facture else ""
+    cents = "" if rec.total_cents is None else str(rec.total_cents)
+    return f"{numero}|{day}|{cents}"
+
+
+class DedupIndex:
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        # Connexion propre à chaque thread (executor par défaut du pipeline async)
+        self._local = threading.local()
+
+    # ---------------------------
+    # Connexion
+    # ---------------------------
+
+    def _db(self) -> sqlite3.Connection:
+        # Une connexion SQLite ne doit traverser ni un fork ni un thread : on la rouvre par processus et par thread
+        local = self._local
+        if getattr(local, "conn", None) is None or local.pid != os.getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            local.conn = conn
+            local.pid = os.getpid()
+        return local.conn
+
+    def close(self) -> None:
+        """Ferme la connexion du thread courant (celles des autres threads partent avec eux)."""
+        local = self._local
+        if getattr(local, "conn", None) is not None and local.pid == os.getpid():
+            local.conn.close()
+        local.conn = None
+        local.pid = None
+
+    # ---------------------------
+    # Avant extraction : contenu
+    # ---------------------------
+
+    def digest(self, pdf_path: str | Path) -> str:
+        """Empreinte du fichier, relue seulement si taille ou mtime ont changé."""
+        path = str(Path(pdf_path).resolve())
+        st = os.stat(path)
+        db = self._db()
+        row = db.execute("SELECT size, mtime_ns, digest FROM files WHERE path = ?", (path,)).fetchone()
+        if row is not None and row[0] == st.st_size and row[1] == st.st_mtime_ns:
+            return row[2]
+        digest = file_digest(path)
+        db.execute(
+            "INSERT OR REPLACE INTO files(path, size, mtime_ns, digest) VALUES (?, ?, ?, ?)",
+            (path, st.st_size, st.st_mtime_ns, digest),
+        )
+        return digest
+
+    def claim(self, pdf_path: str | Path, digest: Optional[str] = None) -> Optional[str]:
+        """
+        Enregistre le document. Renvoie le chemin de l'original si pdf_path en est une
+        copie (doublon exact), None sinon. Un original disparu (supprimé, renommé) cède
+        sa place au fichier courant. Atomique : deux workers qui traitent deux copies
+        en même temps ne peuvent pas se déclarer originaux tous les deux.
+        """
+        path = str(Path(pdf_path).resolve())
+        digest = digest or self.digest(path)
+        db = self._db()
+        with db:
+            db.execute("BEGIN IMMEDIATE")
+            db.execute(
+                "INSERT OR IGNORE INTO documents(digest, path, first_seen) VALUES (?, ?, ?)",
+                (digest, path, time.time()),
+            )
+            original = db.execute("SELECT path FROM documents WHERE digest = ?", (digest,)).fetchone()[0]
+            if original == path:
+                return None
+            if os.path.exists(original):
+                return original
+            db.execute("UPDATE documents SET path = ? WHERE digest = ?", (path, digest))
+            return None
+
+    def lookup(self, digest: str) -> Optional[str]:
+        """Chemin d'un document déjà enregistré avec ce contenu et toujours présent, sinon None."""
+        row = self._db().execute("SELECT path FROM documents WHERE digest = ?", (digest,)).fetchone()
+        return row[0] if row is not None and os.path.exists(row[0]) else None
+
+    def index_files(self, paths: Iterable[str | Path]) -> int:
+        """Enregistre des PDF déjà traités (archive TRAITEMENT_DIR). Retourne le nb de fichiers vus."""
+        count = 0
+        for pdf in paths:
+            try:
+                self.claim(pdf)
+                count += 1
+            except OSError:
+                continue
+        return count
+
+    def index_directory(self, directory: str | Path, pattern: str = "*.pdf") -> int:
+        """index_files sur tout un dossier (voir file_manifest pour ne reprendre que les nouveaux)."""
+        return self.index_files(Path(directory).rglob(pattern))
+
+    # ---------------------------
+    # Après extraction : champs normalisés
+    # ---------------------------
+
+    def near_duplicate(self, rec: InvoiceRecord, digest: str) -> Optional[str]:
+        """
+        Fichier d'une autre facture (contenu différent) aux mêmes numéro/date/montant, sinon None.
+        Comme pour claim, une facture dont le document a disparu (PDF remplacé par un export
+        corrigé, supprimé) cède la clé au document courant.
+        """
+        key = invoice_key(rec)
+        if key is None:
+            return None
+        db = self._db()
+        with db:
+            db.execute("BEGIN IMMEDIATE")
+            db.execute(
+                "INSERT OR IGNORE INTO invoices(invoice_key, digest, fichier) VALUES (?, ?, ?)",
+                (key, digest, rec.fichier),
+            )
+            other_digest, other_fichier = db.execute(
+                "SELECT digest, fichier FROM invoices WHERE invoice_key = ?", (key,)
+            ).fetchone()
+            if other_digest == digest:
+                return None
+            owner = db.execute("SELECT path FROM documents WHERE digest = ?", (other_digest,)).fetchone()
+            if owner is not None and os.path.exists(owner[0]):
+                return other_fichier
+            db.execute(
+                "UPDATE invoices SET digest = ?, fichier = ? WHERE invoice_key = ?", (digest, rec.fichier, key)
+            )
+            return None
+
+    def stats(self) -> dict:
+        db = self._db()
+        return {
+            table: db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            for table in ("files", "documents", "invoices")
+        }
+
+
+# ---------------------------
+# Index par défaut (processus courant)
+# ---------------------------
+
+_default_index: Optional[DedupIndex] = None
+
+def configure_index(path: str | Path | None) -> Optional[DedupIndex]:
+    """Active (path) ou désactive (None) l'index ; sert aussi dans l'initializer des workers."""
+    global _default_index
+    if _default_index is not None:
+        _default_index.close()
+    _default_index = DedupIndex(path) if path else None
+    return _default_index
+
+def get_default_index() -> Optional[DedupIndex]:
+    return _default_index
@@ -1,183 +1,246 @@
 # invoices/excel_reporter.py
 from __future__ import annotations
 
+import time
 from pathlib import Path
-from typing import Iterable, Mapping, Any, Sequence, Optional
-import os
+from copy import copy
+from itertools import islice
+from datetime import date
+from typing import Callable, Iterable, Iterator, Mapping, Any, Sequence, Optional, List
 
 from openpyxl import Workbook
-from openpyxl.worksheet.worksheet import Worksheet
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.worksheet._write_only import WriteOnlyWorksheet
 from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
 from openpyxl.utils import get_column_letter
 
+from invoices import metrics
+from invoices.records import UNKNOWN, InvoiceRecord, as_record
+from invoices.rollups import DIMENSIONS, Rollups
 from invoices.utils import load_env_config  # <-- pour lire OUTPUT_DIR depuis env.json
 
-# Ordre des colonnes attendu par pdf_parser.extract_invoice_data()
+# En-têtes des colonnes (valeurs tirées de records.InvoiceRecord)
 COLUMNS: Sequence[str] = (
     "fichier",         # nom du PDF
     "facture",         # numéro de facture
-    "date",            # dd/mm/yyyy
-    "total_ttc",       # 255,63€ (converti en nombre si possible)
+    "date",            # date Excel (affichée dd/mm/yyyy)
+    "total_ttc",       # nombre (total_cents / 100) si le montant a pu être converti
     "periode",         # ex. "Octobre 2025" si détecté
     "source_montant",  # info debug : "TTC* mois" / "TTC* générique" / "montant générique"
+    "doublon",         # fichier d'une facture aux mêmes numéro/date/montant (doublon probable)
 )
 
+# Colonnes des onglets de synthèse (après la colonne du groupe : periode / mois / fournisseur)
+SUMMARY_COLUMNS: Sequence[str] = ("factures", "total_ttc", "sans_montant")
+
 ALLOWED_EXCEL_NAME = "invoices_extract.xlsx"
 
+# Index (0-based) des colonnes date et total_ttc dans COLUMNS
+_DATE_COL = 2
+_TOTAL_COL = 3
+
+# Nombre de lignes lues avant d'écrire, pour dimensionner les colonnes.
+# En mode write-only, les largeurs doivent être posées avant la première ligne :
+# on les estime sur cet échantillon borné au lieu de relire toute la feuille.
+WIDTH_SAMPLE_ROWS = 500
+
 
 # ---------------------------
 # Helpers chemins & fichiers
 # ---------------------------
 
-def _project_root() -> Path:
-    """Racine du projet: parent de invoices/ ou WORKSPACE Jenkins si défini."""
-    package_dir = Path(__file__).resolve().parent  # .../invoices
-    ws = os.environ.get("WORKSPACE")
-    if ws:
-        return Path(ws).resolve()
-    return package_dir.parent  # .../invoices_project
-
-def _resolve_dir(base: Path, value: str) -> Path:
-    p = Path(value)
-    return (base / p).resolve() if not p.is_absolute() else p.resolve()
-
 def _ensure_parent_dir(path: Path) -> None:
     path.parent.mkdir(parents=True, exist_ok=True)
 
 
 # ---------------------------
-# Parsing / formats
+# Mise en forme Excel (streaming)
 # ---------------------------
 
-def _number_from_amount(val: Any) -> Optional[float]:
+_HEADER_FILL = PatternFill(start_color="F2F2F2", end_color="F2F2F2", fill_type="solid")
+_HEADER_FONT = Font(bold=True)
+_HEADER_ALIGN = Alignment(vertical="center")
+_THIN = Side(style="thin", color="DDDDDD")
+_BORDER = Border(left=_THIN, right=_THIN, top=_THIN, bottom=_THIN)
+_AMOUNT_FORMAT = '#,##0.00'
+_DATE_FORMAT = 'DD/MM/YYYY'
+
+def _row_values(r: InvoiceRecord) -> List[Any]:
+    """Valeurs d'une ligne dans l'ordre COLUMNS (montant et date déjà convertis à l'extraction)."""
+    return [
+        r.fichier,
+        r.numero_facture or UNKNOWN,
+        r.date_facture or r.date_text,
+        r.total_cents / 100 if r.total_cents is not None else (r.total_ttc or UNKNOWN),
+        r.periode,
+        r.source_montant,
+        r.doublon,
+    ]
+
+def _column_widths(header: Sequence[str], sample: Iterable[Sequence[Any]]) -> List[int]:
+    # Ajustement simple : longueur max (en-tête + échantillon) + 2, bornée à [10, 60]
+    max_len = [len(str(h)) for h in header]
+    for values in sample:
+        for idx, v in enumerate(values):
+            l = len(_DATE_FORMAT) if isinstance(v, date) else len(str(v)) if v is not None else 0
+            if l > max_len[idx]:
+                max_len[idx] = l
+    return [min(max(10, l + 2), 60) for l in max_len]
+
+def _header_cells(ws: WriteOnlyWorksheet, header: Sequence[str]) -> List[WriteOnlyCell]:
+    cells = []
+    for value in header:
+        cell = WriteOnlyCell(ws, value=value)
+        cell.fill = _HEADER_FILL
+        cell.font = _HEADER_FONT
+        cell.alignment = _HEADER_ALIGN
+        cell.border = _BORDER
+        cells.append(cell)
+    return cells
+
+def _prototype_style(ws: WriteOnlyWorksheet, number_format: Optional[str] = None):
     """
-    Essaie de convertir un montant texte ('1 234,56€', '1,234.56', '1234.56€') en float.
-    Retourne None si non convertible (on laissera alors la valeur texte telle quelle).
+    Style (bordure, format) résolu une seule fois : assigner un objet Border à chaque
+    cellule le ré-indexe dans le classeur (hash complet), copier le StyleArray ne coûte rien.
     """
-    if val is None:
-        return None
-    s = str(val).strip()
-    if not s:
-        return None
-    # retire les devises courantes et espaces
-    s = s.replace("€", "").replace("$", "").replace(" ", "")
-    # heuristique du séparateur décimal
-    if "," in s and "." in s:
-        if s.rfind(".") > s.rfind(","):
-            # "1,234.56" -> milliers: ',', décimal: '.'
-            s = s.replace(",", "")
+    cell = WriteOnlyCell(ws)
+    cell.border = _BORDER
+    if number_format:
+        cell.number_format = number_format
+    return cell._style
+
+def _body_cells(
+    ws: WriteOnlyWorksheet, values: Sequence[Any], body_style, amount_style, date_style,
+    amount_col: int = _TOTAL_COL, date_col: int = _DATE_COL,
+) -> List[WriteOnlyCell]:
+    # Bordure + format nombre/date posés au fil de l'écriture (aucune relecture de la feuille)
+    cells = []
+    for idx, value in enumerate(values):
+        cell = WriteOnlyCell(ws, value=value)
+        if idx == amount_col and isinstance(value, (int, float)):
+            cell._style = copy(amount_style)
+        elif idx == date_col and isinstance(value, date):
+            cell._style = copy(date_style)
         else:
-            # "1.234,56" -> milliers: '.', décimal: ','
-            s = s.replace(".", "").replace(",", ".")
-    elif "," in s:
-        # "1234,56" (FR)
-        s = s.replace(",", ".")
-    # else: "1234.56" (US) ou entier
-    try:
-        return float(s)
-    except Exception:
-        return None
+            cell._style = copy(body_style)
+        cells.append(cell)
+    return cells
+
+def _sheet_title(sheet_name: str) -> str:
+    # Sanitize minimal du nom d’onglet (Excel limite à 31 chars; interdit: []:*?/\\)
+    clean_title = "".join(ch for ch in sheet_name if ch not in '[]:*?/\\')
+    return clean_title[:31] if clean_title else "Reporting"
 
 
 # ---------------------------
-# Mise en forme Excel
+# Onglets de synthèse
 # ---------------------------
 
-def _apply_table_style(ws: Worksheet, n_rows: int, n_cols: int) -> None:
-    # Style en-tête
-    header_fill = PatternFill(start_color="F2F2F2", end_color="F2F2F2", fill_type="solid")
-    header_font = Font(bold=True)
-    thin = Side(style="thin", color="DDDDDD")
-    border = Border(left=thin, right=thin, top=thin, bottom=thin)
-
-    # En-têtes (ligne 1)
-    for c in range(1, n_cols + 1):
-        cell = ws.cell(row=1, column=c)
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.alignment = Alignment(vertical="center")
-        cell.border = border
-
-    # Corps
-    for r in range(2, n_rows + 1):
-        for c in range(1, n_cols + 1):
-            cell = ws.cell(row=r, column=c)
-            cell.border = border
-
-    # Figer la première ligne et activer l’autofilter
-    ws.freeze_panes = "A2"
-    ws.auto_filter.ref = ws.dimensions
-
-    # Ajustement simple des largeurs de colonnes
-    for idx in range(1, n_cols + 1):
-        letter = get_column_letter(idx)
-        max_len = 0
-        for r in range(1, n_rows + 1):
-            v = ws.cell(row=r, column=idx).value
-            l = len(str(v)) if v is not None else 0
-            max_len = max(max_len, l)
-        ws.column_dimensions[letter].width = min(max(10, max_len + 2), 60)
+def _write_summary_sheets(wb: Workbook, rollups: Rollups) -> None:
+    """Un onglet par dimension (DIMENSIONS) : lignes par groupe puis ligne Total."""
+    for dimension, title in DIMENSIONS.items():
+        ws = wb.create_sheet(_sheet_title(title))
+        header = (dimension, *SUMMARY_COLUMNS)
+        totals = rollups.totals(dimension)
+        values = [[key, t.count, t.total_cents / 100, t.missing] for key, t in totals.items()]
+        total = [
+            "Total",
+            sum(t.count for t in totals.values()),
+            sum(t.total_cents for t in totals.values()) / 100,
+            sum(t.missing for t in totals.values()),
+        ]
+
+        for idx, width in enumerate(_column_widths(header, values + [total]), start=1):
+            ws.column_dimensions[get_column_letter(idx)].width = width
+        ws.freeze_panes = "A2"
+        body_style = _prototype_style(ws)
+        amount_style = _prototype_style(ws, _AMOUNT_FORMAT)
+
+        ws.append(_header_cells(ws, header))
+        for row in values:
+            ws.append(_body_cells(ws, row, body_style, amount_style, body_style, amount_col=2, date_col=-1))
+        total_cells = _header_cells(ws, total)
+        total_cells[2].number_format = _AMOUNT_FORMAT
+        ws.append(total_cells)
 
 
 # ---------------------------
 # Écriture Excel
 # ---------------------------
 
+@metrics.timed("invoices_report_seconds", format="xlsx")
 def write_report(
-    rows: Iterable[Mapping[str, Any]],
+    rows: Iterable[InvoiceRecord | Mapping[str, Any]],
     xlsx_path: str | Path,
-    sheet_name: str = "Reporting"
+    sheet_name: str = "Reporting",
+    summary: Optional[Callable[[Rollups], Rollups]] = None,
 ) -> Path:
     """
-    Écrit un Excel de reporting aligné sur pdf_parser.extract_invoice_data().
-    - rows: itérable de dicts ayant idéalement les clés COLUMNS
+    Écrit un Excel de reporting aligné sur pdf_parser.extract_invoice_record().
+    - rows: itérable d'InvoiceRecord (consommé une seule fois, un générateur convient) ;
+      un dict est accepté et converti (records.as_record)
     - xlsx_path: chemin cible du fichier .xlsx (écrasé si existe)
     - sheet_name: nom de l’onglet
+    - summary: appelé une fois toutes les lignes écrites avec les agrégats du run,
+      renvoie ceux des onglets de synthèse (ex. historique du stockage colonnaire) ;
+      défaut : agrégats du run seul
+    Écriture en streaming (openpyxl write-only) : chaque ligne est stylée au moment où elle
+    est écrite, la mémoire reste bornée par WIDTH_SAMPLE_ROWS quel que soit le volume.
     Retourne le chemin absolu du fichier .xlsx généré.
+    Métriques : durée totale (attente des lignes en amont comprise) et temps passé à
+    écrire seulement (invoices_report_write_seconds_total).
     """
     xlsx_path = Path(xlsx_path).resolve()
     _ensure_parent_dir(xlsx_path)
 
-    wb = Workbook()
-    ws = wb.active
-    # Sanitize minimal du nom d’onglet (Excel limite à 31 chars; interdit: []:*?/\\)
-    clean_title = "".join(ch for ch in sheet_name if ch not in '[]:*?/\\')
-    ws.title = clean_title[:31] if clean_title else "Reporting"
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(_sheet_title(sheet_name))
+
+    run_rollups = Rollups()
+
+    def records() -> Iterator[InvoiceRecord]:
+        for r in rows:
+            rec = as_record(r)
+            run_rollups.add(rec)
+            yield rec
+
+    values_iter: Iterator[List[Any]] = (_row_values(rec) for rec in records())
+    sample = list(islice(values_iter, WIDTH_SAMPLE_ROWS))
 
-    # En-têtes
-    ws.append(list(COLUMNS))
+    # Avant la première ligne : largeurs de colonnes et volet figé
+    for idx, width in enumerate(_column_widths(COLUMNS, sample), start=1):
+        ws.column_dimensions[get_column_letter(idx)].width = width
+    ws.freeze_panes = "A2"
+
+    body_style = _prototype_style(ws)
+    amount_style = _prototype_style(ws, _AMOUNT_FORMAT)
+    date_style = _prototype_style(ws, _DATE_FORMAT)
 
-    # Lignes
+    ws.append(_header_cells(ws, COLUMNS))
     count = 0
-    for r in rows:
+    write_seconds = 0.0
+    t0 = time.perf_counter()
+    for values in sample:
+        ws.append(_body_cells(ws, values, body_style, amount_style, date_style))
+        count += 1
+    write_seconds += time.perf_counter() - t0
+    sample = []
+    for values in values_iter:
+        t0 = time.perf_counter()
+        ws.append(_body_cells(ws, values, body_style, amount_style, date_style))
+        write_seconds += time.perf_counter() - t0
         count += 1
-        fichier = r.get("fichier", "")
-        facture = r.get("facture", "")
-        date = r.get("date", "")
-        total_ttc_raw = r.get("total_ttc", "")
-        periode = r.get("periode", "")
-        source_montant = r.get("source_montant", "")
-
-        # Conversion du total_ttc si possible
-        total_number = _number_from_amount(total_ttc_raw)
-
-        ws.append([
-            fichier,
-            facture,
-            date,
-            total_number if total_number is not None else total_ttc_raw,
-            periode,
-            source_montant
-        ])
-
-    # Format nombre à 2 décimales (FR-like) pour la colonne total_ttc quand numérique
-    for row_idx in range(2, count + 2):  # Colonne 4 = total_ttc
-        cell = ws.cell(row=row_idx, column=4)
-        if isinstance(cell.value, (int, float)):
-            cell.number_format = '#,##0.00'
-
-    _apply_table_style(ws, n_rows=count + 1, n_cols=len(COLUMNS))
+
+    # L’autofilter est écrit après les lignes : sa plage peut être posée en fin de flux
+    ws.auto_filter.ref = f"A1:{get_column_letter(len(COLUMNS))}{count + 1}"
+    rollups = summary(run_rollups) if summary else run_rollups
+    t0 = time.perf_counter()
+    _write_summary_sheets(wb, rollups)
     wb.save(xlsx_path)
+    write_seconds += time.perf_counter() - t0
+
+    metrics.inc("invoices_report_rows_total", count, format="xlsx")
+    metrics.inc("invoices_report_write_seconds_total", write_seconds, format="xlsx")
     return xlsx_path
 
 
@@ -187,19 +250,18 @@ def write_report(
 
 def default_output_xlsx_path() -> Path:
     """Construit <OUTPUT_DIR>/invoices_extract.xlsx (dossier créé si besoin)."""
-    env = load_env_config()
-    root = _project_root()
-    output_dir = _resolve_dir(root, env.get("OUTPUT_DIR", "./output"))
+    output_dir = load_env_config().resolve("OUTPUT_DIR", "./output")
     output_dir.mkdir(parents=True, exist_ok=True)
     return (output_dir / ALLOWED_EXCEL_NAME).resolve()
 
 def write_report_to_output(
-    rows: Iterable[Mapping[str, Any]],
-    sheet_name: str = "Reporting"
+    rows: Iterable[InvoiceRecord | Mapping[str, Any]],
+    sheet_name: str = "Reporting",
+    summary: Optional[Callable[[Rollups], Rollups]] = None,
 ) -> Path:
     """
     Écrit le reporting dans <OUTPUT_DIR>/invoices_extract.xlsx (nom imposé).
     Retourne le chemin absolu.
     """
     xlsx_path = default_output_xlsx_path()
-    return write_report(rows, xlsx_path, sheet_name)
+    return write_report(rows, xlsx_path, sheet_name, summary)
@@ -0,0 +1,252 @@
+# invoices/extract_cache.py
+"""
+Cache persistant des extractions PDF (SQLite), adressé par contenu.
+
+Clé = (empreinte SHA-256 du contenu, fichier ou PDF en mémoire, version du parser).
+Valeur = texte nettoyé + dict renvoyé par extract_invoice_data(). Un PDF identique à un run précédent
+n'est donc jamais re-parsé, même s'il a été renommé ou déplacé.
+
+- Éviction par taille (LRU sur last_used) au-delà de max_bytes.
+- Compteurs hits/misses persistés dans la base (cumulés entre processus). Une lecture
+  n'écrit rien : compteurs et last_used des entrées lues sont gardés en mémoire et
+  écrits par lots (FLUSH_EVERY lectures, put(), stats(), close(), fin du processus,
+  workers d'un pool compris).
+- Connexion ouverte paresseusement, une par thread, rouverte après un fork (pool de processus).
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+_CHUNK = 1024 * 1024
+# Lectures (hits + misses) gardées en mémoire avant écriture dans la base
+FLUSH_EVERY = 64
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    digest    TEXT NOT NULL,
+    version   TEXT NOT NULL,
+    text      TEXT NOT NULL,
+    data      TEXT NOT NULL,
+    size      INTEGER NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (digest, version)
+);
+CREATE INDEX IF NOT EXISTS idx_entries_last_used ON entries(last_used);
+CREATE TABLE IF NOT EXISTS counters (
+    name  TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO counters(name, value) VALUES ('hits', 0), ('misses', 0), ('evictions', 0);
+"""
+
+
+class CacheEntry(NamedTuple):
+    text: str
+    data: Dict[str, Any]
+
+
+def file_digest(path: str | Path) -> str:
+    """SHA-256 du contenu du fichier (lecture par blocs de 1 Mo)."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def buffer_digest(data) -> str:
+    """SHA-256 d'un PDF en mémoire (bytes, memoryview, mmap), même clé que file_digest, sans copie."""
+    return hashlib.sha256(data).hexdigest()
+
+
+class ExtractionCache:
+    def __init__(self, path: str | Path, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = Path(path)
+        self.max_bytes = int(max_bytes)
+        # Connexion propre à chaque thread (executor par défaut du pipeline async)
+        self._local = threading.local()
+        # Lectures pas encore écrites (processus courant) : compteurs, last_used par entrée
+        self._lock = threading.Lock()
+        self._pid: Optional[int] = None
+        self._counts = {"hits": 0, "misses": 0}
+        self._used: Dict[Tuple[str, str], float] = {}
+
+    # ---------------------------
+    # Connexion
+    # ---------------------------
+
+    def _db(self) -> sqlite3.Connection:
+        # Une connexion SQLite ne doit traverser ni un fork ni un thread : on la rouvre par processus et par thread
+        local = self._local
+        if getattr(local, "conn", None) is None or local.pid != os.getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            local.conn = conn
+            local.pid = os.getpid()
+        return local.conn
+
+    def close(self) -> None:
+        """Ferme la connexion du thread courant (celles des autres threads partent avec eux)."""
+        self.flush()
+        local = self._local
+        if getattr(local, "conn", None) is not None and local.pid == os.getpid():
+            local.conn.close()
+        local.conn = None
+        local.pid = None
+
+    # ---------------------------
+    # Lecture / écriture
+    # ---------------------------
+
+    def get(self, digest: str, version: str) -> Optional[CacheEntry]:
+        row = self._db().execute(
+            "SELECT text, data FROM entries WHERE digest = ? AND version = ?", (digest, version)
+        ).fetchone()
+        with self._lock:
+            self._own_pending()
+            if row is None:
+                self._counts["misses"] += 1
+            else:
+                self._counts["hits"] += 1
+                self._used[(digest, version)] = time.time()
+            due = self._counts["hits"] + self._counts["misses"] >= FLUSH_EVERY
+        if due:
+            self.flush()
+        return CacheEntry(row[0], json.loads(row[1])) if row is not None else None
+
+    def put(self, digest: str, version: str, text: str, data: Dict[str, Any]) -> None:
+        payload = json.dumps(data, ensure_ascii=False)
+        size = len(text.encode("utf-8")) + len(payload.encode("utf-8"))
+        db = self._db()
+        with db:
+            db.execute("BEGIN IMMEDIATE")
+            db.execute(
+                "INSERT OR REPLACE INTO entries(digest, version, text, data, size, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (digest, version, text, payload, size, time.time()),
+            )
+            # Lectures en attente écrites avant l'éviction : les entrées lues récemment restent
+            self._write_pending(db)
+            self._evict(db)
+
+    # ---------------------------
+    # Lectures en attente
+    # ---------------------------
+
+    def _own_pending(self) -> None:
+        # (sous self._lock) Après un fork, les lectures en attente du parent restent au parent
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        from multiprocessing.util import Finalize
+
+        self._pid = pid
+        self._counts = {"hits": 0, "misses": 0}
+        self._used = {}
+        # Fin du processus (worker d'un pool compris, qui ne passe pas par atexit)
+        Finalize(None, self._flush_at_exit, exitpriority=10)
+
+    def _take_pending(self) -> Tuple[Dict[str, int], Dict[Tuple[str, str], float]]:
+        with self._lock:
+            if self._pid != os.getpid():
+                return {}, {}
+            counts, used = self._counts, self._used
+            self._counts = {"hits": 0, "misses": 0}
+            self._used = {}
+        return counts, used
+
+    def _write_pending(self, db: sqlite3.Connection) -> None:
+        counts, used = self._take_pending()
+        for name, value in counts.items():
+            if value:
+                db.execute("UPDATE counters SET value = value + ? WHERE name = ?", (value, name))
+        db.executemany(
+            "UPDATE entries SET last_used = MAX(last_used, ?) WHERE digest = ? AND version = ?",
+            ((when, digest, version) for (digest, version), when in used.items()),
+        )
+
+    def _flush_at_exit(self) -> None:
+        try:
+            self.flush()
+        except (OSError, sqlite3.Error):
+            pass  # statistiques seulement : rien à signaler en fin de processus
+
+    def flush(self) -> None:
+        """Écrit les lectures gardées en mémoire (compteurs, last_used) en une transaction."""
+        with self._lock:
+            if self._pid != os.getpid() or not (self._used or any(self._counts.values())):
+                return
+        db = self._db()
+        with db:
+            db.execute("BEGIN IMMEDIATE")
+            self._write_pending(db)
+
+    def _evict(self, db: sqlite3.Connection) -> None:
+        """Supprime les entrées les moins récemment utilisées jusqu'à repasser sous max_bytes."""
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for digest, version, size in db.execute(
+            "SELECT digest, version, size FROM entries ORDER BY last_used ASC"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            db.execute("DELETE FROM entries WHERE digest = ? AND version = ?", (digest, version))
+            total -= size
+            evicted += 1
+        db.execute("UPDATE counters SET value = value + ? WHERE name = 'evictions'", (evicted,))
+
+    # ---------------------------
+    # Statistiques
+    # ---------------------------
+
+    def stats(self) -> Dict[str, int]:
+        """Compteurs cumulés (hits, misses, evictions) + nombre d'entrées et taille totale."""
+        self.flush()
+        db = self._db()
+        out = {name: value for name, value in db.execute("SELECT name, value FROM counters")}
+        count, total = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        out["entries"] = count
+        out["bytes"] = total
+        return out
+
+    def clear(self) -> None:
+        self._take_pending()
+        db = self._db()
+        with db:
+            db.execute("BEGIN IMMEDIATE")
+            db.execute("DELETE FROM entries")
+            db.execute("UPDATE counters SET value = 0")
+
+
+# ---------------------------
+# Cache par défaut (processus courant)
+# ---------------------------
+
+_default_cache: Optional[ExtractionCache] = None
+
+def configure_cache(path: str | Path | None, max_bytes: int = DEFAULT_MAX_BYTES) -> Optional[ExtractionCache]:
+    """
+    Active (path) ou désactive (None) le cache utilisé par défaut par pdf_parser.
+    Sert aussi d'initializer pour les workers d'un ProcessPoolExecutor.
+    """
+    global _default_cache
+    if _default_cache is not None:
+        _default_cache.close()
+    _default_cache = ExtractionCache(path, max_bytes) if path else None
+    return _default_cache
+
+def get_default_cache() -> Optional[ExtractionCache]:
+    return _default_cache
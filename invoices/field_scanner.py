@@ -0,0 +1,251 @@
+# invoices/field_scanner.py
+"""
+Détection des champs de facture en une seule passe sur le texte.
+
+Les fonctions find_invoice_number / find_date / _find_total_ttc de pdf_parser
+font chacune leurs propres `search` sur tout le texte (jusqu'à 9 passes par
+document). Ici, une seule regex de déclenchement parcourt le texte (en
+minuscules) une fois et s'arrête sur chaque ancre possible (« facture », « n° »,
+« inv », « total », « montant », « net », « grand », « amount », ou un
+séparateur de date). À chaque ancre, seules les regex concernées et encore
+non résolues sont essayées avec `match(text, pos)`.
+
+Comme chaque regex d'origine commence par son ancre, le premier `match`
+réussi est exactement le résultat qu'aurait donné son `search` : les règles de
+priorité (primaire > repli, TTC* mois > TTC* générique > montant générique)
+et les libellés `source_montant` sont inchangés. Le parcours s'arrête dès que
+numéro, date et total sont décidés.
+"""
+from __future__ import annotations
+
+import re
+from typing import Dict, NamedTuple, Optional, Pattern, Sequence, Tuple
+
+# ============================
+#   NETTOYAGE
+# ============================
+
+# Même résultat que l'ancien _clean_text de pdf_parser. str.replace ne copie pas la chaîne
+# quand le caractère est absent (cas courant), et la substitution ne touche plus que les
+# blancs réellement à réduire (tabulation, ou espace suivi d'un autre blanc) au lieu de
+# réécrire chaque espace.
+_RGX_BLANKS = re.compile(r"\t[ \t]*| [ \t]+")
+
+def clean_text(txt: str) -> str:
+    if not txt:
+        return ""
+    txt = txt.replace("\xa0", " ").replace("\u202f", " ").replace("€", " €").replace("\r", "\n")
+    return _RGX_BLANKS.sub(" ", txt)
+
+# ============================
+#   SCAN
+# ============================
+
+# Déclencheurs, cherchés sur le texte en minuscules. Alternation de littéraux uniquement :
+# sre la parcourt par préfixe, bien plus vite qu'un motif (?i) ou commençant par \d.
+# Les dates sont repérées par leur premier séparateur ("/mm/" de dd/mm/yyyy, "-mm-" de
+# yyyy-mm-dd) : le début réel est 2 ou 4 caractères avant.
+# Superset des positions de départ possibles de chaque regex ; la validation reste
+# faite par la regex d'origine.
+_TRIGGERS = r"facture|n°|nº|no|inv|ınv|total|montant|net|grand|amount|/\d\d[/-]\d\d|-\d\d[/-]\d\d"
+_RGX_TRIGGER = re.compile(_TRIGGERS)
+# Repli si lower() change la longueur du texte (positions non alignées)
+_RGX_TRIGGER_I = re.compile("(?i)" + _TRIGGERS)
+
+_RGX_DATE_LIKE = re.compile(r"\d{4}[-/]\d{2}[-/]\d{2}")
+
+# Chaînes de priorité (ordre des regex d'origine)
+_INVOICE_CHAIN = ("primary", "fb0", "fb1", "fb2")
+_TOTAL_CHAIN = ("ttc_mois", "ttc_star", "amt0", "amt1")
+_LINE_ANCHORED = frozenset(("ttc_mois", "ttc_star"))
+
+# Première(s) lettre(s) du mot-clé déclencheur -> regex à essayer à cette position
+_KINDS_BY_FIRST: Dict[str, Tuple[str, ...]] = {
+    "f": ("primary",),
+    "n": ("fb0",),
+    "i": ("fb1", "fb2"),
+    "ı": ("fb1", "fb2"),
+    "t": _TOTAL_CHAIN,
+    "m": ("amt0",),
+    "g": ("amt1",),
+    "a": ("amt1",),
+}
+_KINDS_NET = ("amt0",)
+
+
+class ScanResult(NamedTuple):
+    text: str
+    invoice_number: Optional[str]
+    date: Optional[str]
+    total_ttc: Optional[str]
+    source_montant: str
+    periode: str
+
+
+def _line_start(text: str, pos: int) -> int:
+    """Début de la ligne d'où `^\\s*` peut atteindre pos (regex en MULTILINE), -1 sinon."""
+    s = pos
+    while s > 0 and text[s - 1].isspace():
+        s -= 1
+    if s == 0:
+        return 0
+    nl = text.find("\n", s, pos)
+    return -1 if nl < 0 else nl + 1
+
+
+class FieldScanner:
+    """
+    Construit à partir des regex de pdf_parser (voir pdf_parser._SCANNER) :
+    le scanner ne fait qu'ordonner leurs essais, il ne redéfinit aucun motif.
+    """
+
+    def __init__(
+        self,
+        invoice_primary: Pattern[str],
+        invoice_fallbacks: Sequence[Pattern[str]],
+        date: Pattern[str],
+        ttc_mois: Pattern[str],
+        ttc_star: Pattern[str],
+        amount_generic: Sequence[Pattern[str]],
+    ):
+        fb0, fb1, fb2 = invoice_fallbacks
+        amt0, amt1 = amount_generic
+        self._rgx: Dict[str, Pattern[str]] = {
+            "primary": invoice_primary, "fb0": fb0, "fb1": fb1, "fb2": fb2,
+            "date": date,
+            "ttc_mois": ttc_mois, "ttc_star": ttc_star, "amt0": amt0, "amt1": amt1,
+        }
+
+    # ---------------------------
+    # Décisions (règles de priorité)
+    # ---------------------------
+
+    @staticmethod
+    def _invoice_candidate(m: re.Match) -> Optional[str]:
+        cand = m.group(1).strip()
+        if cand and not _RGX_DATE_LIKE.fullmatch(cand):
+            return cand
+        return None
+
+    def _invoice_decided(self, found: Dict[str, re.Match]) -> bool:
+        # Décidé dès qu'un maillon valide est trouvé et que tous les précédents sont connus
+        for kind in _INVOICE_CHAIN:
+            m = found.get(kind)
+            if m is None:
+                return False
+            if self._invoice_candidate(m):
+                return True
+        return True
+
+    # ---------------------------
+    # Passe unique
+    # ---------------------------
+
+    @staticmethod
+    def _kinds_for(trigger: str) -> Tuple[str, ...]:
+        c = trigger[0]
+        c = "i" if c in "İı" else c.lower()
+        if c == "n" and trigger[1:2].lower() == "e":
+            return _KINDS_NET
+        return _KINDS_BY_FIRST[c]
+
+    def _match_date(self, text: str, sep: int) -> Optional[re.Match]:
+        # yyyy-mm-dd commence 4 caractères avant le séparateur, dd/mm/yyyy 2 avant ;
+        # on essaie le plus à gauche d'abord, comme le ferait search()
+        for begin in (sep - 4, sep - 2):
+            if begin >= 0:
+                m = self._rgx["date"].match(text, begin)
+                if m is not None:
+                    return m
+        return None
+
+    def _find_all(self, text: str) -> Dict[str, re.Match]:
+        found: Dict[str, re.Match] = {}
+        rgx = self._rgx
+        low = text.lower()
+        if len(low) == len(text):
+            search = _RGX_TRIGGER.search
+        else:
+            low, search = text, _RGX_TRIGGER_I.search
+
+        pos = 0
+        while True:
+            trig = search(low, pos)
+            if trig is None:
+                break
+            start = trig.start()
+            if low[start] in "/-":
+                if "date" not in found:
+                    m = self._match_date(text, start)
+                    if m is not None:
+                        found["date"] = m
+            else:
+                for kind in self._kinds_for(trig.group()):
+                    if kind in found:
+                        continue
+                    begin = start
+                    if kind in _LINE_ANCHORED:
+                        begin = _line_start(text, start)
+                        if begin < 0:
+                            continue
+                    m = rgx[kind].match(text, begin)
+                    if m is not None:
+                        found[kind] = m
+            if "date" in found and "ttc_mois" in found and self._invoice_decided(found):
+                break
+            # Reprise juste après le début du déclencheur (les séparateurs de date peuvent se chevaucher)
+            pos = start + 1
+        return found
+
+    def scan(self, text: str, clean: bool = True) -> ScanResult:
+        """
+        Nettoie (si clean=True) puis détecte numéro, date, total TTC, période et source du montant.
+        Le numéro issu du nom de fichier (repli) reste du ressort de l'appelant.
+        """
+        if clean:
+            text = clean_text(text)
+        found = self._find_all(text or "")
+
+        invoice_number = None
+        for kind in _INVOICE_CHAIN:
+            m = found.get(kind)
+            if m is not None:
+                invoice_number = self._invoice_candidate(m)
+                if invoice_number:
+                    break
+
+        date = None
+        m = found.get("date")
+        if m is not None:
+            if m.group("y1"):
+                date = f"{m.group('d1')}/{m.group('m1')}/{m.group('y1')}"
+            else:
+                date = f"{m.group('d2')}/{m.group('m2')}/{m.group('y2')}"
+
+        total, source, periode = self._total(found)
+        return ScanResult(text, invoice_number, date, total, source, periode)
+
+    @staticmethod
+    def _total(found: Dict[str, re.Match]) -> Tuple[Optional[str], str, str]:
+        m = found.get("ttc_mois")
+        if m is not None:
+            periode = (m.group("periode") or "").strip()
+            cur = m.group("cur1") or m.group("cur2") or ""
+            val = (m.group("amount") or "").strip()
+            return (f"{val}{cur}" if cur else val, "TTC* mois", periode)
+
+        m = found.get("ttc_star")
+        if m is not None:
+            cur = m.group(1) or m.group(3) or ""
+            val = m.group(2).strip()
+            return (f"{val}{cur}" if cur else val, "TTC* générique", "")
+
+        for kind in ("amt0", "amt1"):
+            m = found.get(kind)
+            if m is not None:
+                cur = m.group(1) or m.group(3) or ""
+                val = m.group(2).strip()
+                return (f"{val}{cur}" if cur else val, "montant générique", "")
+
+        return (None, "non trouvé", "")
+
@@ -0,0 +1,201 @@
+# invoices/file_manifest.py
+"""
+Manifeste incrémental d'un dossier de PDF (INPUT_DIR, TRAITEMENT_DIR), construit avec
+os.scandir au lieu de rglob/iterdir à chaque run.
+
+Pour chaque fichier : (taille, mtime, inode) ; pour chaque dossier : son mtime, ses
+fichiers et ses sous-dossiers. Au run suivant (refresh) :
+  - un dossier dont le mtime n'a pas changé n'est pas relu : ajout, suppression et
+    renommage d'une entrée modifient le mtime du dossier (nos écritures passent toutes
+    par os.replace) ; seul un stat du dossier est fait, puis ses sous-dossiers sont visités
+  - dans un dossier relu, un fichier est "modifié" si sa taille, son mtime ou son inode
+    diffèrent
+  - un dossier modifié pendant la seconde précédant le parcours (résolution des mtime
+    sur certains partages réseau) sera relu au run suivant
+  - full_scan=True relit tous les dossiers (réécriture en place d'un fichier sans
+    changement du dossier)
+
+    manifest = FileManifest(input_dir, ".cache/manifests/input.json")
+    changes = manifest.refresh()        # Changes(added=[...], changed=[...], removed=[...])
+    manifest.paths()                    # tous les PDF, triés
+    manifest.changed_paths()            # nouveaux ou modifiés depuis le run précédent
+
+État JSON réécrit de façon atomique ; state_path=None : manifeste en mémoire seulement
+(tout est relu à chaque run, toujours avec os.scandir).
+"""
+from __future__ import annotations
+
+import fnmatch
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple
+
+FORMAT_VERSION = 1
+
+# Marge sur le mtime des dossiers : un dossier modifié depuis moins longtemps sera relu
+_RACY_NS = 1_000_000_000
+
+
+class FileEntry(NamedTuple):
+    size: int
+    mtime_ns: int
+    inode: int
+
+
+class Changes(NamedTuple):
+    added: List[str]      # chemins relatifs au dossier ("/" comme séparateur)
+    changed: List[str]
+    removed: List[str]
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.changed or self.removed)
+
+
+class _DirEntry(NamedTuple):
+    mtime_ns: int         # -1 : à relire au prochain refresh
+    files: List[str]      # noms des fichiers retenus
+    dirs: List[str]       # noms des sous-dossiers
+
+
+def _join(rel: str, name: str) -> str:
+    return f"{rel}/{name}" if rel else name
+
+
+class FileManifest:
+    def __init__(
+        self,
+        directory: str | Path,
+        state_path: str | Path | None = None,
+        pattern: str = "*.pdf",
+        full_scan: bool = False,
+    ):
+        self.directory = Path(directory)
+        self.state_path = Path(state_path) if state_path else None
+        self.pattern = pattern
+        self.full_scan = full_scan
+        self.files: Dict[str, FileEntry] = {}
+        self._dirs: Dict[str, _DirEntry] = {}
+        self._changes = Changes([], [], [])
+        self.dirs_scanned = 0
+        self._load()
+
+    # ---------------------------
+    # État persistant
+    # ---------------------------
+
+    def _load(self) -> None:
+        if self.state_path is None:
+            return
+        try:
+            state = json.loads(self.state_path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        # Autre dossier, autre motif ou autre format : on repart de zéro
+        if (
+            state.get("version") != FORMAT_VERSION
+            or state.get("directory") != str(self.directory.resolve())
+            or state.get("pattern") != self.pattern
+        ):
+            return
+        self.files = {rel: FileEntry(*v) for rel, v in state["files"].items()}
+        self._dirs = {rel: _DirEntry(*v) for rel, v in state["dirs"].items()}
+
+    def _save(self) -> None:
+        if self.state_path is None:
+            return
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        state = {
+            "version": FORMAT_VERSION,
+            "directory": str(self.directory.resolve()),
+            "pattern": self.pattern,
+            "dirs": {rel: list(d) for rel, d in self._dirs.items()},
+            "files": {rel: list(e) for rel, e in self.files.items()},
+        }
+        tmp = self.state_path.with_name(f".{self.state_path.name}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(state, ensure_ascii=False, separators=(",", ":")), encoding="utf-8")
+        os.replace(tmp, self.state_path)
+
+    # ---------------------------
+    # Parcours
+    # ---------------------------
+
+    def refresh(self) -> Changes:
+        """Met le manifeste à jour depuis le disque et renvoie les différences avec l'état précédent."""
+        old_files, old_dirs = self.files, self._dirs
+        files: Dict[str, FileEntry] = {}
+        dirs: Dict[str, _DirEntry] = {}
+        self.dirs_scanned = 0
+        racy_after = time.time_ns() - _RACY_NS
+        if self.directory.is_dir():
+            self._visit("", old_files, old_dirs, files, dirs, racy_after)
+
+        added = [rel for rel in files if rel not in old_files]
+        changed = [rel for rel, e in files.items() if rel in old_files and old_files[rel] != e]
+        removed = [rel for rel in old_files if rel not in files]
+        self.files, self._dirs = files, dirs
+        self._changes = Changes(sorted(added), sorted(changed), sorted(removed))
+        # Rien de nouveau (cas courant) : l'état sur disque est déjà à jour
+        if self._changes or dirs != old_dirs:
+            self._save()
+        return self._changes
+
+    def _visit(self, rel: str, old_files, old_dirs, files, dirs, racy_after: int) -> None:
+        path = os.path.join(self.directory, rel) if rel else str(self.directory)
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            return
+        prev = old_dirs.get(rel)
+        if prev is not None and prev.mtime_ns == mtime_ns and not self.full_scan:
+            # Liste inchangée : entrées reprises sans les relire
+            for name in prev.files:
+                key = _join(rel, name)
+                if key in old_files:
+                    files[key] = old_files[key]
+            dirs[rel] = prev
+            sub_dirs = prev.dirs
+        else:
+            self.dirs_scanned += 1
+            names, sub_dirs = [], []
+            try:
+                with os.scandir(path) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            sub_dirs.append(entry.name)
+                        elif fnmatch.fnmatch(entry.name, self.pattern) and entry.is_file():
+                            st = entry.stat()
+                            files[_join(rel, entry.name)] = FileEntry(st.st_size, st.st_mtime_ns, st.st_ino)
+                            names.append(entry.name)
+            except OSError:
+                return
+            dirs[rel] = _DirEntry(-1 if mtime_ns >= racy_after else mtime_ns, names, sub_dirs)
+        for name in sub_dirs:
+            self._visit(_join(rel, name), old_files, old_dirs, files, dirs, racy_after)
+
+    # ---------------------------
+    # Consultation
+    # ---------------------------
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+    def paths(self) -> List[Path]:
+        """Tous les fichiers du manifeste (chemins absolus), triés comme sorted(rglob(...))."""
+        return sorted(self.directory / rel for rel in self.files)
+
+    def changed_paths(self) -> Iterator[Path]:
+        """Fichiers nouveaux ou modifiés lors du dernier refresh."""
+        for rel in sorted(self._changes.added + self._changes.changed):
+            yield self.directory / rel
+
+    def listing(self, max_items: int = 50) -> str:
+        """Contenu du premier niveau (sous-dossiers et fichiers retenus), pour les journaux."""
+        top = self._dirs.get("")
+        if top is None:
+            return f"{self.directory} (n'existe pas)"
+        names = sorted([f"{d}/" for d in top.dirs] + top.files)
+        if len(names) > max_items:
+            names = names[:max_items] + ["... (troncation)"]
+        return f"{self.directory} -> {', '.join(names) if names else '(vide)'}"
@@ -0,0 +1,401 @@
+# invoices/isolation.py
+"""
+Extraction isolée : un PDF à la fois par processus worker supervisé, avec un budget
+de temps (horloge murale) et de mémoire (RSS) par document, et liste de quarantaine.
+
+IsolatedExecutor remplace ProcessPoolExecutor (même submit/shutdown, utilisable par
+_iter_extracted comme par async_pipeline) :
+  - chaque worker a un thread superviseur dans le processus parent, qui lui envoie
+    une tâche puis surveille toutes les `poll` secondes sa durée et son RSS ;
+  - budget dépassé (ou worker mort : crash natif, OOM killer) : le worker est tué,
+    la tâche est résolue par on_breach(breach, args) (ou lève BudgetExceeded), et un
+    nouveau worker sera lancé pour la tâche suivante. Le reste du lot continue ;
+  - RSS lu avec psutil s'il est installé, sinon dans /proc (Linux) ; ailleurs, seule
+    la limite de temps s'applique.
+
+Quarantine : documents ayant dépassé leur budget (fichier JSON, avec leur coût),
+ignorés aux runs suivants tant que leur contenu n'a pas changé (empreinte SHA-256, quel
+que soit leur chemin). Retirer une entrée du fichier pour retenter le document.
+
+    budget = Budget(seconds=120, rss_bytes=1024 * 2**20)
+    with IsolatedExecutor(2, budget, on_breach=..., initializer=..., initargs=(...)) as pool:
+        fut = pool.submit(_extract_one, "facture.pdf")
+"""
+from __future__ import annotations
+
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Executor, Future
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional
+
+try:
+    import psutil
+except ImportError:  # dépendance optionnelle
+    psutil = None
+
+from invoices import metrics
+from invoices.extract_cache import file_digest
+
+# Intervalle (s) de surveillance d'une tâche en cours
+DEFAULT_POLL_SECONDS = 0.05
+# Attente (s) de l'arrêt propre d'un worker avant de le tuer
+_STOP_GRACE_SECONDS = 5
+
+# Marqueur de fin (file des tâches, et message d'arrêt envoyé au worker)
+_STOP = None
+
+try:
+    _PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+except (AttributeError, ValueError, OSError):
+    _PAGE_SIZE = 4096
+
+
+class Budget(NamedTuple):
+    seconds: Optional[float] = None    # None : pas de limite de temps
+    rss_bytes: Optional[int] = None    # None : pas de limite mémoire
+
+
+class Breach(NamedTuple):
+    reason: str                        # "timeout" | "rss" | "crash"
+    seconds: float                     # durée de la tâche jusqu'à l'arrêt du worker
+    peak_rss_bytes: int                # RSS max observé (0 si inconnu)
+
+    def describe(self) -> str:
+        cost = f"{self.seconds:.1f}s, RSS max {self.peak_rss_bytes / 2**20:.0f} Mo"
+        return {"timeout": "délai dépassé", "rss": "mémoire dépassée", "crash": "worker mort"}[self.reason] + f" ({cost})"
+
+
+class BudgetExceeded(Exception):
+    def __init__(self, breach: Breach):
+        super().__init__(breach.describe())
+        self.breach = breach
+
+
+def rss_bytes(pid: int) -> Optional[int]:
+    """RSS courant du processus pid, None si non mesurable."""
+    if psutil is not None:
+        try:
+            return psutil.Process(pid).memory_info().rss
+        except psutil.Error:
+            return None
+    try:
+        with open(f"/proc/{pid}/statm", "rb") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+# ---------------------------
+# Processus worker
+# ---------------------------
+
+def _worker_main(conn, initializer: Optional[Callable], initargs: tuple) -> None:
+    if initializer is not None:
+        initializer(*initargs)
+    conn.send("ready")
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            return
+        if task is _STOP:
+            return
+        fn, args, kwargs = task
+        try:
+            result = (True, fn(*args, **kwargs))
+        except BaseException as e:
+            result = (False, e)
+        try:
+            conn.send(result)
+        except Exception as e:  # résultat ou exception non picklable
+            conn.send((False, RuntimeError(f"résultat non transmissible: {type(e).__name__}: {e}")))
+
+
+class _Worker:
+    """Un processus worker et sa connexion (côté parent)."""
+
+    def __init__(self, ctx, initializer: Optional[Callable], initargs: tuple):
+        self.conn, child = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_worker_main, args=(child, initializer, initargs), name="invoices-isolated", daemon=True
+        )
+        self.process.start()
+        child.close()
+        # Attente de la fin de l'initializer : le budget d'une tâche ne compte pas le démarrage
+        try:
+            if self.conn.recv() != "ready":
+                raise EOFError
+        except (EOFError, OSError):
+            self.kill()
+            raise BrokenProcessPool("initialisation d'un worker isolé impossible")
+
+    def kill(self) -> None:
+        if self.process.is_alive():
+            self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+    def stop(self) -> None:
+        try:
+            self.conn.send(_STOP)
+        except OSError:
+            pass
+        self.process.join(_STOP_GRACE_SECONDS)
+        self.kill()
+
+# ---------------------------
+# Executor
+# ---------------------------
+
+class IsolatedExecutor(Executor):
+    def __init__(
+        self,
+        max_workers: int,
+        budget: Budget,
+        on_breach: Optional[Callable[[Breach, tuple], Any]] = None,
+        initializer: Optional[Callable] = None,
+        initargs: tuple = (),
+        poll: float = DEFAULT_POLL_SECONDS,
+        mp_context=None,
+    ):
+        """
+        on_breach(breach, args) : résultat de la tâche dont le worker a été tué (appelé
+        dans un thread superviseur) ; None -> la tâche lève BudgetExceeded.
+        """
+        self.budget = budget
+        self.on_breach = on_breach
+        self.poll = poll
+        self._ctx = mp_context or multiprocessing.get_context()
+        self._initializer = initializer
+        self._initargs = initargs
+        self._tasks: queue.Queue = queue.Queue()
+        self._broken: Optional[str] = None
+        self._shutdown = False
+        self._lock = threading.Lock()
+        self._threads = [
+            threading.Thread(target=self._supervise, name=f"invoices-supervisor-{i}", daemon=True)
+            for i in range(max(1, max_workers))
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, fn: Callable, /, *args: Any, **kwargs: Any) -> Future:
+        with self._lock:
+            if self._broken:
+                raise BrokenProcessPool(self._broken)
+            if self._shutdown:
+                raise RuntimeError("submit() après shutdown()")
+            fut: Future = Future()
+            self._tasks.put((fut, fn, args, kwargs))
+            return fut
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False) -> None:
+        with self._lock:
+            if self._shutdown:
+                return
+            self._shutdown = True
+        if cancel_futures:
+            self._cancel_pending()
+        for _ in self._threads:
+            self._tasks.put(_STOP)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def _cancel_pending(self) -> None:
+        while True:
+            try:
+                item = self._tasks.get_nowait()
+            except queue.Empty:
+                return
+            if item is not _STOP:
+                item[0].cancel()
+
+    # ---------------------------
+    # Supervision (un thread par worker)
+    # ---------------------------
+
+    def _supervise(self) -> None:
+        worker: Optional[_Worker] = None
+        try:
+            while True:
+                item = self._tasks.get()
+                if item is _STOP:
+                    return
+                fut, fn, args, kwargs = item
+                if not fut.set_running_or_notify_cancel():
+                    continue
+                if self._broken:
+                    fut.set_exception(BrokenProcessPool(self._broken))
+                    continue
+                if worker is not None and not worker.process.is_alive():
+                    # Mort entre deux tâches : rien à imputer à la tâche suivante
+                    worker.kill()
+                    worker = None
+                if worker is None:
+                    try:
+                        worker = _Worker(self._ctx, self._initializer, self._initargs)
+                    except BrokenProcessPool as e:
+                        # Comme ProcessPoolExecutor : un initializer en échec casse le pool
+                        self._broken = str(e)
+                        fut.set_exception(e)
+                        continue
+                if not self._run(worker, fut, fn, args, kwargs):
+                    worker = None
+        finally:
+            if worker is not None:
+                worker.stop()
+
+    def _run(self, worker: _Worker, fut: Future, fn: Callable, args: tuple, kwargs: dict) -> bool:
+        """Exécute une tâche sur worker ; False si le worker a été tué (à relancer)."""
+        try:
+            worker.conn.send((fn, args, kwargs))
+        except (OSError, EOFError):
+            return self._breach(worker, fut, args, "crash", 0.0, 0)
+        except Exception as e:  # tâche non picklable : le worker n'a rien reçu
+            fut.set_exception(e)
+            return True
+
+        start = time.perf_counter()
+        peak = 0
+        budget = self.budget
+        while True:
+            try:
+                ready = worker.conn.poll(self.poll)
+            except (OSError, EOFError):
+                ready = False
+            if ready:
+                try:
+                    ok, value = worker.conn.recv()
+                except (OSError, EOFError):
+                    return self._breach(worker, fut, args, "crash", time.perf_counter() - start, peak)
+                if ok:
+                    fut.set_result(value)
+                else:
+                    fut.set_exception(value)
+                return True
+
+            elapsed = time.perf_counter() - start
+            rss = rss_bytes(worker.process.pid) or 0
+            peak = max(peak, rss)
+            if not worker.process.is_alive():
+                return self._breach(worker, fut, args, "crash", elapsed, peak)
+            if budget.seconds is not None and elapsed > budget.seconds:
+                return self._breach(worker, fut, args, "timeout", elapsed, peak)
+            if budget.rss_bytes is not None and rss > budget.rss_bytes:
+                return self._breach(worker, fut, args, "rss", elapsed, peak)
+
+    def _breach(self, worker: _Worker, fut: Future, args: tuple, reason: str, seconds: float, peak: int) -> bool:
+        worker.kill()
+        breach = Breach(reason, seconds, peak)
+        metrics.inc("invoices_isolation_breach_total", reason=reason)
+        if self.on_breach is None:
+            fut.set_exception(BudgetExceeded(breach))
+            return False
+        try:
+            fut.set_result(self.on_breach(breach, args))
+        except Exception as e:
+            fut.set_exception(e)
+        return False
+
+# ---------------------------
+# Quarantaine
+# ---------------------------
+
+class Quarantine:
+    """
+    Liste persistante (JSON) des documents hors budget, par empreinte du contenu
+    (extract_cache.file_digest) : un PDF renommé, déplacé ou réclamé par un nœud de la
+    file de travail reste reconnu, un PDF modifié est retenté.
+    {digest: {fichier, size, reason, seconds, peak_rss_mb, at, count}}.
+    Seuls les PDF de la taille d'une entrée sont hachés (contains, exclude).
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            if isinstance(data, dict):
+                self.entries = self._upgrade(data)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logging.warning(f"Quarantaine illisible, ignorée ({self.path}): {e}")
+
+    @staticmethod
+    def _upgrade(data: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        # Ancienne forme {chemin: {size, mtime_ns, ...}} : reprise si le fichier n'a pas changé
+        entries = {}
+        for key, entry in data.items():
+            if "fichier" in entry:
+                entries[key] = entry
+                continue
+            try:
+                st = os.stat(key)
+                if (st.st_size, st.st_mtime_ns) == (entry.get("size"), entry.pop("mtime_ns", None)):
+                    entries[file_digest(key)] = {"fichier": key, **entry}
+            except OSError:
+                pass
+        return entries
+
+    def add(self, path: str, breach: Breach, digest: Optional[str] = None, size: Optional[int] = None) -> None:
+        """
+        Met le document en quarantaine ; digest et size (contenu en mémoire) évitent de
+        relire path. Sans effet si le fichier n'est plus lisible.
+        """
+        try:
+            size = size if size is not None else os.stat(path).st_size
+            digest = digest or file_digest(path)
+        except OSError as e:
+            logging.warning(f"Quarantaine impossible de {path}: {e}")
+            return
+        with self._lock:
+            previous = self.entries.get(digest, {})
+            self.entries[digest] = {
+                "fichier": str(path),
+                "size": size,
+                "reason": breach.reason,
+                "seconds": round(breach.seconds, 3),
+                "peak_rss_mb": round(breach.peak_rss_bytes / 2**20, 1),
+                "at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "count": previous.get("count", 0) + 1,
+            }
+            self._save()
+
+    def entry(self, path: str) -> Optional[Dict[str, Any]]:
+        """Entrée du document path (même contenu), None s'il n'est pas en quarantaine."""
+        try:
+            if os.stat(path).st_size not in {e.get("size") for e in self.entries.values()}:
+                return None
+            return self.entries.get(file_digest(path))
+        except OSError:
+            return None
+
+    def contains(self, path: str) -> bool:
+        return self.entry(path) is not None
+
+    def exclude(self, paths: Iterable[Path]) -> List[Path]:
+        """paths privé des documents en quarantaine (même contenu)."""
+        kept = []
+        for p in paths:
+            entry = self.entry(str(p)) if self.entries else None
+            if entry is not None:
+                logging.warning(f"PDF en quarantaine ignoré: {p} ({entry['reason']}, {entry['fichier']})")
+                metrics.inc("invoices_pdf_total", result="quarantined")
+            else:
+                kept.append(p)
+        return kept
+
+    def _save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_text(json.dumps(self.entries, indent=2, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, self.path)
@@ -1,34 +1,473 @@
 ﻿# Gestion de la boîte mail
 import imaplib
 import email
+import io
 import os
 import json
+import re
+import base64
+import binascii
+import functools
+import quopri
+from contextlib import contextmanager
+from email.header import decode_header
+from email.utils import collapse_rfc2231_value, decode_rfc2231
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+# Taille des tranches de téléchargement d'une pièce jointe (FETCH BODY.PEEK[part]<offset.taille>)
+FETCH_CHUNK_BYTES = 1024 * 1024
+# Nombre de messages par FETCH BODYSTRUCTURE
+BODYSTRUCTURE_BATCH = 200
+# Taille encodée cumulée (tailles du BODYSTRUCTURE) des petites parties lues en un même FETCH :
+# imaplib garde toute la réponse en mémoire avant décodage
+FETCH_GROUP_BYTES = 4 * FETCH_CHUNK_BYTES
+
+class Attachment(NamedTuple):
+    """
+    PDF reçu par mail, gardé en mémoire (iter_attachments) : extrait sans passer par INPUT_DIR.
+    data : contenu décodé, tel que produit par le décodage de la réponse IMAP.
+    path : chemin d'archive (TRAITEMENT_DIR) une fois confié à l'archiveur, "" sinon.
+    """
+    filename: str
+    data: bytes
+    path: str = ""
+
+    def __str__(self) -> str:
+        return self.path or self.filename
 
 def load_env():
     with open(os.path.join("env", "env.json"), encoding="utf-8") as f:
         return json.load(f)
 
-def fetch_invoices():
-    env = load_env()
-    imap = imaplib.IMAP4_SSL("imap.gmail.com")
+def _connect(env) -> imaplib.IMAP4:
+    """
+    Connexion IMAP. IMAP_HOST / IMAP_PORT / IMAP_SSL permettent de viser un autre
+    serveur que Gmail (ex. serveur IMAP local de test, IMAP_SSL=false).
+    """
+    host = env.get("IMAP_HOST", "imap.gmail.com")
+    use_ssl = str(env.get("IMAP_SSL", True)).lower() in ("1", "true", "yes")
+    if use_ssl:
+        imap = imaplib.IMAP4_SSL(host, int(env.get("IMAP_PORT", 993)))
+    else:
+        imap = imaplib.IMAP4(host, int(env.get("IMAP_PORT", 143)))
     imap.login(env["EMAIL_ACCOUNT"], env["GMAIL_APP_PASSWORD"])
+    return imap
+
+def fetch_invoices(imap: Optional[imaplib.IMAP4] = None):
+    """
+    Télécharge les factures PDF reçues dans INPUT_DIR et renvoie la liste des fichiers écrits.
+    IMAP_FETCH_MODE :
+      - "legacy" (défaut) : messages UNSEEN, FETCH RFC822 message par message
+      - "bulk" : FETCH par UID et par lots (voir fetch_invoices_bulk)
+    `imap` : connexion déjà ouverte (sinon ouverte/fermée ici).
+    """
+    return list(iter_invoices(load_env(), imap))
+
+def iter_invoices(env, imap: Optional[imaplib.IMAP4] = None) -> Iterator[str]:
+    """
+    Variante générateur de fetch_invoices, avec la configuration fournie par l'appelant :
+    en mode "bulk", chaque chemin est produit dès que le PDF est écrit (le mode "legacy"
+    ne produit qu'une fois tous les messages lus).
+    """
+    mode = str(env.get("IMAP_FETCH_MODE", "legacy")).lower()
+    with _session(env, imap) as imap:
+        if mode == "bulk":
+            yield from fetch_invoices_bulk(imap, env)
+        else:
+            yield from _fetch_invoices_legacy(imap, env)
+
+def iter_attachments(
+    env,
+    imap: Optional[imaplib.IMAP4] = None,
+    defer_checkpoint: Optional[Callable[[Callable[[], None]], None]] = None,
+) -> Iterator[Attachment]:
+    """
+    Comme iter_invoices, mais sans écriture dans INPUT_DIR : chaque PDF est produit en
+    mémoire (Attachment), tel que décodé depuis la réponse IMAP, pour être extrait
+    directement (pdf_parser.extract_invoice_record(att.data, name=att.filename)).
+    defer_checkpoint (mode "bulk") : reçoit après chaque lot la fonction qui enregistre le
+    point de reprise, au lieu de l'enregistrer aussitôt ; l'appelant l'appelle une fois les
+    PDF rapportés (un run en échec relit ces messages au run suivant).
+    """
+    mode = str(env.get("IMAP_FETCH_MODE", "legacy")).lower()
+    with _session(env, imap) as imap:
+        if mode == "bulk":
+            for filename, write in _iter_bulk_parts(imap, env, defer_checkpoint=defer_checkpoint):
+                buf = io.BytesIO()
+                write(buf)
+                # getvalue() rend le tampon de décodage lui-même (pas de copie des octets)
+                yield Attachment(filename, buf.getvalue())
+        else:
+            for filename, payload in _legacy_attachments(imap):
+                yield Attachment(filename, payload)
+
+@contextmanager
+def _session(env, imap: Optional[imaplib.IMAP4]) -> Iterator[imaplib.IMAP4]:
+    """Connexion IMAP fournie par l'appelant, ou ouverte ici et fermée en sortie."""
+    own = imap is None
+    if own:
+        imap = _connect(env)
+    try:
+        yield imap
+    finally:
+        if own:
+            try:
+                imap.close()
+            except imaplib.IMAP4.error:
+                pass
+            imap.logout()
+
+def _legacy_attachments(imap) -> Iterator[Tuple[str, bytes]]:
+    """Messages UNSEEN "Facture", FETCH RFC822 : (nom de fichier, contenu décodé) de chaque PDF."""
     imap.select("INBOX")
 
     status, messages = imap.search(None, '(UNSEEN SUBJECT "Facture")')
-    invoices = []
 
     if status == "OK":
         for num in messages[0].split():
             status, data = imap.fetch(num, "(RFC822)")
             msg = email.message_from_bytes(data[0][1])
-            for part in msg.walk():
+            for idx, part in enumerate(msg.walk()):
                 if part.get_content_type() == "application/pdf":
                     filename = part.get_filename()
                     if filename:
-                        filepath = os.path.join(env["INPUT_DIR"], filename)
-                        with open(filepath, "wb") as f:
-                            f.write(part.get_payload(decode=True))
-                        invoices.append(filepath)
-    imap.close()
-    imap.logout()
+                        filename = _decode_filename(filename) or f"{num.decode()}_{idx}.pdf"
+                        yield filename, part.get_payload(decode=True)
+
+def _fetch_invoices_legacy(imap, env):
+    invoices = []
+    for filename, payload in _legacy_attachments(imap):
+        filepath = os.path.join(env["INPUT_DIR"], filename)
+        with open(filepath, "wb") as f:
+            f.write(payload)
+        invoices.append(filepath)
     return invoices
+
+
+# ============================
+#   MODE BULK (UID + BODYSTRUCTURE + parties PDF)
+# ============================
+
+class _Literal(bytes):
+    """Littéral IMAP ({n}\\r\\n...) : jamais interprété comme atome ou parenthèse."""
+
+_RGX_TOKEN = re.compile(rb'\(|\)|"(?:[^"\\]|\\.)*"|[^\s()"]+')
+_RGX_LITERAL_TAIL = re.compile(rb"\{(\d+)\}$")
+
+def _tokens(data: List[Any]) -> Iterator[Any]:
+    """
+    Tokenise une réponse imaplib (mélange de bytes et de tuples (préfixe, littéral)).
+    Produit b"(", b")", des atomes (bytes), des chaînes (str) et des _Literal.
+    """
+    for piece in data:
+        if piece is None:
+            continue
+        if isinstance(piece, tuple):
+            text, literal = piece
+            text = _RGX_LITERAL_TAIL.sub(b"", text.rstrip())
+        else:
+            text, literal = piece, None
+        for tok in _RGX_TOKEN.findall(text):
+            if tok.startswith(b'"'):
+                yield re.sub(rb"\\(.)", rb"\1", tok[1:-1]).decode("utf-8", "replace")
+            else:
+                yield tok
+        if literal is not None:
+            yield _Literal(literal)
+
+def _parse_fetch_response(data: List[Any]) -> Iterator[Dict[str, Any]]:
+    """
+    Découpe une réponse FETCH en messages : {"UID": 12, "BODYSTRUCTURE": [...], "BODY[2]<0>": b"..."}.
+    """
+    stack: List[list] = []
+    current: Optional[list] = None
+    for tok in _tokens(data):
+        if isinstance(tok, bytes) and not isinstance(tok, _Literal) and tok == b"(":
+            new: list = []
+            if current is not None:
+                current.append(new)
+                stack.append(current)
+            current = new
+        elif isinstance(tok, bytes) and not isinstance(tok, _Literal) and tok == b")":
+            if stack:
+                current = stack.pop()
+            else:
+                yield _fetch_items(current or [])
+                current = None
+        elif current is not None:
+            current.append(tok)
+        # hors parenthèses : numéro de séquence, ignoré (on travaille en UID)
+
+def _fetch_items(items: list) -> Dict[str, Any]:
+    out: Dict[str, Any] = {}
+    for i in range(0, len(items) - 1, 2):
+        key = items[i]
+        key = key.decode("ascii", "replace").upper() if isinstance(key, bytes) else str(key).upper()
+        value = items[i + 1]
+        if key == "UID":
+            value = int(value)
+        out[key] = value
+    return out
+
+def _text(value) -> str:
+    if value is None or value == b"NIL":
+        return ""
+    if isinstance(value, bytes):
+        return value.decode("utf-8", "replace")
+    return str(value)
+
+def _params(value) -> Dict[str, str]:
+    if not isinstance(value, list):
+        return {}
+    out: Dict[str, str] = {}
+    for i in range(0, len(value) - 1, 2):
+        key, val = _text(value[i]).lower(), _text(value[i + 1])
+        if key.endswith("*"):
+            # RFC 2231 : filename*=utf-8''facture%20mars.pdf
+            key, val = key[:-1], collapse_rfc2231_value(decode_rfc2231(val))
+        out[key] = val
+    return out
+
+def _decode_filename(name: str) -> str:
+    # En-têtes encodés (=?utf-8?q?...?=) + neutralisation des chemins
+    # (concaténation directe : make_header insérerait une espace entre morceaux encodés et non encodés)
+    # "" si le nom ne désigne pas un fichier ("", ".", "..") : à l'appelant de le générer
+    try:
+        name = "".join(
+            chunk.decode(charset or "utf-8", errors="replace") if isinstance(chunk, bytes) else chunk
+            for chunk, charset in decode_header(name)
+        )
+    except Exception:
+        pass
+    name = Path(name.replace("\\", "/")).name
+    return "" if name in ("", "..") else name
+
+def _pdf_parts(structure, prefix: str = "") -> Iterator[Tuple[str, str, str, int]]:
+    """
+    Parcourt un BODYSTRUCTURE et produit (numéro de partie, nom de fichier, encodage, taille)
+    pour chaque partie application/pdf nommée.
+    """
+    if not isinstance(structure, list) or not structure:
+        return
+    if isinstance(structure[0], list):
+        # multipart : enfants puis sous-type/paramètres
+        idx = 0
+        for child in structure:
+            if not isinstance(child, list):
+                break
+            idx += 1
+            yield from _pdf_parts(child, f"{prefix}.{idx}" if prefix else str(idx))
+        return
+
+    part = prefix or "1"
+    ctype = f"{_text(structure[0])}/{_text(structure[1])}".lower()
+    if ctype == "message/rfc822" and len(structure) > 8:
+        inner = structure[8]
+        if isinstance(inner, list) and inner and not isinstance(inner[0], list):
+            yield from _pdf_parts(inner, f"{part}.1")
+        else:
+            yield from _pdf_parts(inner, part)
+        return
+    if ctype != "application/pdf":
+        return
+
+    params = _params(structure[2])
+    encoding = _text(structure[5]).lower() or "7bit"
+    try:
+        size = int(_text(structure[6]) or 0)
+    except ValueError:
+        size = 0
+    filename = ""
+    # Extension : [md5, disposition, langue, location] après les 7 champs de base
+    for ext in structure[7:]:
+        if isinstance(ext, list) and len(ext) == 2 and isinstance(ext[1], list):
+            filename = _params(ext[1]).get("filename", "")
+            if filename:
+                break
+    filename = filename or params.get("name", "")
+    if filename:
+        yield part, _decode_filename(filename), encoding, size
+
+class _Decoder:
+    """Décodage incrémental d'une partie (base64 par quadruplets complets, sinon tel quel)."""
+
+    def __init__(self, out, encoding: str):
+        self.out = out
+        self.encoding = encoding
+        self._pending = b""
+
+    def feed(self, data: bytes) -> None:
+        if self.encoding == "base64":
+            data = self._pending + data.translate(None, b" \t\r\n")
+            cut = len(data) - len(data) % 4
+            if cut:
+                self.out.write(binascii.a2b_base64(data[:cut]))
+            self._pending = data[cut:]
+        elif self.encoding == "quoted-printable":
+            # Une séquence =XX ou un saut de ligne doux peut être coupé entre deux tranches
+            data = self._pending + data
+            cut = data.rfind(b"\n") + 1 or len(data)
+            self.out.write(quopri.decodestring(data[:cut]))
+            self._pending = data[cut:]
+        else:
+            self.out.write(data)
+
+    def close(self) -> None:
+        if self._pending:
+            if self.encoding == "base64":
+                pad = b"=" * (-len(self._pending) % 4)
+                self.out.write(base64.b64decode(self._pending + pad))
+            else:
+                self.out.write(quopri.decodestring(self._pending))
+            self._pending = b""
+
+def _section_data(item: Dict[str, Any], part: str) -> bytes:
+    prefix = f"BODY[{part}]"
+    for key, value in item.items():
+        if key.startswith(prefix):
+            return b"" if value == b"NIL" else bytes(value)
+    return b""
+
+def _download_part(imap, uid: int, part: str, encoding: str, size: int, out) -> None:
+    """Télécharge une partie par tranches BODY.PEEK[part]<offset.n> et la décode au fil de l'eau dans out."""
+    decoder = _Decoder(out, encoding)
+    offset = 0
+    while True:
+        status, data = imap.uid("FETCH", str(uid), f"(BODY.PEEK[{part}]<{offset}.{FETCH_CHUNK_BYTES}>)")
+        if status != "OK":
+            raise imaplib.IMAP4.error(f"FETCH UID {uid} BODY[{part}] : {status}")
+        chunk = b""
+        for item in _parse_fetch_response(data):
+            chunk = _section_data(item, part)
+        decoder.feed(chunk)
+        offset += len(chunk)
+        if len(chunk) < FETCH_CHUNK_BYTES or (size and offset >= size):
+            break
+    decoder.close()
+
+def _decode_part(encoding: str, raw: bytes, out) -> None:
+    decoder = _Decoder(out, encoding)
+    decoder.feed(raw)
+    decoder.close()
+
+def _download_small_parts(imap, part: str, entries: List[Tuple[int, str, str, int]]) -> Iterator[Tuple[str, str, bytes]]:
+    """
+    Parties tenant en une tranche et portant le même numéro (cas courant : PDF en partie 2) :
+    un seul UID FETCH pour tous les messages concernés au lieu d'un aller-retour par message
+    (l'appelant borne leur taille cumulée, voir _size_groups).
+    Produit (nom de fichier, encodage, contenu encodé).
+    """
+    by_uid = {uid: (filename, encoding) for uid, filename, encoding, _ in entries}
+    status, data = imap.uid("FETCH", ",".join(str(uid) for uid in by_uid), f"(UID BODY.PEEK[{part}])")
+    if status != "OK":
+        raise imaplib.IMAP4.error(f"UID FETCH BODY[{part}] : {status}")
+    for item in _parse_fetch_response(data):
+        uid = item.get("UID")
+        if uid not in by_uid:
+            continue
+        filename, encoding = by_uid[uid]
+        yield filename, encoding, _section_data(item, part)
+
+def _size_groups(entries: List[Tuple[int, str, str, int]], limit: int) -> Iterator[List[Tuple[int, str, str, int]]]:
+    """Découpe entries (dans l'ordre) en groupes dont la taille cumulée ne dépasse pas limit."""
+    group: List[Tuple[int, str, str, int]] = []
+    total = 0
+    for entry in entries:
+        size = entry[3]
+        if group and total + size > limit:
+            yield group
+            group, total = [], 0
+        group.append(entry)
+        total += size
+    if group:
+        yield group
+
+def _load_checkpoint(path: Path) -> Dict[str, int]:
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def _save_checkpoint(path: Path, uidvalidity: int, last_uid: int) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps({"uidvalidity": uidvalidity, "last_uid": last_uid}), encoding="utf-8")
+    os.replace(tmp, path)
+
+def fetch_invoices_bulk(imap, env, mailbox: str = "INBOX") -> Iterator[str]:
+    """
+    Récupération incrémentale et partielle :
+      1) SELECT + point de reprise (UIDVALIDITY, dernier UID traité) au lieu du drapeau UNSEEN
+      2) UID SEARCH des nouveaux messages "Facture"
+      3) UID FETCH BODYSTRUCTURE par lots de BODYSTRUCTURE_BATCH messages
+      4) seules les parties application/pdf sont téléchargées (BODY.PEEK, décodées en flux
+         vers INPUT_DIR) ; images et corps de message ne transitent pas. Les petites parties
+         de même numéro sont regroupées en FETCH d'au plus FETCH_GROUP_BYTES, les grosses
+         sont lues par tranches
+    Produit le chemin de chaque PDF écrit. Le point de reprise (IMAP_CHECKPOINT,
+    défaut ./.cache/imap_checkpoint.json) est mis à jour après chaque lot.
+    """
+    input_dir = Path(env["INPUT_DIR"])
+    input_dir.mkdir(parents=True, exist_ok=True)
+    for filename, write in _iter_bulk_parts(imap, env, mailbox):
+        dest = input_dir / filename
+        tmp = dest.with_name(dest.name + ".part")
+        with tmp.open("wb") as f:
+            write(f)
+        os.replace(tmp, dest)
+        yield str(dest)
+
+def _iter_bulk_parts(
+    imap,
+    env,
+    mailbox: str = "INBOX",
+    defer_checkpoint: Optional[Callable[[Callable[[], None]], None]] = None,
+) -> Iterator[Tuple[str, Callable[[Any], None]]]:
+    """
+    Étapes 1 à 4 de fetch_invoices_bulk, sans choix de destination : produit
+    (nom de fichier, write) où write(out) décode la partie PDF dans le flux binaire out.
+    write est à appeler avant de reprendre l'itération (il peut encore lire la connexion).
+    Point de reprise enregistré après chaque lot, ou confié à defer_checkpoint (voir iter_attachments).
+    """
+    checkpoint_path = Path(env.get("IMAP_CHECKPOINT", os.path.join(".cache", "imap_checkpoint.json")))
+
+    status, _ = imap.select(mailbox, readonly=True)
+    if status != "OK":
+        raise imaplib.IMAP4.error(f"SELECT {mailbox} : {status}")
+    uidvalidity = int((imap.response("UIDVALIDITY")[1] or [b"0"])[0])
+
+    checkpoint = _load_checkpoint(checkpoint_path)
+    last_uid = checkpoint.get("last_uid", 0) if checkpoint.get("uidvalidity") == uidvalidity else 0
+
+    status, found = imap.uid("SEARCH", None, f'UID {last_uid + 1}:* SUBJECT "Facture"')
+    if status != "OK":
+        raise imaplib.IMAP4.error(f"UID SEARCH : {status}")
+    # "n:*" renvoie toujours le plus grand UID, même s'il est <= n
+    uids = sorted(u for u in (int(x) for x in (found[0] or b"").split()) if u > last_uid)
+
+    for start in range(0, len(uids), BODYSTRUCTURE_BATCH):
+        batch = uids[start:start + BODYSTRUCTURE_BATCH]
+        status, data = imap.uid("FETCH", ",".join(map(str, batch)), "(UID BODYSTRUCTURE)")
+        if status != "OK":
+            raise imaplib.IMAP4.error(f"UID FETCH BODYSTRUCTURE : {status}")
+        small: Dict[str, List[Tuple[int, str, str, int]]] = {}
+        for item in sorted(_parse_fetch_response(data), key=lambda it: it.get("UID", 0)):
+            uid = item.get("UID")
+            if uid is None:
+                continue
+            for part, filename, encoding, size in _pdf_parts(item.get("BODYSTRUCTURE")):
+                filename = filename or f"{uid}_{part}.pdf"
+                if 0 < size <= FETCH_CHUNK_BYTES:
+                    small.setdefault(part, []).append((uid, filename, encoding, size))
+                else:
+                    yield filename, functools.partial(_download_part, imap, uid, part, encoding, size)
+        for part, entries in small.items():
+            for group in _size_groups(entries, FETCH_GROUP_BYTES):
+                for filename, encoding, raw in _download_small_parts(imap, part, group):
+                    yield filename, functools.partial(_decode_part, encoding, raw)
+        save = functools.partial(_save_checkpoint, checkpoint_path, uidvalidity, batch[-1])
+        if defer_checkpoint is not None:
+            defer_checkpoint(save)
+        else:
+            save()
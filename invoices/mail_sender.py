@@ -6,7 +6,8 @@ from email.message import EmailMessage
 from pathlib import Path
 from typing import List, Optional
 
-from invoices.utils import load_env_config, ConfigError  # import via package
+from invoices import metrics
+from invoices.utils import load_env_config, EnvConfig, ConfigError  # import via package
 
 # Nom de fichier autorisé (verrouillage)
 ALLOWED_EXCEL_NAME = "invoices_extract.xlsx"
@@ -16,18 +17,6 @@ ALLOWED_EXCEL_NAME = "invoices_extract.xlsx"
 # Helpers chemins & fichiers
 # ---------------------------
 
-def _project_root() -> Path:
-    """Racine du projet: parent de invoices/ ou WORKSPACE Jenkins si défini."""
-    package_dir = Path(__file__).resolve().parent          # .../invoices
-    ws = os.environ.get("WORKSPACE")
-    if ws:
-        return Path(ws).resolve()
-    return package_dir.parent                               # .../invoices_project
-
-def _resolve_dir(base: Path, value: str) -> Path:
-    p = Path(value)
-    return (base / p).resolve() if not p.is_absolute() else p.resolve()
-
 def _latest_xlsx_in(dir_path: Path) -> Optional[Path]:
     # (Conservé mais non utilisé, au cas où — peut être supprimé)
     if not dir_path.exists():
@@ -57,6 +46,20 @@ def normalize_recipients(val) -> List[str]:
             seen.add(addr.lower())
     return cleaned
 
+def is_transient_error(e: BaseException) -> bool:
+    """
+    Échec d'envoi temporaire, qui peut être retenté : coupure réseau, serveur injoignable
+    ou déconnecté, réponse SMTP 4xx. Authentification refusée, destinataires rejetés (5xx),
+    pièce jointe ou configuration invalides : définitifs.
+    """
+    if isinstance(e, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError)):
+        return True
+    if isinstance(e, smtplib.SMTPResponseException):
+        return 400 <= e.smtp_code < 500
+    if isinstance(e, (smtplib.SMTPException, FileNotFoundError, PermissionError)):
+        return False
+    return isinstance(e, OSError)  # socket, TimeoutError, ConnectionError, ssl.SSLError
+
 def _attach_file(msg: EmailMessage, file_path: str | os.PathLike):
     p = Path(file_path)
     if not p.exists():
@@ -78,15 +81,14 @@ def _attach_file(msg: EmailMessage, file_path: str | os.PathLike):
 # Résolution stricte du fichier Excel
 # ---------------------------
 
-def _resolve_excel_path_from_env(env: dict) -> Path:
+def _resolve_excel_path_from_env(env: EnvConfig) -> Path:
     """
     Renvoie le chemin de 'invoices_extract.xlsx' UNIQUEMENT :
       - si EXCEL_FILE est défini, il doit s'appeler exactement 'invoices_extract.xlsx'
       - sinon on cherche 'invoices_extract.xlsx' dans OUTPUT_DIR
     Échec sinon.
     """
-    root = _project_root()
-    output_dir = _resolve_dir(root, env.get("OUTPUT_DIR", "./output"))
+    output_dir = env.resolve("OUTPUT_DIR", "./output")
 
     preferred_name = env.get("EXCEL_FILE", "").strip()
     # Si EXCEL_FILE est renseigné, il doit être le nom autorisé
@@ -122,6 +124,7 @@ def _resolve_excel_path_from_env(env: dict) -> Path:
 # Envoi principal
 # ---------------------------
 
+@metrics.timed("invoices_email_seconds")
 def send_report(excel_file: Optional[str] = None):
     """
     Envoie le reporting par email en lisant la configuration depuis env.json.
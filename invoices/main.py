@@ -1,13 +1,31 @@
 # invoices/main.py
+from __future__ import annotations
+
 import os
+import argparse
 import traceback
 import logging
 import csv
+import time
+from collections import deque
+from contextlib import nullcontext
 from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator
+
+from invoices.utils import load_env_config, project_root, ConfigError
+from invoices.pdf_parser import extract_invoice_record, configure_extraction  # PyPDF2 + regex
+from invoices import extract_cache
+from invoices import dedup_index
+from invoices import metrics
+from invoices.file_manifest import FileManifest
+from invoices.records import CSV_FIELDS, InvoiceRecord, as_record
+from invoices.rollups import Rollups
 
-from invoices.utils import load_env_config, ConfigError
-from invoices.pdf_parser import extract_invoice_data  # PyPDF2 + regex
-from invoices import excel_reporter, mail_sender      # ⬅️ ajouté
+# Importés à la demande (openpyxl, smtplib, imaplib, asyncio, multiprocessing...) : seulement
+# sur le chemin qui en a besoin, et jamais dans les workers d'extraction (spawn sous Windows)
+if TYPE_CHECKING:
+    from invoices import checkpoints, column_store, isolation, mail_handler, report_ledger, work_queue
+    from invoices.archiver import Archiver
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s - %(message)s")
 
@@ -25,17 +43,6 @@ REQUIRED_KEYS = [
     "EMAIL_BODY",
 ]
 
-def _project_root() -> Path:
-    package_dir = Path(__file__).resolve().parent
-    ws = os.environ.get("WORKSPACE")
-    if ws:
-        return Path(ws).resolve()
-    return package_dir.parent
-
-def _resolve_dir(base: Path, value: str) -> Path:
-    p = Path(value)
-    return (base / p).resolve() if not p.is_absolute() else p.resolve()
-
 def _mkdirs(*dirs: Path):
     for d in dirs:
         d.mkdir(parents=True, exist_ok=True)
@@ -51,111 +58,1038 @@ def _list_dir(d: Path, max_items: int = 50) -> str:
         items.append(p.name + ("/" if p.is_dir() else ""))
     return f"{d} -> {', '.join(items) if items else '(vide)'}"
 
-def _find_excel_anywhere(base: Path, filename: str) -> Path | None:
-    candidates = list(base.rglob(filename))
-    return candidates[0] if candidates else None
+def _no_invoice_error(input_dir: Path) -> FileNotFoundError:
+    return FileNotFoundError(
+        "Aucune facture PDF traitée -> pas de reporting généré.\n"
+        f"  Dossier INPUT : {_list_dir(input_dir)}\n"
+        "💡 Ajoute des PDF dans INPUT, ou active ALLOW_EMPTY_REPORT_IF_MISSING=true dans env.json."
+    )
 
-def _normalize_row_keys(data: dict) -> dict:
+def _find_excel_anywhere(base: Path, filename: str, skip: tuple[Path, ...] = ()) -> Path | None:
     """
-    Harmonise les clés indépendamment de la version du parser.
-    Accepte:
-      - ancienne forme: fichier, facture, date, total_ttc, periode
-      - nouvelle forme: fichier, numero_facture, date_facture, total_ttc, periode
+    Recherche du reporting sous base (os.scandir), sans descendre dans les dossiers
+    de PDF (skip : INPUT_DIR, TRAITEMENT_DIR) ni dans les dossiers cachés (.git, .cache).
     """
-    numero = data.get("numero_facture") or data.get("facture") or "INCONNU"
-    date_ = data.get("date_facture") or data.get("date") or "INCONNU"
-    return {
-        "fichier": data.get("fichier") or "INCONNU",
-        "date_facture": date_,
-        "numero_facture": numero,
-        "total_ttc": data.get("total_ttc") or "INCONNU",
-        "periode": data.get("periode") or "",
-    }
+    skipped = {os.path.abspath(d) for d in skip}
+    stack = [os.path.abspath(base)]
+    while stack:
+        try:
+            it = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    if not entry.name.startswith(".") and entry.path not in skipped:
+                        stack.append(entry.path)
+                elif entry.name == filename:
+                    return Path(entry.path)
+    return None
 
-def _write_csv_report(rows: list[dict], csv_path: Path) -> None:
+def _resolve_workers(value) -> int:
     """
-    Écrit un CSV 'invoices_extract.csv' avec colonnes:
-      fichier, date_facture, numero_facture, total_ttc, periode
+    Nombre de processus d'extraction:
+      - None / "" / 1 -> séquentiel (comportement historique)
+      - 0 / "auto"    -> un processus par cœur (os.cpu_count())
+      - n > 1         -> n processus
+    """
+    if value in (None, ""):
+        return 1
+    if str(value).strip().lower() == "auto":
+        return os.cpu_count() or 1
+    try:
+        n = int(value)
+    except (TypeError, ValueError):
+        raise ConfigError(f"EXTRACT_WORKERS invalide: '{value}' (entier ou 'auto' attendu).")
+    if n < 0:
+        raise ConfigError(f"EXTRACT_WORKERS invalide: '{value}' (doit être >= 0).")
+    return (os.cpu_count() or 1) if n == 0 else n
+
+def _is_true(value) -> bool:
+    return str(value).lower() in ("1", "true", "yes")
+
+def _configure_extract_cache(env) -> tuple[str | None, int]:
+    """
+    Cache d'extraction (actif par défaut) :
+      - EXTRACT_CACHE=false pour le désactiver
+      - EXTRACT_CACHE_PATH (défaut ./.cache/extract_cache.sqlite)
+      - EXTRACT_CACHE_MAX_MB (défaut 256) : taille au-delà de laquelle on évince (LRU)
+    Renvoie (chemin, max_bytes) pour réinitialiser le cache dans les workers.
+    """
+    if not _is_true(env.get("EXTRACT_CACHE", True)):
+        extract_cache.configure_cache(None)
+        return None, 0
+    path = str(env.resolve("EXTRACT_CACHE_PATH", "./.cache/extract_cache.sqlite"))
+    try:
+        max_bytes = int(float(env.get("EXTRACT_CACHE_MAX_MB", 256)) * 1024 * 1024)
+    except (TypeError, ValueError):
+        raise ConfigError(f"EXTRACT_CACHE_MAX_MB invalide: '{env.get('EXTRACT_CACHE_MAX_MB')}'.")
+    extract_cache.configure_cache(path, max_bytes)
+    return path, max_bytes
+
+def _open_manifest(env, directory: Path, name: str) -> FileManifest:
+    """
+    Manifeste incrémental d'un dossier de PDF (file_manifest) :
+      - FILE_MANIFEST=false : pas d'état conservé, tout le dossier est relu à chaque run
+      - FILE_MANIFEST_DIR (défaut ./.cache/manifests) : un état JSON par dossier
+      - FILE_MANIFEST_FULL_SCAN=true : relit tous les sous-dossiers, même inchangés
+    """
+    state = None
+    if _is_true(env.get("FILE_MANIFEST", True)):
+        state = env.resolve("FILE_MANIFEST_DIR", "./.cache/manifests") / f"{name}.json"
+    return FileManifest(directory, state, full_scan=_is_true(env.get("FILE_MANIFEST_FULL_SCAN", "")))
+
+def _refresh_manifest(manifest: FileManifest, label: str) -> None:
+    t0 = time.perf_counter()
+    changes = manifest.refresh()
+    seconds = time.perf_counter() - t0
+    metrics.observe("invoices_manifest_seconds", seconds, dir=label)
+    logging.info(
+        f"Manifeste {label}: {len(manifest)} PDF ({len(changes.added)} nouveau(x), "
+        f"{len(changes.changed)} modifié(s), {len(changes.removed)} supprimé(s)), "
+        f"{manifest.dirs_scanned} dossier(s) relu(s) en {seconds * 1e3:.0f} ms"
+    )
+
+def _configure_dedup_index(env, trait_dir: Path) -> str | None:
+    """
+    Index des doublons (actif par défaut) :
+      - DEDUP_INDEX=false pour le désactiver
+      - DEDUP_INDEX_PATH (défaut ./.cache/dedup_index.sqlite)
+    Les PDF archivés dans TRAITEMENT_DIR y sont enregistrés d'abord : une copie reçue
+    à nouveau dans INPUT_DIR est reconnue comme doublon exact. Seuls les PDF archivés
+    nouveaux ou modifiés depuis le run précédent sont relus (manifeste "traitement"),
+    tous si l'index vient d'être créé.
+    Renvoie le chemin de l'index pour le réinitialiser dans les workers.
+    """
+    if not _is_true(env.get("DEDUP_INDEX", True)):
+        dedup_index.configure_index(None)
+        return None
+    path = str(env.resolve("DEDUP_INDEX_PATH", "./.cache/dedup_index.sqlite"))
+    fresh = not Path(path).exists()
+    index = dedup_index.configure_index(path)
+    manifest = _open_manifest(env, trait_dir, "traitement")
+    _refresh_manifest(manifest, "TRAITEMENT")
+    indexed = index.index_files(manifest.paths() if fresh else manifest.changed_paths())
+    logging.info(f"Index des doublons: {path} ({indexed} PDF archivé(s) indexé(s) sur {len(manifest)})")
+    return path
+
+def _configure_column_store(env) -> column_store.ColumnStore | None:
+    """
+    Stockage colonnaire des lignes extraites (actif par défaut), pour les agrégats
+    pluriannuels (python -m invoices.column_store) :
+      - COLUMN_STORE=false pour le désactiver
+      - COLUMN_STORE_DIR (défaut ./output/store)
+    """
+    if not _is_true(env.get("COLUMN_STORE", True)):
+        return None
+    from invoices import column_store
+    try:
+        return column_store.ColumnStore(env.resolve("COLUMN_STORE_DIR", "./output/store"))
+    except (OSError, ValueError, column_store.StoreError) as e:
+        raise ConfigError(f"COLUMN_STORE_DIR illisible: {e}")
+
+REPORT_MODES = ("full", "incremental")
+
+def _configure_report_ledger(env, output_dir: Path) -> tuple[report_ledger.ReportLedger, Path] | None:
+    """
+    REPORT_MODE : "full" (défaut) : CSV et Excel réécrits à chaque run avec toutes les lignes ;
+                  "incremental" : seules les factures jamais reportées sont ajoutées (report_ledger) :
+      - le CSV garde tout l'historique, les nouvelles lignes sont ajoutées en fin de fichier ;
+        au premier run, un CSV déjà écrit en mode "full" est repris comme historique
+      - REPORT_PARTS_DIR (défaut OUTPUT_DIR/parts) : un classeur par mois de facture
+        (invoices_AAAA-MM.xlsx), réécrit seulement quand le run ajoute des lignes à ce mois
+      - invoices_extract.xlsx (envoyé) : nouvelles lignes du run + onglets de synthèse
+        (historique complet si le stockage colonnaire est actif)
+      - REPORT_LEDGER_PATH (défaut OUTPUT_DIR/report_ledger.sqlite)
+    Classeur complet à la demande : python -m invoices report (depuis le CSV).
+    Renvoie (registre, dossier des classeurs mensuels), None en mode "full".
+    """
+    mode = str(env.get("REPORT_MODE") or "full").lower()
+    if mode not in REPORT_MODES:
+        raise ConfigError(f"REPORT_MODE invalide: '{mode}' ({' ou '.join(REPORT_MODES)} attendu).")
+    if mode == "full":
+        return None
+    from invoices import report_ledger
+
+    ledger = report_ledger.ReportLedger(env.resolve("REPORT_LEDGER_PATH", str(output_dir / "report_ledger.sqlite")))
+    parts_dir = env.resolve("REPORT_PARTS_DIR", str(output_dir / "parts"))
+    logging.info(f"Reporting incrémental: {len(ledger)} ligne(s) déjà reportée(s) ({ledger.path})")
+    return ledger, parts_dir
+
+def _commit_increment(ledger: report_ledger.ReportLedger, parts_dir: Path, csv_path: Path) -> None:
+    """
+    Classeurs des mois touchés par le run (relus du registre, nouvelles lignes comprises),
+    puis validation du run dans le registre : un run interrompu avant est rejoué en entier.
+    """
+    from invoices import excel_reporter
+
+    run = ledger.begin()
+    months = sorted(run.months)
+    with metrics.timed("invoices_report_seconds", format="parts"):
+        for month in months:
+            excel_reporter.write_report(ledger.month_records(month), parts_dir / f"invoices_{month}.xlsx", month)
+    rows = run.rows
+    run_id = ledger.commit(csv_path)
+    metrics.inc("invoices_report_parts_total", len(months))
+    logging.info(
+        f"Reporting incrémental: run {run_id}, {rows} ligne(s) ajoutée(s), "
+        f"{len(months)} classeur(s) mensuel(s) réécrit(s) dans {parts_dir}"
+    )
+
+def _prepare_ledger_csv(ledger: report_ledger.ReportLedger, csv_path: Path) -> None:
+    try:
+        state = ledger.prepare_csv(csv_path)
+    except ValueError as e:
+        raise ConfigError(f"REPORT_MODE=incremental: {e}")
+    if state == "seeded":
+        logging.info(f"Reporting incrémental: historique du CSV existant repris dans le registre ({len(ledger)} ligne(s))")
+    elif state != "ok":
+        logging.warning(f"CSV remis à l'état du dernier run validé ({state}): {csv_path}")
+
+def _open_store_appender(store: column_store.ColumnStore) -> column_store.StoreAppender | None:
+    # Un échec n'interrompt pas le pipeline (le reporting du run reste complet)
+    from invoices import column_store
+    try:
+        return store.appender()
+    except (OSError, column_store.StoreError) as e:
+        logging.warning(f"Ajout au stockage colonnaire impossible: {e}")
+        return None
+
+def _tee_to_store(rows: Iterable[InvoiceRecord], appender: column_store.StoreAppender, timing: dict) -> Iterator[InvoiceRecord]:
+    """
+    Étage de diffusion : chaque ligne est ajoutée au stockage colonnaire dès qu'elle arrive,
+    puis retransmise. Sur erreur, l'ajout est abandonné (rien n'est validé) et les lignes
+    continuent vers le reporting. timing["seconds"] cumule le temps passé dans le stockage.
+    """
+    from invoices import column_store
+    timing.setdefault("seconds", 0.0)
+    for row in rows:
+        if not appender.closed:
+            t0 = time.perf_counter()
+            try:
+                appender.add(row)
+            except (OSError, column_store.StoreError) as e:
+                logging.warning(f"Ajout au stockage colonnaire impossible: {e}")
+                appender.close()
+            timing["seconds"] += time.perf_counter() - t0
+        yield row
+
+def _commit_store(store: column_store.ColumnStore, appender: column_store.StoreAppender, timing: dict) -> bool:
+    """Valide les lignes ajoutées par _tee_to_store (manifeste et agrégats). False si l'ajout a échoué."""
+    from invoices import column_store
+    if appender.closed:
+        return False
+    t0 = time.perf_counter()
+    try:
+        added = appender.commit()
+    except (OSError, column_store.StoreError) as e:
+        logging.warning(f"Ajout au stockage colonnaire impossible: {e}")
+        return False
+    finally:
+        metrics.observe("invoices_store_append_seconds", timing.get("seconds", 0.0) + time.perf_counter() - t0)
+    metrics.inc("invoices_store_rows_total", added)
+    logging.info(
+        f"Stockage colonnaire: {added} ligne(s) ajoutée(s), {len(store)} au total ({store.directory})"
+    )
+    return True
+
+def _configure_extraction_mode(env) -> tuple[str, dict, str, bool]:
+    """
+    EXTRACT_MODE : "full" (défaut) ou "lazy" (page par page, arrêt anticipé).
+    PAGE_HINTS   : {"motif nom de fichier": "first" | "last" | "ends"} (ordre de lecture des pages).
+    TEXT_BACKEND : "raw" (défaut : flux de contenu décodés directement, repli PyPDF2)
+                   ou "pypdf2" (PageObject.extract_text pour toutes les pages).
+    SUPPLIER_TEMPLATES : false pour désactiver les modèles fournisseur (supplier_templates)
+                   et toujours passer par la cascade générique.
+    """
+    mode = str(env.get("EXTRACT_MODE", "full") or "full")
+    hints = env.get("PAGE_HINTS") or {}
+    if not isinstance(hints, dict):
+        raise ConfigError("PAGE_HINTS doit être un objet JSON {motif: ordre}.")
+    backend = str(env.get("TEXT_BACKEND", "raw") or "raw")
+    templates = _is_true(env.get("SUPPLIER_TEMPLATES", True))
+    try:
+        configure_extraction(mode, hints, backend, templates)
+    except ValueError as e:
+        raise ConfigError(str(e)) from e
+    return mode, hints, backend, templates
+
+# Vrai dans un processus du pool d'extraction : les métriques repartent avec chaque résultat
+_IN_WORKER = False
+
+def _init_worker(cache_args: tuple, extract_args: tuple, dedup_path: str | None = None) -> None:
+    """Initializer des workers du pool : même cache, même index et même mode d'extraction que le parent."""
+    global _IN_WORKER
+    _IN_WORKER = True
+    metrics.REGISTRY.reset()  # (fork) ne pas renvoyer les métriques héritées du parent
+    extract_cache.configure_cache(*cache_args)
+    dedup_index.configure_index(dedup_path)
+    configure_extraction(*extract_args)
+
+def _extract_one(pdf: str | mail_handler.Attachment) -> tuple[InvoiceRecord | None, str | None, dict | None]:
+    """
+    Extraction d'un PDF (chemin, ou pièce jointe en mémoire archivée sous pdf.path),
+    exécutable dans un processus worker.
+    Ne lève jamais: renvoie (data, None, métriques) ou (None, message d'erreur, métriques),
+    ou (None, None, métriques) pour une copie d'un PDF déjà connu (doublon exact, non parsé).
+    Un doublon probable (mêmes numéro/date/montant) est extrait et marqué (data.doublon).
+    Métriques : snapshot à fusionner dans le parent (metrics.merge) si exécuté dans un
+    worker, None sinon (déjà enregistrées dans le registre du processus).
+    """
+    index = dedup_index.get_default_index()
+    in_memory = not isinstance(pdf, (str, os.PathLike))
+    try:
+        digest = None
+        if index is not None:
+            digest = extract_cache.buffer_digest(pdf.data) if in_memory else index.digest(pdf)
+            original = index.claim(pdf.path if in_memory else pdf, digest)
+            if original is not None:
+                logging.info(f"Doublon exact ignoré: {pdf} (même contenu que {original})")
+                metrics.inc("invoices_pdf_total", result="duplicate")
+                return None, None, metrics.REGISTRY.drain() if _IN_WORKER else None
+        if in_memory:
+            data, err = extract_invoice_record(pdf.data, digest=digest, name=pdf.filename), None
+        else:
+            data, err = extract_invoice_record(pdf, digest=digest), None
+        if index is not None:
+            other = index.near_duplicate(data, digest)
+            if other:
+                logging.warning(f"Doublon probable: {data.fichier} (mêmes numéro/date/montant que {other})")
+                metrics.inc("invoices_near_duplicates_total")
+                data = data._replace(doublon=other)
+        metrics.inc("invoices_pdf_total", result="ok")
+    except Exception as e:
+        data, err = None, f"{type(e).__name__}: {e}"
+        metrics.inc("invoices_pdf_total", result="error")
+    return data, err, metrics.REGISTRY.drain() if _IN_WORKER else None
+
+def _configure_isolation(env) -> tuple[isolation.Budget, isolation.Quarantine] | None:
+    """
+    EXTRACT_ISOLATION=true : chaque PDF est extrait dans un worker supervisé (isolation),
+    tué puis relancé s'il dépasse son budget ; le PDF est mis en quarantaine et le lot continue.
+      - EXTRACT_TIMEOUT_SECONDS (défaut 120, 0 = sans limite) : durée max par PDF
+      - EXTRACT_MAX_RSS_MB (défaut 1024, 0 = sans limite) : mémoire (RSS) max d'un worker
+      - QUARANTINE_FILE (défaut ./.cache/quarantine.json) : PDF hors budget et leur coût,
+        ignorés aux runs suivants tant qu'ils n'ont pas changé
+    Renvoie (budget, quarantaine), None si l'isolation est désactivée.
+    """
+    if not _is_true(env.get("EXTRACT_ISOLATION", "")):
+        return None
+    from invoices import isolation
+    try:
+        seconds = float(env.get("EXTRACT_TIMEOUT_SECONDS", 120) or 0)
+        rss_mb = float(env.get("EXTRACT_MAX_RSS_MB", 1024) or 0)
+    except (TypeError, ValueError):
+        raise ConfigError(
+            f"EXTRACT_TIMEOUT_SECONDS / EXTRACT_MAX_RSS_MB invalides: "
+            f"'{env.get('EXTRACT_TIMEOUT_SECONDS')}' / '{env.get('EXTRACT_MAX_RSS_MB')}' (nombres attendus)."
+        )
+    budget = isolation.Budget(seconds or None, int(rss_mb * 1024 * 1024) or None)
+    quarantine = isolation.Quarantine(env.resolve("QUARANTINE_FILE", "./.cache/quarantine.json"))
+    logging.info(
+        f"Extraction isolée: {seconds:g}s et {rss_mb:g} Mo max par PDF (0 = sans limite), "
+        f"quarantaine {quarantine.path} ({len(quarantine.entries)} PDF)"
+    )
+    return budget, quarantine
+
+def _quarantined(quarantine: isolation.Quarantine, breach: isolation.Breach, args: tuple) -> tuple:
+    """on_breach de IsolatedExecutor : même forme de résultat qu'un échec de _extract_one."""
+    pdf = args[0]
+    if isinstance(pdf, (str, os.PathLike)):
+        quarantine.add(pdf, breach)
+    else:
+        # Archive éventuellement pas encore écrite : empreinte du contenu en mémoire
+        quarantine.add(pdf.path or pdf.filename, breach, extract_cache.buffer_digest(pdf.data), len(pdf.data))
+    metrics.inc("invoices_pdf_total", result="error")
+    metrics.inc("invoices_quarantine_total", reason=breach.reason)
+    metrics.observe("invoices_quarantine_seconds", breach.seconds, reason=breach.reason)
+    return None, f"{breach.describe()}, mis en quarantaine", None
+
+def _pool(workers: int, cache_args: tuple, extract_args: tuple, dedup_path: str | None,
+          isolated: tuple[isolation.Budget, isolation.Quarantine] | None = None):
+    """Pool de processus d'extraction : ProcessPoolExecutor, ou workers supervisés (isolation)."""
+    initargs = (cache_args, extract_args, dedup_path)
+    if isolated is None:
+        from concurrent.futures import ProcessPoolExecutor
+        return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs)
+    from invoices import isolation
+    budget, quarantine = isolated
+    return isolation.IsolatedExecutor(
+        workers, budget,
+        on_breach=lambda breach, args: _quarantined(quarantine, breach, args),
+        initializer=_init_worker, initargs=initargs,
+    )
+
+class _ExtractPool:
+    """
+    Pool d'extraction reconstructible : un worker mort (crash natif, OOM) casse tout le
+    ProcessPoolExecutor (BrokenProcessPool sur chaque PDF en vol et chaque submit suivant).
+    rebuild() remplace le pool cassé par un neuf, mêmes réglages, et le renvoie.
+    """
+
+    def __init__(self, workers: int, cache_args: tuple, extract_args: tuple, dedup_path: str | None,
+                 isolated: tuple[isolation.Budget, isolation.Quarantine] | None = None):
+        self._args = (workers, cache_args, extract_args, dedup_path, isolated)
+        self.executor = _pool(*self._args)
+
+    def submit(self, pdf):
+        return self.executor.submit(_extract_one, str(pdf))
+
+    def rebuild(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.executor = _pool(*self._args)
+        metrics.inc("invoices_pool_rebuilds_total")
+        return self.executor
+
+    def shutdown(self) -> None:
+        self.executor.shutdown()
+
+    def __enter__(self) -> "_ExtractPool":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.shutdown()
+
+def _iter_extracted(
+    pdf_paths: list[Path],
+    workers: int = 1,
+    cache_args: tuple = (None, 0),
+    extract_args: tuple = ("full", {}, "raw", True),
+    batch_size: int = 0,
+    dedup_path: str | None = None,
+    isolated: tuple[isolation.Budget, isolation.Quarantine] | None = None,
+    pool: _ExtractPool | None = None,
+) -> Iterator[InvoiceRecord]:
+    """
+    Extrait les PDF et produit chaque résultat dès qu'il est disponible (générateur).
+    - séquentiel, ou pool de processus avec au plus `batch_size` PDF en vol
+      (défaut: 4 par worker) : la mémoire ne dépend pas du nombre total de PDF
+    - isolated (_configure_isolation) : toujours dans des workers supervisés, même à 1 worker
+    - l'ordre produit est celui de pdf_paths, quel que soit l'ordre de fin des workers
+    - un PDF en échec est journalisé et ignoré, sans interrompre le lot
+    - un worker mort (crash natif, OOM) : pool reconstruit, PDF en vol relancés un par un
+      pour trouver celui qui le tue ; seul ce PDF est compté en échec
+    - un doublon exact (dedup_index) n'est ni parsé ni produit
+    - pool : pool déjà ouvert (_ExtractPool), réutilisé d'un appel à l'autre et laissé ouvert
+    """
+    if isolated is None and (workers <= 1 or len(pdf_paths) < 2):
+        for pdf in pdf_paths:
+            logging.info(f"Extraction: {pdf}")
+            data, err, _ = _extract_one(str(pdf))
+            if err:
+                logging.error(f"Échec extraction {pdf}: {err}")
+            elif data is not None:
+                yield data
+        return
+
+    if not pdf_paths:
+        return
+    from concurrent.futures.process import BrokenProcessPool
+    workers = max(1, min(workers, len(pdf_paths)))
+    batch_size = max(batch_size or workers * 4, workers)
+    logging.info(f"Extraction parallèle: {len(pdf_paths)} PDF sur {workers} processus (lot: {batch_size})")
+    # Pool fourni : fermé par l'appelant
+    owned = _ExtractPool(workers, cache_args, extract_args, dedup_path, isolated) if pool is None else nullcontext(pool)
+    with owned as pool:
+        pending: deque = deque()  # (pdf, future), dans l'ordre de pdf_paths
+        retry: deque = deque()    # (pdf, future terminée ou None) en vol lors d'une casse du pool
+        todo = iter(pdf_paths)
+        alone = False             # le PDF en tête de pending est seul en vol (relance après casse)
+        while True:
+            try:
+                if retry:
+                    # Relance un par un : si le pool casse, le PDF fautif est identifié
+                    if not pending:
+                        pdf, fut = retry.popleft()
+                        alone = fut is None
+                        pending.append((pdf, fut or pool.submit(pdf)))
+                else:
+                    # Fenêtre glissante : au plus batch_size PDF en vol
+                    alone = False
+                    while len(pending) < batch_size:
+                        pdf = next(todo, None)
+                        if pdf is None:
+                            break
+                        pending.append((pdf, pool.submit(pdf)))
+            except BrokenProcessPool:
+                # Cassé entre deux résultats : tout ce qui est en vol est suspect
+                retry.extendleft(reversed(_unfinished(pending) + [(pdf, None)]))
+                pending.clear()
+                pool.rebuild()
+                continue
+            if not pending:
+                break
+            pdf, fut = pending.popleft()
+            try:
+                data, err, worker_metrics = fut.result()
+                metrics.merge(worker_metrics)
+            except BrokenProcessPool as e:
+                if not alone:
+                    # Un worker est mort avec plusieurs PDF en vol : lequel ? résultats déjà obtenus
+                    # gardés, les autres relancés un par un dans un pool neuf
+                    logging.warning(
+                        f"Pool d'extraction cassé ({e}) : {len(pending) + 1} PDF en vol relancés un par un"
+                    )
+                    retry.extendleft(reversed([(pdf, None)] + _unfinished(pending)))
+                    pending.clear()
+                    pool.rebuild()
+                    continue
+                # Seul en vol : c'est lui qui tue le worker
+                data, err = None, f"worker interrompu ({e})"
+                metrics.inc("invoices_pdf_total", result="error")
+                pool.rebuild()
+            if err:
+                logging.error(f"Échec extraction {pdf}: {err}")
+            elif data is not None:
+                yield data
+
+def _unfinished(pending: deque) -> list:
+    # Futures d'un pool cassé : un résultat déjà obtenu est gardé, le reste est à relancer (None)
+    return [(pdf, fut if fut.done() and not fut.cancelled() and fut.exception() is None else None)
+            for pdf, fut in pending]
+
+PIPELINE_MODES = ("sequential", "async")
+
+def _int_setting(env, key: str, default: int) -> int:
+    try:
+        return int(env.get(key, default) or default)
+    except (TypeError, ValueError):
+        raise ConfigError(f"{key} invalide: '{env.get(key)}' (entier attendu).")
+
+def _run_async_pipeline(env, input_dir: Path, pdf_paths: list[Path], workers: int,
+                        cache_args: tuple, extract_args: tuple, report, fetch_mail: bool,
+                        dedup_path: str | None = None,
+                        isolated: tuple[isolation.Budget, isolation.Quarantine] | None = None):
+    """
+    PIPELINE_MODE=async : téléchargement IMAP, extraction et reporting se chevauchent
+    (voir async_pipeline). Réglages :
+      - PIPELINE_FETCH_MAIL=true : télécharge les nouvelles factures pendant le run
+        (mail_handler.iter_invoices ; IMAP_FETCH_MODE=bulk pour un flux PDF par PDF)
+      - MAIL_IN_MEMORY=true : les pièces jointes sont extraites depuis la mémoire
+        (mail_handler.iter_attachments), sans écriture dans INPUT_DIR ni relecture ;
+        l'archivage dans TRAITEMENT_DIR se fait en tâche de fond (archiver.Archiver).
+        Le point de reprise IMAP n'avance qu'une fois le rapport écrit ; run en échec :
+        les archives du run sont retirées et les messages relus au run suivant
+      - PIPELINE_PARSE_CONCURRENCY : PDF en cours d'extraction (défaut: 2 par worker)
+      - PIPELINE_QUEUE_SIZE : taille des files entre étapes (défaut: 16)
+      - EXTRACT_ISOLATION=true : workers supervisés (voir _configure_isolation)
+    Renvoie le chemin de l'Excel produit par report().
+    """
+    from invoices import async_pipeline, mail_handler
+    from invoices.archiver import Archiver
+
+    parse_concurrency = _int_setting(env, "PIPELINE_PARSE_CONCURRENCY", workers * 2)
+    queue_size = _int_setting(env, "PIPELINE_QUEUE_SIZE", async_pipeline.DEFAULT_QUEUE_SIZE)
+
+    fetch = None
+    archive = None
+    checkpoints: list = []  # enregistrement différé du point de reprise IMAP (un par lot)
+    if fetch_mail:
+        # Chemins résolus depuis la racine projet, comme INPUT_DIR côté extraction
+        mail_env = dict(env)
+        mail_env["INPUT_DIR"] = str(input_dir)
+        mail_env["IMAP_CHECKPOINT"] = str(env.resolve("IMAP_CHECKPOINT", "./.cache/imap_checkpoint.json"))
+        if _is_true(env.get("MAIL_IN_MEMORY", "")):
+            archive = Archiver(env.resolve("TRAITEMENT_DIR", "./traitement"), queue_size)
+            recovered = archive.recover()
+            if recovered:
+                logging.warning(
+                    f"Archivage: {recovered} PDF d'un run interrompu retiré(s) de {archive.directory} "
+                    "(messages relus depuis la boîte mail)"
+                )
+            fetch = lambda: _archived_attachments(mail_env, archive, checkpoints.append)
+        else:
+            fetch = lambda: mail_handler.iter_invoices(mail_env)
+
+    logging.info(
+        f"Pipeline async: {len(pdf_paths)} PDF locaux, mail={'oui' if fetch else 'non'}, "
+        f"{workers} processus, {parse_concurrency} extraction(s) en vol, files de {queue_size}"
+    )
+    pool = None
+    if workers > 1 or isolated is not None:
+        # Reconstructible : un worker mort ne fait échouer que son PDF (comme _iter_extracted)
+        pool = _ExtractPool(max(1, workers), cache_args, extract_args, dedup_path, isolated)
+    reported = False
+    try:
+        xlsx_path, stats = async_pipeline.run_pipeline(
+            pdf_paths, _extract_one, report,
+            fetch=fetch, parse_concurrency=parse_concurrency, queue_size=queue_size,
+            executor=pool.executor if pool is not None else None,
+            rebuild=pool.rebuild if pool is not None else None,
+        )
+        reported = True
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        if archive is not None:
+            archive.close()
+            logging.info(f"Archivage: {archive.written} PDF écrit(s) dans {archive.directory}, {archive.errors} échec(s)")
+            if reported:
+                # Rapport écrit (registre et stockage validés) : archives définitives, puis point de reprise
+                archive.commit()
+                if checkpoints:
+                    checkpoints[-1]()
+            else:
+                removed = archive.discard()
+                logging.warning(
+                    f"Run en échec: {removed} PDF reçu(s) par mail retiré(s) de {archive.directory}, "
+                    "relus au prochain run (point de reprise IMAP inchangé)"
+                )
+    logging.info(
+        f"Pipeline async: {stats['downloaded']} PDF téléchargé(s), {stats['extracted']} extrait(s), "
+        f"{stats['failed']} échec(s), {stats['duplicates']} doublon(s) ignoré(s)"
+    )
+    return xlsx_path
+
+def _archived_attachments(mail_env, archive: Archiver,
+                          defer_checkpoint: Callable[[Callable[[], None]], None]) -> Iterator[mail_handler.Attachment]:
+    """
+    Pièces jointes en mémoire, chacune confiée à l'archiveur : le nom d'archive (unique)
+    devient le nom du document. Le point de reprise IMAP est confié à defer_checkpoint
+    (enregistré par l'appelant une fois le rapport écrit).
+    Une copie d'un PDF déjà archivé (index des doublons) n'est ni archivée ni extraite.
+    """
+    from invoices import mail_handler
+
+    index = dedup_index.get_default_index()
+    for att in mail_handler.iter_attachments(mail_env, defer_checkpoint=defer_checkpoint):
+        original = index.lookup(extract_cache.buffer_digest(att.data)) if index is not None else None
+        if original is not None:
+            logging.info(f"Doublon exact ignoré: {att.filename} (même contenu que {original})")
+            metrics.inc("invoices_pdf_total", result="duplicate")
+            continue
+        dest = archive.submit(att.filename, att.data)
+        yield att._replace(filename=dest.name, path=str(dest))
+
+def _configure_work_queue(env, input_dir: Path) -> work_queue.WorkQueue | None:
+    """
+    WORK_QUEUE=true : plusieurs nœuds (agents Jenkins) se partagent INPUT_DIR (partage réseau).
+    Chacun réclame des lots de PDF (work_queue) et publie ses lignes en partiels ; le dernier
+    nœud à finir fusionne et envoie le reporting unique. Réglages :
+      - QUEUE_DIR (défaut <INPUT_DIR>.queue, à côté d'INPUT_DIR : même système de fichiers)
+      - QUEUE_NODE_ID (défaut: nom d'hôte) : un identifiant par exécuteur si plusieurs
+        runs partagent un hôte (ex. ${NODE_NAME}-${EXECUTOR_NUMBER})
+      - QUEUE_CLAIM_BATCH (défaut: 8 par worker) : PDF réclamés à la fois
+      - QUEUE_LEASE_SECONDS (défaut 600) : PDF réclamés par un nœud sans battement de
+        cœur depuis ce délai repris par les autres
+    Les PDF traités quittent INPUT_DIR (QUEUE_DIR/done) ; le reporting fusionné porte sur
+    toutes les factures traitées (historique des fusions + nouveaux partiels).
+    Renvoie la file, None si WORK_QUEUE n'est pas activé.
+    """
+    if not _is_true(env.get("WORK_QUEUE", "")):
+        return None
+    from invoices import work_queue
+
+    queue_dir = env.resolve("QUEUE_DIR", str(input_dir.with_name(input_dir.name + ".queue")))
+    if queue_dir.is_relative_to(input_dir):
+        raise ConfigError(f"QUEUE_DIR ne doit pas être dans INPUT_DIR: {queue_dir}")
+    try:
+        lease = float(env.get("QUEUE_LEASE_SECONDS", work_queue.DEFAULT_LEASE_SECONDS))
+    except (TypeError, ValueError):
+        raise ConfigError(f"QUEUE_LEASE_SECONDS invalide: '{env.get('QUEUE_LEASE_SECONDS')}' (nombre attendu).")
+    try:
+        queue = work_queue.WorkQueue(input_dir, queue_dir, env.get("QUEUE_NODE_ID") or None, lease)
+    except OSError as e:
+        raise ConfigError(f"QUEUE_DIR inutilisable: {e}")
+    logging.info(f"File de travail: nœud {queue.node}, {queue.directory} (bail {lease:g}s)")
+    return queue
+
+def _run_node(queue: work_queue.WorkQueue, claim_batch: int, workers: int, cache_args: tuple,
+              extract_args: tuple, batch_size: int, dedup_path: str | None = None,
+              isolated: tuple[isolation.Budget, isolation.Quarantine] | None = None) -> int:
+    """
+    WORK_QUEUE : lots réclamés jusqu'à épuisement (INPUT_DIR, puis PDF des nœuds arrêtés),
+    chacun extrait (même pool d'un lot à l'autre) puis publié en partiel.
+    Renvoie le nombre de PDF traités par ce nœud.
+    """
+    pool = None
+    if workers > 1 or isolated is not None:
+        pool = _ExtractPool(workers, cache_args, extract_args, dedup_path, isolated)
+    processed = 0
+    try:
+        with queue:
+            while True:
+                batch = queue.claim(claim_batch)
+                if not batch:
+                    break
+                # Quarantaine par contenu : reconnue sous le chemin de réclamation ; le PDF
+                # ignoré sort du lot avec les autres (done/), sans ligne
+                todo = isolated[1].exclude(batch) if isolated is not None else batch
+                rows = list(_iter_extracted(
+                    todo, workers, cache_args, extract_args, batch_size, dedup_path, isolated, pool
+                ))
+                queue.publish(rows, batch)
+                processed += len(batch)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return processed
+
+def _configure_checkpoints(env) -> checkpoints.StageCheckpoints | None:
+    """
+    Points de reprise des étapes (actifs par défaut) : un run relancé après un échec (ou une
+    interruption) saute les étapes déjà faites dont les entrées n'ont pas changé ; après un
+    run terminé, tout est refait et le reporting envoyé (voir checkpoints) :
+      - "report" (extraction -> CSV -> Excel, une seule passe en flux) : PDF d'INPUT_DIR
+        (chemin, taille, mtime), configuration hors envoi, version du parser
+      - "send" : contenu de l'Excel et destinataires ; un reporting déjà envoyé par le run
+        en échec ne l'est pas une seconde fois
+      - CHECKPOINTS=false pour refaire toutes les étapes à chaque run
+      - CHECKPOINT_FILE (défaut ./.cache/checkpoints.json)
+    Le relevé IMAP a son propre point de reprise (IMAP_CHECKPOINT). Avec relevé pendant le
+    run (PIPELINE_FETCH_MAIL) ou file de travail (WORK_QUEUE), les entrées de "report" ne
+    sont connues qu'en cours de run : l'étape est refaite (cache d'extraction), seul "send"
+    est repris.
+    """
+    if not _is_true(env.get("CHECKPOINTS", True)):
+        return None
+    from invoices import checkpoints
+
+    return checkpoints.StageCheckpoints(env.resolve("CHECKPOINT_FILE", "./.cache/checkpoints.json"))
+
+# Clés sans effet sur l'extraction ni le reporting (envoi, secrets, exports) : hors empreinte de "report"
+_NON_REPORT_KEYS = ("EMAIL_", "GMAIL_", "SMTP_", "SEND_", "CHECKPOINT", "METRICS_", "IMAP_")
+
+def _report_inputs(env, input_dir: Path, pdf_paths: list[Path]) -> str:
+    # stat de chaque PDF, pas les entrées du manifeste : un PDF réécrit sur place (dossier
+    # inchangé) doit invalider l'étape
+    from invoices import checkpoints
+    from invoices.pdf_parser import PARSER_VERSION
+
+    pdfs = []
+    for p in pdf_paths:
+        try:
+            st = p.stat()
+            pdfs.append((p.relative_to(input_dir).as_posix(), st.st_size, st.st_mtime_ns))
+        except OSError:
+            pdfs.append((p.relative_to(input_dir).as_posix(),))
+    config = {k: v for k, v in env.items() if not k.startswith(_NON_REPORT_KEYS)}
+    return checkpoints.fingerprint(PARSER_VERSION, config, pdfs)
+
+def _send_report(env, xlsx_path: Path, stages: checkpoints.StageCheckpoints | None) -> bool:
+    """
+    Envoi du reporting, retenté en cas d'échec transitoire (mail_sender.is_transient_error) :
+      - SEND_MAX_ATTEMPTS (défaut 4) : tentatives au plus
+      - SEND_RETRY_DELAY_SECONDS (défaut 2) : attente avant la 2e tentative, doublée
+        ensuite, plafonnée à SEND_RETRY_MAX_DELAY_SECONDS (défaut 60)
+    Sauté si le run reprend un run en échec qui avait déjà envoyé ce même Excel aux mêmes
+    destinataires (point de reprise).
+    Renvoie False si l'envoi a été sauté.
+    """
+    from invoices import checkpoints, mail_sender
+
+    inputs = None
+    if stages is not None:
+        recipients = {k: env.get(k) for k in ("EMAIL_RECIPIENTS", "EMAIL_CC", "EMAIL_BCC", "EMAIL_SUBJECT", "EMAIL_BODY")}
+        inputs = checkpoints.fingerprint(extract_cache.file_digest(xlsx_path), recipients)
+        if stages.completed("send", inputs) is not None:
+            logging.info(f"Reporting déjà envoyé (Excel et destinataires inchangés), envoi sauté: {xlsx_path}")
+            return False
+    try:
+        delay = float(env.get("SEND_RETRY_DELAY_SECONDS", 2))
+        max_delay = float(env.get("SEND_RETRY_MAX_DELAY_SECONDS", 60))
+    except (TypeError, ValueError):
+        raise ConfigError(
+            f"SEND_RETRY_DELAY_SECONDS / SEND_RETRY_MAX_DELAY_SECONDS invalides: "
+            f"'{env.get('SEND_RETRY_DELAY_SECONDS')}' / '{env.get('SEND_RETRY_MAX_DELAY_SECONDS')}' (nombres attendus)."
+        )
+    attempts = _int_setting(env, "SEND_MAX_ATTEMPTS", 4)
+    logging.info(f"Envoi du reporting par email: {xlsx_path}")
+    try:
+        # send_report sans argument : Excel résolu depuis OUTPUT_DIR (nom verrouillé)
+        checkpoints.retry(
+            mail_sender.send_report, "send", attempts, delay, max_delay, transient=mail_sender.is_transient_error
+        )
+    except Exception as e:
+        if stages is not None:
+            stages.fail("send", inputs, e, attempts=getattr(e, "attempts", 1))
+        raise
+    if stages is not None:
+        stages.complete("send", inputs)
+    return True
+
+def _parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="run-invoices", description="Pipeline factures: extraction PDF, reporting, email.")
+    parser.add_argument(
+        "-w", "--workers",
+        help="Processus d'extraction en parallèle (entier, 0 ou 'auto' = nb de cœurs). Prioritaire sur EXTRACT_WORKERS.",
+    )
+    parser.add_argument(
+        "--pipeline", choices=PIPELINE_MODES,
+        help="Enchaînement des étapes (prioritaire sur PIPELINE_MODE) : 'sequential' (défaut) ou 'async'.",
+    )
+    return parser.parse_args(argv)
+
+CSV_FIELDNAMES = list(CSV_FIELDS)
+
+def _tee_to_csv(rows: Iterable[InvoiceRecord], csv_path: Path, stats: dict, append: bool = False) -> Iterator[InvoiceRecord]:
+    """
+    Étage de diffusion : écrit chaque ligne dans le CSV dès qu'elle arrive (flush par
+    ligne, le CSV est lisible pendant le run) puis la retransmet à l'étage suivant
+    (reporting Excel). stats["rows"] compte les lignes écrites.
+    append=True : lignes ajoutées à la fin du CSV existant (en-tête seulement s'il est vide).
     """
     csv_path.parent.mkdir(parents=True, exist_ok=True)
-    fieldnames = ["fichier", "date_facture", "numero_facture", "total_ttc", "periode"]
-    with csv_path.open("w", newline="", encoding="utf-8-sig") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
+    stats.setdefault("rows", 0)
+    write_seconds = 0.0
+    with csv_path.open("a" if append else "w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDNAMES)
+        if not append or f.tell() == 0:
+            writer.writeheader()
+        f.flush()
         for row in rows:
-            writer.writerow(_normalize_row_keys(row))
-    logging.info(f"CSV généré: {csv_path} ({len(rows)} ligne(s))")
+            t0 = time.perf_counter()
+            row = as_record(row)
+            writer.writerow(row.csv_row())
+            f.flush()
+            write_seconds += time.perf_counter() - t0
+            stats["rows"] += 1
+            yield row
+    metrics.inc("invoices_report_rows_total", stats["rows"], format="csv")
+    metrics.inc("invoices_report_write_seconds_total", write_seconds, format="csv")
+    if append:
+        logging.info(f"CSV complété: {csv_path} (+{stats['rows']} ligne(s))")
+    else:
+        logging.info(f"CSV généré: {csv_path} ({stats['rows']} ligne(s))")
+
+@metrics.timed("invoices_report_seconds", format="csv")
+def _write_csv_report(rows: Iterable[InvoiceRecord], csv_path: Path) -> int:
+    """
+    Écrit un CSV 'invoices_extract.csv' avec colonnes:
+      fichier, date_facture, numero_facture, total_ttc, periode
+    Retourne le nombre de lignes écrites.
+    """
+    stats: dict = {}
+    for _ in _tee_to_csv(rows, csv_path, stats):
+        pass
+    return stats["rows"]
+
+class _StageClock:
+    """Durées successives des étapes de main() -> histogramme invoices_stage_seconds{stage=...}."""
+
+    def __init__(self):
+        self.start = self.last = time.perf_counter()
+
+    def lap(self, stage: str) -> None:
+        now = time.perf_counter()
+        metrics.observe("invoices_stage_seconds", now - self.last, stage=stage)
+        self.last = now
+
+    def total(self) -> float:
+        return time.perf_counter() - self.start
+
+def _export_metrics(env, clock: _StageClock, success: bool, rows: int) -> None:
+    """
+    Fin de run : jauges du run puis export des métriques.
+      - METRICS_JSON : résumé JSON (défaut ./logs/metrics.json, "" pour désactiver)
+      - METRICS_PROM_FILE : fichier texte Prometheus pour le collecteur textfile du node
+        exporter (ex. /var/lib/node_exporter/textfile/invoices.prom), désactivé par défaut
+    N'interrompt jamais le pipeline : un échec d'écriture est seulement journalisé.
+    """
+    duration = clock.total()
+    pdfs = sum(metrics.REGISTRY.counter("invoices_pdf_total", result=r) for r in ("ok", "error", "duplicate"))
+    rate = pdfs / duration if duration > 0 else 0.0
+    metrics.set_gauge("invoices_last_run_timestamp_seconds", time.time())
+    metrics.set_gauge("invoices_last_run_duration_seconds", duration)
+    metrics.set_gauge("invoices_last_run_success", 1 if success else 0)
+    metrics.set_gauge("invoices_last_run_pdfs", pdfs)
+    metrics.set_gauge("invoices_last_run_rows", rows)
+    metrics.set_gauge("invoices_last_run_docs_per_second", rate)
+    logging.info(f"Métriques: {pdfs:.0f} PDF en {duration:.2f}s ({rate:.1f} PDF/s)")
+    if env is None:
+        return
+    try:
+        if env.get("METRICS_JSON", "./logs/metrics.json"):
+            path = metrics.write_json(
+                env.resolve("METRICS_JSON", "./logs/metrics.json"), success=success, duration_seconds=duration
+            )
+            logging.info(f"Métriques JSON: {path}")
+        if env.get("METRICS_PROM_FILE"):
+            path = metrics.write_prometheus(env.resolve("METRICS_PROM_FILE", ""))
+            logging.info(f"Métriques Prometheus: {path}")
+    except OSError as e:
+        logging.warning(f"Export des métriques impossible: {e}")
 
-def main():
+def main(argv: list[str] | None = None):
+    args = _parse_args(argv)
+    # Métriques propres à ce run (main() peut être appelé plusieurs fois dans un même processus)
+    metrics.REGISTRY.reset()
+    clock = _StageClock()
+    env = None
+    success = False
+    stats: dict = {"rows": 0}
+    merge = stages = None
     try:
         # 1) Chargement config + dossiers
-        root = _project_root()
+        root = project_root()
         env_path = root / "env.json"
         logging.info(f"Racine projet: {root}")
         logging.info(f"Chargement configuration depuis : {env_path}")
 
         env = load_env_config(path=str(env_path), required_keys=REQUIRED_KEYS)
 
-        input_dir = _resolve_dir(root, env.get("INPUT_DIR", "./input"))
-        trait_dir = _resolve_dir(root, env.get("TRAITEMENT_DIR", "./traitement"))
-        output_dir = _resolve_dir(root, env.get("OUTPUT_DIR", "./output"))
+        input_dir = env.resolve("INPUT_DIR", "./input")
+        trait_dir = env.resolve("TRAITEMENT_DIR", "./traitement")
+        output_dir = env.resolve("OUTPUT_DIR", "./output")
         _mkdirs(input_dir, trait_dir, output_dir)
 
         # CSV configurable, défaut: invoices_extract.csv
         csv_name = env.get("CSV_FILE", "invoices_extract.csv")
         csv_file = output_dir / csv_name
 
-        logging.info("Diagnostics dossiers :")
-        logging.info(_list_dir(root))
-        logging.info(_list_dir(input_dir))
-        logging.info(_list_dir(output_dir))
+        # 2) Parcours des PDF (manifeste incrémental) + extraction via pdf_parser
+        #    (séquentiel ou pool de processus) ; en file de travail partagée (WORK_QUEUE),
+        #    les PDF sont réclamés par lots pendant l'extraction
+        queue = _configure_work_queue(env, input_dir)
+        pdf_paths = []
+        if queue is None:
+            input_manifest = _open_manifest(env, input_dir, "input")
+            _refresh_manifest(input_manifest, "INPUT")
+            pdf_paths = input_manifest.paths()
 
-        # 2) Parcours des PDF + extraction via pdf_parser
-        pdf_paths = sorted(list(input_dir.rglob("*.pdf")))
-        rows: list[dict] = []
+            logging.info("Diagnostics dossiers :")
+            logging.info(input_manifest.listing())
+            if not pdf_paths:
+                logging.warning(f"Aucun PDF trouvé dans {input_dir}")
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug(_list_dir(root))
+            logging.debug(_list_dir(output_dir))
 
-        if not pdf_paths:
-            logging.warning(f"Aucun PDF trouvé dans {input_dir}")
+        workers = _resolve_workers(args.workers if args.workers is not None else env.get("EXTRACT_WORKERS"))
+        try:
+            batch_size = int(env.get("EXTRACT_BATCH_SIZE", 0) or 0)
+        except (TypeError, ValueError):
+            raise ConfigError(f"EXTRACT_BATCH_SIZE invalide: '{env.get('EXTRACT_BATCH_SIZE')}'.")
+        cache_args = _configure_extract_cache(env)
+        dedup_path = _configure_dedup_index(env, trait_dir)
+        extract_args = _configure_extraction_mode(env)
+        isolated = _configure_isolation(env)
+        if isolated is not None:
+            pdf_paths = isolated[1].exclude(pdf_paths)
+        cache = extract_cache.get_default_cache()
+        before = cache.stats() if cache else None
+        allow_empty = _is_true(env.get("ALLOW_EMPTY_REPORT_IF_MISSING", ""))
+        store = _configure_column_store(env)
+        incremental = _configure_report_ledger(env, output_dir)
+
+        pipeline_mode = str(args.pipeline or env.get("PIPELINE_MODE") or "sequential").lower()
+        if pipeline_mode not in PIPELINE_MODES:
+            raise ConfigError(f"PIPELINE_MODE invalide: '{pipeline_mode}' ({' ou '.join(PIPELINE_MODES)} attendu).")
+        fetch_mail = pipeline_mode == "async" and _is_true(env.get("PIPELINE_FETCH_MAIL", ""))
+        if queue is not None and pipeline_mode == "async":
+            raise ConfigError("WORK_QUEUE=true : PIPELINE_MODE=sequential attendu (lots réclamés dans INPUT_DIR).")
+
+        if queue is None and not pdf_paths and not allow_empty and not fetch_mail:
+            raise _no_invoice_error(input_dir)
+        stages = _configure_checkpoints(env)
+        report_inputs = done = None
+        if stages is not None:
+            stages.begin_run()
+        if stages is not None and queue is None and not fetch_mail:
+            report_inputs = _report_inputs(env, input_dir, pdf_paths)
+            done = stages.completed("report", report_inputs)
+        clock.lap("config")
+
+        # 3) Pipeline en flux : extraction -> CSV (ligne à ligne) -> Excel (write-only)
+        #    lignes: InvoiceRecord (montant en centimes et date déjà convertis à l'extraction)
+        #    Excel verrouillé sur invoices_extract.xlsx (OUTPUT_DIR)
+
+        def report(rows: Iterable[InvoiceRecord]):
+            from invoices import excel_reporter
+            if incremental is not None:
+                # Seules les factures jamais reportées continuent vers le CSV (ajout) et l'Excel ;
+                # le registre les enregistre au fil de l'eau, validées par _commit_increment
+                ledger, _ = incremental
+                _prepare_ledger_csv(ledger, csv_file)
+                rows = ledger.new_records(rows, stats)
+            appender = _open_store_appender(store) if store is not None else None
+            timing: dict = {}
+            if appender is not None:
+                rows = _tee_to_store(rows, appender, timing)
+
+            def summary(run_rollups: Rollups) -> Rollups:
+                # Toutes les lignes sont écrites : validation de l'ajout au stockage, dont les agrégats
+                # (historique complet, mis à jour incrémentalement) alimentent les onglets de synthèse
+                if appender is None or not _commit_store(store, appender, timing):
+                    return run_rollups
+                return store.rollups()
 
-        for pdf in pdf_paths:
             try:
-                logging.info(f"Extraction: {pdf}")
-                data = extract_invoice_data(str(pdf))
-                # data: {fichier, (numero_facture|facture), (date_facture|date), total_ttc, periode, ...}
-                rows.append(data)
-
-                # (Optionnel) déplacer le PDF traité vers 'traitement'
-                # (trait_dir / pdf.name).write_bytes(pdf.read_bytes())
-                # pdf.unlink()
-
-            except Exception as e:
-                logging.error(f"Échec extraction {pdf}: {e}")
-
-        # 3) CSV + Excel (nom verrouillé -> OUTPUT_DIR/invoices_extract.xlsx)
-        if rows:
-            # CSV
-            _write_csv_report(rows, csv_file)
-
-            # Excel verrouillé sur invoices_extract.xlsx
-            xlsx_path = excel_reporter.write_report_to_output(rows)
-            logging.info(f"Reporting Excel généré: {xlsx_path} ({len(rows)} ligne(s))")
-        else:
-            allow_empty = str(env.get("ALLOW_EMPTY_REPORT_IF_MISSING", "")).lower() in ("1", "true", "yes")
-            if allow_empty:
-                logging.warning("Aucune donnée extraite, création d'un CSV/Excel vides (ALLOW_EMPTY_REPORT_IF_MISSING=true).")
-                _write_csv_report([], csv_file)
-                xlsx_path = excel_reporter.write_report_to_output([])
-            else:
-                raise FileNotFoundError(
-                    "Aucune facture PDF traitée -> pas de reporting généré.\n"
-                    f"  Dossier INPUT : {_list_dir(input_dir)}\n"
-                    "💡 Ajoute des PDF dans INPUT, ou active ALLOW_EMPTY_REPORT_IF_MISSING=true dans env.json."
+                xlsx = excel_reporter.write_report_to_output(
+                    _tee_to_csv(rows, csv_file, stats, append=incremental is not None), summary=summary
                 )
+                if incremental is not None:
+                    _commit_increment(incremental[0], incremental[1], csv_file)
+            finally:
+                # Rapport interrompu : ajout au stockage et run du registre abandonnés
+                if appender is not None:
+                    appender.close()
+                if incremental is not None:
+                    incremental[0].rollback()
+            return xlsx
+
+        if done is not None:
+            # Run précédent interrompu après le reporting (envoi en échec...) : mêmes PDF, même configuration
+            xlsx_path = done["outputs"]["xlsx"][0]
+            stats.update(done["info"])
+            logging.info(
+                f"Reprise: extraction et reporting déjà faits pour ces PDF ({stats['rows']} ligne(s)), étape sautée"
+            )
+        elif queue is not None:
+            claim_batch = _int_setting(env, "QUEUE_CLAIM_BATCH", max(workers, 1) * 8)
+            processed = _run_node(
+                queue, claim_batch, workers, cache_args, extract_args, batch_size, dedup_path, isolated
+            )
+            logging.info(f"File de travail: {processed} PDF traité(s) par le nœud {queue.node}")
+            merge = queue.merge()
+            if merge is None:
+                clock.lap("extract")
+                success = True
+                logging.info("✅ Lots du nœud terminés (partiels publiés), reporting laissé au dernier nœud.")
+                return
+            xlsx_path = report(merge.records())
+        elif pipeline_mode == "async":
+            xlsx_path = _run_async_pipeline(
+                env, input_dir, pdf_paths, workers, cache_args, extract_args, report, fetch_mail, dedup_path, isolated
+            )
+        else:
+            xlsx_path = report(
+                _iter_extracted(pdf_paths, workers, cache_args, extract_args, batch_size, dedup_path, isolated)
+            )
+        clock.lap("extract_report")
+
+        # (Optionnel) déplacer les PDF traités vers 'traitement'
+        # (trait_dir / pdf.name).write_bytes(pdf.read_bytes())
+        # pdf.unlink()
+
+        if cache:
+            after = cache.stats()
+            logging.info(
+                f"Cache extraction: {after['hits'] - before['hits']} hit(s), "
+                f"{after['misses'] - before['misses']} miss(es), "
+                f"{after['entries']} entrée(s), {after['bytes'] / 1024:.0f} Ko"
+            )
+
+        if stats.get("skipped"):
+            logging.info(f"Reporting incrémental: {stats['skipped']} facture(s) déjà reportée(s) ignorée(s)")
+        if stats["rows"]:
+            logging.info(f"Reporting Excel généré: {xlsx_path} ({stats['rows']} ligne(s))")
+        elif incremental is not None and stats.get("extracted"):
+            logging.info(f"Aucune nouvelle facture depuis le run précédent: {xlsx_path} sans nouvelle ligne.")
+        elif allow_empty:
+            logging.warning("Aucune donnée extraite, création d'un CSV/Excel vides (ALLOW_EMPTY_REPORT_IF_MISSING=true).")
+        else:
+            # Tous les PDF ont échoué : pas de reporting vide laissé derrière
+            # (en mode incrémental, le CSV porte l'historique : il est conservé)
+            if incremental is None:
+                csv_file.unlink(missing_ok=True)
+            Path(xlsx_path).unlink(missing_ok=True)
+            raise _no_invoice_error(input_dir)
 
         # Double vérif Excel (sur le nom attendu invoices_extract.xlsx)
         if not Path(xlsx_path).exists():
             logging.warning(f"Reporting introuvable à l'endroit prévu: {xlsx_path}")
-            found = _find_excel_anywhere(root, Path(xlsx_path).name)
+            found = _find_excel_anywhere(root, Path(xlsx_path).name, skip=(input_dir, trait_dir))
             if found:
                 logging.info(f"Reporting trouvé ailleurs: {found}")
                 xlsx_path = found
@@ -168,13 +1102,21 @@ def main():
                     "💡 Vérifie la génération du reporting ou active ALLOW_EMPTY_REPORT_IF_MISSING=true."
                 )
 
-        # 4) Envoi email avec le reporting Excel (sans argument)
-        logging.info(f"Envoi du reporting par email: {xlsx_path}")
-        mail_sender.send_report()                 # recommandé
-        # ou, si tu préfères être explicite :
-        # mail_sender.send_report(str(xlsx_path))  # aussi OK (nom conforme)
+        if report_inputs is not None and done is None:
+            stages.complete("report", report_inputs, {"csv": csv_file, "xlsx": xlsx_path}, **stats)
 
-        logging.info("✅ Pipeline terminé avec succès (CSV + Excel + Email).")
+        # 4) Envoi email avec le reporting Excel (nouvelles tentatives si échec transitoire)
+        sent = _send_report(env, Path(xlsx_path), stages)
+        clock.lap("email")
+        if merge is not None:
+            # Reporting envoyé : partiels fusionnés dans l'historique (sinon refusionnés au prochain nœud)
+            merge.commit()
+
+        success = True
+        if sent:
+            logging.info("✅ Pipeline terminé avec succès (CSV + Excel + Email).")
+        else:
+            logging.info("✅ Pipeline terminé avec succès (rien de nouveau à envoyer).")
 
     except ConfigError as e:
         logging.error(f"Erreur de configuration : {e}")
@@ -182,6 +1124,12 @@ def main():
     except Exception:
         logging.error("Erreur critique dans le pipeline :\n%s", traceback.format_exc())
         raise
+    finally:
+        if merge is not None:
+            merge.release()
+        if stages is not None:
+            stages.end_run(success)
+        _export_metrics(env, clock, success, stats["rows"])
 
 if __name__ == "__main__":
     main()
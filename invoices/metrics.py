@@ -0,0 +1,284 @@
+# invoices/metrics.py
+"""
+Métriques du pipeline : compteurs, jauges, histogrammes et chronométrage par étape.
+
+    from invoices import metrics
+
+    metrics.inc("invoices_pdf_total", result="ok")
+    metrics.observe("invoices_pdf_bytes", 20704, buckets=metrics.BYTES_BUCKETS)
+    with metrics.timed("invoices_stage_seconds", stage="report"):
+        ...
+
+    @metrics.timed("invoices_email_seconds")
+    def send_report(...): ...
+
+Les valeurs sont propres au processus. Un worker du pool d'extraction renvoie les
+siennes avec chaque résultat (drain) et le parent les fusionne (merge).
+En fin de run : export JSON (write_json) et fichier texte Prometheus (write_prometheus,
+à déposer dans le répertoire textfile du node exporter).
+"""
+from __future__ import annotations
+
+import functools
+import json
+import math
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+# Bornes par défaut (secondes), dans l'esprit des clients Prometheus
+SECONDS_BUCKETS: Tuple[float, ...] = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BYTES_BUCKETS: Tuple[float, ...] = (10_000, 50_000, 100_000, 500_000, 1_000_000, 5_000_000, 20_000_000)
+PAGES_BUCKETS: Tuple[float, ...] = (1, 2, 3, 5, 10, 20, 50, 100)
+
+_Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+def _key(name: str, labels: Dict[str, Any]) -> _Key:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class _Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)  # non cumulés, cumulés à l'export
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """Ensemble de métriques d'un processus (thread-safe)."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counters: Dict[_Key, float] = {}
+        self._gauges: Dict[_Key, float] = {}
+        self._histograms: Dict[_Key, _Histogram] = {}
+
+    # ---------------------------
+    # Enregistrement
+    # ---------------------------
+
+    def inc(self, name: str, value: float = 1, **labels: Any) -> None:
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels: Any) -> None:
+        with self._lock:
+            self._gauges[_key(name, labels)] = value
+
+    def observe(self, name: str, value: float, buckets: Sequence[float] = SECONDS_BUCKETS, **labels: Any) -> None:
+        key = _key(name, labels)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = _Histogram(buckets)
+            hist.observe(value)
+
+    # ---------------------------
+    # Lecture / transfert entre processus
+    # ---------------------------
+
+    def counter(self, name: str, **labels: Any) -> float:
+        return self._counters.get(_key(name, labels), 0)
+
+    def snapshot(self) -> Dict[str, List[Any]]:
+        """État sérialisable (picklable / JSON) : listes de [nom, labels, valeur(s)]."""
+        with self._lock:
+            return self._snapshot()
+
+    def drain(self) -> Dict[str, List[Any]]:
+        """snapshot() puis remise à zéro, atomiquement (worker : renvoie ses métriques au parent)."""
+        with self._lock:
+            snap = self._snapshot()
+            self._clear()
+        return snap
+
+    def _snapshot(self) -> Dict[str, List[Any]]:
+        return {
+            "counters": [[n, dict(l), v] for (n, l), v in self._counters.items()],
+            "gauges": [[n, dict(l), v] for (n, l), v in self._gauges.items()],
+            "histograms": [
+                [n, dict(l), {"buckets": list(h.buckets), "counts": list(h.counts), "sum": h.sum, "count": h.count}]
+                for (n, l), h in self._histograms.items()
+            ],
+        }
+
+    def _clear(self) -> None:
+        self._counters.clear()
+        self._gauges.clear()
+        self._histograms.clear()
+
+    def merge(self, snap: Optional[Dict[str, List[Any]]]) -> None:
+        """Ajoute un snapshot (d'un worker) : compteurs et histogrammes sommés, jauges remplacées."""
+        if not snap:
+            return
+        with self._lock:
+            for name, labels, value in snap.get("counters", ()):
+                key = _key(name, labels)
+                self._counters[key] = self._counters.get(key, 0) + value
+            for name, labels, value in snap.get("gauges", ()):
+                self._gauges[_key(name, labels)] = value
+            for name, labels, data in snap.get("histograms", ()):
+                key = _key(name, labels)
+                hist = self._histograms.get(key)
+                if hist is None:
+                    hist = self._histograms[key] = _Histogram(data["buckets"])
+                if list(hist.buckets) != list(data["buckets"]):
+                    continue  # bornes incompatibles : ignoré plutôt que faussé
+                hist.counts = [a + b for a, b in zip(hist.counts, data["counts"])]
+                hist.sum += data["sum"]
+                hist.count += data["count"]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._clear()
+
+    # ---------------------------
+    # Export
+    # ---------------------------
+
+    def summary(self) -> Dict[str, Any]:
+        """Résumé JSON : valeurs brutes + moyenne et quantiles estimés (p50/p95) des histogrammes."""
+        snap = self.snapshot()
+        for entry in snap["histograms"]:
+            data = entry[2]
+            data["mean"] = data["sum"] / data["count"] if data["count"] else None
+            data["p50"] = _bucket_quantile(data, 0.50)
+            data["p95"] = _bucket_quantile(data, 0.95)
+        return snap
+
+    def prometheus_text(self) -> str:
+        """Format d'exposition texte Prometheus (0.0.4)."""
+        snap = self.snapshot()
+        lines: List[str] = []
+        typed: set = set()
+
+        def type_line(name: str, kind: str) -> None:
+            if name not in typed:
+                lines.append(f"# TYPE {name} {kind}")
+                typed.add(name)
+
+        for name, labels, value in sorted(snap["counters"], key=_sort_key):
+            type_line(name, "counter")
+            lines.append(f"{name}{_labels(labels)} {_num(value)}")
+        for name, labels, value in sorted(snap["gauges"], key=_sort_key):
+            type_line(name, "gauge")
+            lines.append(f"{name}{_labels(labels)} {_num(value)}")
+        for name, labels, data in sorted(snap["histograms"], key=_sort_key):
+            type_line(name, "histogram")
+            cumulative = 0
+            for bound, count in zip(data["buckets"], data["counts"]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels({**labels, 'le': _num(bound)})} {cumulative}")
+            lines.append(f"{name}_bucket{_labels({**labels, 'le': '+Inf'})} {data['count']}")
+            lines.append(f"{name}_sum{_labels(labels)} {_num(data['sum'])}")
+            lines.append(f"{name}_count{_labels(labels)} {data['count']}")
+        return "\n".join(lines) + "\n"
+
+
+def _sort_key(entry: List[Any]) -> Tuple[str, List[Tuple[str, str]]]:
+    return entry[0], sorted(entry[1].items())
+
+def _labels(labels: Dict[str, Any]) -> str:
+    if not labels:
+        return ""
+    inner = ",".join(
+        f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(10), " ").replace(chr(34), chr(92) + chr(34))}"'
+        for k, v in sorted(labels.items())
+    )
+    return "{" + inner + "}"
+
+def _num(value: float) -> str:
+    if isinstance(value, float) and math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+def _bucket_quantile(data: Dict[str, Any], q: float) -> Optional[float]:
+    # Estimation par interpolation linéaire dans la tranche (comme histogram_quantile)
+    total = data["count"]
+    if not total:
+        return None
+    rank = q * total
+    cumulative = 0
+    lower = 0.0
+    for bound, count in zip(data["buckets"], data["counts"]):
+        if count and cumulative + count >= rank:
+            return lower + (bound - lower) * (rank - cumulative) / count
+        cumulative += count
+        lower = bound
+    return data["buckets"][-1] if data["buckets"] else None
+
+
+# ---------------------------
+# Registre par défaut (processus courant)
+# ---------------------------
+
+REGISTRY = Registry()
+
+inc = REGISTRY.inc
+set_gauge = REGISTRY.set_gauge
+observe = REGISTRY.observe
+merge = REGISTRY.merge
+
+
+class timed:
+    """
+    Chronomètre un bloc (`with timed(...)`) ou une fonction (`@timed(...)`) et enregistre
+    la durée (secondes) dans l'histogramme `name`, même si le bloc lève une exception.
+    """
+
+    def __init__(self, name: str, registry: Optional[Registry] = None, **labels: Any):
+        self.name = name
+        self.labels = labels
+        self.registry = registry
+        self.seconds: Optional[float] = None
+        self._start = 0.0
+
+    def __enter__(self) -> "timed":
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.seconds = time.perf_counter() - self._start
+        (self.registry or REGISTRY).observe(self.name, self.seconds, **self.labels)
+
+    def __call__(self, func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(self.name, self.registry, **self.labels):
+                return func(*args, **kwargs)
+        return wrapper
+
+
+def _write_atomic(path: Path, text: str) -> Path:
+    # Écriture puis renommage : le node exporter ne lit jamais un fichier à moitié écrit
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(text, encoding="utf-8")
+    os.replace(tmp, path)
+    return path
+
+def write_json(path: str | Path, registry: Optional[Registry] = None, **extra: Any) -> Path:
+    """Résumé JSON du run (extra : champs ajoutés au niveau racine, ex. durée, nb de PDF)."""
+    payload = {"generated_at": time.strftime("%Y-%m-%dT%H:%M:%S"), **extra, **(registry or REGISTRY).summary()}
+    return _write_atomic(Path(path), json.dumps(payload, indent=2, ensure_ascii=False))
+
+def write_prometheus(path: str | Path, registry: Optional[Registry] = None) -> Path:
+    """Fichier texte Prometheus (*.prom) pour le collecteur textfile du node exporter."""
+    return _write_atomic(Path(path), (registry or REGISTRY).prometheus_text())
@@ -0,0 +1,298 @@
+# invoices/normalize.py
+"""
+Normalisation par lots des colonnes brutes total_ttc / date_facture.
+
+    from invoices import normalize
+
+    amounts = normalize.normalize_amounts(["255,63€", "1.234,56 €", "$1,234.56", "INCONNU"])
+    amounts.values   # centimes : [25563, 123456, 123456, None] (ndarray int64, 0 au lieu de None, avec NumPy)
+    amounts.failed   # [False, False, False, False] : valeur présente mais illisible
+    amounts.missing  # [False, False, False, True]  : None / "" / "INCONNU"
+
+    dates = normalize.normalize_dates(["01/04/2023", "31/02/2023", None])
+    dates.values     # datetime64[D] (NaT si non converti) avec NumPy, sinon date | None
+
+Pour reconstruire de gros rapports (plusieurs années, centaines de milliers de lignes) :
+une colonne entière est convertie en une passe, au lieu d'une conversion par valeur.
+Avec NumPy (optionnel) les opérations sont vectorisées ; sans NumPy, même résultat
+en listes Python (comme InvoiceRecord.from_fields, ligne par ligne).
+
+Montants : même heuristique de séparateur que records.parse_amount_cents, appliquée
+à chaque ligne (une colonne peut mélanger "1.234,56" et "1,234.56"). Forme acceptée
+après nettoyage : [+-]chiffres[.chiffres] ; arrondi au centime, exact pour les
+montants à deux décimales.
+Dates : "dd/mm/yyyy" (forme produite par le parser) ; les autres formes lisibles par
+records.parse_date sont converties ligne par ligne.
+"""
+from __future__ import annotations
+
+import re
+from datetime import date
+from typing import Any, Iterable, List, Mapping, NamedTuple, Optional, Sequence
+
+try:
+    import numpy as np
+except ImportError:  # dépendance optionnelle
+    np = None
+
+from invoices.records import UNKNOWN, InvoiceRecord, parse_amount_cents, parse_date
+
+HAVE_NUMPY = np is not None
+
+# Au-delà, un montant en centimes n'est plus représenté exactement en float64
+_MAX_EXACT_AMOUNT = 2 ** 53 / 100
+
+_RGX_NUMBER = re.compile(r"[+-]?(?:\d+\.?\d*|\.\d+)")
+_STRIP_CURRENCY = str.maketrans("", "", "€$ ")
+_COMMA_DECIMAL = str.maketrans({".": None, ",": "."})   # "1.234,56" -> "1234.56"
+_DOT_DECIMAL = str.maketrans({",": None})               # "1,234.56" -> "1234.56"
+_NUMBER_CHARS = str.maketrans("", "", "0123456789.+-\n")
+_DATE_CHARS = str.maketrans("", "", "0123456789/")
+
+_DAYS_IN_MONTH = (31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
+
+class Column(NamedTuple):
+    values: Any     # ndarray (NumPy) ou liste Python
+    failed: Any     # masque : valeur présente mais non convertible
+    missing: Any    # masque : valeur absente (None, "", "INCONNU")
+
+
+class Batch(NamedTuple):
+    cents: Any
+    dates: Any
+    failed: Any     # montant OU date non convertible
+
+
+# ---------------------------
+# Préparation
+# ---------------------------
+
+def _use_numpy(use_numpy: Optional[bool]) -> bool:
+    if use_numpy is None:
+        return HAVE_NUMPY
+    if use_numpy and not HAVE_NUMPY:
+        raise ImportError("numpy n'est pas installé (pip install numpy)")
+    return use_numpy
+
+def _texts(values: Iterable[Any]) -> List[str]:
+    # None / "INCONNU" -> "" : une seule représentation de l'absence
+    out = []
+    for v in values:
+        if v is None:
+            out.append("")
+        elif isinstance(v, date):
+            out.append(f"{v.day:02d}/{v.month:02d}/{v.year:04d}")
+        else:
+            s = str(v).strip()
+            out.append("" if s == UNKNOWN else s)
+    return out
+
+
+# ---------------------------
+# Montants
+# ---------------------------
+
+def normalize_amounts(values: Iterable[Any], use_numpy: Optional[bool] = None) -> Column:
+    """Colonne total_ttc brute -> montants en centimes (None, ou 0 avec NumPy, là où rien n'est converti)."""
+    texts = _texts(values)
+    if _use_numpy(use_numpy):
+        return _amounts_numpy(texts)
+    return _amounts_python(texts)
+
+def _amounts_python(texts: List[str]) -> Column:
+    # Colonne traitée d'un bloc (texte joint) : nettoyage et convention de séparateur
+    # décidés une fois ; une colonne mélangeant les conventions passe ligne par ligne.
+    joined = "\n".join(texts).translate(_STRIP_CURRENCY)
+    if "." not in joined:
+        joined = joined.replace(",", ".")
+    elif "," in joined:
+        return _amounts_rows(texts)
+    if joined.translate(_NUMBER_CHARS):
+        return _amounts_rows(texts)  # caractères hors [0-9.+-] : lignes illisibles à signaler
+    cleaned = joined.split("\n")
+    if len(cleaned) != len(texts):
+        return _amounts_rows(texts)
+    try:
+        # float() n'accepte ici que [+-]chiffres[.chiffres] (seuls ces caractères restent)
+        amounts = [float(s) if s else None for s in cleaned]
+    except ValueError:
+        return _amounts_rows(texts)
+    if max((abs(a) for a in amounts if a is not None), default=0) >= _MAX_EXACT_AMOUNT:
+        return _amounts_rows(texts)
+    cents = [round(a * 100) if a is not None else None for a in amounts]
+    return Column(cents, [False] * len(texts), [a is None for a in amounts])
+
+def _amounts_rows(texts: List[str]) -> Column:
+    cents: List[Optional[int]] = []
+    failed: List[bool] = []
+    missing: List[bool] = []
+    for s in texts:
+        if not s:
+            cents.append(None)
+            failed.append(False)
+            missing.append(True)
+            continue
+        s = s.translate(_STRIP_CURRENCY)
+        s = s.translate(_COMMA_DECIMAL if s.rfind(",") > s.rfind(".") else _DOT_DECIMAL)
+        value = float(s) if _RGX_NUMBER.fullmatch(s) else None
+        ok = value is not None and abs(value) < _MAX_EXACT_AMOUNT
+        cents.append(round(value * 100) if ok else None)
+        failed.append(not ok)
+        missing.append(False)
+    return Column(cents, failed, missing)
+
+def _amounts_numpy(texts: List[str]) -> Column:
+    arr = np.asarray(texts, dtype=str)
+    if not arr.size:
+        return Column(np.zeros(0, np.int64), np.zeros(0, bool), np.zeros(0, bool))
+    missing = arr == ""
+    for ch in "€$ ":
+        arr = np.char.replace(arr, ch, "")
+    # Séparateur décimal ligne par ligne : le dernier des deux, la virgule seule est décimale
+    comma_decimal = np.char.rfind(arr, ",") > np.char.rfind(arr, ".")
+    arr = np.where(
+        comma_decimal,
+        np.char.replace(np.char.replace(arr, ".", ""), ",", "."),
+        np.char.replace(arr, ",", ""),
+    )
+
+    # Validation sur les codes de caractères (une ligne de la matrice par valeur, 0 = bourrage)
+    width = arr.dtype.itemsize // 4
+    codes = arr.view(np.uint32).reshape(-1, width)
+    is_digit = (codes >= ord("0")) & (codes <= ord("9"))
+    is_dot = codes == ord(".")
+    is_sign = (codes == ord("+")) | (codes == ord("-"))
+    is_sign[:, 1:] = False  # signe accepté en tête seulement
+    well_formed = np.all(is_digit | is_dot | is_sign | (codes == 0), axis=1)
+    ok = well_formed & is_digit.any(axis=1) & (is_dot.sum(axis=1) <= 1) & ~missing
+
+    amounts = np.zeros(arr.shape[0], np.float64)
+    amounts[ok] = arr[ok].astype(np.float64)
+    ok &= np.abs(amounts) < _MAX_EXACT_AMOUNT
+    cents = np.where(ok, np.rint(amounts * 100), 0).astype(np.int64)
+    return Column(cents, ~ok & ~missing, missing)
+
+
+# ---------------------------
+# Dates
+# ---------------------------
+
+def normalize_dates(values: Iterable[Any], use_numpy: Optional[bool] = None) -> Column:
+    """Colonne date_facture brute -> dates (datetime64[D] / NaT avec NumPy, date / None sinon)."""
+    texts = _texts(values)
+    if _use_numpy(use_numpy):
+        return _dates_numpy(texts)
+    return _dates_python(texts)
+
+def _dates_python(texts: List[str]) -> Column:
+    missing = [not s for s in texts]
+    if _fixed_width_dates(texts):
+        try:
+            # Lecture à position fixe ; un "/" mal placé tombe dans une tranche et lève ValueError
+            dates = [date(int(s[6:]), int(s[3:5]), int(s[:2])) if s else None for s in texts]
+            return Column(dates, [False] * len(texts), missing)
+        except ValueError:
+            pass  # date hors calendrier ou mal formée : ligne par ligne
+    dates = [parse_date(s) if s else None for s in texts]
+    failed = [d is None and not m for d, m in zip(dates, missing)]
+    return Column(dates, failed, missing)
+
+def _fixed_width_dates(texts: List[str]) -> bool:
+    # Colonne entièrement "dd/mm/yyyy" (cas courant) : 10 caractères, chiffres et deux "/" par valeur
+    if not set(map(len, texts)) <= {0, 10}:
+        return False
+    joined = "".join(texts)
+    return not joined.translate(_DATE_CHARS) and joined.count("/") == len(joined) // 5
+
+def _dates_numpy(texts: List[str]) -> Column:
+    arr = np.asarray(texts, dtype=str)
+    n = arr.shape[0]
+    if not n:
+        return Column(np.zeros(0, "datetime64[D]"), np.zeros(0, bool), np.zeros(0, bool))
+    missing = arr == ""
+    fixed = np.char.str_len(arr) == 10
+
+    # "dd/mm/yyyy" : chiffres lus directement dans la matrice des codes de caractères
+    codes = arr.astype("U10").view(np.uint32).reshape(n, 10).astype(np.int64) - ord("0")
+    digits = codes[:, [0, 1, 3, 4, 6, 7, 8, 9]]
+    ok = (
+        fixed
+        & np.all((digits >= 0) & (digits <= 9), axis=1)
+        & (codes[:, 2] == ord("/") - ord("0"))
+        & (codes[:, 5] == ord("/") - ord("0"))
+    )
+    day = codes[:, 0] * 10 + codes[:, 1]
+    month = codes[:, 3] * 10 + codes[:, 4]
+    year = codes[:, 6] * 1000 + codes[:, 7] * 100 + codes[:, 8] * 10 + codes[:, 9]
+
+    leap = (year % 4 == 0) & ((year % 100 != 0) | (year % 400 == 0))
+    month_idx = np.clip(month, 1, 12) - 1
+    days_in_month = np.asarray(_DAYS_IN_MONTH)[month_idx] + ((month == 2) & leap)
+    ok &= (year >= 1) & (month >= 1) & (month <= 12) & (day >= 1) & (day <= days_in_month)
+
+    months = np.where(ok, (year - 1970) * 12 + month - 1, 0).astype("datetime64[M]")
+    dates = months.astype("datetime64[D]") + np.where(ok, day - 1, 0).astype("timedelta64[D]")
+    dates[~ok] = np.datetime64("NaT")
+
+    # Formes non fixes ("1/4/2023") : conversion ligne par ligne, rares en pratique
+    for i in np.flatnonzero(~fixed & ~missing):
+        d = parse_date(texts[i])
+        if d is not None:
+            dates[i] = np.datetime64(d, "D")
+            ok[i] = True
+    return Column(dates, ~ok & ~missing, missing)
+
+
+# ---------------------------
+# Lignes complètes
+# ---------------------------
+
+def normalize_rows(rows: Sequence[Mapping[str, Any]], use_numpy: Optional[bool] = None) -> Batch:
+    """Convertit montants et dates d'un lot de lignes (forme CSV ou ancienne forme facture/date)."""
+    amounts = normalize_amounts((r.get("total_ttc") for r in rows), use_numpy)
+    dates = normalize_dates((r.get("date_facture") or r.get("date") for r in rows), use_numpy)
+    if _use_numpy(use_numpy):
+        failed = amounts.failed | dates.failed
+    else:
+        failed = [a or d for a, d in zip(amounts.failed, dates.failed)]
+    return Batch(amounts.values, dates.values, failed)
+
+def records_from_rows(rows: Sequence[Mapping[str, Any]], use_numpy: Optional[bool] = None) -> List[InvoiceRecord]:
+    """
+    Lignes (dict) -> InvoiceRecord, conversions faites par colonne.
+    Équivalent à [InvoiceRecord.from_mapping(r) for r in rows] pour des montants à deux décimales.
+    Les montants que le lot ne convertit pas (forme inattendue, au-delà de la précision float64)
+    sont repris un par un par records.parse_amount_cents.
+    """
+    numpy = _use_numpy(use_numpy)
+    amounts = normalize_amounts((r.get("total_ttc") for r in rows), numpy)
+    dates = normalize_dates((r.get("date_facture") or r.get("date") for r in rows), numpy)
+    if numpy:
+        ok = ~(amounts.failed | amounts.missing)
+        cents = [c if k else None for c, k in zip(amounts.values.tolist(), ok.tolist())]
+        days = dates.values.astype(object).tolist()  # NaT -> None
+    else:
+        cents, days = amounts.values, dates.values
+
+    out = []
+    for row, total_cents, day in zip(rows, cents, days):
+        total = row.get("total_ttc")
+        total = None if total is None or str(total) in ("", UNKNOWN) else str(total)
+        if total_cents is None and total is not None:
+            total_cents = parse_amount_cents(total)
+        numero = row.get("numero_facture") or row.get("facture")
+        raw_date = row.get("date_facture") or row.get("date")
+        raw_date = "" if day is not None or raw_date in (None, "", UNKNOWN) else str(raw_date)
+        out.append(InvoiceRecord(
+            row.get("fichier") or UNKNOWN,
+            None if not numero or numero == UNKNOWN else str(numero),
+            day,
+            total,
+            total_cents,
+            row.get("periode") or "",
+            row.get("source_montant") or "",
+            row.get("doublon") or "",
+            date_brute=raw_date,
+        ))
+    return out
@@ -1,23 +1,43 @@
 ﻿# invoices/pdf_parser.py
 from __future__ import annotations
 
+import io
+import mmap
+import os
 import re
 import csv
+import logging
 from pathlib import Path
-from typing import Optional, Dict, Any, Tuple
+from typing import Optional, Dict, Any, Tuple, Mapping, List, Iterator, Union, Callable
 
-from PyPDF2 import PdfReader
-from openpyxl import Workbook  # <-- NEW
+from PyPDF2 import PageObject, PdfReader
+
+from invoices import content_stream, metrics, supplier_templates
+from invoices.extract_cache import ExtractionCache, buffer_digest, file_digest, get_default_cache
+from invoices.field_scanner import FieldScanner, clean_text
+from invoices.records import CSV_FIELDS, InvoiceRecord
+
+logger = logging.getLogger(__name__)
 
 __all__ = [
     "extract_invoice_data",
+    "extract_invoice_record",
     "extract_invoice_number_from_string",
     "find_invoice_number",
     "find_date",
     "process_input_folder_to_csv",
     "process_input_folder_to_xlsx",  # <-- NEW
+    "PARSER_VERSION",
+    "configure_extraction",
+    "TEXT_BACKENDS",
+    "register_text_backend",
 ]
 
+# À incrémenter à chaque changement des regex / du nettoyage : invalide le cache d'extraction
+PARSER_VERSION = "3"
+# Idem pour la règle d'arrêt du mode lazy (texte partiel mis en cache)
+LAZY_VERSION = "2"
+
 # ============================
 #   REGEX UNIQUEMENT
 # ============================
@@ -49,16 +69,21 @@ def find_invoice_number(text: str, filename: Optional[str] = None) -> Optional[s
                 return cand
 
     if filename:
-        stem = Path(filename).stem
-        m = re.search(r"(?i)\b(?:facture|invoice|inv)[-_ ]*([A-Za-z0-9._/\-]+)", stem)
-        if m:
-            cand = m.group(1).strip()
-            if cand and not _looks_like_date(cand):
-                return cand
+        return _invoice_number_from_filename(filename)
 
-        m = re.search(r"([A-Za-z0-9]{3,}[-_/][A-Za-z0-9._/\-]{2,})", stem)
-        if m:
-            return m.group(1).strip()
+    return None
+
+def _invoice_number_from_filename(filename: str) -> Optional[str]:
+    stem = Path(filename).stem
+    m = re.search(r"(?i)\b(?:facture|invoice|inv)[-_ ]*([A-Za-z0-9._/\-]+)", stem)
+    if m:
+        cand = m.group(1).strip()
+        if cand and not _looks_like_date(cand):
+            return cand
+
+    m = re.search(r"([A-Za-z0-9]{3,}[-_/][A-Za-z0-9._/\-]{2,})", stem)
+    if m:
+        return m.group(1).strip()
 
     return None
 
@@ -113,89 +138,381 @@ def _find_total_ttc(txt: str) -> Tuple[Optional[str], str, str]:
 
     return (None, "non trouvé", "")
 
+# Moteur une passe équivalent à find_invoice_number (sans repli nom de fichier) + find_date + _find_total_ttc
+_SCANNER = FieldScanner(
+    RGX_INVOICE_PRIMARY,
+    RGX_INVOICE_FALLBACKS,
+    RGX_DATE,
+    RGX_TTC_MOIS,
+    RGX_TTC_STAR_GENERIC,
+    RGX_AMOUNT_GENERIC,
+)
+
+# ============================
+#   SOURCE PDF : FICHIER OU MÉMOIRE
+# ============================
+
+# Chemin, ou contenu déjà en mémoire (pièce jointe IMAP décodée, fichier mappé par mmap)
+PdfSource = Union[str, Path, bytes, bytearray, memoryview, mmap.mmap]
+
+def _in_memory(source: PdfSource) -> bool:
+    return isinstance(source, (bytes, bytearray, memoryview, mmap.mmap))
+
+def _pdf_input(source: PdfSource):
+    """
+    Argument de PdfReader. bytes : BytesIO partage le tampon (pas de copie) ; mmap : lu
+    sur place ; bytearray / memoryview : une copie en mémoire, négligeable devant l'analyse.
+    """
+    if isinstance(source, mmap.mmap):
+        source.seek(0)
+        return source
+    if _in_memory(source):
+        return io.BytesIO(source)
+    return str(source)
+
+def _source_size(source: PdfSource) -> int:
+    return len(source) if _in_memory(source) else os.path.getsize(source)
+
+def _source_name(source: PdfSource, name: Optional[str]) -> str:
+    """Nom de fichier du document (colonne fichier, indices fournisseur, journaux)."""
+    if name:
+        return name
+    if _in_memory(source):
+        raise ValueError("Nom de fichier requis (name=...) pour un PDF en mémoire")
+    return str(source)
+
+# ============================
+#   BACKENDS TEXTE (page -> texte brut)
+# ============================
+
+# Backend : page PyPDF2 -> texte brut de la page (nettoyé ensuite par _clean_text)
+TextBackend = Callable[[PageObject], str]
+
+def _pypdf2_text(page: PageObject) -> str:
+    return page.extract_text() or ""
+
+def _raw_text(page: PageObject) -> str:
+    """
+    Flux de contenu décodés directement (content_stream), même texte que PyPDF2 ;
+    page hors périmètre (syntaxe, police, écriture RTL...) : repli PyPDF2.
+    """
+    try:
+        return content_stream.page_text(page)
+    except content_stream.Unsupported as e:
+        reason = e.reason
+    except Exception:
+        reason = "error"
+    metrics.inc("invoices_text_backend_fallback_total", backend="raw", reason=reason)
+    return _pypdf2_text(page)
+
+# Surchargeable via register_text_backend / TEXT_BACKEND dans env.json
+TEXT_BACKENDS: Dict[str, TextBackend] = {
+    "pypdf2": _pypdf2_text,  # PageObject.extract_text (historique)
+    "raw": _raw_text,        # content_stream + repli PyPDF2
+}
+
+DEFAULT_TEXT_BACKEND = "raw"
+_TEXT_BACKEND = DEFAULT_TEXT_BACKEND
+
+def register_text_backend(name: str, backend: TextBackend) -> None:
+    """Ajoute (ou remplace) un backend, sélectionnable ensuite par configure_extraction(backend=name)."""
+    TEXT_BACKENDS[name.strip().lower()] = backend
+
+def _page_text(page: PageObject) -> str:
+    with metrics.timed("invoices_text_backend_seconds", backend=_TEXT_BACKEND):
+        return TEXT_BACKENDS[_TEXT_BACKEND](page)
+
 # ============================
 #   EXTRACTION TEXTE PyPDF2
 # ============================
 
 def _clean_text(txt: str) -> str:
-    if not txt:
-        return ""
-    txt = txt.replace("\xa0", " ")
-    txt = txt.replace("\u202f", " ")
-    txt = txt.replace("€", " €")
-    txt = re.sub(r"[ \t]+", " ", txt)
-    txt = txt.replace("\r", "\n")
-    return txt
-
-def _extract_text_from_pdf(pdf_path: str | Path) -> str:
+    # espaces insécables -> espace, "€" -> " €", blancs multiples réduits, \r -> \n
+    return clean_text(txt)
+
+def _producer(reader: PdfReader) -> Optional[str]:
+    """/Producer des métadonnées (indice pour les modèles fournisseur), None si absent ou illisible."""
+    try:
+        info = reader.metadata
+        return str(info.producer) if info is not None and info.producer else None
+    except Exception:
+        return None
+
+@metrics.timed("invoices_text_extract_seconds", mode="full")
+def _extract_text_from_pdf(source: PdfSource, name: Optional[str] = None, meta: Optional[Dict[str, Any]] = None) -> str:
+    """Texte nettoyé de toutes les pages ; meta (si fourni) reçoit le producteur du PDF ("producer")."""
     parts: list[str] = []
+    name = _source_name(source, name)
     try:
-        reader = PdfReader(str(pdf_path))
+        reader = PdfReader(_pdf_input(source))
+        if meta is not None:
+            meta["producer"] = _producer(reader)
+        metrics.observe("invoices_pdf_pages", len(reader.pages), buckets=metrics.PAGES_BUCKETS)
         for page in reader.pages:
-            parts.append(page.extract_text() or "")
+            parts.append(_page_text(page))
     except Exception as e:
-        print(f"❌ Erreur lecture PDF '{pdf_path}': {e}")
+        metrics.inc("invoices_pdf_read_errors_total")
+        logger.error(f"❌ Erreur lecture PDF '{name}': {e}")
     return _clean_text("\n".join(parts))
 
 # ============================
-#   API PRINCIPALE (1 PDF)
+#   EXTRACTION PARESSEUSE (page par page)
 # ============================
 
-def extract_invoice_data(pdf_path: str | Path) -> Dict[str, Any]:
-    pdf_path = str(pdf_path)
-    pdf_name = Path(pdf_path).name
+# Ordres de lecture des pages :
+#   "first" : ordre naturel (défaut)
+#   "last"  : de la dernière à la première (total en fin de relevé)
+#   "ends"  : première, dernière, puis le reste dans l'ordre
+PAGE_ORDERS = ("first", "last", "ends")
+
+# Indices par fournisseur : sous-chaîne du nom de fichier (minuscules) -> ordre de lecture.
+# Surchargeable via configure_extraction(page_hints=...) / PAGE_HINTS dans env.json.
+SUPPLIER_PAGE_HINTS: Dict[str, str] = {
+    "alan": "first",  # Alan : numéro, date et total sur la page 1
+}
+
+_EXTRACT_MODE = "full"
+_USE_TEMPLATES = True
+
+def configure_extraction(
+    mode: str = "full",
+    page_hints: Optional[Mapping[str, str]] = None,
+    backend: str = DEFAULT_TEXT_BACKEND,
+    templates: bool = True,
+) -> None:
+    """
+    Mode d'extraction du texte pour le processus courant :
+      - "full" : toutes les pages sont lues puis analysées (historique)
+      - "lazy" : lecture page par page, arrêt dès que numéro, date et total sont trouvés
+    page_hints complète SUPPLIER_PAGE_HINTS ({"motif nom de fichier": "first"|"last"|"ends"}).
+    backend : texte d'une page, parmi TEXT_BACKENDS ("pypdf2", "raw", ou enregistré).
+    templates : False pour toujours passer par la cascade générique (sans modèles fournisseur).
+    """
+    global _EXTRACT_MODE, _TEXT_BACKEND, _USE_TEMPLATES
+    mode = (mode or "full").strip().lower()
+    if mode not in ("full", "lazy"):
+        raise ValueError(f"Mode d'extraction inconnu: '{mode}' (attendu: full | lazy)")
+    backend = (backend or DEFAULT_TEXT_BACKEND).strip().lower()
+    if backend not in TEXT_BACKENDS:
+        raise ValueError(f"Backend texte inconnu: '{backend}' (attendu: {' | '.join(TEXT_BACKENDS)})")
+    for pattern, order in (page_hints or {}).items():
+        if order not in PAGE_ORDERS:
+            raise ValueError(f"Ordre de pages inconnu pour '{pattern}': '{order}' (attendu: {', '.join(PAGE_ORDERS)})")
+        SUPPLIER_PAGE_HINTS[pattern.lower()] = order
+    _EXTRACT_MODE = mode
+    _TEXT_BACKEND = backend
+    _USE_TEMPLATES = bool(templates)
+
+def _page_hint_for(pdf_path: str | Path) -> str:
+    name = Path(pdf_path).name.lower()
+    for pattern, order in SUPPLIER_PAGE_HINTS.items():
+        if pattern in name:
+            return order
+    return "first"
+
+def _page_order(n_pages: int, hint: str) -> List[int]:
+    if hint == "last":
+        return list(range(n_pages - 1, -1, -1))
+    if hint == "ends" and n_pages > 2:
+        return [0, n_pages - 1, *range(1, n_pages - 1)]
+    return list(range(n_pages))
+
+def _primary_number(page_text: str) -> Optional[str]:
+    m = RGX_INVOICE_PRIMARY.search(page_text)
+    cand = m.group(1).strip() if m else ""
+    return cand if cand and not _looks_like_date(cand) else None
+
+@metrics.timed("invoices_text_extract_seconds", mode="lazy")
+def _extract_text_lazy(
+    source: PdfSource,
+    hint: Optional[str] = None,
+    name: Optional[str] = None,
+    meta: Optional[Dict[str, Any]] = None,
+) -> str:
+    """
+    Lit les pages dans l'ordre suggéré par l'indice fournisseur et s'arrête dès que
+    numéro de facture ("Facture N°..."), date et total TTC ("Total TTC* pour <mois>")
+    ont été trouvés ; sinon toutes les pages sont lues, comme en mode full.
+    Le texte renvoyé ne contient que les pages lues, remises dans l'ordre du document.
+    """
+    pages: Dict[int, str] = {}
+    need_number = need_date = need_total = True
+    name = _source_name(source, name)
+    try:
+        reader = PdfReader(_pdf_input(source))
+        if meta is not None:
+            meta["producer"] = _producer(reader)
+        metrics.observe("invoices_pdf_pages", len(reader.pages), buckets=metrics.PAGES_BUCKETS)
+        order = _page_order(len(reader.pages), hint or _page_hint_for(name))
+        for idx in order:
+            page_text = _clean_text(_page_text(reader.pages[idx]))
+            pages[idx] = page_text
+            # Une passe du scanner par page ; un champ trouvé le reste dans le texte cumulé
+            found = _SCANNER.scan(page_text, clean=False)
+            # Un champ de repli (numéro hors "Facture N°", montant générique...) peut être
+            # supplanté par une page suivante : seul le motif prioritaire arrête la lecture
+            need_number = need_number and _primary_number(page_text) is None
+            need_date = need_date and found.date is None
+            need_total = need_total and found.source_montant != "TTC* mois"
+            if not (need_number or need_date or need_total):
+                break
+    except Exception as e:
+        metrics.inc("invoices_pdf_read_errors_total")
+        logger.error(f"❌ Erreur lecture PDF '{name}': {e}")
+    metrics.observe("invoices_pdf_pages_read", len(pages), buckets=metrics.PAGES_BUCKETS)
+    return "\n".join(pages[i] for i in sorted(pages))
+
+def _read_text(source: PdfSource, name: Optional[str] = None, meta: Optional[Dict[str, Any]] = None) -> str:
+    if _EXTRACT_MODE == "lazy":
+        return _extract_text_lazy(source, name=name, meta=meta)
+    return _extract_text_from_pdf(source, name, meta)
+
+def _cache_version() -> str:
+    # Le texte partiel du mode lazy ne doit pas être servi au mode full (et inversement) ;
+    # un backend enregistré peut produire un autre texte que PyPDF2 ("raw" : texte identique,
+    # vérifié par tests/test_content_stream.py)
+    version = PARSER_VERSION if _EXTRACT_MODE == "full" else f"{PARSER_VERSION}-{_EXTRACT_MODE}{LAZY_VERSION}"
+    if _TEXT_BACKEND not in ("pypdf2", "raw"):
+        version += f"-{_TEXT_BACKEND}"
+    if not _USE_TEMPLATES:
+        version += "-generic"
+    return version
 
-    text = _extract_text_from_pdf(pdf_path)
+# ============================
+#   API PRINCIPALE (1 PDF)
+# ============================
 
-    invoice_number = find_invoice_number(text, filename=pdf_path)
-    date_str = find_date(text)
-    total_ttc, source, periode = _find_total_ttc(text)
+def _extract_fields(text: str, name: Optional[str] = None, producer: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Champs dépendant uniquement du contenu (donc cachables). Document reconnu par un modèle
+    fournisseur (supplier_templates) : extracteurs ancrés du modèle ; sinon, ou s'il manque
+    un champ, une passe du scanner générique sur le texte. name / producer : indices
+    d'ordre des modèles, sans effet sur le résultat.
+    """
+    with metrics.timed("invoices_field_scan_seconds"):
+        template = supplier_templates.match(text, name, producer) if _USE_TEMPLATES else None
+        if template is not None:
+            fields = template.extract(text)
+            metrics.inc("invoices_template_total", template=template.name, result="hit" if fields else "miss")
+            if fields is not None:
+                return fields
+        found = _SCANNER.scan(text, clean=False)
 
     return {
-        "fichier": pdf_name,
-        "date_facture": date_str or "INCONNU",
-        "numero_facture": invoice_number or "INCONNU",
-        "total_ttc": total_ttc or "INCONNU",
-        "periode": periode,
-        "source_montant": source,
+        "date_facture": found.date or "INCONNU",
+        "numero_facture": found.invoice_number or "INCONNU",
+        "total_ttc": found.total_ttc or "INCONNU",
+        "periode": found.periode,
+        "source_montant": found.source_montant,
     }
 
+def _to_record(data: Dict[str, Any], pdf_path: str) -> InvoiceRecord:
+    """Ajoute le nom de fichier et, à défaut de numéro dans le texte, le numéro déduit du nom."""
+    numero = data["numero_facture"]
+    if numero == "INCONNU":
+        numero = _invoice_number_from_filename(pdf_path)
+    return InvoiceRecord.from_fields(
+        Path(pdf_path).name,
+        numero,
+        data["date_facture"],
+        data["total_ttc"],
+        data["periode"],
+        data["source_montant"],
+    )
+
+def extract_invoice_record(
+    source: PdfSource,
+    cache: Optional[ExtractionCache] = None,
+    digest: Optional[str] = None,
+    name: Optional[str] = None,
+) -> InvoiceRecord:
+    """
+    Extrait numéro, date, total TTC et période d'un PDF, montant et date déjà convertis.
+    source : chemin du PDF, ou son contenu en mémoire (bytes, memoryview, mmap), analysé
+    sans passage par le disque ; name (nom de fichier) est alors obligatoire.
+    Passe par le cache d'extraction (argument `cache`, sinon cache par défaut
+    configuré via extract_cache.configure_cache) : un contenu déjà vu n'est pas re-parsé.
+    digest : empreinte SHA-256 déjà calculée par l'appelant (évite de relire le fichier),
+    reprise dans l'enregistrement (identité du contenu pour report_ledger et column_store).
+    """
+    if not _in_memory(source):
+        source = str(source)
+    name = _source_name(source, name)
+    with metrics.timed("invoices_pdf_seconds"):
+        digest = digest or (buffer_digest(source) if _in_memory(source) else file_digest(source))
+        data = _extract_invoice_fields(source, cache, digest, name)
+    metrics.inc("invoices_source_montant_total", source=data.get("source_montant", ""))
+    return _to_record(data, name)._replace(digest=digest)
+
+def extract_invoice_data(
+    source: PdfSource,
+    cache: Optional[ExtractionCache] = None,
+    name: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Forme dict de extract_invoice_record() :
+    {fichier, date_facture, numero_facture, total_ttc, periode, source_montant}.
+    """
+    return extract_invoice_record(source, cache, name=name).as_dict()
+
+def _extract_invoice_fields(
+    source: PdfSource,
+    cache: Optional[ExtractionCache],
+    digest: Optional[str] = None,
+    name: Optional[str] = None,
+) -> Dict[str, Any]:
+    try:
+        metrics.observe("invoices_pdf_bytes", _source_size(source), buckets=metrics.BYTES_BUCKETS)
+    except OSError:
+        pass
+
+    cache = cache if cache is not None else get_default_cache()
+    if cache is not None:
+        digest = digest or (buffer_digest(source) if _in_memory(source) else file_digest(source))
+        hit = cache.get(digest, _cache_version())
+        metrics.inc("invoices_extract_cache_total", result="hit" if hit is not None else "miss")
+        if hit is not None:
+            return hit.data
+
+    meta: Dict[str, Any] = {}
+    text = _read_text(source, name, meta)
+    data = _extract_fields(text, name, meta.get("producer"))
+
+    # Un PDF illisible (texte vide) n'est pas mis en cache : il sera retenté au prochain run
+    if cache is not None and text:
+        cache.put(digest, _cache_version(), text, data)
+    return data
+
 # ============================
 #   TRAITEMENT DOSSIER -> CSV
 # ============================
 
+_FOLDER_COLUMNS = list(CSV_FIELDS)
+
+def _iter_folder(in_dir: Path, cache: Optional[ExtractionCache]) -> Iterator[InvoiceRecord]:
+    """Extrait les PDF du dossier un par un (générateur : rien n'est accumulé)."""
+    for pdf in sorted(in_dir.glob("*.pdf")):
+        logger.info(f"🔎 Extraction : {pdf.name}")
+        yield extract_invoice_record(pdf, cache=cache)
+
 def process_input_folder_to_csv(
     input_dir: str | Path = "./input",
     output_csv: str | Path = "./output/invoices_extract.csv",
+    cache: Optional[ExtractionCache] = None,
 ) -> Path:
     in_dir = Path(input_dir)
     out_csv = Path(output_csv)
     out_csv.parent.mkdir(parents=True, exist_ok=True)
 
-    pdfs = sorted(in_dir.glob("*.pdf"))
-    rows: list[Dict[str, Any]] = []
-
-    for pdf in pdfs:
-        print(f"🔎 Extraction : {pdf.name}")
-        rows.append(extract_invoice_data(pdf))
-
-    # écrit même vide (en-têtes)
+    # écrit même vide (en-têtes) ; chaque ligne est écrite dès son extraction
     with out_csv.open("w", newline="", encoding="utf-8-sig") as f:
-        writer = csv.DictWriter(
-            f,
-            fieldnames=["fichier", "date_facture", "numero_facture", "total_ttc", "periode"],
-        )
+        writer = csv.DictWriter(f, fieldnames=_FOLDER_COLUMNS)
         writer.writeheader()
-        for r in rows:
-            writer.writerow({
-                "fichier": r.get("fichier", ""),
-                "date_facture": r.get("date_facture", ""),
-                "numero_facture": r.get("numero_facture", ""),
-                "total_ttc": r.get("total_ttc", ""),
-                "periode": r.get("periode", ""),
-            })
-
-    print(f"✅ CSV généré : {out_csv.resolve()}")
+        for r in _iter_folder(in_dir, cache):
+            writer.writerow(r.csv_row())
+            f.flush()
+
+    logger.info(f"✅ CSV généré : {out_csv.resolve()}")
     return out_csv
 
 # ============================
@@ -205,6 +522,7 @@ def process_input_folder_to_csv(
 def process_input_folder_to_xlsx(
     input_dir: str | Path = "./input",
     output_xlsx: str | Path = "./output/invoices_extract.xlsx",
+    cache: Optional[ExtractionCache] = None,
 ) -> Path:
     """
     Parcourt ./input, extrait les infos pour chaque PDF, et écrit ./output/invoices_extract.xlsx.
@@ -214,31 +532,19 @@ def process_input_folder_to_xlsx(
     out_xlsx = Path(output_xlsx)
     out_xlsx.parent.mkdir(parents=True, exist_ok=True)
 
-    pdfs = sorted(in_dir.glob("*.pdf"))
-    rows: list[Dict[str, Any]] = []
-
-    for pdf in pdfs:
-        print(f"🔎 Extraction : {pdf.name}")
-        rows.append(extract_invoice_data(pdf))
-
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "invoices"
+    from openpyxl import Workbook  # seulement pour cet export (pas pour l'extraction)
 
-    headers = ["fichier", "date_facture", "numero_facture", "total_ttc", "periode"]
-    ws.append(headers)
+    # Classeur write-only : les lignes partent sur disque au fil de l'extraction
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("invoices")
 
-    for r in rows:
-        ws.append([
-            r.get("fichier", ""),
-            r.get("date_facture", ""),
-            r.get("numero_facture", ""),
-            r.get("total_ttc", ""),
-            r.get("periode", ""),
-        ])
+    ws.append(_FOLDER_COLUMNS)
+    for r in _iter_folder(in_dir, cache):
+        row = r.csv_row()
+        ws.append([row[col] for col in _FOLDER_COLUMNS])
 
     wb.save(out_xlsx)
-    print(f"✅ XLSX généré : {out_xlsx.resolve()}")
+    logger.info(f"✅ XLSX généré : {out_xlsx.resolve()}")
     return out_xlsx
 
 # ============================
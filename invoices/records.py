@@ -0,0 +1,204 @@
+# invoices/records.py
+"""
+Enregistrement typé d'une facture extraite.
+
+Le parser produit un InvoiceRecord par PDF ; CSV, Excel et pipeline le consomment
+tel quel. Montant et date sont convertis une seule fois, à l'extraction :
+  - total_cents : montant en centimes (entier), le texte d'origine reste dans total_ttc
+  - date_facture : datetime.date ; une date présente mais invalide (31/02/2025) reste
+    en texte dans date_brute et est reprise telle quelle dans le CSV
+Un champ absent vaut None (rendu "INCONNU" dans les rapports).
+
+NamedTuple (pas de __dict__ par instance) : compact en mémoire et à la sérialisation
+entre processus du pool d'extraction.
+"""
+from __future__ import annotations
+
+import json
+from datetime import date
+from decimal import Decimal, InvalidOperation, ROUND_HALF_EVEN
+from pathlib import PurePath
+from typing import Any, Dict, Mapping, NamedTuple, Optional
+
+UNKNOWN = "INCONNU"
+
+# Colonnes du CSV (et des exports dossier de pdf_parser)
+CSV_FIELDS = ("fichier", "date_facture", "numero_facture", "total_ttc", "periode")
+
+
+# ---------------------------
+# Conversions (une fois par facture)
+# ---------------------------
+
+def parse_amount_cents(val: Any) -> Optional[int]:
+    """
+    "255,63€" -> 25563, "1.234,56 €" -> 123456, "$1,234.56" -> 123456.
+    None si non convertible. Même heuristique de séparateurs que l'ancien
+    excel_reporter._number_from_amount, mais en Decimal (pas d'arrondi flottant).
+    """
+    if val is None:
+        return None
+    s = str(val).strip()
+    if not s or s == UNKNOWN:
+        return None
+    # retire les devises courantes et espaces
+    s = s.replace("€", "").replace("$", "").replace(" ", "")
+    # heuristique du séparateur décimal
+    if "," in s and "." in s:
+        if s.rfind(".") > s.rfind(","):
+            # "1,234.56" -> milliers: ',', décimal: '.'
+            s = s.replace(",", "")
+        else:
+            # "1.234,56" -> milliers: '.', décimal: ','
+            s = s.replace(".", "").replace(",", ".")
+    elif "," in s:
+        # "1234,56" (FR)
+        s = s.replace(",", ".")
+    try:
+        amount = Decimal(s)
+    except InvalidOperation:
+        return None
+    if not amount.is_finite():
+        return None
+    return int((amount * 100).to_integral_value(rounding=ROUND_HALF_EVEN))
+
+def parse_date(val: Any) -> Optional[date]:
+    """"dd/mm/yyyy" (format produit par le parser) -> date ; None si absent ou invalide."""
+    if isinstance(val, date):
+        return val
+    if not val:
+        return None
+    parts = str(val).strip().split("/")
+    if len(parts) != 3:
+        return None
+    try:
+        day, month, year = (int(p) for p in parts)
+        return date(year, month, day)
+    except ValueError:
+        return None
+
+def supplier_from_filename(fichier: str) -> str:
+    """Premier mot du nom de fichier ("Alan 20230401 - Facture ....pdf" -> "Alan")."""
+    stem = PurePath(fichier or "").stem.replace("_", " ").strip()
+    return stem.split(" ", 1)[0] if stem else UNKNOWN
+
+def _known(val: Any) -> Optional[str]:
+    if val is None:
+        return None
+    s = str(val)
+    return None if not s or s == UNKNOWN else s
+
+
+# ---------------------------
+# Enregistrement
+# ---------------------------
+
+class InvoiceRecord(NamedTuple):
+    fichier: str
+    numero_facture: Optional[str]
+    date_facture: Optional[date]
+    total_ttc: Optional[str]     # texte tel que trouvé ("286,00€"), repris tel quel dans le CSV
+    total_cents: Optional[int]
+    periode: str = ""
+    source_montant: str = ""
+    doublon: str = ""            # fichier d'une facture aux mêmes numéro/date/montant (dedup_index)
+    date_brute: str = ""         # texte de la date quand il n'est pas une date valide, "" sinon
+    digest: str = ""             # SHA-256 du PDF (extract_cache.file_digest), "" si inconnue
+
+    @classmethod
+    def from_fields(
+        cls,
+        fichier: str,
+        numero_facture: Optional[str],
+        date_facture: Any,
+        total_ttc: Optional[str],
+        periode: Optional[str] = "",
+        source_montant: Optional[str] = "",
+    ) -> "InvoiceRecord":
+        """Construit l'enregistrement à partir des champs texte du parser (conversions faites ici)."""
+        total = _known(total_ttc)
+        raw_date = _known(date_facture)
+        day = parse_date(raw_date)
+        return cls(
+            fichier or UNKNOWN,
+            _known(numero_facture),
+            day,
+            total,
+            parse_amount_cents(total),
+            periode or "",
+            source_montant or "",
+            date_brute=raw_date if day is None and raw_date else "",
+        )
+
+    @classmethod
+    def from_mapping(cls, row: Mapping[str, Any]) -> "InvoiceRecord":
+        """
+        Depuis un dict, quelle que soit la version du parser :
+          - ancienne forme: fichier, facture, date, total_ttc, periode
+          - nouvelle forme: fichier, numero_facture, date_facture, total_ttc, periode
+        """
+        return cls.from_fields(
+            row.get("fichier") or UNKNOWN,
+            row.get("numero_facture") or row.get("facture"),
+            row.get("date_facture") or row.get("date"),
+            row.get("total_ttc"),
+            row.get("periode"),
+            row.get("source_montant"),
+        )._replace(doublon=row.get("doublon") or "")
+
+    # ---------------------------
+    # Rendus
+    # ---------------------------
+
+    @property
+    def date_text(self) -> str:
+        d = self.date_facture
+        if d is None:
+            return self.date_brute or UNKNOWN
+        return f"{d.day:02d}/{d.month:02d}/{d.year:04d}"
+
+    @property
+    def fournisseur(self) -> str:
+        return supplier_from_filename(self.fichier)
+
+    @property
+    def total_amount(self) -> Optional[Decimal]:
+        return Decimal(self.total_cents).scaleb(-2) if self.total_cents is not None else None
+
+    def csv_row(self) -> Dict[str, str]:
+        """Ligne CSV (colonnes CSV_FIELDS, "INCONNU" pour les champs absents)."""
+        return {
+            "fichier": self.fichier,
+            "date_facture": self.date_text,
+            "numero_facture": self.numero_facture or UNKNOWN,
+            "total_ttc": self.total_ttc or UNKNOWN,
+            "periode": self.periode,
+        }
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Forme dict historique de pdf_parser.extract_invoice_data()."""
+        return {
+            "fichier": self.fichier,
+            "date_facture": self.date_text,
+            "numero_facture": self.numero_facture or UNKNOWN,
+            "total_ttc": self.total_ttc or UNKNOWN,
+            "periode": self.periode,
+            "source_montant": self.source_montant,
+        }
+
+    def to_json(self) -> str:
+        """Tous les champs (date ISO), sans perte : registre de reporting, partiels de la file de travail."""
+        data = self._asdict()
+        data["date_facture"] = self.date_facture.isoformat() if self.date_facture else None
+        return json.dumps(data, ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, text: str) -> "InvoiceRecord":
+        data = json.loads(text)
+        data["date_facture"] = date.fromisoformat(data["date_facture"]) if data["date_facture"] else None
+        return cls(**data)
+
+
+def as_record(row: InvoiceRecord | Mapping[str, Any]) -> InvoiceRecord:
+    """Accepte aussi un dict (appelants existants) : converti une fois, à l'entrée du writer."""
+    return row if isinstance(row, InvoiceRecord) else InvoiceRecord.from_mapping(row)
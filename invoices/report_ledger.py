@@ -0,0 +1,311 @@
+# invoices/report_ledger.py
+"""
+Registre des lignes déjà reportées (SQLite), pour le reporting incrémental (REPORT_MODE=incremental).
+
+Chaque run n'ajoute au CSV que les factures jamais reportées (clé : nom de fichier et
+empreinte du contenu, InvoiceRecord.digest, comme column_store : un PDF remplacé sous le
+même nom est reporté) ; le registre garde :
+  - les lignes reportées (champs de InvoiceRecord en JSON, mois de facture "AAAA-MM")
+    -> classeurs mensuels réécrits à partir du seul mois concerné ;
+  - la taille du CSV au dernier run validé (fait foi) : des octets au-delà (run
+    interrompu avant commit) sont tronqués au run suivant, un CSV plus court
+    (supprimé, remplacé) est reconstruit depuis le registre ;
+  - l'historique des runs (lignes ajoutées, mois touchés).
+
+Un run est une transaction : new_records y enregistre chaque nouvelle ligne au fil de
+l'eau (rien n'est gardé en mémoire que le compte et les mois touchés), commit la valide
+après l'écriture du CSV et des classeurs. Rejouer un run interrompu n'ajoute aucune
+ligne en double.
+
+    ledger = ReportLedger("output/report_ledger.sqlite")
+    ledger.prepare_csv(csv_path)
+    for rec in ledger.new_records(records):
+        ...  # ajout au CSV
+    for month in sorted(ledger.current_run().months):
+        ...  # classeur du mois depuis ledger.month_records(month)
+    ledger.commit(csv_path)
+
+Un registre neuf reprend le CSV déjà présent (REPORT_MODE=full jusque-là) comme
+historique reporté : passer en incrémental ne perd aucune ligne. Ces lignes n'ont pas
+d'empreinte ; le premier contenu extrait sous leur nom leur est attribué (pas de doublon).
+
+Même schéma d'accès que dedup_index : une connexion par thread (le rapport du pipeline
+async est écrit dans un thread dédié).
+"""
+from __future__ import annotations
+
+import csv
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional, Set
+
+from invoices.records import CSV_FIELDS, InvoiceRecord, as_record
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS runs (
+    run_id   INTEGER PRIMARY KEY AUTOINCREMENT,
+    finished REAL NOT NULL,
+    rows     INTEGER NOT NULL,
+    months   TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rows (
+    fichier TEXT NOT NULL,
+    digest  TEXT NOT NULL,
+    run_id  INTEGER NOT NULL,
+    month   TEXT NOT NULL,
+    record  TEXT NOT NULL,
+    PRIMARY KEY (fichier, digest)
+);
+CREATE INDEX IF NOT EXISTS rows_month ON rows(month);
+"""
+
+# Registre d'avant l'empreinte (clé : nom de fichier seul) : lignes reprises sans empreinte,
+# dans le même ordre (rowid conservé)
+_MIGRATE_ROWS = """
+ALTER TABLE rows RENAME TO rows_v1;
+DROP INDEX IF EXISTS rows_month;
+CREATE TABLE rows (
+    fichier TEXT NOT NULL,
+    digest  TEXT NOT NULL,
+    run_id  INTEGER NOT NULL,
+    month   TEXT NOT NULL,
+    record  TEXT NOT NULL,
+    PRIMARY KEY (fichier, digest)
+);
+INSERT INTO rows(rowid, fichier, digest, run_id, month, record)
+    SELECT rowid, fichier, '', run_id, month, record FROM rows_v1;
+DROP TABLE rows_v1;
+CREATE INDEX rows_month ON rows(month);
+"""
+
+# Mois des factures sans date
+NO_DATE_MONTH = "sans-date"
+
+
+def month_key(rec: InvoiceRecord) -> str:
+    d = rec.date_facture
+    return f"{d.year:04d}-{d.month:02d}" if d is not None else NO_DATE_MONTH
+
+
+class LedgerRun:
+    """Run ouvert (ReportLedger.begin) : lignes ajoutées et mois touchés jusqu'ici."""
+
+    def __init__(self, run_id: int):
+        self.run_id = run_id
+        self.rows = 0
+        self.months: Set[str] = set()
+
+
+class ReportLedger:
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self._local = threading.local()
+
+    # ---------------------------
+    # Connexion
+    # ---------------------------
+
+    def _db(self) -> sqlite3.Connection:
+        local = self._local
+        if getattr(local, "conn", None) is None or local.pid != os.getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            _migrate(conn)
+            local.conn = conn
+            local.pid = os.getpid()
+        return local.conn
+
+    def close(self) -> None:
+        local = self._local
+        if getattr(local, "conn", None) is not None and local.pid == os.getpid():
+            local.conn.close()
+        local.conn = None
+        local.pid = None
+
+    def __len__(self) -> int:
+        return self._db().execute("SELECT COUNT(*) FROM rows").fetchone()[0]
+
+    # ---------------------------
+    # CSV
+    # ---------------------------
+
+    def _committed_csv_size(self) -> Optional[int]:
+        row = self._db().execute("SELECT value FROM meta WHERE key = 'csv_size'").fetchone()
+        return row[0] if row is not None else None
+
+    def csv_size(self) -> int:
+        """Taille du CSV au dernier run validé (0 : rien de reporté)."""
+        return self._committed_csv_size() or 0
+
+    def _set_csv_size(self, db: sqlite3.Connection, size: int) -> None:
+        db.execute("INSERT OR REPLACE INTO meta(key, value) VALUES ('csv_size', ?)", (size,))
+
+    def prepare_csv(self, csv_path: Path) -> str:
+        """
+        Remet le CSV dans l'état du dernier run validé avant d'y ajouter des lignes.
+        Renvoie "ok", "truncated" (run interrompu), "rebuilt" (CSV absent ou plus court)
+        ou "seeded" : registre neuf et CSV déjà là (écrit en REPORT_MODE=full), ses lignes
+        sont enregistrées comme déjà reportées et le CSV est conservé tel quel.
+        ValueError si ce CSV n'a pas les colonnes CSV_FIELDS.
+        """
+        committed = self._committed_csv_size()
+        size = csv_path.stat().st_size if csv_path.exists() else 0
+        if committed is None:
+            if size:
+                self._seed(csv_path)
+                return "seeded"
+            # Taille validée explicite dès le premier run : un CSV laissé par ce run, s'il
+            # est interrompu, sera tronqué (et non pris pour un historique à reprendre)
+            db = self._db()
+            with db:
+                self._set_csv_size(db, 0)
+            return "ok"
+        if size == committed:
+            return "ok"
+        if size > committed:
+            with open(csv_path, "r+b") as f:
+                f.truncate(committed)
+            return "truncated"
+        csv_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = csv_path.with_name(csv_path.name + ".tmp")
+        with tmp.open("w", newline="", encoding="utf-8-sig") as f:
+            writer = csv.DictWriter(f, fieldnames=list(CSV_FIELDS))
+            writer.writeheader()
+            for rec in self.records():
+                writer.writerow(rec.csv_row())
+        os.replace(tmp, csv_path)
+        db = self._db()
+        with db:
+            self._set_csv_size(db, csv_path.stat().st_size)
+        return "rebuilt"
+
+    def _seed(self, csv_path: Path) -> int:
+        with csv_path.open(newline="", encoding="utf-8-sig") as f:
+            reader = csv.DictReader(f)
+            missing = [name for name in CSV_FIELDS if name not in (reader.fieldnames or ())]
+            if missing:
+                raise ValueError(
+                    f"CSV existant sans les colonnes {', '.join(missing)}: {csv_path} "
+                    "(à déplacer ou renommer avant le premier run incrémental)"
+                )
+            try:
+                for _ in self.new_records(reader):
+                    pass
+            except BaseException:
+                self.rollback()
+                raise
+        return self.commit(csv_path)
+
+    # ---------------------------
+    # Lignes
+    # ---------------------------
+
+    def begin(self) -> LedgerRun:
+        """
+        Ouvre le run (transaction) : les lignes de new_records y sont enregistrées au fil
+        de l'eau, visibles de month_records mais validées seulement par commit().
+        """
+        local = self._local
+        if getattr(local, "run", None) is not None:
+            return local.run
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        run_id = db.execute(
+            "INSERT INTO runs(finished, rows, months) VALUES (0, 0, '[]')"
+        ).lastrowid
+        local.run = LedgerRun(run_id)
+        return local.run
+
+    def new_records(self, rows: Iterable, stats: Optional[Dict[str, int]] = None) -> Iterator[InvoiceRecord]:
+        """
+        Lignes jamais reportées (ni déjà vues dans ce flux), enregistrées dans le run
+        ouvert (begin() implicite). stats["extracted"] compte toutes les lignes,
+        stats["skipped"] celles déjà reportées (même nom, même contenu).
+        """
+        run = self.begin()
+        db = self._db()
+        for row in rows:
+            rec = as_record(row)
+            if stats is not None:
+                stats["extracted"] = stats.get("extracted", 0) + 1
+            month = month_key(rec)
+            # Ligne reprise d'un CSV (sans empreinte) : ce contenu est le sien
+            adopted = rec.digest and db.execute(
+                "UPDATE OR IGNORE rows SET digest = ? WHERE fichier = ? AND digest = ''", (rec.digest, rec.fichier)
+            ).rowcount
+            inserted = not adopted and db.execute(
+                "INSERT OR IGNORE INTO rows(fichier, digest, run_id, month, record) VALUES (?, ?, ?, ?, ?)",
+                (rec.fichier, rec.digest, run.run_id, month, rec.to_json()),
+            ).rowcount
+            if inserted:
+                run.rows += 1
+                run.months.add(month)
+                yield rec
+            elif stats is not None:
+                stats["skipped"] = stats.get("skipped", 0) + 1
+
+    def current_run(self) -> Optional[LedgerRun]:
+        return getattr(self._local, "run", None)
+
+    def month_records(self, month: str) -> Iterator[InvoiceRecord]:
+        """Lignes du mois dans l'ordre d'ajout (celles du run ouvert comprises), lues au fil de l'eau."""
+        for (text,) in self._db().execute("SELECT record FROM rows WHERE month = ? ORDER BY rowid", (month,)):
+            yield InvoiceRecord.from_json(text)
+
+    def records(self) -> Iterator[InvoiceRecord]:
+        """Toutes les lignes reportées, dans l'ordre d'ajout."""
+        for (text,) in self._db().execute("SELECT record FROM rows ORDER BY rowid"):
+            yield InvoiceRecord.from_json(text)
+
+    def commit(self, csv_path: Path) -> int:
+        """Valide le run ouvert : lignes ajoutées et taille du CSV. Renvoie l'id du run."""
+        run = self.begin()
+        db = self._db()
+        try:
+            db.execute(
+                "UPDATE runs SET finished = ?, rows = ?, months = ? WHERE run_id = ?",
+                (time.time(), run.rows, json.dumps(sorted(run.months)), run.run_id),
+            )
+            self._set_csv_size(db, csv_path.stat().st_size if csv_path.exists() else 0)
+            db.execute("COMMIT")
+        except BaseException:
+            self.rollback()
+            raise
+        self._local.run = None
+        return run.run_id
+
+    def rollback(self) -> None:
+        """Abandonne le run ouvert (rapport interrompu) : rien n'est enregistré."""
+        local = self._local
+        if getattr(local, "run", None) is None:
+            return
+        local.run = None
+        db = self._db()
+        if db.in_transaction:
+            db.execute("ROLLBACK")
+
+
+def _migrate(conn: sqlite3.Connection) -> None:
+    if any(col[1] == "digest" for col in conn.execute("PRAGMA table_info(rows)")):
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Revérifié sous verrou : un autre processus a pu migrer entre-temps
+        if not any(col[1] == "digest" for col in conn.execute("PRAGMA table_info(rows)")):
+            for statement in _MIGRATE_ROWS.split(";"):
+                if statement.strip():
+                    conn.execute(statement)
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
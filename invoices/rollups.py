@@ -0,0 +1,119 @@
+# invoices/rollups.py
+"""
+Agrégats incrémentaux du reporting : totaux par période, par mois de date_facture
+et par fournisseur.
+
+Chaque facture ajoute sa contribution (add) aux groupes concernés ; rien n'est
+recalculé sur l'historique. Persistés avec le stockage colonnaire (manifeste de
+column_store), ils donnent les onglets de synthèse du reporting en un temps qui
+dépend du nombre de groupes, pas du nombre de factures.
+
+    rollups = Rollups()
+    rollups.update(records)
+    rollups.totals("mois")   # {"2023-04": GroupTotal(count=1, total_cents=26900, missing=0), ...}
+"""
+from __future__ import annotations
+
+import re
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+
+from invoices.records import UNKNOWN, InvoiceRecord, as_record
+
+# dimension -> titre de l'onglet de synthèse
+DIMENSIONS: Dict[str, str] = {
+    "periode": "Par période",
+    "mois": "Par mois",
+    "fournisseur": "Par fournisseur",
+}
+
+_MONTHS_FR = {
+    m: i for i, m in enumerate(
+        ("janvier", "février", "mars", "avril", "mai", "juin", "juillet",
+         "août", "septembre", "octobre", "novembre", "décembre"), start=1
+    )
+}
+_RGX_PERIODE = re.compile(r"(?i)^\s*([a-zà-ÿ]+)\s+(\d{4})\s*$")
+
+
+class GroupTotal(NamedTuple):
+    count: int          # lignes du groupe
+    total_cents: int    # somme des montants connus
+    missing: int        # lignes sans montant
+
+
+def rollup_keys(rec: InvoiceRecord) -> Dict[str, str]:
+    """Groupe de la facture pour chaque dimension (UNKNOWN si la valeur manque)."""
+    d = rec.date_facture
+    return {
+        "periode": rec.periode or UNKNOWN,
+        "mois": f"{d.year:04d}-{d.month:02d}" if d else UNKNOWN,
+        "fournisseur": rec.fournisseur,
+    }
+
+def _sort_key(dimension: str, key: str) -> tuple:
+    # Périodes "Avril 2023" dans l'ordre chronologique, INCONNU en dernier
+    if key == UNKNOWN:
+        return (1, 0, 0, key)
+    if dimension == "periode":
+        m = _RGX_PERIODE.match(key)
+        if m and m.group(1).lower() in _MONTHS_FR:
+            return (0, int(m.group(2)), _MONTHS_FR[m.group(1).lower()], key)
+    return (0, 0, 0, key)
+
+
+class Rollups:
+    def __init__(self, groups: Optional[Dict[str, Dict[str, List[int]]]] = None):
+        # dimension -> clé -> [count, total_cents, missing]
+        self.groups: Dict[str, Dict[str, List[int]]] = {dim: {} for dim in DIMENSIONS}
+        for dim, entries in (groups or {}).items():
+            if dim in self.groups:
+                self.groups[dim] = {key: list(v) for key, v in entries.items()}
+
+    def add(self, rec: InvoiceRecord | Dict[str, Any]) -> None:
+        rec = as_record(rec)
+        for dim, key in rollup_keys(rec).items():
+            acc = self.groups[dim].setdefault(key, [0, 0, 0])
+            acc[0] += 1
+            if rec.total_cents is None:
+                acc[2] += 1
+            else:
+                acc[1] += rec.total_cents
+
+    def update(self, records: Iterable[InvoiceRecord]) -> "Rollups":
+        for rec in records:
+            self.add(rec)
+        return self
+
+    def merged(self, other: "Rollups") -> "Rollups":
+        out = Rollups(self.groups)
+        for dim, entries in other.groups.items():
+            for key, (count, cents, missing) in entries.items():
+                acc = out.groups[dim].setdefault(key, [0, 0, 0])
+                acc[0] += count
+                acc[1] += cents
+                acc[2] += missing
+        return out
+
+    def totals(self, dimension: str) -> Dict[str, GroupTotal]:
+        """Totaux d'une dimension, triés (mois et périodes dans l'ordre chronologique)."""
+        if dimension not in DIMENSIONS:
+            raise ValueError(f"Dimension inconnue: {dimension} ({', '.join(DIMENSIONS)})")
+        entries = self.groups[dimension]
+        return {
+            key: GroupTotal(*entries[key])
+            for key in sorted(entries, key=lambda k: _sort_key(dimension, k))
+        }
+
+    def __bool__(self) -> bool:
+        return any(self.groups.values())
+
+    # ---------------------------
+    # Sérialisation (manifeste du stockage colonnaire)
+    # ---------------------------
+
+    def to_json(self) -> Dict[str, Dict[str, List[int]]]:
+        return {dim: dict(entries) for dim, entries in self.groups.items()}
+
+    @classmethod
+    def from_json(cls, data: Optional[Dict[str, Dict[str, List[int]]]]) -> "Rollups":
+        return cls(data)
@@ -0,0 +1,103 @@
+# invoices/supplier_templates.py
+"""
+Modèles de factures par fournisseur : empreinte peu coûteuse + extracteurs ancrés.
+
+Un document reconnu par un modèle est extrait par les regex ancrées de ce modèle
+(numéro, date d'émission, total TTC et période), sans passer par la cascade générique
+de pdf_parser (FieldScanner, repli sur le nom de fichier). S'il manque un champ, la
+cascade générique reprend tout le texte : un modèle ne peut qu'ajouter des résultats.
+
+Empreinte :
+  - mots-clés (minuscules), tous présents dans le début du texte (première page) :
+    seule condition de reconnaissance. Le cache d'extraction étant adressé par contenu,
+    le résultat ne doit dépendre que du texte.
+  - nom de fichier et /Producer des métadonnées PDF : simples indices, le modèle
+    correspondant est essayé en premier.
+
+    template = supplier_templates.match(text, name="Alan 20240601 - Facture.pdf")
+    fields = template.extract(text) if template else None   # None : cascade générique
+
+Nouveau fournisseur : register_template(SupplierTemplate(...)).
+"""
+from __future__ import annotations
+
+import re
+from typing import Any, Dict, List, NamedTuple, Optional, Pattern, Tuple
+
+# Les mots-clés sont cherchés dans ce début de texte (première page d'une facture)
+_HEAD_CHARS = 2000
+
+
+class SupplierTemplate(NamedTuple):
+    name: str
+    keywords: Tuple[str, ...]                  # en minuscules, tous requis
+    invoice_number: Pattern[str]               # groupe "value"
+    date: Pattern[str]                         # groupes "d", "m", "y"
+    total: Pattern[str]                        # groupes "periode", "amount", "cur"
+    filename: Optional[Pattern[str]] = None    # indice : nom de fichier
+    producer: Optional[Pattern[str]] = None    # indice : /Producer du PDF
+
+    def hinted(self, name: Optional[str], producer: Optional[str]) -> bool:
+        return bool(
+            (name and self.filename is not None and self.filename.search(name))
+            or (producer and self.producer is not None and self.producer.search(producer))
+        )
+
+    def extract(self, text: str) -> Optional[Dict[str, Any]]:
+        """Champs au format de pdf_parser._extract_fields, None si l'un d'eux manque."""
+        number = self.invoice_number.search(text)
+        date = self.date.search(text) if number else None
+        total = self.total.search(text) if date else None
+        if total is None:
+            return None
+        return {
+            "date_facture": f"{date.group('d')}/{date.group('m')}/{date.group('y')}",
+            "numero_facture": number.group("value"),
+            "total_ttc": f"{total.group('amount')}{total.group('cur')}",
+            "periode": total.group("periode"),
+            "source_montant": "TTC* mois",
+        }
+
+
+# ---------------------------
+# Modèles connus
+# ---------------------------
+
+# Alan, "Facture Sante" mensuelle (cairo puis WeasyPrint), texte nettoyé par clean_text :
+#   Facture N°2024-06-621513456-000059041-IH-1
+#   Team Alan, le 01/06/2024          (2025 : "L'équipe Alan, le 01/09/2025")
+#   Total TTC* pour Juin 2024 286,00 €
+ALAN = SupplierTemplate(
+    name="alan",
+    keywords=("assurance complémentaire santé", "alan, le "),
+    invoice_number=re.compile(r"(?m)^Facture N°\s*(?P<value>[A-Za-z0-9._/\-]+)"),
+    date=re.compile(r"(?m)^(?:Team|L['’]équipe) Alan, le (?P<d>\d{2})/(?P<m>\d{2})/(?P<y>\d{4})\b"),
+    total=re.compile(
+        r"(?m)^\s*Total TTC\* pour (?P<periode>[A-Za-zÀ-ÿ]+ \d{4}) "
+        r"(?P<amount>\d[\d .,]*\d)\s*(?P<cur>[€$])[ \t]*$"
+    ),
+    filename=re.compile(r"(?i)^alan\b.*\bfacture"),
+    producer=re.compile(r"(?i)weasyprint|cairo"),
+)
+
+# Surchargeable via register_template (ordre d'insertion = ordre d'essai, après les indices)
+TEMPLATES: Dict[str, SupplierTemplate] = {ALAN.name: ALAN}
+
+def register_template(template: SupplierTemplate) -> None:
+    TEMPLATES[template.name] = template
+
+def _candidates(name: Optional[str], producer: Optional[str]) -> List[SupplierTemplate]:
+    hinted, others = [], []
+    for template in TEMPLATES.values():
+        (hinted if template.hinted(name, producer) else others).append(template)
+    return hinted + others
+
+def match(text: str, name: Optional[str] = None, producer: Optional[str] = None) -> Optional[SupplierTemplate]:
+    """Premier modèle dont tous les mots-clés figurent dans le début du texte (indices d'abord)."""
+    if not text or not TEMPLATES:
+        return None
+    head = text[:_HEAD_CHARS].lower()
+    for template in _candidates(name, producer):
+        if all(k in head for k in template.keywords):
+            return template
+    return None
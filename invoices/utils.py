@@ -1,8 +1,9 @@
 ﻿# invoices/utils.py
 import json
 import os
+import threading
 from pathlib import Path
-from typing import Iterable, Mapping, Any, Optional, List
+from typing import Iterable, Iterator, Mapping, Any, Optional, List, Dict, Tuple
 
 class ConfigError(RuntimeError):
     """Erreur de configuration levée lorsque le fichier env.json est invalide ou introuvable."""
@@ -48,28 +49,76 @@ def _candidate_env_paths(explicit: Optional[str]) -> List[Path]:
             seen.add(rp)
     return uniq
 
-def load_env_config(path: Optional[str] = None, required_keys: Iterable[str] | None = None) -> Mapping[str, Any]:
+# ---------------------------
+# Racine projet & chemins
+# ---------------------------
+
+def project_root() -> Path:
+    """Racine du projet: parent de invoices/ ou WORKSPACE Jenkins si défini."""
+    ws = os.environ.get("WORKSPACE")
+    if ws:
+        return Path(ws).resolve()
+    return Path(__file__).resolve().parent.parent
+
+def resolve_dir(base: Path, value: str) -> Path:
+    p = Path(value)
+    return (base / p).resolve() if not p.is_absolute() else p.resolve()
+
+
+# ---------------------------
+# Configuration chargée une fois
+# ---------------------------
+
+class EnvConfig(Mapping[str, Any]):
     """
-    Charge env.json depuis l'un des chemins candidats et valide les clés requises.
-    - path : chemin explicite optionnel
-    - required_keys : liste des clés obligatoires
+    Contenu de env.json (lecture seule) + fichier source et racine projet.
+    Les chemins résolus via resolve() sont calculés une seule fois par chargement.
     """
+
+    def __init__(self, source: Path, data: Mapping[str, Any], stamp: Tuple[int, int], root: Path):
+        self.source = source
+        self.root = root
+        self.stamp = stamp
+        self._data = data
+        self._paths: Dict[Tuple[str, str], Path] = {}
+
+    def __getitem__(self, key: str) -> Any:
+        return self._data[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._data)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __repr__(self) -> str:
+        return f"EnvConfig({self.source})"
+
+    def resolve(self, key: str, default: str) -> Path:
+        """Chemin de la clé `key` (ou `default`), résolu depuis la racine projet si relatif."""
+        path = self._paths.get((key, default))
+        if path is None:
+            path = self._paths[(key, default)] = resolve_dir(self.root, self._data.get(key, default))
+        return path
+
+def _stamp(path: Path) -> Tuple[int, int]:
+    st = path.stat()
+    return st.st_mtime_ns, st.st_size
+
+def _read_env_file(cand: Path) -> EnvConfig:
+    # stat avant lecture : si le fichier change entre les deux, le prochain appel relira
+    stamp = _stamp(cand)
+    try:
+        data = json.loads(cand.read_text(encoding="utf-8"))
+    except json.JSONDecodeError as e:
+        raise ConfigError(f"JSON invalide dans {cand.resolve()} : {e}") from e
+    return EnvConfig(cand.resolve(), data, stamp, project_root())
+
+def _find_env_file(path: Optional[str]) -> EnvConfig:
     candidates = _candidate_env_paths(path)
     for cand in candidates:
         if cand.exists():
-            try:
-                data = json.loads(cand.read_text(encoding="utf-8"))
-            except json.JSONDecodeError as e:
-                raise ConfigError(f"JSON invalide dans {cand.resolve()} : {e}") from e
-
-            required = list(required_keys or data.get("_required_keys") or [])
-            if required:
-                missing = [k for k in required if k not in data or data.get(k) in (None, "", [])]
-                if missing:
-                    raise ConfigError(
-                        f"Clés manquantes/vides dans {cand.resolve()} : {', '.join(missing)}"
-                    )
-            return data
+            return _read_env_file(cand)
 
     # Rien trouvé : message clair avec la liste des chemins testés
     tested = "\n - ".join(str(p) for p in candidates)
@@ -80,3 +129,42 @@ def load_env_config(path: Optional[str] = None, required_keys: Iterable[str] | N
         "  2) Ou passe un chemin explicite à load_env_config(path=...).\n"
         "  3) Ou définis INVOICES_ENV_PATH dans l'environnement Jenkins/Windows."
     )
+
+# Configurations déjà chargées, par contexte de recherche (chemin explicite, variables, cwd)
+_ENV_CACHE: Dict[Tuple[Optional[str], ...], EnvConfig] = {}
+_ENV_LOCK = threading.Lock()
+
+def load_env_config(path: Optional[str] = None, required_keys: Iterable[str] | None = None) -> EnvConfig:
+    """
+    Charge env.json depuis l'un des chemins candidats et valide les clés requises.
+    - path : chemin explicite optionnel
+    - required_keys : liste des clés obligatoires
+    La configuration est mémoïsée : les appels suivants ne font qu'un stat() du fichier
+    trouvé la première fois, et ne relisent le JSON que si sa date/taille a changé.
+    """
+    key = (path, os.environ.get("INVOICES_ENV_PATH"), os.environ.get("WORKSPACE"), os.getcwd())
+    with _ENV_LOCK:
+        cfg = _ENV_CACHE.get(key)
+        if cfg is not None:
+            try:
+                if _stamp(cfg.source) != cfg.stamp:
+                    cfg = _read_env_file(cfg.source)
+            except FileNotFoundError:
+                cfg = None  # fichier déplacé/supprimé : nouvelle recherche
+        if cfg is None:
+            cfg = _find_env_file(path)
+        _ENV_CACHE[key] = cfg
+
+    required = list(required_keys or cfg.get("_required_keys") or [])
+    if required:
+        missing = [k for k in required if k not in cfg or cfg.get(k) in (None, "", [])]
+        if missing:
+            raise ConfigError(
+                f"Clés manquantes/vides dans {cfg.source} : {', '.join(missing)}"
+            )
+    return cfg
+
+def clear_env_cache() -> None:
+    """Oublie les configurations chargées (prochain appel : recherche et lecture complètes)."""
+    with _ENV_LOCK:
+        _ENV_CACHE.clear()
@@ -0,0 +1,364 @@
+# invoices/work_queue.py
+"""
+File de travail partagée par plusieurs nœuds (agents Jenkins) sur un même INPUT_DIR
+(partage réseau), sans serveur ni verrou : WORK_QUEUE=true (voir main._configure_work_queue).
+
+Un PDF appartient au nœud qui réussit à le renommer d'INPUT_DIR vers son dossier de
+réclamation : os.rename est atomique sur un même système de fichiers (NFS, SMB compris),
+les autres nœuds reçoivent FileNotFoundError et passent au suivant. Pas de file SQLite
+à baux : le verrouillage de SQLite n'est pas fiable sur un partage réseau.
+
+    QUEUE_DIR/
+      nodes/<nœud>                  battement de cœur (mtime), rafraîchi pendant le run
+      claims/<nœud>/<chemin>        PDF réclamés, en cours d'extraction
+      done/<chemin>                 PDF traités (sortis d'INPUT_DIR : plus jamais réclamés)
+      partials/<nœud>-<ns>-<n>.jsonl  lignes extraites d'un lot (InvoiceRecord.to_json)
+      partials/history.jsonl        lignes des fusions précédentes
+      merge.lock/                   fusion en cours (mkdir atomique)
+
+Un lot : claim(n) -> extraction -> publish(lignes, lot) : le partiel est publié (écrit puis
+renommé) AVANT que les PDF quittent claims/ ; un nœud arrêté en cours de lot laisse ses
+PDF dans claims/<nœud>/. Il les reprend au run suivant, ou un autre nœud les récupère
+(renommage vers son propre dossier) dès que son battement de cœur est plus vieux que
+le bail. Un PDF repris après publication apparaît dans deux partiels : la fusion garde
+la dernière ligne par fichier.
+
+Fusion : un nœud qui ne trouve plus rien à réclamer vérifie qu'aucun PDF n'est réclamé
+ailleurs ; le dernier à finir prend le verrou (merge()), relit historique + partiels,
+produit le rapport unique, puis commit() compacte le tout dans history.jsonl et supprime
+les partiels fusionnés. Une fusion interrompue (envoi en échec...) est refaite par le
+prochain nœud qui termine.
+
+Les âges (bail, verrou) sont mesurés avec l'horloge du partage (mtime d'un fichier que
+l'on vient de toucher), pas celle du nœud : pas de dépendance à la synchronisation NTP.
+"""
+from __future__ import annotations
+
+import errno
+import logging
+import os
+import random
+import re
+import shutil
+import socket
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from invoices import metrics
+from invoices.records import InvoiceRecord
+
+HISTORY = "history.jsonl"
+DEFAULT_LEASE_SECONDS = 600.0
+
+
+def default_node_id() -> str:
+    """Nom d'hôte (un dossier de réclamation par agent) ; QUEUE_NODE_ID si plusieurs exécuteurs par hôte."""
+    return socket.gethostname() or f"node-{os.getpid()}"
+
+def _safe_name(node: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", node).strip("._") or "node"
+
+def _rmtree_empty(directory: Path) -> None:
+    # Sous-dossiers vidés par les renommages (INPUT_DIR/<sous-dossier> réclamé), pas le dossier lui-même
+    for sub in sorted((p for p in directory.rglob("*") if p.is_dir()), key=lambda p: len(p.parts), reverse=True):
+        try:
+            sub.rmdir()
+        except OSError:
+            pass
+
+
+class WorkQueue:
+    def __init__(self, input_dir: str | Path, queue_dir: str | Path, node: Optional[str] = None,
+                 lease_seconds: float = DEFAULT_LEASE_SECONDS, pattern: str = "*.pdf"):
+        self.input_dir = Path(input_dir)
+        self.directory = Path(queue_dir)
+        self.node = _safe_name(node or default_node_id())
+        self.lease_seconds = lease_seconds
+        self.pattern = pattern
+        self.claims_dir = self.directory / "claims"
+        self.done_dir = self.directory / "done"
+        self.partials_dir = self.directory / "partials"
+        self.nodes_dir = self.directory / "nodes"
+        self.lock_dir = self.directory / "merge.lock"
+        self.own_dir = self.claims_dir / self.node
+        for d in (self.own_dir, self.done_dir, self.partials_dir, self.nodes_dir):
+            d.mkdir(parents=True, exist_ok=True)
+        if os.stat(self.input_dir).st_dev != os.stat(self.directory).st_dev:
+            # Renommage atomique impossible entre deux systèmes de fichiers (EXDEV)
+            raise OSError(errno.EXDEV, "INPUT_DIR et la file de travail doivent être sur le même système de fichiers",
+                          str(self.directory))
+        self._inflight: set = set()  # réclamés par ce run, pas encore publiés
+        self._seq = 0
+        self._stop = threading.Event()
+        self._heartbeat: Optional[threading.Thread] = None
+
+    # ---------------------------
+    # Battement de cœur
+    # ---------------------------
+
+    def _beat(self) -> float:
+        """Touche le fichier du nœud ; renvoie son mtime = "maintenant" selon le partage."""
+        path = self.nodes_dir / self.node
+        path.touch()
+        return path.stat().st_mtime
+
+    def start(self) -> "WorkQueue":
+        """Bat tant que le nœud travaille (thread) : ses PDF réclamés ne sont pas repris par d'autres."""
+        self._beat()
+        if self._heartbeat is None:
+            self._stop.clear()
+            interval = max(self.lease_seconds / 4, 0.05)
+
+            def run() -> None:
+                while not self._stop.wait(interval):
+                    try:
+                        self._beat()
+                    except OSError as e:
+                        logging.warning(f"File de travail: battement de cœur impossible ({e})")
+
+            self._heartbeat = threading.Thread(target=run, name="work-queue-heartbeat", daemon=True)
+            self._heartbeat.start()
+        return self
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+            self._heartbeat = None
+
+    def __enter__(self) -> "WorkQueue":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _stale_nodes(self, now: float) -> List[str]:
+        """Nœuds ayant des PDF réclamés mais plus de battement de cœur depuis le bail."""
+        stale = []
+        for d in self.claims_dir.iterdir():
+            if d.name == self.node or not d.is_dir():
+                continue
+            try:
+                beat = (self.nodes_dir / d.name).stat().st_mtime
+            except FileNotFoundError:
+                beat = 0.0
+            if now - beat > self.lease_seconds:
+                stale.append(d.name)
+        return stale
+
+    # ---------------------------
+    # Réclamation
+    # ---------------------------
+
+    def _take(self, src: Path, rel: Path) -> Optional[Path]:
+        dest = self.own_dir / rel
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.rename(src, dest)
+        except FileNotFoundError:
+            return None  # pris par un autre nœud entre le listage et le renommage
+        return dest
+
+    def pending(self) -> List[Path]:
+        """PDF encore dans INPUT_DIR (non réclamés)."""
+        return sorted(self.input_dir.rglob(self.pattern))
+
+    def claim(self, count: int) -> List[Path]:
+        """
+        Réclame jusqu'à `count` PDF, dans l'ordre : ceux laissés dans claims/<nœud>/ par un run
+        interrompu, puis INPUT_DIR, puis ceux des nœuds sans battement de cœur depuis le bail.
+        Renvoie leurs nouveaux chemins (dans claims/<nœud>/) ; liste vide quand il n'y a plus rien.
+        """
+        batch = [p for p in sorted(self.own_dir.rglob(self.pattern)) if p not in self._inflight][:count]
+        if batch:
+            metrics.inc("invoices_queue_claims_total", len(batch), source="resumed")
+        candidates: List[Path] = []
+        while len(batch) < count:
+            if not candidates:
+                # Listage à chaque lot (une liste gardée d'un lot à l'autre vieillit : autant de
+                # renommages perdus), en ordre aléatoire : des nœuds qui listent ensemble se gênent peu
+                candidates = self.pending()
+                random.shuffle(candidates)
+                if not candidates:
+                    break
+            src = candidates.pop()
+            dest = self._take(src, src.relative_to(self.input_dir))
+            if dest is None:
+                metrics.inc("invoices_queue_claim_conflicts_total")
+            else:
+                metrics.inc("invoices_queue_claims_total", source="input")
+                batch.append(dest)
+        if len(batch) < count:
+            now = self._beat()
+            for node in self._stale_nodes(now):
+                stale_dir = self.claims_dir / node
+                for src in sorted(stale_dir.rglob(self.pattern)):
+                    if len(batch) >= count:
+                        break
+                    dest = self._take(src, src.relative_to(stale_dir))
+                    if dest is not None:
+                        logging.warning(f"File de travail: {src.name} repris au nœud {node} (bail expiré)")
+                        metrics.inc("invoices_queue_claims_total", source="stale")
+                        batch.append(dest)
+        self._inflight.update(batch)
+        return batch
+
+    # ---------------------------
+    # Résultats partiels
+    # ---------------------------
+
+    def publish(self, records: Iterable[InvoiceRecord], batch: List[Path]) -> Path:
+        """
+        Publie les lignes extraites d'un lot (écrit puis renommé : un partiel visible est
+        complet), puis sort ses PDF de claims/ vers done/. Renvoie le chemin du partiel.
+        """
+        self._seq += 1
+        path = self.partials_dir / f"{self.node}-{time.time_ns()}-{self._seq}.jsonl"
+        tmp = path.with_name(path.name + ".tmp")
+        rows = 0
+        with tmp.open("w", encoding="utf-8") as f:
+            for rec in records:
+                f.write(rec.to_json() + "\n")
+                rows += 1
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        for pdf in batch:
+            dest = self.done_dir / pdf.relative_to(self.own_dir)
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                os.replace(pdf, dest)
+            except FileNotFoundError:
+                pass  # repris par un autre nœud pendant une pause plus longue que le bail
+            self._inflight.discard(pdf)
+        _rmtree_empty(self.own_dir)
+        metrics.inc("invoices_queue_partials_total")
+        logging.info(f"File de travail: lot de {len(batch)} PDF publié ({rows} ligne(s)) -> {path.name}")
+        return path
+
+    def partials(self) -> List[Path]:
+        """Partiels publiés non encore fusionnés, du plus ancien au plus récent."""
+        paths = [p for p in self.partials_dir.glob("*.jsonl") if p.name != HISTORY]
+        return sorted(paths, key=lambda p: (p.stat().st_mtime_ns, p.name))
+
+    def busy_nodes(self) -> Dict[str, int]:
+        """Nœuds ayant encore des PDF réclamés -> nombre de PDF."""
+        busy = {}
+        for d in self.claims_dir.iterdir():
+            if d.is_dir():
+                n = sum(1 for _ in d.rglob(self.pattern))
+                if n:
+                    busy[d.name] = n
+        return busy
+
+    # ---------------------------
+    # Fusion
+    # ---------------------------
+
+    def _lock(self) -> bool:
+        try:
+            os.mkdir(self.lock_dir)
+        except FileExistsError:
+            try:
+                age = self._beat() - self.lock_dir.stat().st_mtime
+            except FileNotFoundError:
+                return False
+            if age <= self.lease_seconds:
+                return False
+            # Fusionneur disparu : le verrou est retiré par renommage (un seul nœud y parvient)
+            stale = self.directory / f"merge.lock.{self.node}.{time.time_ns()}"
+            try:
+                os.rename(self.lock_dir, stale)
+            except OSError:
+                return False
+            shutil.rmtree(stale, ignore_errors=True)
+            logging.warning(f"File de travail: verrou de fusion périmé ({age:.0f}s) retiré")
+            try:
+                os.mkdir(self.lock_dir)
+            except FileExistsError:
+                return False
+        (self.lock_dir / self.node).touch()
+        return True
+
+    def merge(self) -> Optional["Merge"]:
+        """
+        Fusion, si ce nœud est le dernier à finir : plus de PDF dans INPUT_DIR ni réclamé
+        ailleurs, des partiels à fusionner, et le verrou obtenu. None sinon.
+        """
+        busy = self.busy_nodes()
+        if busy:
+            logging.info(
+                "File de travail: fusion laissée au dernier nœud (en cours: "
+                + ", ".join(f"{node} {n} PDF" for node, n in sorted(busy.items())) + ")"
+            )
+            return None
+        if self.pending():
+            logging.info("File de travail: des PDF sont arrivés dans INPUT_DIR, fusion laissée au prochain lot")
+            return None
+        if not self.partials():
+            logging.info("File de travail: aucun partiel à fusionner")
+            return None
+        if not self._lock():
+            logging.info(f"File de travail: fusion déjà en cours sur un autre nœud ({self.lock_dir})")
+            return None
+        partials = self.partials()  # relu sous verrou : une fusion concurrente a pu les consommer
+        if not partials:
+            self._unlock()
+            return None
+        return Merge(self, partials)
+
+    def _unlock(self) -> None:
+        shutil.rmtree(self.lock_dir, ignore_errors=True)
+
+
+class Merge:
+    """Fusion en cours (verrou détenu) : records() pour le rapport, commit() une fois envoyé, release()."""
+
+    def __init__(self, queue: WorkQueue, partials: List[Path]):
+        self.queue = queue
+        self.partials = partials
+        self.history = queue.partials_dir / HISTORY
+        self._merged: Dict[str, InvoiceRecord] = {}
+        self.rows = 0
+
+    def _read(self, path: Path) -> Iterator[InvoiceRecord]:
+        try:
+            with path.open(encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        yield InvoiceRecord.from_json(line)
+        except FileNotFoundError:
+            return
+
+    def records(self) -> Iterator[InvoiceRecord]:
+        """Historique puis partiels ; une ligne par fichier (la plus récente, à la place de la première)."""
+        merged: Dict[str, InvoiceRecord] = {}
+        for path in [self.history] + self.partials:
+            for rec in self._read(path):
+                merged[rec.fichier] = rec
+        self._merged = merged
+        self.rows = len(merged)
+        logging.info(
+            f"File de travail: fusion de {len(self.partials)} partiel(s) et de l'historique "
+            f"-> {len(merged)} ligne(s)"
+        )
+        metrics.inc("invoices_queue_merges_total")
+        yield from merged.values()
+
+    def commit(self) -> None:
+        """Rapport envoyé : historique compacté (écrit puis renommé), partiels fusionnés supprimés."""
+        tmp = self.history.with_name(HISTORY + ".tmp")
+        with tmp.open("w", encoding="utf-8") as f:
+            for rec in self._merged.values():
+                f.write(rec.to_json() + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.history)
+        for path in self.partials:
+            path.unlink(missing_ok=True)
+        logging.info(f"File de travail: historique compacté ({self.rows} ligne(s)), {len(self.partials)} partiel(s) supprimé(s)")
+
+    def release(self) -> None:
+        self.queue._unlock()
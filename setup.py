@@ -12,7 +12,8 @@ setup(
     ],
     entry_points={
         "console_scripts": [
-            "run-invoices=invoices.main:main"
+            "run-invoices=invoices.main:main",
+            "invoices=invoices.__main__:main"
         ]
     }
 )
@@ -0,0 +1,34 @@
+from invoices.archiver import JOURNAL, Archiver
+
+
+def test_commit_keeps_the_archives(tmp_path):
+    with Archiver(tmp_path) as archiver:
+        first = archiver.submit("facture.pdf", b"un")
+        second = archiver.submit("facture.pdf", b"deux")
+    archiver.commit()
+
+    assert (first.name, second.name) == ("facture.pdf", "facture_1.pdf")
+    assert second.read_bytes() == b"deux"
+    assert not (tmp_path / JOURNAL).exists()
+
+
+def test_failed_run_discards_its_archives(tmp_path):
+    (tmp_path / "ancienne.pdf").write_bytes(b"x")
+    with Archiver(tmp_path) as archiver:
+        archiver.submit("a.pdf", b"a")
+        archiver.submit("b.pdf", b"b")
+
+    assert archiver.discard() == 2
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["ancienne.pdf"]
+
+
+def test_archives_of_a_killed_run_are_recovered(tmp_path):
+    archiver = Archiver(tmp_path)
+    kept = archiver.submit("a.pdf", b"a")
+    archiver.commit()
+    archiver.submit("b.pdf", b"b")
+    archiver.close()
+    # Processus tué avant commit() : journal laissé sur disque
+
+    assert Archiver(tmp_path).recover() == 1
+    assert sorted(p.name for p in tmp_path.iterdir()) == [kept.name]
@@ -0,0 +1,122 @@
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from invoices import async_pipeline
+
+
+def _extract(pdf):
+    if pdf.endswith("boom.pdf"):
+        raise RuntimeError("extraction cassée")
+    return {"fichier": pdf}, None, None
+
+
+def _slow_extract(pdf):
+    # Fins d'extraction dans le désordre ; échecs et doublons ne donnent pas de ligne
+    time.sleep(random.uniform(0, 0.01))
+    if pdf.startswith("err"):
+        return None, "illisible", None
+    if pdf.startswith("dup"):
+        return None, None, None
+    return {"fichier": pdf}, None, None
+
+
+def _crashy_extract(pdf):
+    # "crash" tue le worker comme un crash natif : le pool entier est cassé
+    if "crash" in pdf:
+        os._exit(1)
+    time.sleep(0.01)
+    return {"fichier": pdf}, None, None
+
+
+class _Pool:
+    def __init__(self, workers):
+        self.workers = workers
+        self.executor = ProcessPoolExecutor(workers)
+        self.rebuilds = 0
+
+    def rebuild(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.executor = ProcessPoolExecutor(self.workers)
+        self.rebuilds += 1
+        return self.executor
+
+
+def _reporter(committed):
+    def report(rows):
+        seen = [row["fichier"] for row in rows]
+        # N'est atteint que si le flux de lignes s'est terminé normalement
+        committed.append(seen)
+        return "rapport.xlsx"
+    return report
+
+
+def test_report_gets_every_row():
+    committed = []
+    pdfs = [f"{i}.pdf" for i in range(20)]
+
+    result, stats = async_pipeline.run_pipeline(pdfs, _extract, _reporter(committed), queue_size=2)
+
+    assert result == "rapport.xlsx"
+    assert committed[0] == pdfs
+    assert stats["extracted"] == 20
+
+
+@pytest.mark.parametrize("queue_size", [1, 16])
+def test_rows_follow_input_order(queue_size):
+    committed = []
+    pdfs = [f"{kind}{i}.pdf" for i, kind in enumerate(random.Random(0).choices(["ok", "ok", "err", "dup"], k=60))]
+
+    _, stats = async_pipeline.run_pipeline(
+        pdfs, _slow_extract, _reporter(committed), parse_concurrency=6, queue_size=queue_size
+    )
+
+    assert committed == [[p for p in pdfs if p.startswith("ok")]]
+    assert stats["extracted"] + stats["failed"] + stats["duplicates"] == len(pdfs)
+
+
+def test_worker_crash_only_fails_its_pdf():
+    committed = []
+    pdfs = [f"{i}.pdf" for i in range(10)] + ["crash.pdf"] + [f"{i}.pdf" for i in range(10, 21)]
+    pool = _Pool(3)
+    try:
+        _, stats = async_pipeline.run_pipeline(
+            pdfs, _crashy_extract, _reporter(committed),
+            executor=pool.executor, rebuild=pool.rebuild, parse_concurrency=6,
+        )
+    finally:
+        pool.executor.shutdown()
+
+    assert committed == [[p for p in pdfs if p != "crash.pdf"]]
+    assert (stats["extracted"], stats["failed"]) == (21, 1)
+    assert pool.rebuilds >= 1
+
+
+def test_broken_pool_without_rebuild_aborts_report():
+    committed = []
+    executor = ProcessPoolExecutor(2)
+    try:
+        with pytest.raises(BrokenProcessPool):
+            async_pipeline.run_pipeline(
+                ["a.pdf", "crash.pdf", "b.pdf"], _crashy_extract, _reporter(committed),
+                executor=executor, parse_concurrency=2,
+            )
+    finally:
+        executor.shutdown()
+
+    assert committed == []
+
+
+@pytest.mark.parametrize("queue_size", [1, 16])
+def test_upstream_failure_aborts_report_without_commit(queue_size):
+    committed = []
+    pdfs = [f"{i}.pdf" for i in range(10)] + ["boom.pdf"] + [f"{i}.pdf" for i in range(10, 20)]
+
+    with pytest.raises(RuntimeError, match="extraction cassée"):
+        async_pipeline.run_pipeline(pdfs, _extract, _reporter(committed), queue_size=queue_size)
+
+    assert committed == []
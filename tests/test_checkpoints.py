@@ -0,0 +1,40 @@
+from invoices import checkpoints
+
+
+def _run(path, stage_outputs, success):
+    stages = checkpoints.StageCheckpoints(path)
+    stages.begin_run()
+    done = stages.completed("report", "in") is not None
+    if not done:
+        stages.complete("report", "in", stage_outputs)
+    stages.end_run(success)
+    return done
+
+
+def test_steps_are_only_resumed_after_a_failed_run(tmp_path):
+    path = tmp_path / "checkpoints.json"
+    out = tmp_path / "report.xlsx"
+    out.write_bytes(b"x")
+
+    assert _run(path, {"xlsx": out}, success=False) is False
+    # Run précédent en échec : l'étape faite est reprise
+    assert _run(path, {"xlsx": out}, success=True) is True
+    # Run précédent terminé : entrées inchangées, l'étape est refaite quand même
+    assert _run(path, {"xlsx": out}, success=True) is False
+
+
+def test_interrupted_run_is_resumed(tmp_path):
+    path = tmp_path / "checkpoints.json"
+    out = tmp_path / "report.xlsx"
+    out.write_bytes(b"x")
+    stages = checkpoints.StageCheckpoints(path)
+    stages.begin_run()
+    stages.complete("report", "in", {"xlsx": out})
+    # Processus tué avant end_run()
+
+    resumed = checkpoints.StageCheckpoints(path)
+    assert resumed.resuming
+    assert resumed.completed("report", "in") is not None
+    assert resumed.completed("report", "autre") is None
+    out.write_bytes(b"autre contenu")
+    assert resumed.completed("report", "in") is None
@@ -0,0 +1,107 @@
+import csv
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+from openpyxl import load_workbook
+
+import invoices.main
+from invoices import mail_sender
+from invoices.__main__ import main
+from invoices.pdf_parser import extract_invoice_record
+
+ROOT = Path(__file__).resolve().parent.parent
+SAMPLES = sorted((ROOT / "traitement").glob("*.pdf"))
+
+# Modules lourds qu'une commande ne doit charger que si elle en a besoin
+_HEAVY = ("PyPDF2", "openpyxl", "smtplib", "imaplib", "asyncio")
+
+
+def _rows(path):
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        return list(csv.DictReader(f))
+
+
+def _loaded(*argv):
+    """Modules lourds importés par python -m invoices <argv> avant l'exécution de la commande."""
+    code = (
+        "import sys\n"
+        "from invoices import __main__ as cli\n"
+        f"cli._parser().parse_args({list(argv)!r})\n"
+        f"print(sorted(m for m in {_HEAVY!r} if m in sys.modules))\n"
+    )
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return out.stdout.strip()
+
+
+@pytest.fixture
+def env(tmp_path, monkeypatch):
+    path = tmp_path / "env.json"
+    path.write_text(json.dumps({"OUTPUT_DIR": str(tmp_path / "output")}), encoding="utf-8")
+    monkeypatch.setenv("INVOICES_ENV_PATH", str(path))
+    return tmp_path
+
+
+def test_extract_folder_to_csv(tmp_path):
+    if not SAMPLES:
+        pytest.skip("aucun PDF d'exemple")
+    out = tmp_path / "extrait.csv"
+
+    assert main(["extract", str(SAMPLES[0].parent), "-o", str(out)]) == 0
+    assert _rows(out) == [extract_invoice_record(p).csv_row() for p in SAMPLES]
+
+
+def test_extract_to_stdout_reports_failures(tmp_path, capsys):
+    broken = tmp_path / "casse.pdf"
+    broken.write_bytes(b"pas un PDF")
+
+    assert main(["extract", str(broken), str(tmp_path / "absent.pdf")]) == 1
+    # PDF illisible : ligne INCONNU (comme le pipeline) ; fichier absent : échec, sans ligne
+    assert capsys.readouterr().out.splitlines() == [
+        "fichier,date_facture,numero_facture,total_ttc,periode",
+        "casse.pdf,INCONNU,INCONNU,INCONNU,",
+    ]
+
+
+def test_report_from_csv(env):
+    csv_path = env / "invoices_extract.csv"
+    with csv_path.open("w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.DictWriter(f, fieldnames=["fichier", "date_facture", "numero_facture", "total_ttc", "periode"])
+        writer.writeheader()
+        writer.writerow({"fichier": "Alan a.pdf", "date_facture": "01/03/2025", "numero_facture": "N-1",
+                         "total_ttc": "12,00€", "periode": "Mars 2025"})
+
+    assert main(["report", str(csv_path)]) == 0
+    ws = load_workbook(env / "output" / "invoices_extract.xlsx").worksheets[0]
+    assert "Alan a.pdf" in [row[0] for row in ws.iter_rows(values_only=True)]
+
+
+def test_send_and_run_delegate(monkeypatch):
+    calls = []
+    monkeypatch.setattr(mail_sender, "send_report", lambda xlsx=None: calls.append(("send", xlsx)))
+    monkeypatch.setattr(invoices.main, "main", lambda argv=None: calls.append(("run", argv)))
+
+    assert main(["send", "output/invoices_extract.xlsx"]) == 0
+    assert main(["send"]) == 0
+    assert main(["run", "-w", "auto", "--pipeline", "async"]) == 0
+    assert main(["run"]) == 0
+    assert calls == [
+        ("send", "output/invoices_extract.xlsx"),
+        ("send", None),
+        ("run", ["--workers", "auto", "--pipeline", "async"]),
+        ("run", []),
+    ]
+
+
+def test_unknown_or_missing_command_exits():
+    with pytest.raises(SystemExit):
+        main([])
+    with pytest.raises(SystemExit):
+        main(["run", "--pipeline", "parallel"])
+
+
+def test_command_line_parsing_imports_no_heavy_module():
+    assert _loaded("extract", "x.pdf") == "[]"
+    assert _loaded("run") == "[]"
@@ -0,0 +1,111 @@
+import json
+import os
+import sqlite3
+from datetime import date
+from pathlib import Path
+
+import pytest
+
+from invoices.column_store import KEYS, MANIFEST, ColumnStore, StoreError
+from invoices.records import InvoiceRecord
+
+
+def _rec(fichier, day, total):
+    return InvoiceRecord.from_fields(fichier, f"N-{fichier}", day, total, "Mars 2025")
+
+
+RECORDS = [
+    _rec("Alan a.pdf", "05/03/2025", "10,00€"),
+    _rec("Alan b.pdf", "06/03/2025", "2,50€"),
+    _rec("Qonto c.pdf", "01/04/2025", None),
+]
+
+
+def test_append_dedups_across_runs_and_within_a_run(tmp_path):
+    assert ColumnStore(tmp_path).append(RECORDS + RECORDS[:1]) == 3
+
+    store = ColumnStore(tmp_path)
+    assert store.append([RECORDS[1], _rec("Alan d.pdf", "07/03/2025", "1,00€")]) == 1
+    assert len(store) == 4
+    assert store.group_sum("mois")["2025-03"] == (3, 1350, 0)
+    assert store.group_sum("fournisseur")["Qonto"] == (1, 0, 1)
+    assert store.rollups().to_json() == ColumnStore(tmp_path).rollups().to_json()
+
+
+def test_key_index_is_rebuilt_from_the_store(tmp_path):
+    ColumnStore(tmp_path).append(RECORDS)
+    (tmp_path / KEYS).unlink()
+
+    assert ColumnStore(tmp_path).append(RECORDS) == 0
+    assert ColumnStore(tmp_path).append([_rec("e.pdf", "01/05/2025", "3€")]) == 1
+
+
+def test_abandoned_append_commits_nothing(tmp_path):
+    ColumnStore(tmp_path).append(RECORDS[:1])
+    store = ColumnStore(tmp_path)
+    with store.appender() as appender:
+        assert appender.add(RECORDS[1])
+    assert appender.closed
+
+    store = ColumnStore(tmp_path)
+    assert len(store) == 1
+    assert store.append(RECORDS) == 2
+    assert ColumnStore(tmp_path).fichiers() == {r.fichier for r in RECORDS}
+
+
+def test_short_column_file_raises_store_error(tmp_path):
+    ColumnStore(tmp_path).append(RECORDS)
+    with open(tmp_path / "total_cents.col", "r+b") as f:
+        f.truncate(8)
+
+    with pytest.raises(StoreError):
+        ColumnStore(tmp_path).group_sum("mois")
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/maps"), reason="/proc/self/maps requis")
+def test_column_maps_are_closed(tmp_path):
+    store = ColumnStore(tmp_path)
+    store.append(RECORDS)
+    store.group_sum("annee", since=date(2025, 1, 1))
+    store.fichiers()
+
+    assert str(tmp_path) not in Path("/proc/self/maps").read_text()
+
+
+def test_replaced_pdf_with_the_same_name_is_added(tmp_path):
+    first = [r._replace(digest=f"d{i}") for i, r in enumerate(RECORDS)]
+    ColumnStore(tmp_path).append(first)
+
+    replaced = first[0]._replace(total_ttc="20,00€", total_cents=2000, digest="autre")
+    assert ColumnStore(tmp_path).append(first + [replaced]) == 1
+    assert ColumnStore(tmp_path).strings("digest") == ["d0", "d1", "d2", "autre"]
+    assert ColumnStore(tmp_path).group_sum("mois")["2025-03"] == (3, 3250, 0)
+
+
+def test_format_1_store_is_upgraded_on_append(tmp_path):
+    ColumnStore(tmp_path).append(RECORDS)
+    # Stockage et index d'avant la colonne digest
+    for suffix in (".off", ".dat"):
+        (tmp_path / f"digest{suffix}").unlink()
+    manifest = json.loads((tmp_path / MANIFEST).read_text(encoding="utf-8"))
+    manifest["version"] = 1
+    del manifest["string_bytes"]["digest"]
+    (tmp_path / MANIFEST).write_text(json.dumps(manifest), encoding="utf-8")
+    (tmp_path / KEYS).unlink()
+    with sqlite3.connect(tmp_path / KEYS) as db:
+        db.executescript(
+            "CREATE TABLE fichiers (fichier TEXT PRIMARY KEY);"
+            "CREATE TABLE meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);"
+            "INSERT INTO meta VALUES ('rows', 3);"
+        )
+        db.executemany("INSERT INTO fichiers VALUES (?)", [(r.fichier,) for r in RECORDS])
+    db.close()
+
+    assert ColumnStore(tmp_path).strings("digest") == ["", "", ""]
+    extracted = [r._replace(digest=f"d{i}") for i, r in enumerate(RECORDS)]
+    assert ColumnStore(tmp_path).append(extracted + [_rec("e.pdf", "01/05/2025", "3€")._replace(digest="e")]) == 1
+
+    store = ColumnStore(tmp_path)
+    assert store.manifest["version"] == 2
+    assert store.strings("digest") == ["", "", "", "e"]
+    assert store.append(extracted) == 0
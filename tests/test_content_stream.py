@@ -0,0 +1,51 @@
+import io
+from pathlib import Path
+
+import pytest
+from PyPDF2 import PdfReader
+
+from benchmarks.corpus import iter_corpus
+from invoices import content_stream, pdf_parser
+
+SAMPLES = sorted((Path(__file__).resolve().parent.parent / "traitement").glob("*.pdf"))
+
+
+def _pdfs():
+    for path in SAMPLES:
+        yield path.name, path.read_bytes()
+    for invoice, data in iter_corpus(30, seed=3, multipage_ratio=0.3, malformed_ratio=0):
+        yield invoice.fichier, data
+
+
+@pytest.fixture
+def text_backend():
+    yield lambda backend: pdf_parser.configure_extraction(backend=backend)
+    pdf_parser.configure_extraction()
+
+
+def test_raw_decoder_matches_pypdf2():
+    if not content_stream.HAVE_CHAR_MAP:
+        pytest.skip("PyPDF2 sans _cmap.build_char_map")
+    decoded = 0
+    for name, data in _pdfs():
+        for n, page in enumerate(PdfReader(io.BytesIO(data)).pages, start=1):
+            try:
+                text = content_stream.page_text(page)
+            except content_stream.Unsupported:
+                continue  # repli PyPDF2 pour la page
+            assert text == page.extract_text(), f"{name} page {n}"
+            decoded += 1
+    # Le décodeur doit couvrir les factures réelles et générées, pas seulement se replier
+    assert decoded >= len(SAMPLES) + 30
+
+
+def test_raw_and_pypdf2_backends_give_the_same_records_and_cache_version(text_backend):
+    records = {}
+    for backend in ("pypdf2", "raw"):
+        text_backend(backend)
+        records[backend] = [pdf_parser.extract_invoice_record(data, cache=None, name=name) for name, data in _pdfs()]
+        version = pdf_parser._cache_version()
+
+    assert records["raw"] == records["pypdf2"]
+    text_backend("pypdf2")
+    assert pdf_parser._cache_version() == version
@@ -0,0 +1,54 @@
+from invoices.dedup_index import DedupIndex
+from invoices.records import InvoiceRecord
+
+
+def _pdf(path, content):
+    path.write_bytes(b"%PDF-1.4\n" + content)
+    return path
+
+
+def _rec(path):
+    return InvoiceRecord.from_fields(path.name, "F-2025-001", "05/03/2025", "96,10€")
+
+
+def _extract(index, path):
+    digest = index.digest(path)
+    assert index.claim(path, digest) is None
+    return index.near_duplicate(_rec(path), digest)
+
+
+def test_near_duplicate_flags_other_content_with_same_fields(tmp_path):
+    index = DedupIndex(tmp_path / "dedup.sqlite")
+    first = _pdf(tmp_path / "facture.pdf", b"v1")
+    second = _pdf(tmp_path / "facture-reemise.pdf", b"v2")
+
+    assert _extract(index, first) is None
+    assert _extract(index, second) == "facture.pdf"
+    # Relecture du même document : jamais son propre doublon
+    assert _extract(index, first) is None
+
+
+def test_missing_owner_hands_the_invoice_key_over(tmp_path):
+    index = DedupIndex(tmp_path / "dedup.sqlite")
+    bad = _pdf(tmp_path / "facture.pdf", b"export illisible")
+    assert _extract(index, bad) is None
+
+    bad.unlink()
+    fixed = _pdf(tmp_path / "facture-corrigee.pdf", b"export corrige")
+
+    assert _extract(index, fixed) is None
+    assert _extract(index, fixed) is None
+    # La clé appartient désormais au document corrigé
+    other = _pdf(tmp_path / "copie-modifiee.pdf", b"autre")
+    assert _extract(index, other) == "facture-corrigee.pdf"
+
+
+def test_exact_copy_is_claimed_by_the_original(tmp_path):
+    index = DedupIndex(tmp_path / "dedup.sqlite")
+    original = _pdf(tmp_path / "a.pdf", b"same")
+    copy = _pdf(tmp_path / "b.pdf", b"same")
+
+    assert index.claim(original) is None
+    assert index.claim(copy) == str(original.resolve())
+    original.unlink()
+    assert index.claim(copy) is None
@@ -0,0 +1,101 @@
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from benchmarks.corpus import pdf_bytes
+from invoices import extract_cache, pdf_parser
+from invoices.extract_cache import ExtractionCache
+
+
+def _entry(i):
+    return {"numero_facture": f"N-{i}", "total_ttc": "12,00€"}
+
+
+def _stored_counters(path):
+    with sqlite3.connect(path) as db:
+        counters = dict(db.execute("SELECT name, value FROM counters"))
+    db.close()
+    return counters
+
+
+def _lookups(digests):
+    cache = extract_cache.get_default_cache()
+    return [cache.get(d, "v1") is not None for d in digests]
+
+
+@pytest.fixture
+def extraction():
+    yield pdf_parser.configure_extraction
+    pdf_parser.configure_extraction()
+
+
+def test_eviction_drops_the_least_recently_used_entries(tmp_path):
+    cache = ExtractionCache(tmp_path / "cache.sqlite", max_bytes=10_000)
+    for i in range(3):
+        cache.put(f"d{i}", "v1", "x" * 3000, _entry(i))
+    # Lecture en attente (pas encore écrite) : prise en compte par l'éviction de put()
+    assert cache.get("d0", "v1") is not None
+
+    cache.put("d3", "v1", "x" * 3000, _entry(3))
+
+    assert cache.get("d1", "v1") is None
+    assert [cache.get(f"d{i}", "v1") is not None for i in (0, 2, 3)] == [True, True, True]
+    stats = cache.stats()
+    assert (stats["entries"], stats["evictions"]) == (3, 1)
+    assert stats["bytes"] <= 10_000
+
+
+def test_entries_are_versioned(tmp_path):
+    cache = ExtractionCache(tmp_path / "cache.sqlite")
+    cache.put("d", "v1", "texte", _entry(1))
+
+    assert cache.get("d", "v1") == extract_cache.CacheEntry("texte", _entry(1))
+    assert cache.get("d", "v2") is None
+
+
+def test_parser_settings_change_the_cache_version(tmp_path, extraction):
+    pdf = tmp_path / "facture.pdf"
+    pdf.write_bytes(pdf_bytes([[(50, 800, 10, "Facture N° 2025-1"), (50, 780, 10, "Total TTC 12,00€")]]))
+    cache = ExtractionCache(tmp_path / "cache.sqlite")
+
+    versions = set()
+    for settings in ({}, {"mode": "lazy"}, {"templates": False}, {"backend": "pypdf2"}):
+        extraction(**settings)
+        versions.add(pdf_parser._cache_version())
+        pdf_parser.extract_invoice_record(pdf, cache=cache)
+        pdf_parser.extract_invoice_record(pdf, cache=cache)
+
+    # pypdf2 et raw donnent le même texte : même version, même entrée
+    assert len(versions) == 3
+    stats = cache.stats()
+    assert (stats["entries"], stats["misses"], stats["hits"]) == (3, 3, 5)
+
+
+def test_lookups_are_counted_in_memory_and_flushed_in_batches(tmp_path):
+    path = tmp_path / "cache.sqlite"
+    cache = ExtractionCache(path)
+    cache.put("d", "v1", "texte", _entry(1))
+
+    for _ in range(extract_cache.FLUSH_EVERY - 1):
+        cache.get("d", "v1")
+    assert _stored_counters(path)["hits"] == 0
+
+    cache.get("absent", "v1")
+    assert _stored_counters(path)["hits"] == extract_cache.FLUSH_EVERY - 1
+    cache.get("d", "v1")
+    assert cache.stats()["hits"] == extract_cache.FLUSH_EVERY
+    assert _stored_counters(path) == {"hits": extract_cache.FLUSH_EVERY, "misses": 1, "evictions": 0}
+
+
+def test_pool_worker_lookups_are_flushed_at_exit(tmp_path):
+    path = tmp_path / "cache.sqlite"
+    cache = ExtractionCache(path)
+    cache.put("d", "v1", "texte", _entry(1))
+    cache.close()  # pas de connexion SQLite ouverte au moment du fork
+
+    with ProcessPoolExecutor(2, initializer=extract_cache.configure_cache, initargs=(str(path),)) as pool:
+        found = list(pool.map(_lookups, [["d", "absent"]] * 4))
+
+    assert found == [[True, False]] * 4
+    assert _stored_counters(path) == {"hits": 4, "misses": 4, "evictions": 0}
@@ -0,0 +1,67 @@
+import io
+import re
+
+import pytest
+from PyPDF2 import PdfReader
+
+from benchmarks.corpus import iter_corpus
+from invoices.field_scanner import clean_text
+from invoices.pdf_parser import _SCANNER, _find_total_ttc, find_date, find_invoice_number
+
+_TEXTS = [
+    "Facture N° 2024-001\nDate : 12/03/2024\nMontant TTC : 1\xa0234,56€\n",
+    "INVOICE\nInvoice number: INV-77\n2024-05-06\nGrand total $ 99.00\n",
+    "Facture 2024-01-01\nN° ABC-42\nNet à payer 12,00 €\n",
+    ("Conditions générales " * 400) + "\nTotal TTC* pour Mars 2024 45,00 €\nle 01/03/2024\n",
+    "Total TTC* 12,50€\r\nTotal 99,00 €\r\nfacture:F/2025/7",
+    "Récapitulatif mensuel\t\tno : 88-B  total à payer\t$1,234.56",
+    "İnv. no. X-1 le 31-12-2024 amount due 3.00",
+    "Aucun champ ici, seulement du texte.",
+    "",
+]
+
+
+def _legacy_clean(txt):
+    # Nettoyage d'origine de pdf_parser._clean_text (référence)
+    if not txt:
+        return ""
+    txt = txt.replace("\xa0", " ").replace("\u202f", " ").replace("€", " €")
+    txt = re.sub(r"[ \t]+", " ", txt)
+    return txt.replace("\r", "\n")
+
+
+def _cascade(raw):
+    txt = _legacy_clean(raw)
+    return txt, find_invoice_number(txt), find_date(txt), _find_total_ttc(txt)
+
+
+def _scan(raw):
+    r = _SCANNER.scan(raw)
+    return r.text, r.invoice_number, r.date, (r.total_ttc, r.source_montant, r.periode)
+
+
+def _corpus_texts(docs):
+    for invoice, data in iter_corpus(docs, seed=3, multipage_ratio=0.3, malformed_ratio=0):
+        reader = PdfReader(io.BytesIO(data))
+        yield invoice, "\n".join(page.extract_text() or "" for page in reader.pages)
+
+
+@pytest.mark.parametrize("raw", _TEXTS)
+def test_clean_text_matches_the_original_cleanup(raw):
+    assert clean_text(raw) == _legacy_clean(raw)
+
+
+@pytest.mark.parametrize("raw", _TEXTS)
+def test_scanner_matches_the_regex_cascade(raw):
+    assert _scan(raw) == _cascade(raw)
+
+
+def test_scanner_on_generated_invoices():
+    for invoice, raw in _corpus_texts(40):
+        r = _SCANNER.scan(raw)
+
+        assert _scan(raw) == _cascade(raw)
+        assert (r.invoice_number, r.date, r.total_ttc, r.periode) == (
+            invoice.numero_facture, invoice.date_facture, invoice.total_ttc, invoice.periode
+        ), invoice.fichier
+        assert r.source_montant == "TTC* mois"
@@ -0,0 +1,114 @@
+import os
+
+from invoices.file_manifest import Changes, FileManifest
+
+# Septembre 2020 : bien au-delà de la marge des mtime récents
+_OLD_NS = 1_600_000_000 * 10**9
+_NAMES = ("a.pdf", "b.pdf", "notes.txt", "2024/c.pdf", "2024/03/d.pdf", "2025/e.pdf")
+
+
+def _tree(root):
+    for name in _NAMES:
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"%PDF " + name.encode())
+    return root
+
+
+def _age(root):
+    for dirpath, _, _ in os.walk(root):
+        os.utime(dirpath, ns=(_OLD_NS, _OLD_NS))
+
+
+def _rglob(root):
+    return sorted(root.rglob("*.pdf"))
+
+
+def test_first_refresh_lists_every_pdf(tmp_path):
+    root = _tree(tmp_path / "input")
+    manifest = FileManifest(root)
+
+    changes = manifest.refresh()
+
+    assert changes == Changes(["2024/03/d.pdf", "2024/c.pdf", "2025/e.pdf", "a.pdf", "b.pdf"], [], [])
+    assert manifest.paths() == _rglob(root)
+    assert list(manifest.changed_paths()) == _rglob(root)
+    assert manifest.dirs_scanned == 4
+    assert manifest.listing() == f"{root} -> 2024/, 2025/, a.pdf, b.pdf"
+
+
+def test_unchanged_folders_are_not_scanned_again(tmp_path):
+    root = _tree(tmp_path / "input")
+    state = tmp_path / "manifest.json"
+    _age(root)
+    FileManifest(root, state).refresh()
+    saved = state.stat().st_mtime_ns
+
+    manifest = FileManifest(root, state)
+    assert not manifest.refresh()
+    assert manifest.dirs_scanned == 0
+    assert manifest.paths() == _rglob(root)
+    assert list(manifest.changed_paths()) == []
+    assert state.stat().st_mtime_ns == saved
+
+
+def test_changes_are_found_in_the_modified_folders_only(tmp_path):
+    root = _tree(tmp_path / "input")
+    state = tmp_path / "manifest.json"
+    _age(root)
+    FileManifest(root, state).refresh()
+
+    (root / "2024" / "f.pdf").write_bytes(b"%PDF f")
+    (root / "2025" / "e.pdf").unlink()
+    os.replace(root / "b.pdf", root / "2024" / "03" / "b.pdf")
+    manifest = FileManifest(root, state)
+    changes = manifest.refresh()
+
+    assert changes == Changes(["2024/03/b.pdf", "2024/f.pdf"], [], ["2025/e.pdf", "b.pdf"])
+    assert manifest.dirs_scanned == 4
+    assert manifest.paths() == _rglob(root)
+
+
+def test_rewrite_in_place_needs_a_full_scan(tmp_path):
+    root = _tree(tmp_path / "input")
+    state = tmp_path / "manifest.json"
+    _age(root)
+    FileManifest(root, state).refresh()
+    (root / "2024" / "c.pdf").write_bytes(b"%PDF contenu plus long")
+    _age(root)
+
+    assert not FileManifest(root, state).refresh()
+    manifest = FileManifest(root, state, full_scan=True)
+    assert manifest.refresh() == Changes([], ["2024/c.pdf"], [])
+    assert list(manifest.changed_paths()) == [root / "2024" / "c.pdf"]
+
+
+def test_recently_modified_folder_is_scanned_again(tmp_path):
+    root = _tree(tmp_path / "input")
+    state = tmp_path / "manifest.json"
+    _age(root)
+    (root / "2025" / "g.pdf").write_bytes(b"%PDF g")  # 2025/ modifié à l'instant
+    FileManifest(root, state).refresh()
+
+    manifest = FileManifest(root, state)
+    assert not manifest.refresh()
+    assert manifest.dirs_scanned == 1
+
+
+def test_state_of_another_folder_or_pattern_is_ignored(tmp_path):
+    root = _tree(tmp_path / "input")
+    state = tmp_path / "manifest.json"
+    _age(root)
+    FileManifest(root, state).refresh()
+
+    other = _tree(tmp_path / "autre")
+    assert len(FileManifest(other, state).refresh().added) == 5
+    assert FileManifest(root, state, pattern="*.txt").refresh() == Changes(["notes.txt"], [], [])
+
+
+def test_missing_folder(tmp_path):
+    manifest = FileManifest(tmp_path / "absent", tmp_path / "manifest.json")
+
+    assert not manifest.refresh()
+    assert manifest.paths() == []
+    assert manifest.listing() == f"{tmp_path / 'absent'} (n'existe pas)"
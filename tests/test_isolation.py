@@ -0,0 +1,110 @@
+import json
+import os
+import time
+
+import pytest
+
+from invoices import isolation
+from invoices.isolation import Breach, Budget, BudgetExceeded, IsolatedExecutor, Quarantine
+
+
+def _square(x):
+    return x * x
+
+
+def _sleep(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+def _allocate(mb):
+    data = bytearray(mb * 2**20)
+    for i in range(0, len(data), 4096):
+        data[i] = 1
+    time.sleep(30)
+    return len(data)
+
+
+def _crash():
+    os._exit(3)
+
+
+def _breached(breach, args):
+    return breach.reason, args
+
+
+def test_time_budget_kills_the_worker_and_the_next_task_runs():
+    with IsolatedExecutor(1, Budget(seconds=0.5), on_breach=_breached) as pool:
+        slow = pool.submit(_sleep, 30)
+        after = pool.submit(_square, 3)
+
+        assert slow.result(timeout=10) == ("timeout", (30,))
+        assert after.result(timeout=10) == 9
+
+
+def test_breach_without_handler_raises_budget_exceeded():
+    with IsolatedExecutor(1, Budget(seconds=0.5)) as pool:
+        with pytest.raises(BudgetExceeded) as exc:
+            pool.submit(_sleep, 30).result(timeout=10)
+        assert pool.submit(_crash).exception(timeout=10).breach.reason == "crash"
+
+    assert exc.value.breach.reason == "timeout"
+    assert exc.value.breach.seconds >= 0.5
+
+
+def test_rss_budget_kills_the_worker():
+    baseline = isolation.rss_bytes(os.getpid())
+    if baseline is None:
+        pytest.skip("RSS non mesurable ici")
+    limit = baseline + 64 * 2**20
+    breaches = []
+    with IsolatedExecutor(1, Budget(seconds=20, rss_bytes=limit), on_breach=lambda b, a: breaches.append(b)) as pool:
+        pool.submit(_allocate, 256).result(timeout=20)
+        assert pool.submit(_square, 4).result(timeout=10) == 16
+
+    breach, = breaches
+    assert breach.reason == "rss"
+    assert breach.peak_rss_bytes > limit
+    assert breach.seconds < 20
+
+
+def test_quarantine_is_written_and_matches_the_content(tmp_path):
+    pdf = tmp_path / "input" / "lent.pdf"
+    pdf.parent.mkdir()
+    pdf.write_bytes(b"%PDF lent")
+    other = tmp_path / "input" / "autre.pdf"
+    other.write_bytes(b"%PDF autr")  # même taille, autre contenu
+    path = tmp_path / "quarantine.json"
+
+    Quarantine(path).add(str(pdf), Breach("timeout", 120.5, 300 * 2**20))
+    entry, = json.loads(path.read_text(encoding="utf-8")).values()
+    assert entry["fichier"] == str(pdf)
+    assert (entry["reason"], entry["seconds"], entry["peak_rss_mb"], entry["count"]) == ("timeout", 120.5, 300.0, 1)
+
+    quarantine = Quarantine(path)
+    assert quarantine.exclude([pdf, other]) == [other]
+    # Réclamé par un nœud de la file de travail : même contenu, autre chemin
+    claimed = tmp_path / "queue" / "claims" / "node-a" / "lent.pdf"
+    claimed.parent.mkdir(parents=True)
+    os.replace(pdf, claimed)
+    assert quarantine.contains(str(claimed))
+    # Contenu modifié : retenté
+    claimed.write_bytes(b"%PDF corrige")
+    assert not quarantine.contains(str(claimed))
+
+
+def test_path_keyed_quarantine_is_upgraded(tmp_path):
+    pdf = tmp_path / "lent.pdf"
+    pdf.write_bytes(b"%PDF lent")
+    st = pdf.stat()
+    gone = str(tmp_path / "supprime.pdf")
+    path = tmp_path / "quarantine.json"
+    path.write_text(json.dumps({
+        str(pdf): {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "reason": "rss", "count": 2},
+        gone: {"size": 1, "mtime_ns": 1, "reason": "timeout", "count": 1},
+    }), encoding="utf-8")
+
+    quarantine = Quarantine(path)
+
+    assert list(quarantine.entries.values()) == [{"fichier": str(pdf), "size": st.st_size, "reason": "rss", "count": 2}]
+    assert quarantine.contains(str(pdf))
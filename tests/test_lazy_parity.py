@@ -0,0 +1,48 @@
+import pytest
+
+from benchmarks.corpus import pdf_bytes
+from invoices import pdf_parser
+
+
+def _page(*lines):
+    return [(50, 800 - 20 * i, 10, text) for i, text in enumerate(lines)]
+
+
+# Champs de repli en page 1 ("N°", montant générique), motifs prioritaires plus loin
+_PAGES = [
+    _page("Alan Insurance", "Contrat N° 4471-B", "Le 05/03/2025", "Total cotisations 12,00€"),
+    _page("Détail des bénéficiaires", "Vous : Camille Martin 84,10€"),
+    _page("Facture N°2025-03-123456789-IH-1", "Total TTC* pour Mars 2025 96,10€"),
+]
+
+
+@pytest.fixture
+def extraction_mode():
+    yield lambda mode: pdf_parser.configure_extraction(mode)
+    pdf_parser.configure_extraction("full")
+
+
+def test_lazy_matches_full_when_priority_fields_come_later(tmp_path, extraction_mode):
+    pdf = tmp_path / "facture.pdf"
+    pdf.write_bytes(pdf_bytes(_PAGES))
+
+    extraction_mode("full")
+    full = pdf_parser.extract_invoice_data(pdf, cache=None)
+    extraction_mode("lazy")
+    lazy = pdf_parser.extract_invoice_data(pdf, cache=None)
+
+    assert full["total_ttc"] == "96,10€"
+    assert full["source_montant"] == "TTC* mois"
+    assert full["numero_facture"] == "2025-03-123456789-IH-1"
+    assert lazy == full
+
+
+def test_lazy_stops_once_priority_fields_are_found(tmp_path, extraction_mode):
+    pdf = tmp_path / "facture.pdf"
+    pdf.write_bytes(pdf_bytes([_page("Le 05/03/2025", *(text for *_, text in _PAGES[2])), *_PAGES[:2]]))
+
+    extraction_mode("lazy")
+    text = pdf_parser._extract_text_lazy(str(pdf))
+
+    assert "Total TTC* pour Mars 2025" in text
+    assert "bénéficiaires" not in text
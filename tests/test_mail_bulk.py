@@ -0,0 +1,202 @@
+import base64
+import re
+import socketserver
+import threading
+
+import pytest
+
+from invoices import mail_handler
+
+
+def _pdf(n):
+    return b"%PDF-1.4\n" + bytes(range(256)) * n + b"\n%%EOF\n"
+
+
+def _b64(data):
+    raw = base64.b64encode(data)
+    return b"\r\n".join(raw[i:i + 76] for i in range(0, len(raw), 76)) + b"\r\n"
+
+
+class _Message:
+    """Message "Facture" : texte en partie 1, PDF (base64) en partie 2, nom éventuellement encodé."""
+
+    def __init__(self, uid, filename, data, disposition=True):
+        self.uid = uid
+        self.filename = filename
+        self.data = data
+        self.parts = {"1": b"Bonjour\r\n", "2": _b64(data)}
+        name = f'("NAME" "{filename}")' if not disposition else "NIL"
+        disp = f'("ATTACHMENT" ("FILENAME" "{filename}"))' if disposition else "NIL"
+        self.bodystructure = (
+            '(("TEXT" "PLAIN" ("CHARSET" "utf-8") NIL NIL "7BIT" 9 1 NIL NIL NIL NIL)'
+            f'("APPLICATION" "PDF" {name} NIL NIL "BASE64" {len(self.parts["2"])} NIL {disp} NIL NIL)'
+            ' "MIXED" ("BOUNDARY" "sep") NIL NIL NIL)'
+        )
+
+
+class _FakeImap(socketserver.ThreadingTCPServer):
+    """Serveur IMAP minimal : EXAMINE, UID SEARCH, UID FETCH (BODYSTRUCTURE, BODY.PEEK[n]<o.n>)."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, messages, uidvalidity=7):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.messages = {m.uid: m for m in messages}
+        self.uidvalidity = uidvalidity
+        self.fetches = []
+
+
+_RGX_SECTION = re.compile(r"BODY\.PEEK\[([\d.]+)\](?:<(\d+)\.(\d+)>)?")
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def send(self, data):
+        self.wfile.write(data if isinstance(data, bytes) else data.encode() + b"\r\n")
+
+    def handle(self):
+        server = self.server
+        self.send("* OK fake IMAP4rev1 ready")
+        for line in self.rfile:
+            tag, cmd, *rest = line.decode().rstrip("\r\n").split(" ", 2)
+            cmd = cmd.upper()
+            args = rest[0] if rest else ""
+            if cmd == "CAPABILITY":
+                self.send("* CAPABILITY IMAP4rev1")
+            elif cmd == "EXAMINE":
+                self.send(f"* {len(server.messages)} EXISTS")
+                self.send(f"* OK [UIDVALIDITY {server.uidvalidity}] UIDs valid")
+            elif cmd == "UID":
+                sub, args = args.split(" ", 1)
+                if sub.upper() == "SEARCH":
+                    low = int(re.match(r"UID (\d+):\*", args).group(1))
+                    uids = [u for u in sorted(server.messages) if u >= low] or [max(server.messages)]
+                    self.send("* SEARCH " + " ".join(map(str, uids)))
+                else:
+                    self._fetch(*args.split(" ", 1))
+            elif cmd == "LOGOUT":
+                self.send("* BYE")
+                self.send(f"{tag} OK LOGOUT completed")
+                return
+            self.send(f"{tag} OK {cmd} completed")
+
+    def _fetch(self, uid_set, items):
+        server = self.server
+        server.fetches.append((uid_set, items))
+        for seq, uid in enumerate(int(u) for u in uid_set.split(",")):
+            msg = server.messages[uid]
+            if "BODYSTRUCTURE" in items:
+                self.send(f"* {seq + 1} FETCH (UID {uid} BODYSTRUCTURE {msg.bodystructure})")
+                continue
+            part, offset, length = _RGX_SECTION.search(items).groups()
+            data = msg.parts[part]
+            key = f"BODY[{part}]"
+            if offset is not None:
+                data = data[int(offset):int(offset) + int(length)]
+                key += f"<{offset}>"
+            self.send(f"* {seq + 1} FETCH (UID {uid} {key} {{{len(data)}}}\r\n".encode() + data + b")\r\n")
+
+
+@pytest.fixture
+def imap_server():
+    servers = []
+
+    def start(messages):
+        server = _FakeImap(messages)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def _env(server, tmp_path):
+    return {
+        "IMAP_HOST": "127.0.0.1",
+        "IMAP_PORT": server.server_address[1],
+        "IMAP_SSL": False,
+        "IMAP_FETCH_MODE": "bulk",
+        "IMAP_CHECKPOINT": str(tmp_path / "imap_checkpoint.json"),
+        "EMAIL_ACCOUNT": "test@example.invalid",
+        "GMAIL_APP_PASSWORD": "-",
+    }
+
+
+def _fetched(env):
+    return {att.filename: att.data for att in mail_handler.iter_attachments(env)}
+
+
+def test_pdf_parts_from_bodystructure():
+    nested = _Message(3, "=?utf-8?q?facture_mars.pdf?=", b"x", disposition=False)
+    data = [
+        f"1 (UID 3 BODYSTRUCTURE ({nested.bodystructure} "
+        '("MESSAGE" "RFC822" NIL NIL NIL "7BIT" 900 NIL ("APPLICATION" "PDF" ("NAME" "jointe.pdf") '
+        'NIL NIL "BASE64" 40 NIL NIL NIL NIL) 12) "MIXED" ("BOUNDARY" "out") NIL NIL NIL))'.encode()
+    ]
+    item, = mail_handler._parse_fetch_response(data)
+
+    assert item["UID"] == 3
+    assert list(mail_handler._pdf_parts(item["BODYSTRUCTURE"])) == [
+        ("1.2", "facture mars.pdf", "base64", len(nested.parts["2"])),
+        ("2.1", "jointe.pdf", "base64", 40),
+    ]
+
+
+def test_bulk_fetch_chunks_large_parts_and_caps_grouped_fetches(imap_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(mail_handler, "FETCH_CHUNK_BYTES", 4096)
+    monkeypatch.setattr(mail_handler, "FETCH_GROUP_BYTES", 8192)
+    messages = [_Message(uid, f"f{uid}.pdf", _pdf(8)) for uid in (1, 2, 4, 5)]
+    messages.append(_Message(9, "grosse.pdf", _pdf(40)))
+    server = imap_server(messages)
+
+    got = _fetched(_env(server, tmp_path))
+
+    assert got == {m.filename: m.data for m in messages}
+    sizes = {m.uid: len(m.parts["2"]) for m in messages}
+    grouped = [uids for uids, items in server.fetches if items == "(UID BODY.PEEK[2])"]
+    assert len(grouped) > 1
+    for uids in grouped:
+        assert sum(sizes[int(u)] for u in uids.split(",")) <= 8192
+    chunks = [items for uids, items in server.fetches if uids == "9" and "<" in items]
+    assert len(chunks) == -(-sizes[9] // 4096)
+
+
+def test_bulk_fetch_resumes_from_checkpoint(imap_server, tmp_path):
+    server = imap_server([_Message(1, "a.pdf", _pdf(1)), _Message(2, "b.pdf", _pdf(2))])
+    env = _env(server, tmp_path)
+
+    assert set(_fetched(env)) == {"a.pdf", "b.pdf"}
+    assert _fetched(env) == {}
+
+    server.messages[3] = _Message(3, "c.pdf", _pdf(3))
+    assert _fetched(env) == {"c.pdf": _pdf(3)}
+
+    # UIDVALIDITY changée : le point de reprise ne vaut plus, tout est relu
+    server.uidvalidity += 1
+    assert set(_fetched(env)) == {"a.pdf", "b.pdf", "c.pdf"}
+
+
+def test_deferred_checkpoint_is_only_saved_by_the_caller(imap_server, tmp_path):
+    server = imap_server([_Message(1, "a.pdf", _pdf(1)), _Message(2, "b.pdf", _pdf(2))])
+    env = _env(server, tmp_path)
+    saves = []
+
+    assert {att.filename for att in mail_handler.iter_attachments(env, defer_checkpoint=saves.append)} == {
+        "a.pdf", "b.pdf"
+    }
+    # Rapport non écrit : rien n'est enregistré, les messages sont relus
+    assert set(_fetched(env)) == {"a.pdf", "b.pdf"}
+
+    list(mail_handler.iter_attachments(env, defer_checkpoint=saves.append))
+    saves[-1]()
+    assert _fetched(env) == {}
+
+
+@pytest.mark.parametrize("filename", ["..", "dossier/..", "=?utf-8?q?=2E=2E?=", "/"])
+def test_unsafe_attachment_name_gets_a_generated_one(imap_server, tmp_path, filename):
+    server = imap_server([_Message(4, filename, _pdf(1))])
+
+    assert _fetched(_env(server, tmp_path)) == {"4_2.pdf": _pdf(1)}
@@ -0,0 +1,89 @@
+import random
+from datetime import date
+
+import pytest
+
+from invoices import normalize
+from invoices.records import InvoiceRecord
+
+# Colonnes qui empruntent chacun des chemins de _amounts_python / _dates_python
+_AMOUNTS = {
+    "virgule": ["255,63€", "1 234,50 €", "12€", "INCONNU", None, "0,01"],
+    "point": ["$99.00", "1234.5", "-3.10", "", "7"],
+    "mixte": ["1.234,56 €", "$1,234.56", "12,00€", "3.5"],
+    "illisible": ["12,00€", "abc", "1-2", "INCONNU"],
+    "énorme": ["12,00€", "999999999999999,99€"],
+}
+_DATES = {
+    "largeur fixe": ["01/04/2023", "29/02/2024", "INCONNU", None],
+    "hors calendrier": ["01/04/2023", "31/02/2023", "15/13/2024"],
+    "autres formes": ["1/4/2023", "2023-04-01", "05/03/2025", ""],
+}
+
+
+def _rows(amounts, dates):
+    n = max(len(amounts), len(dates))
+    return [
+        {"fichier": f"Alan {i}.pdf", "numero_facture": f"F-{i}" if i % 3 else "INCONNU",
+         "date_facture": dates[i % len(dates)], "total_ttc": amounts[i % len(amounts)],
+         "periode": "Avril 2023", "doublon": "x.pdf" if i == 1 else ""}
+        for i in range(n)
+    ]
+
+
+def _random_rows(count, seed=0):
+    rnd = random.Random(seed)
+    rows = []
+    for i in range(count):
+        euros, cents = rnd.randint(0, 99_999), rnd.randint(0, 99)
+        amount = rnd.choice((f"{euros},{cents:02d}€", f"{euros:,}.{cents:02d}", f"{euros:,},{cents:02d} €".replace(",", ".", 1)))
+        day = rnd.choice((f"{rnd.randint(1, 28):02d}/{rnd.randint(1, 12):02d}/{rnd.randint(2020, 2025)}", "INCONNU", "32/01/2024"))
+        rows.append({"fichier": f"f{i}.pdf", "facture": f"F-{i}", "date": day, "total_ttc": amount})
+    return rows
+
+
+@pytest.mark.parametrize("amounts", list(_AMOUNTS.values()), ids=list(_AMOUNTS))
+@pytest.mark.parametrize("dates", list(_DATES.values()), ids=list(_DATES))
+def test_records_from_rows_matches_from_mapping(amounts, dates):
+    rows = _rows(amounts, dates)
+
+    assert normalize.records_from_rows(rows, use_numpy=False) == [InvoiceRecord.from_mapping(r) for r in rows]
+
+
+def test_records_from_rows_on_a_large_batch():
+    rows = _random_rows(2000)
+
+    assert normalize.records_from_rows(rows, use_numpy=False) == [InvoiceRecord.from_mapping(r) for r in rows]
+
+
+def test_masks():
+    amounts = normalize.normalize_amounts(_AMOUNTS["illisible"], use_numpy=False)
+    dates = normalize.normalize_dates(["01/04/2023", "31/02/2023", "INCONNU", date(2024, 1, 2)], use_numpy=False)
+
+    assert amounts == normalize.Column([1200, None, None, None], [False, True, True, False], [False, False, False, True])
+    assert dates == normalize.Column(
+        [date(2023, 4, 1), None, None, date(2024, 1, 2)], [False, True, False, False], [False, False, True, False]
+    )
+    assert normalize.normalize_rows(_rows(_AMOUNTS["illisible"], ["01/04/2023"]), use_numpy=False).failed == [
+        False, True, True, False
+    ]
+
+
+def test_numpy_requested_without_numpy():
+    if normalize.HAVE_NUMPY:
+        pytest.skip("numpy installé")
+    with pytest.raises(ImportError):
+        normalize.normalize_amounts(["1€"], use_numpy=True)
+
+
+@pytest.mark.parametrize("amounts", list(_AMOUNTS.values()), ids=list(_AMOUNTS))
+@pytest.mark.parametrize("dates", list(_DATES.values()), ids=list(_DATES))
+def test_numpy_matches_python(amounts, dates):
+    pytest.importorskip("numpy")
+    rows = _rows(amounts, dates)
+
+    assert normalize.records_from_rows(rows, use_numpy=True) == normalize.records_from_rows(rows, use_numpy=False)
+    column = normalize.normalize_amounts(amounts, use_numpy=True)
+    expected = normalize.normalize_amounts(amounts, use_numpy=False)
+    assert column.failed.tolist() == expected.failed
+    assert column.missing.tolist() == expected.missing
@@ -0,0 +1,42 @@
+import os
+from pathlib import Path
+
+from invoices import main as pipeline
+from invoices import metrics
+from invoices.records import InvoiceRecord
+
+
+def _crashy_extract(pdf):
+    # Remplace _extract_one dans les workers : "crash" tue le processus comme un crash natif
+    name = Path(pdf).name
+    if "crash" in name:
+        os._exit(1)
+    return InvoiceRecord.from_fields(name, name, "01/01/2025", "1,00€"), None, None
+
+
+def _paths(*names):
+    return [Path(n) for n in names]
+
+
+def test_worker_crash_only_fails_its_pdf(monkeypatch):
+    monkeypatch.setattr(pipeline, "_extract_one", _crashy_extract)
+    metrics.REGISTRY.reset()
+    pdfs = _paths("a.pdf", "b.pdf", "c-crash.pdf", "d.pdf", "e.pdf", "f.pdf", "g.pdf")
+
+    rows = list(pipeline._iter_extracted(pdfs, workers=2))
+
+    assert [r.fichier for r in rows] == ["a.pdf", "b.pdf", "d.pdf", "e.pdf", "f.pdf", "g.pdf"]
+    assert metrics.REGISTRY.counter("invoices_pdf_total", result="error") == 1
+    assert metrics.REGISTRY.counter("invoices_pool_rebuilds_total") >= 1
+
+
+def test_shared_pool_survives_crash_across_batches(monkeypatch):
+    monkeypatch.setattr(pipeline, "_extract_one", _crashy_extract)
+    metrics.REGISTRY.reset()
+    with pipeline._ExtractPool(2, (None, 0), ("full", {}, "raw", True), None) as pool:
+        first = list(pipeline._iter_extracted(_paths("a.pdf", "crash-1.pdf", "b.pdf"), 2, pool=pool))
+        second = list(pipeline._iter_extracted(_paths("c.pdf", "d.pdf", "crash-2.pdf", "e.pdf"), 2, pool=pool))
+
+    assert [r.fichier for r in first] == ["a.pdf", "b.pdf"]
+    assert [r.fichier for r in second] == ["c.pdf", "d.pdf", "e.pdf"]
+    assert metrics.REGISTRY.counter("invoices_pdf_total", result="error") == 2
@@ -0,0 +1,98 @@
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+from invoices.normalize import records_from_rows
+from invoices.records import CSV_FIELDS, UNKNOWN, InvoiceRecord, parse_amount_cents, parse_date
+
+
+def test_invalid_date_keeps_its_text_in_the_csv():
+    rec = InvoiceRecord.from_fields("a.pdf", "F-1", "31/02/2025", "10,00€")
+
+    assert rec.date_facture is None
+    assert rec.csv_row()["date_facture"] == "31/02/2025"
+    assert rec.as_dict()["date_facture"] == "31/02/2025"
+    assert InvoiceRecord.from_json(rec.to_json()) == rec
+
+
+def test_valid_and_missing_dates():
+    assert InvoiceRecord.from_fields("a.pdf", "F-1", "05/03/2025", "1€").csv_row()["date_facture"] == "05/03/2025"
+    for missing in (None, "", "INCONNU"):
+        rec = InvoiceRecord.from_fields("a.pdf", "F-1", missing, "1€")
+        assert rec.date_brute == ""
+        assert rec.csv_row()["date_facture"] == "INCONNU"
+
+
+def test_records_from_rows_keeps_invalid_date_text():
+    rows = [
+        {"fichier": "a.pdf", "date_facture": "31/02/2025", "total_ttc": "1,00€"},
+        {"fichier": "b.pdf", "date": "05/03/2025", "total_ttc": "2,00€"},
+        {"fichier": "c.pdf", "date_facture": "INCONNU", "total_ttc": "INCONNU"},
+    ]
+
+    out = records_from_rows(rows, use_numpy=False)
+
+    assert out == [InvoiceRecord.from_mapping(r) for r in rows]
+    assert out[0].date_brute == "31/02/2025"
+    assert out[1].date_facture == date(2025, 3, 5)
+
+
+@pytest.mark.parametrize("text, cents", [
+    ("255,63€", 25563),
+    ("1.234,56 €", 123456),
+    ("$1,234.56", 123456),
+    ("1 234,5", 123450),
+    ("-12,00€", -1200),
+    ("0,005", 0),
+    ("0,015", 2),
+    ("12", 1200),
+    ("INCONNU", None),
+    ("", None),
+    (None, None),
+    ("abc", None),
+    ("1,2,3", None),
+    ("NaN", None),
+    ("Infinity", None),
+])
+def test_parse_amount_cents(text, cents):
+    assert parse_amount_cents(text) == cents
+
+
+@pytest.mark.parametrize("text, day", [
+    ("05/03/2025", date(2025, 3, 5)),
+    (" 29/02/2024 ", date(2024, 2, 29)),
+    ("29/02/2023", None),
+    ("2025-03-05", None),
+    ("5/3/2025", date(2025, 3, 5)),
+    ("aa/bb/cccc", None),
+    ("", None),
+    (None, None),
+    (date(2025, 1, 1), date(2025, 1, 1)),
+])
+def test_parse_date(text, day):
+    assert parse_date(text) == day
+
+
+def test_from_mapping_reads_both_row_shapes():
+    new = {"fichier": "Alan 20250301 - Facture.pdf", "numero_facture": "F-1", "date_facture": "01/03/2025",
+           "total_ttc": "1.234,56€", "periode": "Mars 2025", "doublon": "x.pdf"}
+    old = {"fichier": new["fichier"], "facture": "F-1", "date": "01/03/2025", "total_ttc": "1.234,56€",
+           "periode": "Mars 2025", "doublon": "x.pdf"}
+
+    rec = InvoiceRecord.from_mapping(new)
+
+    assert InvoiceRecord.from_mapping(old) == rec
+    assert (rec.numero_facture, rec.date_facture, rec.total_cents, rec.doublon) == ("F-1", date(2025, 3, 1), 123456, "x.pdf")
+    assert rec.fournisseur == "Alan"
+    assert rec.total_amount == Decimal("1234.56")
+    assert rec.csv_row() == {k: new[k] for k in CSV_FIELDS}
+    assert InvoiceRecord.from_json(rec.to_json()) == rec
+
+
+def test_unknown_fields():
+    rec = InvoiceRecord.from_fields("", "INCONNU", "INCONNU", "INCONNU")
+
+    assert rec == InvoiceRecord(UNKNOWN, None, None, None, None)
+    assert rec.csv_row() == {"fichier": UNKNOWN, "date_facture": UNKNOWN, "numero_facture": UNKNOWN,
+                             "total_ttc": UNKNOWN, "periode": ""}
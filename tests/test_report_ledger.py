@@ -0,0 +1,154 @@
+import sqlite3
+
+import pytest
+from openpyxl import load_workbook
+
+from invoices.main import _commit_increment, _tee_to_csv, _write_csv_report
+from invoices.records import InvoiceRecord
+from invoices.report_ledger import ReportLedger
+
+
+def _rec(i, month=3):
+    return InvoiceRecord.from_fields(f"f{i:03d}.pdf", f"N-{i}", f"{i % 28 + 1:02d}/{month:02d}/2025", f"{i},00€")
+
+
+HISTORY = [_rec(i) for i in range(5)] + [_rec(i, month=4) for i in range(5, 8)]
+NEW = [_rec(i, month=4) for i in range(8, 10)]
+
+
+def _run(ledger, rows, csv_path, parts_dir=None, stop_after=None):
+    """Un run incrémental de main ; stop_after : interruption après n nouvelles lignes écrites."""
+    ledger.prepare_csv(csv_path)
+    stats = {}
+    for n, _ in enumerate(_tee_to_csv(ledger.new_records(rows, stats), csv_path, stats, append=True), start=1):
+        if n == stop_after:
+            ledger.rollback()
+            return stats
+    if parts_dir is not None:
+        _commit_increment(ledger, parts_dir, csv_path)
+    else:
+        ledger.commit(csv_path)
+    return stats
+
+
+def _full_csv(rows, path):
+    _write_csv_report(rows, path)
+    return path.read_bytes()
+
+
+def test_replay_adds_only_new_rows_and_matches_full_csv(tmp_path):
+    csv_path = tmp_path / "invoices_extract.csv"
+    ledger = ReportLedger(tmp_path / "ledger.sqlite")
+
+    _run(ledger, HISTORY, csv_path)
+    stats = _run(ledger, HISTORY + NEW + NEW[:1], csv_path, parts_dir=tmp_path / "parts")
+
+    assert stats == {"rows": 2, "extracted": len(HISTORY) + 3, "skipped": len(HISTORY) + 1}
+    assert len(ledger) == len(HISTORY) + 2
+    assert csv_path.read_bytes() == _full_csv(HISTORY + NEW, tmp_path / "full.csv")
+    # Classeur du mois touché seulement, historique du mois compris
+    assert [p.name for p in (tmp_path / "parts").iterdir()] == ["invoices_2025-04.xlsx"]
+    ws = load_workbook(tmp_path / "parts" / "invoices_2025-04.xlsx").active
+    assert [row[0] for row in ws.iter_rows(min_row=2, values_only=True)] == [r.fichier for r in HISTORY[5:] + NEW]
+
+    _run(ledger, HISTORY + NEW, csv_path)
+    assert csv_path.read_bytes() == _full_csv(HISTORY + NEW, tmp_path / "full.csv")
+
+
+def test_interrupted_runs_are_replayed(tmp_path):
+    csv_path = tmp_path / "invoices_extract.csv"
+    ledger = ReportLedger(tmp_path / "ledger.sqlite")
+
+    # Premier run interrompu : rien de validé, le CSV partiel n'est pas pris pour un historique
+    _run(ledger, HISTORY, csv_path, stop_after=3)
+    assert len(ledger) == 0
+    assert ledger.prepare_csv(csv_path) == "truncated"
+
+    _run(ledger, HISTORY, csv_path)
+    _run(ledger, HISTORY + NEW, csv_path, stop_after=1)
+    _run(ReportLedger(tmp_path / "ledger.sqlite"), HISTORY + NEW, csv_path)
+
+    assert csv_path.read_bytes() == _full_csv(HISTORY + NEW, tmp_path / "full.csv")
+
+
+def test_existing_full_mode_csv_seeds_the_ledger(tmp_path):
+    csv_path = tmp_path / "invoices_extract.csv"
+    history = _full_csv(HISTORY, csv_path)
+    ledger = ReportLedger(tmp_path / "ledger.sqlite")
+
+    assert ledger.prepare_csv(csv_path) == "seeded"
+    assert csv_path.read_bytes() == history
+    assert len(ledger) == len(HISTORY)
+
+    stats = _run(ledger, HISTORY + NEW, csv_path)
+    assert stats["rows"] == len(NEW)
+    assert csv_path.read_bytes() == _full_csv(HISTORY + NEW, tmp_path / "full.csv")
+
+
+def test_foreign_csv_is_refused(tmp_path):
+    csv_path = tmp_path / "invoices_extract.csv"
+    csv_path.write_text("a;b\n1;2\n", encoding="utf-8")
+
+    with pytest.raises(ValueError, match="colonnes"):
+        ReportLedger(tmp_path / "ledger.sqlite").prepare_csv(csv_path)
+    assert csv_path.read_text(encoding="utf-8") == "a;b\n1;2\n"
+
+
+def test_missing_csv_is_rebuilt_from_the_ledger(tmp_path):
+    csv_path = tmp_path / "invoices_extract.csv"
+    ledger = ReportLedger(tmp_path / "ledger.sqlite")
+    _run(ledger, HISTORY, csv_path)
+    csv_path.unlink()
+
+    assert ledger.prepare_csv(csv_path) == "rebuilt"
+    assert csv_path.read_bytes() == _full_csv(HISTORY, tmp_path / "full.csv")
+    stats = _run(ledger, HISTORY + NEW, csv_path)
+    assert stats["rows"] == len(NEW)
+    assert csv_path.read_bytes() == _full_csv(HISTORY + NEW, tmp_path / "full.csv")
+
+
+def test_replaced_pdf_with_the_same_name_is_reported(tmp_path):
+    csv_path = tmp_path / "invoices_extract.csv"
+    ledger = ReportLedger(tmp_path / "ledger.sqlite")
+    first = [r._replace(digest=f"d{i}") for i, r in enumerate(HISTORY)]
+    _run(ledger, first, csv_path)
+
+    replaced = first[0]._replace(total_ttc="99,00€", total_cents=9900, digest="autre")
+    stats = _run(ledger, first + [replaced], csv_path)
+
+    assert stats == {"rows": 1, "extracted": len(HISTORY) + 1, "skipped": len(HISTORY)}
+    assert csv_path.read_bytes() == _full_csv(first + [replaced], tmp_path / "full.csv")
+
+
+def test_seeded_rows_take_the_digest_of_their_first_extraction(tmp_path):
+    csv_path = tmp_path / "invoices_extract.csv"
+    _full_csv(HISTORY, csv_path)
+    ledger = ReportLedger(tmp_path / "ledger.sqlite")
+    ledger.prepare_csv(csv_path)
+    extracted = [r._replace(digest=f"d{i}") for i, r in enumerate(HISTORY)]
+
+    assert _run(ledger, extracted, csv_path)["skipped"] == len(HISTORY)
+    assert _run(ledger, extracted, csv_path)["skipped"] == len(HISTORY)
+    assert len(ledger) == len(HISTORY)
+    assert csv_path.read_bytes() == _full_csv(HISTORY, tmp_path / "full.csv")
+
+
+def test_ledger_keyed_by_file_name_is_migrated(tmp_path):
+    path = tmp_path / "ledger.sqlite"
+    with sqlite3.connect(path) as db:
+        db.executescript(
+            "CREATE TABLE rows (fichier TEXT PRIMARY KEY, run_id INTEGER NOT NULL, month TEXT NOT NULL, record TEXT NOT NULL);"
+            "CREATE INDEX rows_month ON rows(month);"
+        )
+        db.executemany(
+            "INSERT INTO rows(fichier, run_id, month, record) VALUES (?, 1, '2025-03', ?)",
+            [(r.fichier, r.to_json()) for r in reversed(HISTORY[:5])],
+        )
+    db.close()
+    ledger = ReportLedger(path)
+
+    assert [r.fichier for r in ledger.month_records("2025-03")] == [r.fichier for r in reversed(HISTORY[:5])]
+    stats = {}
+    assert list(ledger.new_records([HISTORY[0]._replace(digest="d0")], stats)) == []
+    assert stats["skipped"] == 1
+    ledger.rollback()
@@ -0,0 +1,85 @@
+import io
+import re
+from pathlib import Path
+
+import pytest
+from PyPDF2 import PdfReader
+
+from benchmarks.corpus import iter_corpus
+from invoices import pdf_parser, supplier_templates
+from invoices.field_scanner import clean_text
+from invoices.supplier_templates import ALAN, SupplierTemplate
+
+SAMPLES = sorted((Path(__file__).resolve().parent.parent / "traitement").glob("*.pdf"))
+
+_ALAN_TEXT = (
+    "Assurance complémentaire santé\n"
+    "Facture N°2024-06-621513456-000059041-IH-1\n"
+    "Team Alan, le 01/06/2024\n"
+    "Total TTC* pour Juin 2024 286,00 €\n"
+)
+
+
+def _texts():
+    for path in SAMPLES:
+        yield path.name, PdfReader(path)
+    for invoice, data in iter_corpus(20, seed=5, multipage_ratio=0.3, malformed_ratio=0):
+        yield invoice.fichier, PdfReader(io.BytesIO(data))
+
+
+def _generic(text, name):
+    pdf_parser.configure_extraction(templates=False)
+    try:
+        return pdf_parser._extract_fields(text, name)
+    finally:
+        pdf_parser.configure_extraction()
+
+
+def _other(name, **hints):
+    return SupplierTemplate(name, ALAN.keywords, re.compile(r"N°(?P<value>\d{4})"), ALAN.date, ALAN.total, **hints)
+
+
+def test_template_matches_the_generic_cascade():
+    for name, reader in _texts():
+        text = clean_text("\n".join(page.extract_text() or "" for page in reader.pages))
+
+        assert supplier_templates.match(text, name) is ALAN, name
+        fields = ALAN.extract(text)
+        assert fields is not None, name
+        assert fields == _generic(text, name), name
+
+
+def test_keywords_decide_and_hints_only_order(monkeypatch):
+    monkeypatch.setitem(supplier_templates.TEMPLATES, "autre", _other("autre", producer=re.compile("Autre PDF")))
+
+    assert supplier_templates.match(_ALAN_TEXT, "facture.pdf") is ALAN
+    assert supplier_templates.match(_ALAN_TEXT, "facture.pdf", producer="Autre PDF 1.0").name == "autre"
+    # Indice sans les mots-clés : pas de modèle
+    assert supplier_templates.match("Facture quelconque", "Alan 20240601 - Facture.pdf", "WeasyPrint") is None
+    # Mots-clés au-delà du début du texte
+    assert supplier_templates.match("x" * 3000 + _ALAN_TEXT) is None
+
+
+def test_missing_field_falls_back_to_the_generic_cascade():
+    text = _ALAN_TEXT.replace("Team Alan, le 01/06/2024", "Team Alan, le 1er juin 2024 (01/06/2024)")
+
+    assert supplier_templates.match(text) is ALAN
+    assert ALAN.extract(text) is None
+    assert pdf_parser._extract_fields(text) == _generic(text, None)
+    assert pdf_parser._extract_fields(text)["date_facture"] == "01/06/2024"
+
+
+def test_registered_template_is_used(monkeypatch):
+    monkeypatch.setattr(supplier_templates, "TEMPLATES", {})
+    supplier_templates.register_template(_other("autre"))
+
+    assert pdf_parser._extract_fields(_ALAN_TEXT)["numero_facture"] == "2024"
+
+
+@pytest.mark.parametrize("templates", [True, False])
+def test_templates_setting_is_part_of_the_cache_version(templates):
+    pdf_parser.configure_extraction(templates=templates)
+    try:
+        assert pdf_parser._cache_version().endswith("-generic") is not templates
+    finally:
+        pdf_parser.configure_extraction()
@@ -0,0 +1,152 @@
+import os
+
+import pytest
+
+from invoices import metrics
+from invoices.isolation import Breach, Budget, Quarantine
+from invoices.main import _run_node
+from invoices.records import InvoiceRecord
+from invoices.work_queue import HISTORY, WorkQueue
+
+
+@pytest.fixture
+def dirs(tmp_path):
+    input_dir = tmp_path / "input"
+    (input_dir / "sous").mkdir(parents=True)
+    for name in ("a.pdf", "b.pdf", "c.pdf", "sous/d.pdf", "sous/e.pdf"):
+        (input_dir / name).write_bytes(b"%PDF")
+    return input_dir, tmp_path / "queue"
+
+
+def _records(batch, total="10,00€"):
+    return [InvoiceRecord.from_fields(p.name, p.stem, "01/01/2025", total) for p in batch]
+
+
+def _work(queue, count=2, total="10,00€"):
+    processed = []
+    while True:
+        batch = queue.claim(count)
+        if not batch:
+            return processed
+        queue.publish(_records(batch, total), batch)
+        processed += [p.name for p in batch]
+
+
+def test_nodes_share_the_input_and_the_last_one_merges(dirs):
+    input_dir, queue_dir = dirs
+    a, b = WorkQueue(input_dir, queue_dir, "node-a"), WorkQueue(input_dir, queue_dir, "node-b")
+
+    with a, b:
+        held = b.claim(1)
+        done_a = _work(a)
+        # b a encore un PDF réclamé : a ne fusionne pas
+        assert a.merge() is None
+        b.publish(_records(held), held)
+        done_b = [p.name for p in held] + _work(b)
+
+    assert sorted(done_a + done_b) == ["a.pdf", "b.pdf", "c.pdf", "d.pdf", "e.pdf"]
+    assert not list(input_dir.rglob("*.pdf"))
+    assert sorted(p.relative_to(queue_dir / "done").as_posix() for p in (queue_dir / "done").rglob("*.pdf")) == [
+        "a.pdf", "b.pdf", "c.pdf", "sous/d.pdf", "sous/e.pdf"
+    ]
+
+    merge = b.merge()
+    assert merge is not None
+    # Verrou détenu par b
+    assert a.merge() is None
+    assert sorted(r.fichier for r in merge.records()) == ["a.pdf", "b.pdf", "c.pdf", "d.pdf", "e.pdf"]
+    merge.commit()
+    merge.release()
+
+    assert b.partials() == []
+    assert len((queue_dir / "partials" / HISTORY).read_text(encoding="utf-8").splitlines()) == 5
+    assert b.merge() is None
+
+
+def test_merge_keeps_history_and_latest_row_per_file(dirs):
+    input_dir, queue_dir = dirs
+    queue = WorkQueue(input_dir, queue_dir, "node-a")
+    _work(queue, count=10)
+    merge = queue.merge()
+    list(merge.records())
+    merge.commit()
+    merge.release()
+
+    (input_dir / "b.pdf").write_bytes(b"%PDF")
+    (input_dir / "f.pdf").write_bytes(b"%PDF")
+    _work(queue, total="20,00€")
+    merge = queue.merge()
+    rows = {r.fichier: r.total_cents for r in merge.records()}
+    merge.release()
+
+    assert rows == {"a.pdf": 1000, "b.pdf": 2000, "c.pdf": 1000, "d.pdf": 1000, "e.pdf": 1000, "f.pdf": 2000}
+
+
+def test_uncommitted_merge_is_redone(dirs):
+    input_dir, queue_dir = dirs
+    queue = WorkQueue(input_dir, queue_dir, "node-a")
+    _work(queue)
+    merge = queue.merge()
+    first = sorted(r.fichier for r in merge.records())
+    # Envoi en échec : verrou rendu sans commit, partiels conservés
+    merge.release()
+
+    merge = WorkQueue(input_dir, queue_dir, "node-b").merge()
+    assert sorted(r.fichier for r in merge.records()) == first
+    merge.release()
+
+
+def test_interrupted_claims_are_resumed_then_taken_over(dirs):
+    input_dir, queue_dir = dirs
+    with WorkQueue(input_dir, queue_dir, "node-a") as queue:
+        first = queue.claim(2)
+
+    # Même nœud relancé : ses PDF réclamés d'abord
+    with WorkQueue(input_dir, queue_dir, "node-a") as queue:
+        assert sorted(queue.claim(2)) == sorted(first)
+
+    # Autre nœud : PDF de node-a repris une fois son bail expiré
+    other = WorkQueue(input_dir, queue_dir, "node-b", lease_seconds=60)
+    assert len(_work(other, count=10)) == 3
+    assert other.merge() is None
+    stale = os.stat(queue_dir / "nodes" / "node-a").st_mtime - 120
+    os.utime(queue_dir / "nodes" / "node-a", (stale, stale))
+
+    taken = other.claim(10)
+    assert sorted(p.name for p in taken) == sorted(p.name for p in first)
+    other.publish(_records(taken), taken)
+    merge = other.merge()
+    assert len(list(merge.records())) == 5
+    merge.release()
+
+
+def test_stale_merge_lock_is_removed(dirs):
+    input_dir, queue_dir = dirs
+    queue = WorkQueue(input_dir, queue_dir, "node-a", lease_seconds=60)
+    _work(queue)
+    (queue_dir / "merge.lock").mkdir()
+    assert queue.merge() is None
+
+    old = os.stat(queue_dir / "merge.lock").st_mtime - 120
+    os.utime(queue_dir / "merge.lock", (old, old))
+    merge = queue.merge()
+    assert merge is not None
+    merge.release()
+    assert not (queue_dir / "merge.lock").exists()
+
+
+def test_quarantined_pdf_is_skipped_under_its_claimed_path(dirs, tmp_path):
+    input_dir, queue_dir = dirs
+    (input_dir / "b.pdf").write_bytes(b"%PDF lent")
+    quarantine = Quarantine(tmp_path / "quarantine.json")
+    quarantine.add(str(input_dir / "b.pdf"), Breach("timeout", 120.0, 0))
+    before = metrics.REGISTRY.counter("invoices_pdf_total", result="quarantined")
+
+    processed = _run_node(
+        WorkQueue(input_dir, queue_dir, "node-a"), 10, 1, (None, 0), ("full", None, "raw", True), 0,
+        isolated=(Budget(seconds=30), quarantine),
+    )
+
+    assert processed == 5
+    assert metrics.REGISTRY.counter("invoices_pdf_total", result="quarantined") == before + 1
+    assert (queue_dir / "done" / "b.pdf").exists()